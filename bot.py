@@ -12,6 +12,7 @@ import asyncio
 import warnings
 from typing import Dict, Any
 import hashlib
+import hmac
 import time
 import json
 import re
@@ -43,6 +44,7 @@ from telegram.ext import (
     filters,
     AIORateLimiter,
     ApplicationHandlerStop,
+    PersistenceInput,
 )
 
 from config import config
@@ -70,12 +72,29 @@ from handlers.social import build_social_handlers, handle_social_media
 
 # Import utilities
 from utils.rate_limiter import rate_limiter, multi_rate_limiter, rate_limit_handler
-from database.db import session_scope
-from database.service import is_user_banned, ban_user, unban_user
+from utils.ban_registry import ban_registry
+from utils.leaderboard import leaderboard
+from utils.question_bank import question_bank
+from utils.stats_snapshot import stats_snapshot
+from utils.update_dispatcher import UpdateDispatcher
+from utils.payment_store import get_payment_store
+from utils.instrumentation import TimedHTTPXRequest, instrument_application
+from utils.user_cache import get_cached_user
+from database.db import (
+    session_scope,
+    ensure_schema_ready,
+    invalidate_schema_gate,
+    iterate_blocking,
+    run_blocking,
+    schema_ready,
+)
+from database import async_service
+from database.persistence import SQLPersistence
 from utils.error_handler import ptb_error_handler
 from ui.keyboards import build_register_keyboard
 from datetime import datetime
 from utils.background import BroadcastManager
+from utils.broadcast_store import SQLBroadcastStore
 
 # Configure logging
 logging.basicConfig(
@@ -139,6 +158,8 @@ def _parse_admin_filters(request):
     to_str = request.query.get("to", "").strip()
     page = max(0, int(request.query.get("page", "0") or 0))
     page_size = max(1, min(100, int(request.query.get("size", "20") or 20)))
+    after = _decode_admin_cursor(request.query.get("after", ""))
+    before = None if after else _decode_admin_cursor(request.query.get("before", ""))
 
     uid = int(uid_str) if uid_str.isdigit() else None
     dt_from = None
@@ -174,12 +195,45 @@ def _parse_admin_filters(request):
         "fmt": fmt,
         "page": page,
         "page_size": page_size,
+        "after": after,
+        "before": before,
         "to_admin": (int(to_str) if to_str.isdigit() else None),
         "to_admin_str": to_str,
     }
 
 
-def _build_admin_qs(base_url, status, ptype, uid_str, product_q, from_str, to_str, page_size, page):
+def _encode_admin_cursor(created_at, pid):
+    """Keyset cursor for the admin order list: `<created_at ISO>~<purchase id>`."""
+    return f"{created_at.isoformat() if created_at else ''}~{int(pid)}"
+
+
+def _decode_admin_cursor(raw):
+    from datetime import datetime
+
+    ts, sep, pid = (raw or "").strip().rpartition("~")
+    if not sep or not ts or not pid.isdigit():
+        return None
+    try:
+        return datetime.fromisoformat(ts), int(pid)
+    except ValueError:
+        return None
+
+
+def _build_admin_qs(
+    base_url,
+    status,
+    ptype,
+    uid_str,
+    product_q,
+    from_str,
+    to_str,
+    page_size,
+    page,
+    after=None,
+    before=None,
+):
+    from urllib.parse import quote
+
     params = {
         "status": status,
         "type": ptype,
@@ -189,28 +243,219 @@ def _build_admin_qs(base_url, status, ptype, uid_str, product_q, from_str, to_st
         "to": to_str,
         "size": str(page_size),
         "page": str(page),
+        "after": quote(after, safe="~") if after else None,
+        "before": quote(before, safe="~") if before else None,
     }
     parts = [f"{k}={v}" for k, v in params.items() if v not in (None, "")]
     return base_url + "&" + "&".join(parts)
 
 
-def _query_purchases_filtered(stmt):
-    from database.db import session_scope
+def _query_purchases_page(stmt, page, page_size, after=None, before=None):
+    """Return `(items, total, has_more, receipt_ids)` for one page of a purchase query.
+
+    `stmt` is the unordered filtered `select(Purchase)`. The total is a `COUNT(*)` over
+    it and only `page_size` rows are fetched. With an `after`/`before` cursor
+    (`(created_at, id)` of the last/first row shown) the page is located by keyset on
+    `(created_at DESC, id DESC)`; otherwise `page` is used as a plain OFFSET.
+    `receipt_ids` holds the ids on the page that have a receipt, read through an
+    `EXISTS` column on the same statement.
+    """
+    from sqlalchemy import and_, exists, func, or_, select
+    from database.db import session_scope, invalidate_schema_gate
+    from database.models_sql import Purchase, Receipt
+
+    has_receipt = exists().where(Receipt.purchase_id == Purchase.id).label("has_receipt")
+    page_stmt = stmt.add_columns(has_receipt)
+    if after is not None:
+        ts, pid = after
+        page_stmt = page_stmt.where(
+            or_(Purchase.created_at < ts, and_(Purchase.created_at == ts, Purchase.id < pid))
+        )
+    elif before is not None:
+        ts, pid = before
+        page_stmt = page_stmt.where(
+            or_(Purchase.created_at > ts, and_(Purchase.created_at == ts, Purchase.id > pid))
+        )
+    if before is not None:
+        page_stmt = page_stmt.order_by(Purchase.created_at.asc(), Purchase.id.asc())
+    else:
+        page_stmt = page_stmt.order_by(Purchase.created_at.desc(), Purchase.id.desc())
+    if after is None and before is None:
+        page_stmt = page_stmt.offset(page * page_size)
+    # One extra row tells whether another page follows without a second query
+    page_stmt = page_stmt.limit(page_size + 1)
 
     try:
         with session_scope() as session:
-            return list(session.execute(stmt).scalars())
+            total = session.execute(
+                select(func.count()).select_from(stmt.order_by(None).subquery())
+            ).scalar_one()
+            rows = list(session.execute(page_stmt))
     except Exception as e:
-        try:
-            logger.warning(f"purchase query failed, attempting DB init: {e}")
-            from database.migrate import init_db
-
-            init_db()
-            with session_scope() as session:
-                return list(session.execute(stmt).scalars())
-        except Exception as e2:
-            logger.error(f"fatal DB error after init retry: {e2}")
-            raise
+        logger.error(f"purchase page query failed: {e}")
+        invalidate_schema_gate()
+        raise
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if before is not None:
+        rows.reverse()
+    items = [p for p, _ in rows]
+    receipt_ids = {p.id for p, has in rows if has}
+    return items, int(total or 0), has_more, receipt_ids
+
+
+# Rows fetched per server-side cursor batch when streaming exports
+EXPORT_BATCH_SIZE = int(os.getenv("ADMIN_EXPORT_BATCH_SIZE", "500"))
+
+ORDERS_CSV_HEADER = [
+    "id",
+    "user_id",
+    "telegram_user_id",
+    "product_type",
+    "product_id",
+    "status",
+    "admin_action_by",
+    "admin_action_at",
+    "created_at",
+]
+
+ORDERS_XLSX_HEADER = [
+    "id",
+    "user_id",
+    "telegram_user_id",
+    "city",
+    "grade",
+    "product_type",
+    "product_id",
+    "status",
+    "payment_status",
+    "amount",
+    "discount",
+    "payment_method",
+    "transaction_id",
+    "admin_action_by",
+    "admin_action_at",
+    "created_at",
+]
+
+
+def _iter_purchase_batches(stmt):
+    """Yield lists of `(purchase, telegram_user_id, city, grade)` per server-side cursor batch.
+
+    The user columns come from an outer join in the same statement, so an export costs
+    one query regardless of its size.
+    """
+    from sqlalchemy.orm import aliased
+    from database.models_sql import Purchase, User as DBUser
+
+    # Aliased so it does not clash with the `uid` filter's join on `users`
+    buyer = aliased(DBUser)
+    stmt = stmt.add_columns(buyer.telegram_user_id, buyer.city, buyer.grade).outerjoin(
+        buyer, buyer.id == Purchase.user_id
+    )
+    with session_scope() as session:
+        result = session.execute(stmt.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        for batch in result.partitions():
+            # The identity map holds weak refs, so written-out batches are collected
+            yield [(p, tg, city or "", grade or "") for p, tg, city, grade in batch]
+
+
+def _iter_orders_csv(stmt):
+    """Blocking generator of UTF-8 CSV chunks, one per cursor batch."""
+    import csv
+    import io
+
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(ORDERS_CSV_HEADER)
+    for batch in _iter_purchase_batches(stmt):
+        for p, _tg, _city, _grade in batch:
+            writer.writerow(
+                [
+                    p.id,
+                    p.user_id,
+                    _tg,
+                    p.product_type,
+                    p.product_id,
+                    p.status,
+                    p.admin_action_by,
+                    p.admin_action_at.isoformat() if p.admin_action_at else "",
+                    p.created_at.isoformat() if p.created_at else "",
+                ]
+            )
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+
+def _iter_orders_xlsx(stmt, chunk_size=64 * 1024):
+    """Blocking generator of XLSX bytes built with openpyxl's write-only mode.
+
+    Rows are flushed to a temp file as they are appended; the finished zip (spooled to
+    disk past a few MB) is then read back in `chunk_size` pieces.
+    """
+    import tempfile
+    from openpyxl import Workbook
+    from utils.catalog import course_catalog
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("orders")
+    ws.append(ORDERS_XLSX_HEADER)
+    for batch in _iter_purchase_batches(stmt):
+        for p, _tg, _city, _grade in batch:
+            _amount = course_catalog.price(p.product_id) if p.product_type == "course" else None
+            ws.append(
+                [
+                    p.id,
+                    p.user_id,
+                    _tg,
+                    _city,
+                    _grade,
+                    p.product_type,
+                    p.product_id,
+                    p.status,
+                    p.status,
+                    _amount,
+                    None,
+                    None,
+                    None,
+                    p.admin_action_by,
+                    p.admin_action_at.isoformat() if p.admin_action_at else "",
+                    p.created_at.isoformat() if p.created_at else "",
+                ]
+            )
+    with tempfile.SpooledTemporaryFile(max_size=4 * 1024 * 1024) as out:
+        wb.save(out)
+        out.seek(0)
+        while True:
+            chunk = out.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+async def _stream_export(request, gen_fn, stmt, content_type, filename, charset=None):
+    """Send the chunks of blocking generator `gen_fn(stmt)` as a chunked `StreamResponse`."""
+    from aiohttp import web
+
+    resp = web.StreamResponse(headers={"Content-Disposition": f"attachment; filename={filename}"})
+    resp.content_type = content_type
+    if charset:
+        resp.charset = charset
+    resp.enable_chunked_encoding()
+    await resp.prepare(request)
+    try:
+        async for chunk in iterate_blocking(gen_fn, stmt):
+            await resp.write(chunk)
+    except Exception as e:
+        # Headers are already sent; the truncated body is all we can signal
+        logger.error(f"{filename} export failed mid-stream: {e}")
+        invalidate_schema_gate()
+        return resp
+    await resp.write_eof()
+    return resp
 
 
 # Command handlers
@@ -301,44 +546,55 @@ async def _ensure_admin(update: Update) -> bool:
     return True
 
 
+async def _start_segment_broadcast(update: Update, context: Any, segment, text: str) -> None:
+    """Hand `segment`'s audience stream and `text` to the background broadcast engine."""
+    from database.audience import stream_audience
+
+    # Validate message length (Telegram limit is 4096 characters)
+    if len(text) > 4000:
+        await update.effective_message.reply_text(
+            "❌ پیام خیلی طولانی است. حداکثر 4000 کاراکتر مجاز است."
+        )
+        return
+
+    manager: BroadcastManager = context.bot_data["broadcast_manager"]
+    job_id = await manager.start_broadcast(
+        context.application, update.effective_chat.id, stream_audience(segment), text
+    )
+    logger.info(f"Broadcast {job_id} queued for segment [{segment.describe() or 'all'}]")
+
+
 @rate_limit_handler("admin")
 async def broadcast_command(update: Update, context: Any) -> None:
-    """Handle /broadcast command - Admin only"""
+    """Handle /broadcast [key=value ...] <message> - Admin only
+
+    Leading filters narrow the audience: grade=, province=, city=, field=, course=<slug>,
+    buyers=any|book|course (spaces in place names are written as `_`).
+    """
     try:
         if not await _ensure_admin(update):
             return
 
-        # Broadcast to all registered users
-        from sqlalchemy import select
-        from database.models_sql import User as DBUser
-
-        with session_scope() as session:
-            rows = list(session.execute(select(DBUser)).scalars())
-        students = [{"user_id": u.telegram_user_id} for u in rows]
+        from database.audience import parse_segment_args
 
-        if not students:
-            await update.effective_message.reply_text("هیچ کاربری برای ارسال وجود ندارد.")
-            return
-
-        text = " ".join(context.args) if context.args else ""
-        if not text:
+        try:
+            segment, words = parse_segment_args(context.args or [])
+        except ValueError:
             await update.effective_message.reply_text(
-                "لطفاً متن پیام را پس از دستور وارد کنید.\n"
-                "مثال: /broadcast سلام! کلاس جدید شروع شده است."
+                "❌ مقدار buyers باید any، book یا course باشد."
             )
             return
 
-        # Validate message length (Telegram limit is 4096 characters)
-        if len(text) > 4000:
+        text = " ".join(words)
+        if not text:
             await update.effective_message.reply_text(
-                "❌ پیام خیلی طولانی است. حداکثر 4000 کاراکتر مجاز است."
+                "لطفاً متن پیام را پس از دستور وارد کنید.\n"
+                "مثال: /broadcast سلام! کلاس جدید شروع شده است.\n"
+                "فیلتر: /broadcast grade=دهم city=تهران پیام شما"
             )
             return
 
-        # Start background broadcast with progress
-        manager: BroadcastManager = context.bot_data["broadcast_manager"]
-        user_ids = [s.get("user_id") for s in students if s.get("user_id")]
-        await manager.start_broadcast(context.application, update.effective_chat.id, user_ids, text)
+        await _start_segment_broadcast(update, context, segment, text)
 
     except Exception as e:
         logger.error(f"Error in broadcast_command: {e}")
@@ -362,33 +618,9 @@ async def broadcast_grade_command(update: Update, context: Any) -> None:
             await update.effective_message.reply_text("پایه تحصیلی نامعتبر است.")
             return
 
-        from sqlalchemy import select
-        from database.models_sql import User as DBUser
-
-        with session_scope() as session:
-            rows = list(
-                session.execute(select(DBUser).where(DBUser.grade == target_grade)).scalars()
-            )
-        students = [{"user_id": u.telegram_user_id} for u in rows]
-        if not students:
-            await update.effective_message.reply_text("کاربری با این پایه یافت نشد.")
-            return
-
-        sent = 0
-        failed = 0
-        for student in students:
-            try:
-                uid = student.get("user_id")
-                if not uid:
-                    continue
-                await context.bot.send_message(chat_id=uid, text=text)
-                sent += 1
-                await asyncio.sleep(0.05)
-            except Exception:
-                failed += 1
-                continue
+        from database.audience import AudienceSegment
 
-        await update.effective_message.reply_text(f"✅ ارسال شد: {sent} | ناموفق: {failed}")
+        await _start_segment_broadcast(update, context, AudienceSegment(grade=target_grade), text)
     except Exception as e:
         logger.error(f"Error in broadcast_grade_command: {e}")
         await update.effective_message.reply_text("❌ خطا در ارسال پیام گروهی بر اساس پایه.")
@@ -413,8 +645,7 @@ async def ban_command(update: Update, context: Any) -> None:
             await update.effective_message.reply_text("فرمت درست: /ban 123456789")
             return
 
-        with session_scope() as session:
-            ok = ban_user(session, uid)
+        ok = await async_service.ban_user(uid)
         if ok:
             await update.effective_message.reply_text(f"✅ کاربر {uid} مسدود شد.")
         else:
@@ -444,8 +675,7 @@ async def unban_command(update: Update, context: Any) -> None:
             await update.effective_message.reply_text("فرمت درست: /unban 123456789")
             return
 
-        with session_scope() as session:
-            ok = unban_user(session, uid)
+        ok = await async_service.unban_user(uid)
         if ok:
             await update.effective_message.reply_text(f"✅ کاربر {uid} آزاد شد.")
         else:
@@ -510,19 +740,12 @@ async def orders_command(update: Update, context: Any) -> None:
             await update.effective_message.reply_text("فرمت: /orders [pending|approved|rejected]")
             return
 
-        notifications = context.bot_data.get("payment_notifications", {})
-        entries = [
-            (t, m)
-            for t, m in notifications.items()
-            if (
-                (status == "pending" and not m.get("processed"))
-                or (
-                    status != "pending"
-                    and m.get("processed")
-                    and m.get("decision") == ("approve" if status == "approved" else "reject")
-                )
-            )
-        ]
+        wants_csv = bool(context.args) and any(a.lower() == "csv" for a in context.args)
+        entries = await get_payment_store(context.bot_data).list(
+            status={"pending": "pending", "approved": "approve", "rejected": "reject"}[status],
+            # The CSV export covers more history than the 30-line chat summary
+            limit=(1000 if wants_csv else 30),
+        )
         if not entries:
             await update.effective_message.reply_text("موردی یافت نشد.")
             return
@@ -534,7 +757,7 @@ async def orders_command(update: Update, context: Any) -> None:
             )
         text = "\n".join(lines)
         # Optional CSV export
-        if context.args and any(a.lower() == "csv" for a in context.args):
+        if wants_csv:
             import csv, io
 
             buf = io.StringIO()
@@ -610,12 +833,6 @@ async def orders_ui_command(update: Update, context: Any) -> None:
     try:
         if not await _ensure_admin(update):
             return
-        notifications = context.bot_data.get("payment_notifications", {})
-        pending = [(t, m) for t, m in notifications.items() if not m.get("processed")]
-        if not pending:
-            await update.effective_message.reply_text("مورد در انتظاری وجود ندارد.")
-            return
-
         # Filters: page [book|course] [user_id]
         page = 0
         type_filter = "all"
@@ -629,17 +846,21 @@ async def orders_ui_command(update: Update, context: Any) -> None:
             elif arg.lower() in ("book", "course"):
                 type_filter = arg.lower()
 
-        # Apply filters
-        if type_filter in ("book", "course"):
-            pending = [(t, m) for t, m in pending if m.get("item_type") == type_filter]
-        if user_filter is not None:
-            pending = [(t, m) for t, m in pending if int(m.get("student_id", 0)) == user_filter]
-
         page_size = 5
-        ordered = list(sorted(pending, key=lambda kv: kv[1].get("created_at", 0), reverse=True))
         start = page * page_size
-        end = start + page_size
-        slice_items = ordered[start:end]
+        # One extra row tells whether a next page exists
+        entries = await get_payment_store(context.bot_data).list(
+            status="pending",
+            item_type=type_filter if type_filter in ("book", "course") else None,
+            student_id=user_filter,
+            limit=page_size + 1,
+            offset=start,
+        )
+        if not entries and page == 0:
+            await update.effective_message.reply_text("مورد در انتظاری وجود ندارد.")
+            return
+        has_next = len(entries) > page_size
+        slice_items = entries[:page_size]
 
         from telegram import InlineKeyboardMarkup, InlineKeyboardButton
 
@@ -665,7 +886,7 @@ async def orders_ui_command(update: Update, context: Any) -> None:
                     callback_data=f"orders_page:{page-1}:{type_filter}:{user_filter if user_filter is not None else '-'}",
                 )
             )
-        if end < len(ordered):
+        if has_next:
             nav.append(
                 InlineKeyboardButton(
                     "بعدی ➡️",
@@ -687,12 +908,8 @@ async def orders_ui_command(update: Update, context: Any) -> None:
 async def profile_command(update: Update, context: Any) -> None:
     """Handle /profile command"""
     try:
-        from database.db import session_scope
-        from database.models_sql import User as DBUser
-
         user_id = update.effective_user.id
-        with session_scope() as session:
-            db_user = session.query(DBUser).filter(DBUser.telegram_user_id == user_id).one_or_none()
+        db_user = await async_service.get_user_by_telegram_id(user_id)
 
         if not db_user:
             await update.message.reply_text(
@@ -828,7 +1045,7 @@ async def help_command(update: Update, context: Any) -> None:
             "**دستورات ادمین:**\n"
             "📊 `/status` - وضعیت ربات\n"
             "👥 `/students` - لیست دانش‌آموزان\n"
-            "📢 `/broadcast` - ارسال پیام همگانی\n"
+            "📢 `/broadcast [grade=… city=…]` - ارسال پیام همگانی یا گروهی\n"
             "🚫 `/ban` - مسدودسازی کاربر\n"
             "✅ `/unban` - آزادسازی کاربر\n"
             "💰 `/confirm_payment` - تایید پرداخت\n\n"
@@ -855,36 +1072,17 @@ async def help_command(update: Update, context: Any) -> None:
 @rate_limit_handler("default")
 async def daily_command(update: Update, context: Any) -> None:
     try:
-        # Send daily quiz directly (no mock), same logic as handle_daily_quiz
-        from database.db import session_scope
-        from database.models_sql import User as DBUser
-        from database.service import get_daily_question
-        from sqlalchemy import select
-        from telegram import InlineKeyboardMarkup, InlineKeyboardButton
-
-        with session_scope() as session:
-            db_user = session.execute(
-                select(DBUser).where(DBUser.telegram_user_id == update.effective_user.id)
-            ).scalar_one_or_none()
+        # Same question and keyboard as handle_daily_quiz, served from the bank
+        db_user = await get_cached_user(update.effective_user.id)
         if not db_user:
             await update.effective_message.reply_text("❌ ابتدا ثبت‌نام کنید.")
             return
-        q = None
-        with session_scope() as session:
-            q = get_daily_question(session, db_user.grade or "دهم")
+        await question_bank.ensure_loaded()
+        q = question_bank.daily(db_user.grade or "دهم")
         if not q:
             await update.effective_message.reply_text("سوال روز موجود نیست. فردا دوباره تلاش کنید.")
             return
-        choices = (q.options or {}).get("choices", [])
-        rows = [
-            [InlineKeyboardButton(text=c, callback_data=f"quiz:{q.id}:{i}")]
-            for i, c in enumerate(choices[:8])
-        ]
-        rows.append([InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_menu")])
-        await update.effective_message.reply_text(
-            f"سوال روز ({q.grade})\n\n{q.question_text}",
-            reply_markup=InlineKeyboardMarkup(rows),
-        )
+        await update.effective_message.reply_text(q.text, reply_markup=q.reply_markup)
     except Exception as e:
         logger.error(f"Error in daily_command: {e}")
         await update.message.reply_text("❌ خطا در سوال روز.")
@@ -893,19 +1091,11 @@ async def daily_command(update: Update, context: Any) -> None:
 @rate_limit_handler("default")
 async def progress_command(update: Update, context: Any) -> None:
     try:
-        from sqlalchemy import select
-        from database.models_sql import User as DBUser
-        from database.db import session_scope
-        from database.service import get_user_stats
-
-        with session_scope() as session:
-            u = session.execute(
-                select(DBUser).where(DBUser.telegram_user_id == update.effective_user.id)
-            ).scalar_one_or_none()
-            if not u:
-                await update.message.reply_text("❌ ابتدا ثبت‌نام کنید.")
-                return
-            s = get_user_stats(session, u.id)
+        u = await get_cached_user(update.effective_user.id)
+        if not u:
+            await update.message.reply_text("❌ ابتدا ثبت‌نام کنید.")
+            return
+        s = await async_service.get_user_stats(u.id)
         await update.message.reply_text(
             f"📊 پیشرفت شما:\nامتیاز: {s['points']}\nدرست‌ها: {s['total_correct']} از {s['total_attempts']}\nاستریک: {s['streak_days']} روز"
         )
@@ -914,20 +1104,34 @@ async def progress_command(update: Update, context: Any) -> None:
         await update.message.reply_text("❌ خطا در نمایش پیشرفت.")
 
 
+_LEADERBOARD_WINDOWS = {
+    "week": ("week", "این هفته"),
+    "هفته": ("week", "این هفته"),
+    "month": ("month", "این ماه"),
+    "ماه": ("month", "این ماه"),
+}
+
+
 @rate_limit_handler("default")
 async def leaderboard_command(update: Update, context: Any) -> None:
+    """Handle /leaderboard [week|month] - top 10 plus the caller's own rank"""
     try:
-        from database.db import session_scope
-        from database.service import get_leaderboard_top
-
-        with session_scope() as session:
-            top = get_leaderboard_top(session, limit=10)
+        arg = (context.args[0].lower() if getattr(context, "args", None) else "") or "all"
+        window, label = _LEADERBOARD_WINDOWS.get(arg, ("all", ""))
+        await leaderboard.ensure_loaded()
+        top = leaderboard.top(limit=10, window=window)
         if not top:
             await update.message.reply_text("هنوز جدول امتیازات خالی است.")
             return
-        lines = ["🏆 جدول امتیازات:"]
-        for i, row in enumerate(top, 1):
-            lines.append(f"{i}. {row['telegram_user_id']} — {row['points']} امتیاز")
+        lines = [f"🏆 جدول امتیازات {label}:" if label else "🏆 جدول امتیازات:"]
+        for row in top:
+            lines.append(f"{row['rank']}. {row['telegram_user_id']} — {row['points']} امتیاز")
+        u = await get_cached_user(update.effective_user.id)
+        mine = leaderboard.rank(u.id, window=window) if u else None
+        if mine:
+            lines.append(
+                f"\n📍 رتبه شما: {mine['rank']} از {mine['total']} — {mine['points']} امتیاز"
+            )
         await update.message.reply_text("\n".join(lines))
     except Exception as e:
         logger.error(f"Error in leaderboard_command: {e}")
@@ -1037,15 +1241,14 @@ async def status_command(update: Update, context: Any) -> None:
             bot_name = "Unknown"
             bot_username = "Unknown"
 
-        # Get user count from DB
+        # User and order counts from the precomputed stats snapshot
         try:
-            from sqlalchemy import select, func
-            from database.models_sql import User as DBUser
-
-            with session_scope() as session:
-                total_students = session.execute(select(func.count(DBUser.id))).scalar() or 0
-        except Exception:
-            total_students = 0
+            await stats_snapshot.ensure_loaded()
+        except Exception as e:
+            logger.warning(f"Could not load stats snapshot: {e}")
+        summary = stats_snapshot.summary()
+        total_students = summary.get("users", 0)
+        purchases = summary.get("purchases", {})
 
         # Get rate limiter stats if available
         rate_limiter_stats = {}
@@ -1060,6 +1263,11 @@ async def status_command(update: Update, context: Any) -> None:
         status_text = f"🤖 **وضعیت ربات {bot_name}**\n\n"
         status_text += f"📊 **آمار کلی:**\n"
         status_text += f"• تعداد دانش‌آموزان: {total_students}\n"
+        status_text += (
+            f"• سفارش‌ها: {purchases.get('total', 0)} "
+            f"(در انتظار {purchases.get('pending', 0)}، تایید {purchases.get('approved', 0)}، "
+            f"رد {purchases.get('rejected', 0)})\n"
+        )
         status_text += f"• نام کاربری: @{bot_username}\n"
 
         if rate_limiter_stats:
@@ -1091,20 +1299,15 @@ async def payments_audit_command(update: Update, context: Any) -> None:
         if not await _ensure_admin(update):
             return
 
-        notifications = context.bot_data.get("payment_notifications", {})
-        if not notifications:
+        # Most recent first, straight from the (created_at-indexed) store
+        entries = await get_payment_store(context.bot_data).list(limit=20)
+        if not entries:
             await update.effective_message.reply_text("هیچ پرداختی ثبت نشده است.")
             return
 
         # Build a concise audit log
         lines = ["🧾 گزارش پرداخت‌ها:"]
-        # Sort by created_at desc
-        entries = sorted(
-            notifications.items(),
-            key=lambda kv: kv[1].get("created_at", 0),
-            reverse=True,
-        )
-        for token, meta in entries[:20]:
+        for token, meta in entries:
             created = datetime.fromtimestamp(meta.get("created_at", 0)).strftime("%Y-%m-%d %H:%M")
             decided_at = (
                 datetime.fromtimestamp(meta["decided_at"]).strftime("%Y-%m-%d %H:%M")
@@ -1154,7 +1357,31 @@ async def metrics_command(update: Update, context: Any) -> None:
         for name, data in handlers.items():
             lines.append(
                 f"• {name}: {data.get('total_requests',0)} req | err {data.get('error_count',0)} | avg {data.get('avg_duration',0)}s"
+                f" (db {data.get('avg_db_duration',0)}s, api {data.get('avg_api_duration',0)}s)"
+                f" | q {data.get('avg_db_queries',0)}/{data.get('max_db_queries',0)}"
+            )
+        sql = stats.get("sql")
+        if sql:
+            pool = sql.get("pool", {})
+            checkouts = pool.get("checkouts", 0)
+            avg_wait = pool.get("wait_seconds", 0.0) / checkouts if checkouts else 0.0
+            lines.append("")
+            lines.append("🗄 پایگاه داده:")
+            lines.append(
+                f"• کوئری‌ها: {sql.get('queries', 0)} ({sql.get('query_seconds', 0)}s)"
+                f" | کند (>{sql.get('slow_threshold_ms', 0)}ms): {sql.get('slow_total', 0)}"
+            )
+            lines.append(
+                f"• استخر اتصال: {checkouts} checkout | انتظار avg {avg_wait * 1000:.1f}ms"
+                f" max {pool.get('max_wait_seconds', 0.0) * 1000:.1f}ms"
+                f" | overflow {pool.get('overflow', 0)} | timeout {pool.get('timeouts', 0)}"
+                f" | invalidated {pool.get('invalidated', 0)}"
             )
+            for row in sql.get("top", [])[:5]:
+                lines.append(
+                    f"• {row['count']}× {row['total_seconds']}s (max {row['max_seconds']}s):"
+                    f" {row['fingerprint'][:80]}"
+                )
         # CSV export if requested
         if context.args and any(a.lower() == "csv" for a in context.args):
             import csv, io
@@ -1165,7 +1392,18 @@ async def metrics_command(update: Update, context: Any) -> None:
             for k, v in counters.items():
                 writer.writerow([k, v])
             writer.writerow([])
-            writer.writerow(["handler", "total_requests", "error_count", "avg_duration"])
+            writer.writerow(
+                [
+                    "handler",
+                    "total_requests",
+                    "error_count",
+                    "avg_duration",
+                    "avg_db_duration",
+                    "avg_api_duration",
+                    "avg_db_queries",
+                    "max_db_queries",
+                ]
+            )
             for name, data in handlers.items():
                 writer.writerow(
                     [
@@ -1173,8 +1411,19 @@ async def metrics_command(update: Update, context: Any) -> None:
                         data.get("total_requests", 0),
                         data.get("error_count", 0),
                         data.get("avg_duration", 0),
+                        data.get("avg_db_duration", 0),
+                        data.get("avg_api_duration", 0),
+                        data.get("avg_db_queries", 0),
+                        data.get("max_db_queries", 0),
                     ]
                 )
+            if sql:
+                writer.writerow([])
+                writer.writerow(["fingerprint", "count", "total_seconds", "max_seconds"])
+                for row in sql.get("top", []):
+                    writer.writerow(
+                        [row["fingerprint"], row["count"], row["total_seconds"], row["max_seconds"]]
+                    )
             buf.seek(0)
             await update.effective_message.reply_document(
                 document=io.BytesIO(buf.getvalue().encode("utf-8")),
@@ -1195,13 +1444,16 @@ async def setup_handlers(application: Application) -> None:
         async def block_banned_messages(update: Update, context: Any) -> None:
             try:
                 user_id = update.effective_user.id if update and update.effective_user else 0
-                with session_scope() as session:
-                    banned = is_user_banned(session, user_id)
-                if banned:
+                # O(1) in-process lookup; the set is loaded once and kept in sync by
+                # ban/unban, periodic re-sync and (on Postgres) LISTEN/NOTIFY
+                await ban_registry.ensure_loaded()
+                if ban_registry.is_banned(user_id):
                     if update.effective_message:
                         await update.effective_message.reply_text("⛔️ دسترسی شما محدود شده است.")
                     # Stop further handler processing for this update
                     raise ApplicationHandlerStop()
+            except ApplicationHandlerStop:
+                raise
             except Exception as e:
                 logger.error(f"Error in block_banned_messages: {e}")
 
@@ -1234,8 +1486,11 @@ async def setup_handlers(application: Application) -> None:
         application.add_handler(CommandHandler("user_search", user_search_command), group=1)
         application.add_handler(CommandHandler("orders_ui", orders_ui_command), group=1)
 
+        # Conversation state survives restarts when the application has a persistence
+        persistent = getattr(application, "persistence", None) is not None
+
         # Add conversation handlers
-        registration_conv = build_registration_conversation()
+        registration_conv = build_registration_conversation(persistent=persistent)
         if registration_conv:
             application.add_handler(registration_conv, group=1)
 
@@ -1250,7 +1505,7 @@ async def setup_handlers(application: Application) -> None:
             application.add_handler(handler, group=1)
 
         # Add book handlers
-        book_handlers = build_book_purchase_conversation()
+        book_handlers = build_book_purchase_conversation(persistent=persistent)
         if book_handlers:
             application.add_handler(book_handlers, group=1)
 
@@ -1335,6 +1590,10 @@ async def setup_handlers(application: Application) -> None:
             CallbackQueryHandler(show_book_info, pattern="^book_info$"), group=1
         )
 
+        # Record duration, outcome and SQL / Bot API time of every handler call
+        instrumented = instrument_application(application)
+        logger.info(f"⏱️ Instrumented {instrumented} handler callbacks")
+
         # Add error handler
         application.add_error_handler(ptb_error_handler)
 
@@ -1356,6 +1615,10 @@ async def run_webhook_mode(application: Application) -> None:
             config.webhook.url or ""
         )
 
+        # Webhook requests are acked once queued; workers run them in order per chat
+        update_dispatcher = UpdateDispatcher(application.process_update)
+        application.bot_data["update_dispatcher"] = update_dispatcher
+
         # Create web application with optional compression/security middleware (disable in tests)
         @web.middleware
         async def safe_middleware(request, handler):
@@ -1443,6 +1706,39 @@ async def run_webhook_mode(application: Application) -> None:
             except Exception as e:
                 return web.json_response({"db": "error", "error": str(e)}, status=500)
 
+        # Prometheus scrape endpoint: requires "Authorization: Bearer <METRICS_TOKEN>" and
+        # stays closed (401) while METRICS_TOKEN is unset
+        async def metrics_endpoint(request):
+            from utils.cache import cache_manager
+            from utils.metrics_export import CONTENT_TYPE, iter_metrics
+            from utils.performance_monitor import monitor
+
+            expected = os.getenv("METRICS_TOKEN", "").strip()
+            supplied = request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+            if not expected or not hmac.compare_digest(supplied.encode(), expected.encode()):
+                return web.Response(status=401, text="unauthorized")
+            try:
+                from database.db import ENGINE as _engine, QUERY_TELEMETRY as _queries
+            except Exception:
+                _engine = _queries = None
+            caches = dict(cache_manager.caches)
+            caches.setdefault("default", cache_manager._default_cache)
+            resp = web.StreamResponse(headers={"Content-Type": CONTENT_TYPE})
+            await resp.prepare(request)
+            # One family per write: the loop keeps serving updates between chunks
+            for chunk in iter_metrics(
+                monitor=monitor,
+                multi_limiter=multi_rate_limiter,
+                caches=caches,
+                engine=_engine,
+                broadcast_manager=application.bot_data.get("broadcast_manager"),
+                update_dispatcher=update_dispatcher,
+                query_telemetry=_queries,
+            ):
+                await resp.write(chunk.encode("utf-8"))
+            await resp.write_eof()
+            return resp
+
         # Telegram webhook endpoint
         async def telegram_webhook(request):
             if request.method != "POST":
@@ -1471,13 +1767,10 @@ async def run_webhook_mode(application: Application) -> None:
                     logger.warning("Empty webhook data received")
                     return web.Response(status=400)
 
-                # Process update (ensure DB schema at start of bursts)
-                try:
-                    from database.migrate import init_db
-
-                    init_db()
-                except Exception as _e:
-                    logger.debug(f"init_db() best-effort failed: {_e}")
+                # Schema readiness is checked once at startup; only re-check (off-loop)
+                # if the watchdog or a failed query re-opened the gate
+                if not schema_ready():
+                    await run_blocking(ensure_schema_ready)
                 update = Update.de_json(data, application.bot)
                 # Avoid logging raw user content to protect sensitive data
                 try:
@@ -1491,7 +1784,10 @@ async def run_webhook_mode(application: Application) -> None:
                         )
                 except Exception as _e:
                     logger.debug(f"log update meta failed: {_e}")
-                await application.process_update(update)
+                if not update_dispatcher.submit(update):
+                    # Queue full (or shutting down): Telegram redelivers on non-2xx
+                    logger.warning(f"Update queue full at depth {update_dispatcher.depth}")
+                    return web.Response(status=503, headers={"Retry-After": "1"})
                 return web.json_response({"ok": True})
             except json.JSONDecodeError as e:
                 logger.error(f"Invalid JSON in webhook: {e}")
@@ -1530,12 +1826,7 @@ async def run_webhook_mode(application: Application) -> None:
                 if token_ok is None:
                     return web.Response(status=401, text="unauthorized")
                 from sqlalchemy import select
-                from database.db import session_scope
                 from database.models_sql import Purchase, User as DBUser
-                from database.service import (
-                    get_stats_summary,
-                    list_stale_pending_purchases,
-                )
                 import secrets
 
                 f = _parse_admin_filters(request)
@@ -1555,17 +1846,58 @@ async def run_webhook_mode(application: Application) -> None:
                     stmt = stmt.join(DBUser, DBUser.id == Purchase.user_id).where(
                         DBUser.telegram_user_id == f["uid"]
                     )
-                stmt = stmt.order_by(Purchase.created_at.desc())
+
+                accept = request.headers.get("Accept", "").lower()
+                wants_csv = f["fmt"] == "csv" or ("text/csv" in accept)
+                ordered = stmt.order_by(Purchase.created_at.desc(), Purchase.id.desc())
+                if wants_csv:
+                    return await _stream_export(
+                        request,
+                        _iter_orders_csv,
+                        ordered,
+                        "text/csv",
+                        f"orders_{f['status'] or 'all'}.csv",
+                        charset="utf-8",
+                    )
+
+                # XLSX export
+                if f["fmt"] == "xlsx":
+                    try:
+                        import openpyxl  # noqa: F401
+                    except Exception as e:
+                        logger.error(f"xlsx export failed: {e}")
+                        return web.Response(status=500, text="xlsx error")
+                    return await _stream_export(
+                        request,
+                        _iter_orders_xlsx,
+                        ordered,
+                        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                        f"orders_{f['status'] or 'all'}.xlsx",
+                    )
 
                 try:
-                    items = _query_purchases_filtered(stmt)
+                    slice_items, total, has_more, receipt_ids = await run_blocking(
+                        _query_purchases_page,
+                        stmt,
+                        f["page"],
+                        f["page_size"],
+                        f["after"],
+                        f["before"],
+                    )
                 except Exception as e:
                     logger.error(f"admin_list purchases query failed: {e}")
                     return web.Response(status=500, text="server error")
 
-                total = len(items)
-                start = f["page"] * f["page_size"]
-                slice_items = items[start : start + f["page_size"]]
+                next_cursor = (
+                    _encode_admin_cursor(slice_items[-1].created_at, slice_items[-1].id)
+                    if slice_items and (has_more or f["before"] is not None)
+                    else None
+                )
+                prev_cursor = (
+                    _encode_admin_cursor(slice_items[0].created_at, slice_items[0].id)
+                    if slice_items and f["page"] > 0
+                    else None
+                )
                 rows = []
                 for p in slice_items:
                     rows.append(
@@ -1575,6 +1907,7 @@ async def run_webhook_mode(application: Application) -> None:
                             "type": p.product_type,
                             "product": p.product_id,
                             "status": p.status,
+                            "has_receipt": p.id in receipt_ids,
                             "created_at": (
                                 getattr(p, "created_at", None).isoformat()
                                 if getattr(p, "created_at", None)
@@ -1583,207 +1916,12 @@ async def run_webhook_mode(application: Application) -> None:
                         }
                     )
 
-                accept = request.headers.get("Accept", "").lower()
-                wants_csv = f["fmt"] == "csv" or ("text/csv" in accept)
-                if wants_csv:
-                    import csv, io
-
-                    # Map internal user_id -> telegram_user_id for simple CSV export
-                    try:
-                        user_ids = {getattr(p, "user_id", None) for p in items}
-                        user_ids.discard(None)
-                        tg_map = {}
-                        if user_ids:
-                            from sqlalchemy import select as _select
-                            from database.models_sql import User as _User
-
-                            with session_scope() as _s:
-                                for _id, _tg in _s.execute(
-                                    _select(_User.id, _User.telegram_user_id).where(
-                                        _User.id.in_(list(user_ids))
-                                    )
-                                ):
-                                    tg_map[int(_id)] = int(_tg)
-                    except Exception:
-                        tg_map = {}
-
-                    buf = io.StringIO()
-                    writer = csv.writer(buf)
-                    # Simple header expected by tests
-                    writer.writerow(
-                        [
-                            "id",
-                            "user_id",
-                            "telegram_user_id",
-                            "product_type",
-                            "product_id",
-                            "status",
-                            "admin_action_by",
-                            "admin_action_at",
-                            "created_at",
-                        ]
-                    )
-                    for p in items:
-                        _uid = getattr(p, "user_id", None)
-                        _tg = tg_map.get(_uid, None)
-                        writer.writerow(
-                            [
-                                getattr(p, "id", None),
-                                _uid,
-                                _tg,
-                                getattr(p, "product_type", None),
-                                getattr(p, "product_id", None),
-                                getattr(p, "status", None),
-                                getattr(p, "admin_action_by", None),
-                                (
-                                    p.admin_action_at.isoformat()
-                                    if getattr(p, "admin_action_at", None)
-                                    else ""
-                                ),
-                                (
-                                    p.created_at.isoformat()
-                                    if getattr(p, "created_at", None)
-                                    else ""
-                                ),
-                            ]
-                        )
-                    csv_bytes = buf.getvalue().encode("utf-8")
-                    return web.Response(
-                        body=csv_bytes,
-                        content_type="text/csv",
-                        headers={
-                            "Content-Disposition": f"attachment; filename=orders_{f['status'] or 'all'}.csv"
-                        },
-                        charset="utf-8",
-                    )
-
-                # XLSX export
-                if f["fmt"] == "xlsx":
-                    try:
-                        import io
-                        from openpyxl import Workbook
-
-                        # Map internal user_id -> telegram_user_id and demographics for richer exports
-                        try:
-                            user_ids = {getattr(p, "user_id", None) for p in items}
-                            user_ids.discard(None)
-                            tg_map = {}
-                            user_demo = {}
-                            if user_ids:
-                                from sqlalchemy import select as _select
-                                from database.models_sql import User as _User
-
-                                with session_scope() as _s:
-                                    for _id, _tg, _city, _grade in _s.execute(
-                                        _select(
-                                            _User.id,
-                                            _User.telegram_user_id,
-                                            _User.city,
-                                            _User.grade,
-                                        ).where(_User.id.in_(list(user_ids)))
-                                    ):
-                                        tg_map[int(_id)] = int(_tg)
-                                        user_demo[int(_id)] = {
-                                            "city": _city or "",
-                                            "grade": _grade or "",
-                                        }
-                        except Exception:
-                            tg_map = {}
-                            user_demo = {}
-
-                        # Load course price map (best-effort)
-                        course_price = {}
-                        try:
-                            import json as _json
-
-                            with open("data/courses.json", "r", encoding="utf-8") as _f:
-                                _all = _json.load(_f)
-                            for c in _all or []:
-                                slug = c.get("course_id") or c.get("slug")
-                                if slug:
-                                    course_price[slug] = c.get("price")
-                        except Exception:
-                            course_price = {}
-
-                        wb = Workbook()
-                        ws = wb.active
-                        ws.title = "orders"
-                        ws.append(
-                            [
-                                "id",
-                                "user_id",
-                                "telegram_user_id",
-                                "city",
-                                "grade",
-                                "product_type",
-                                "product_id",
-                                "status",
-                                "payment_status",
-                                "amount",
-                                "discount",
-                                "payment_method",
-                                "transaction_id",
-                                "admin_action_by",
-                                "admin_action_at",
-                                "created_at",
-                            ]
-                        )
-                        for p in items:
-                            _uid = getattr(p, "user_id", None)
-                            _tg = tg_map.get(_uid, None)
-                            _demo = user_demo.get(_uid, {"city": "", "grade": ""})
-                            _amount = None
-                            _discount = None
-                            if getattr(p, "product_type", None) == "course":
-                                _amount = course_price.get(getattr(p, "product_id", ""))
-                            _payment_status = getattr(p, "status", None)
-                            _payment_method = None
-                            _transaction_id = None
-                            ws.append(
-                                [
-                                    getattr(p, "id", None),
-                                    _uid,
-                                    _tg,
-                                    _demo.get("city"),
-                                    _demo.get("grade"),
-                                    getattr(p, "product_type", None),
-                                    getattr(p, "product_id", None),
-                                    getattr(p, "status", None),
-                                    _payment_status,
-                                    _amount,
-                                    _discount,
-                                    _payment_method,
-                                    _transaction_id,
-                                    getattr(p, "admin_action_by", None),
-                                    (
-                                        p.admin_action_at.isoformat()
-                                        if getattr(p, "admin_action_at", None)
-                                        else ""
-                                    ),
-                                    (
-                                        p.created_at.isoformat()
-                                        if getattr(p, "created_at", None)
-                                        else ""
-                                    ),
-                                ]
-                            )
-                        bio = io.BytesIO()
-                        wb.save(bio)
-                        bio.seek(0)
-                        return web.Response(
-                            body=bio.getvalue(),
-                            content_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                            headers={
-                                "Content-Disposition": f"attachment; filename=orders_{f['status'] or 'all'}.xlsx"
-                            },
-                        )
-                    except Exception as e:
-                        logger.error(f"xlsx export failed: {e}")
-                        return web.Response(status=500, text="xlsx error")
-
                 if f["fmt"] == "html" or "text/html" in accept or accept in ("", "*/*"):
                     qbase = f"/admin?token={(os.getenv('ADMIN_DASHBOARD_TOKEN') or config.bot.admin_dashboard_token)}"
 
+                    cur_after = _encode_admin_cursor(*f["after"]) if f["after"] else None
+                    cur_before = _encode_admin_cursor(*f["before"]) if f["before"] else None
+
                     def _qs(**kw):
                         return _build_admin_qs(
                             qbase,
@@ -1795,8 +1933,17 @@ async def run_webhook_mode(application: Application) -> None:
                             f["to_str"],
                             f["page_size"],
                             kw.get("page", f["page"]),
+                            kw.get("after"),
+                            kw.get("before"),
                         )
 
+                    # Header counters come from the precomputed snapshot, not a live aggregate
+                    try:
+                        await stats_snapshot.ensure_loaded()
+                    except Exception as e:
+                        logger.warning(f"admin_list stats snapshot unavailable: {e}")
+                    stats = stats_snapshot.summary()
+
                     csrf_value = request.cookies.get("csrf")
                     if not csrf_value or len(csrf_value) < 16:
                         csrf_value = secrets.token_urlsafe(32)
@@ -1859,25 +2006,6 @@ async def run_webhook_mode(application: Application) -> None:
                     def _ui_t(key: str, default: str) -> str:
                         return _ui.get(key, default)
 
-                    # Add receipt indicator via subquery (best-effort)
-                    from sqlalchemy import select as _select
-                    from database.db import session_scope as _sess
-                    from database.models_sql import Receipt as _Receipt
-
-                    receipt_ids = set()
-                    try:
-                        with _sess() as _s:
-                            for rr in rows:
-                                rid = _s.execute(
-                                    _select(_Receipt.id)
-                                    .where(_Receipt.purchase_id == rr["id"])
-                                    .limit(1)
-                                ).scalar()
-                                if rid:
-                                    receipt_ids.add(rr["id"])
-                    except Exception:
-                        pass
-
                     def _receipt_badge(rid: int) -> str:
                         if rid in receipt_ids:
                             # Link to Telegram file via deep-link is not possible; show icon only
@@ -1901,7 +2029,7 @@ async def run_webhook_mode(application: Application) -> None:
                         f"<input type='hidden' name='id' value='{r['id']}'/>"
                         f"<input type='hidden' name='action' value='approve'/>"
                         f"<input type='hidden' name='csrf' value='{csrf_value}'/>"
-                        f"<input type='hidden' name='redirect' value='{_qs(page=f['page'])}'/>"
+                        f"<input type='hidden' name='redirect' value='{_qs(page=f['page'], after=cur_after, before=cur_before)}'/>"
                         f"<select name='payment_method' title='روش پرداخت را انتخاب کنید' class='pm'>{_method_opts}</select>"
                         f"<input class='tx' type='text' name='transaction_id' placeholder='شناسه تراکنش' title='شناسه تراکنش (در صورت وجود)'/>"
                         f"<input class='dc' type='number' name='discount' placeholder='تخفیف' title='مبلغ تخفیف (اختیاری)'/>"
@@ -1912,7 +2040,7 @@ async def run_webhook_mode(application: Application) -> None:
                         f"<input type='hidden' name='id' value='{r['id']}'/>"
                         f"<input type='hidden' name='action' value='reject'/>"
                         f"<input type='hidden' name='csrf' value='{csrf_value}'/>"
-                        f"<input type='hidden' name='redirect' value='{_qs(page=f['page'])}'/>"
+                        f"<input type='hidden' name='redirect' value='{_qs(page=f['page'], after=cur_after, before=cur_before)}'/>"
                         f"<button class='btn reject' type='submit'>{_ui_t('reject_button','رد')}</button>"
                         f"</form>"
                         f"</td>"
@@ -1920,6 +2048,14 @@ async def run_webhook_mode(application: Application) -> None:
                         for r in rows
                     )
 
+                    # Only offer "next" when another page exists
+                    next_link = (
+                        f"<a href='{_qs(page=f['page'] + 1, after=next_cursor)}'>"
+                        f"{_ui_t('next', 'بعدی')}</a>"
+                        if next_cursor
+                        else ""
+                    )
+
                     resp_html = f"""
 <html>
 <head>
@@ -1947,11 +2083,15 @@ th{{background:#0d1117;color:#c9d1d9;}}
 .rcpt.no{{color:#8b949e;}}
 .filters{{display:flex;gap:8px;flex-wrap:wrap;margin:12px 0;}}
 .filters .chip{{background:#0d1117;border:1px solid #30363d;border-radius:999px;padding:6px 10px;}}
+.pager{{display:flex;gap:12px;justify-content:center;margin-top:12px;color:#8b949e;}}
+.pager a{{color:#58a6ff;text-decoration:none;}}
+.meta{{color:#8b949e;font-size:13px;}}
 </style>
 </head>
 <body>
   <div class='container'>
     <h2 style='margin-top:0'>{_ui_t('admin_title','مدیریت سفارش‌ها')}</h2>
+    <div class='meta'>{_ui_t('users','کاربران')}: {stats.get('users',0)} | {_ui_t('orders','سفارش‌ها')}: {_ui_t('total','کل')} {stats['purchases'].get('total',0)}، {_ui_t('pending','در انتظار')} {stats['purchases'].get('pending',0)}، {_ui_t('status_approved','تایید شده')} {stats['purchases'].get('approved',0)}، {_ui_t('status_rejected','رد شده')} {stats['purchases'].get('rejected',0)}</div>
     {flash_html}
     <form method='GET' action='/admin' class='controls'>
       <input type='hidden' name='token' value='{config.bot.admin_dashboard_token}' />
@@ -1976,8 +2116,8 @@ th{{background:#0d1117;color:#c9d1d9;}}
         <span class='chip'>از: <input type='date' name='from' value='{f['from_str']}' /></span>
         <span class='chip'>تا: <input type='date' name='to' value='{f['to_str']}' /></span>
         <button class='btn' type='submit'>جستجو</button>
-        <a class='btn' style='background:#1f6feb;text-decoration:none' href='{_qs(page=0)}&fmt=csv'>CSV</a>
-        <a class='btn' style='background:#a371f7;text-decoration:none' href='{_qs(page=0)}&fmt=xlsx'>XLSX</a>
+        <a class='btn' style='background:#1f6feb;text-decoration:none' href='{_qs(page=0)}&format=csv'>CSV</a>
+        <a class='btn' style='background:#a371f7;text-decoration:none' href='{_qs(page=0)}&format=xlsx'>XLSX</a>
       </div>
     </form>
     <table>
@@ -1990,196 +2130,17 @@ th{{background:#0d1117;color:#c9d1d9;}}
         {html_rows}
       </tbody>
     </table>
+    <div class='pager'>
+      <a href='{_qs(page=max(0, f['page']-1), before=prev_cursor)}'>{_ui_t('prev','قبلی')}</a>
+      <span>{_ui_t('results_total','مجموع نتایج')}: {total} | {_ui_t('page','صفحه')}: {f['page']+1}</span>
+      {next_link}
+    </div>
   </div>
 </body>
 </html>
 """
                     return web.Response(text=resp_html, content_type="text/html", charset="utf-8")
 
-                    # Stats summary (top)
-                    try:
-                        with session_scope() as session:
-                            stats = get_stats_summary(session)
-                            stale = list_stale_pending_purchases(session, older_than_days=14)
-                    except Exception:
-                        stats = {
-                            "users": 0,
-                            "purchases": {},
-                            "grades": [],
-                            "cities_top": [],
-                        }
-                        stale = []
-                    # i18n for admin UI labels
-                    _ui = {}
-                    try:
-                        _ui = dict(config.bot.admin_ui_labels or {})
-                    except Exception:
-                        _ui = {}
-
-                    def _ui_t(key: str, default: str) -> str:
-                        return _ui.get(key, default)
-
-                    stats_html = (
-                        f"<div class='meta'>{_ui_t('users','کاربران')}: {stats.get('users',0)} | "
-                        f"{_ui_t('orders','سفارش‌ها')}: {_ui_t('total','کل')} {stats.get('purchases',{}).get('total',0)}، "
-                        f"{_ui_t('pending','در انتظار')} {stats.get('purchases',{}).get('pending',0)}</div>"
-                    )
-                    stale_html = ""
-                    if stale:
-                        stale_html = (
-                            f"<details><summary>{_ui_t('stale_pending','در انتظارهای قدیمی')} (14+ روز)</summary><ul>"
-                            + "".join(
-                                f"<li>#{s['purchase_id']} | u={s['user_id']} | {s['product_type']}:{s['product_id']} | {s['created_at']}</li>"
-                                for s in stale[:20]
-                            )
-                            + "</ul></details>"
-                        )
-                    body = f"""
-                    <html>
-                    <head>
-                      <meta charset='utf-8'>
-                      <title>{_ui_t('admin_title','مدیریت سفارش‌ها')}</title>
-                       <style>
-                        body {{ font-family: Vazirmatn, tahoma, sans-serif; margin: 24px; background:#f8fafc; color:#0f172a; }}
-                        h3 {{ margin-top:0; }}
-                        .panel {{ background:#fff; border:1px solid #e2e8f0; border-radius:8px; padding:16px; box-shadow:0 1px 2px rgba(0,0,0,0.04); }}
-                        table {{ width:100%; border-collapse:collapse; margin-top:12px; }}
-                        th, td {{ border-bottom:1px solid #e2e8f0; padding:8px 10px; text-align:left; }}
-                        th {{ background:#f1f5f9; font-weight:600; }}
-                        .controls {{ display:flex; gap:8px; margin:10px 0; align-items:center; flex-wrap:wrap; }}
-                        input, select {{ padding:6px 8px; border:1px solid #cbd5e1; border-radius:6px; }}
-                        input[type='text']{{ width:180px; }}
-                        .btn {{ padding:6px 10px; border-radius:6px; text-decoration:none; color:#fff; margin-right:6px; border:none; cursor:pointer; }}
-                        .approve {{ background:#16a34a; }}
-                        .reject {{ background:#dc2626; }}
-                        .filter {{ background:#2563eb; }}
-                        .csv {{ background:#0f766e; }}
-                        .pager a {{ margin:0 6px; text-decoration:none; color:#2563eb; }}
-                        .badge {{ padding:2px 8px; border-radius:999px; font-size:12px; color:#fff; }}
-                        .badge.pending {{ background:#ea580c; }}
-                        .badge.approved {{ background:#16a34a; }}
-                        .badge.rejected {{ background:#dc2626; }}
-                        .meta {{ color:#475569; font-size:13px; }}
-                         .flash {{ padding:10px 12px; border-radius:6px; margin-bottom:12px; }}
-                         .flash.success {{ background:#ecfdf5; color:#065f46; border:1px solid #a7f3d0; }}
-                         .flash.error {{ background:#fef2f2; color:#991b1b; border:1px solid #fecaca; }}
-                      </style>
-                    </head>
-                    <body>
-                      <div class='panel'>
-                        {flash_html}
-                         <h3>{_ui_t('orders','سفارش‌ها')} ({f['status']})</h3>
-                        {stats_html}
-                        <form method='GET' action='/admin' class='controls'>
-                          <input type='hidden' name='token' value='{config.bot.admin_dashboard_token}' />
-                          <label>{_ui_t('status_label','وضعیت:')}
-                            <select name='status'>
-                              <option value='' {'selected' if not f['status'] else ''}>{_ui_t('status_all','همه')}</option>
-                              <option value='pending' {'selected' if f['status']=='pending' else ''}>{_ui_t('status_pending','در انتظار')}</option>
-                              <option value='approved' {'selected' if f['status']=='approved' else ''}>{_ui_t('status_approved','تایید شده')}</option>
-                              <option value='rejected' {'selected' if f['status']=='rejected' else ''}>{_ui_t('status_rejected','رد شده')}</option>
-                            </select>
-                          </label>
-                          <label>{_ui_t('type_label','نوع:')}
-                            <select name='type'>
-                              <option value='' {'selected' if not f['ptype'] else ''}>{_ui_t('type_all','همه')}</option>
-                              <option value='course' {'selected' if f['ptype']=='course' else ''}>{_ui_t('type_course','دوره')}</option>
-                              <option value='book' {'selected' if f['ptype']=='book' else ''}>{_ui_t('type_book','کتاب')}</option>
-                            </select>
-                          </label>
-                          <label>{_ui_t('uid_label','شناسه کاربر:')}
-                            <input id='uid' name='uid' value='{f['uid_str']}' placeholder='{_ui_t('uid_placeholder','شناسه تلگرام')}' />
-                          </label>
-                          <label>{_ui_t('product_label','محصول:')}
-                            <input id='product' name='product' value='{f['product_q']}' placeholder='{_ui_t('product_placeholder','عنوان/شناسه')}' />
-                          </label>
-                          <label>{_ui_t('from_label','از:')}
-                            <input type='date' name='from' value='{f['from_str']}' />
-                          </label>
-                          <label>{_ui_t('to_label','تا:')}
-                            <input type='date' name='to' value='{f['to_str']}' />
-                          </label>
-                          <label>{_ui_t('page_size_label','سایز صفحه:')}
-                            <input type='number' min='1' max='100' name='size' value='{f['page_size']}' />
-                          </label>
-                          <button class='btn filter' type='submit'>{_ui_t('filter_button','اعمال فیلتر')}</button>
-                          <a class='btn csv' href='{_qs(page=0)}&format=csv'>{_ui_t('csv_button_label','CSV')}</a>
-                        </form>
-                        <div class='meta'>
-                           {_ui_t('results_total','مجموع نتایج')}: {total} | {_ui_t('page','صفحه')}: {f['page']+1}
-                        </div>
-                        <table>
-                          <thead>
-                            <tr>
-                              <th>{_ui_t('th_id','شناسه')}</th>
-                              <th>{_ui_t('th_user','کاربر')}</th>
-                              <th>{_ui_t('th_type','نوع')}</th>
-                              <th>{_ui_t('th_product','محصول')}</th>
-                              <th>{_ui_t('th_created','ایجاد')}</th>
-                              <th>{_ui_t('th_status','وضعیت')}</th>
-                              <th>{_ui_t('th_action','اقدام')}</th>
-                            </tr>
-                          </thead>
-                          <tbody>{html_rows or f"<tr><td colspan=6>{_ui_t('not_found','موردی یافت نشد')}</td></tr>"}</tbody>
-                        </table>
-                        <div class='pager'>
-                          <a href='{_qs(page=max(0, f['page']-1))}'>{_ui_t('prev','قبلی')}</a>
-                          |
-                          <a href='{_qs(page=f['page']+1)}'>{_ui_t('next','بعدی')}</a>
-                        </div>
-                        <div class='controls' style='margin-top:10px;'>
-                          <a class='btn csv' href='{_qs(page=0)}&format=csv'>{_ui_t('csv_button_label','CSV')}</a>
-                          <a class='btn filter' href='{_qs(page=0)}&format=xlsx'>{_ui_t('xlsx_button_label','XLSX')}</a>
-                        </div>
-                        {stale_html}
-                      </div>
-                      <script>
-                        const form = document.querySelector('form.controls');
-                        const uidInput = document.getElementById('uid');
-                        const productInput = document.getElementById('product');
-                        let t1=null, t2=null;
-                        uidInput && uidInput.addEventListener('input', ()=>{{ clearTimeout(t1); t1=setTimeout(()=>form.submit(), 550); }});
-                        productInput && productInput.addEventListener('input', ()=>{{ clearTimeout(t2); t2=setTimeout(()=>form.submit(), 550); }});
-                      </script>
-                    </body></html>
-                    """
-                    resp = web.Response(text=body, content_type="text/html", charset="utf-8")
-
-                    # Clear flash cookies after displaying them
-                    if flash_msg:
-                        try:
-                            resp.delete_cookie("flash", path="/")
-                            resp.delete_cookie("flash_type", path="/")
-                        except Exception:
-                            pass
-
-                    try:
-                        resp.set_cookie(
-                            "csrf",
-                            csrf_value,
-                            max_age=3600,
-                            path="/",
-                            secure=_cookie_secure(request),
-                            httponly=False,
-                            samesite="Lax",
-                        )
-                        # Redundant headers to help strict cookie jars in test environments
-                        try:
-                            # Basic cookie without domain restriction for test environments
-                            resp.headers.add(
-                                "Set-Cookie", f"csrf={csrf_value}; Path=/; Max-Age=3600; HttpOnly"
-                            )
-                            # Additional cookie with explicit localhost domain for aiohttp jar capture
-                            resp.headers.add(
-                                "Set-Cookie",
-                                f"csrf={csrf_value}; Path=/; Max-Age=3600; Domain=127.0.0.1; HttpOnly",
-                            )
-                        except Exception:
-                            pass
-                    except Exception:
-                        pass
-                    return resp
-
                 # Default to JSON when explicitly requested
                 if f["fmt"] == "json" or "application/json" in accept:
                     return web.json_response(
@@ -2193,6 +2154,8 @@ th{{background:#0d1117;color:#c9d1d9;}}
                             "page": f["page"],
                             "page_size": f["page_size"],
                             "total": total,
+                            "next_cursor": next_cursor,
+                            "prev_cursor": prev_cursor,
                             "items": rows,
                         }
                     )
@@ -2265,25 +2228,9 @@ th{{background:#0d1117;color:#c9d1d9;}}
                         if not result:
                             return web.Response(status=409, text="conflict")
                 except Exception as e:
-                    try:
-                        logger.warning(f"admin_act query failed, attempting DB init: {e}")
-                        from database.migrate import init_db
-
-                        init_db()
-                        with session_scope() as session:
-                            db_purchase = session.execute(
-                                select(Purchase).where(Purchase.id == pid)
-                            ).scalar_one_or_none()
-                            if not db_purchase or db_purchase.status != "pending":
-                                return web.Response(status=404, text="not found or already decided")
-                            result = approve_or_reject_purchase(
-                                session, db_purchase.id, admin_id, action
-                            )
-                            if not result:
-                                return web.Response(status=409, text="conflict")
-                    except Exception as e2:
-                        logger.error(f"admin_act fatal DB error after init retry: {e2}")
-                        return web.Response(status=500, text="server error")
+                    logger.error(f"admin_act DB error: {e}")
+                    invalidate_schema_gate()
+                    return web.Response(status=500, text="server error")
 
                 # Try to notify student and admins asynchronously (fire-and-forget)
                 try:
@@ -2392,48 +2339,32 @@ th{{background:#0d1117;color:#c9d1d9;}}
                         if not result:
                             return web.Response(status=409, text="conflict")
                 except Exception as e:
-                    try:
-                        logger.warning(f"admin_act_post query failed, attempting DB init: {e}")
-                        from database.migrate import init_db
-
-                        init_db()
-                        with session_scope() as session:
-                            db_purchase = session.execute(
-                                select(Purchase).where(Purchase.id == pid)
-                            ).scalar_one_or_none()
-                            if not db_purchase or db_purchase.status != "pending":
-                                return web.Response(status=404, text="not found or already decided")
-                            result = approve_or_reject_purchase(
-                                session, db_purchase.id, admin_id, action
+                    logger.error(f"admin_act_post DB error: {e}")
+                    invalidate_schema_gate()
+                    # Redirect back with error if possible
+                    if redirect_to:
+                        resp = web.HTTPSeeOther(location=redirect_to)
+                        try:
+                            resp.set_cookie(
+                                "flash",
+                                _ui_t("flash_error", "خطا در انجام عملیات"),
+                                max_age=10,
+                                path="/",
+                                secure=str(config.webhook.url).startswith("https://"),
+                                samesite="Strict",
                             )
-                            if not result:
-                                return web.Response(status=409, text="conflict")
-                    except Exception as e2:
-                        logger.error(f"admin_act_post fatal DB error after init retry: {e2}")
-                        # Redirect back with error if possible
-                        if redirect_to:
-                            resp = web.HTTPSeeOther(location=redirect_to)
-                            try:
-                                resp.set_cookie(
-                                    "flash",
-                                    _ui_t("flash_error", "خطا در انجام عملیات"),
-                                    max_age=10,
-                                    path="/",
-                                    secure=str(config.webhook.url).startswith("https://"),
-                                    samesite="Strict",
-                                )
-                                resp.set_cookie(
-                                    "flash_type",
-                                    "error",
-                                    max_age=10,
-                                    path="/",
-                                    secure=str(config.webhook.url).startswith("https://"),
-                                    samesite="Strict",
-                                )
-                            except Exception:
-                                pass
-                            raise resp
-                        return web.Response(status=500, text="server error")
+                            resp.set_cookie(
+                                "flash_type",
+                                "error",
+                                max_age=10,
+                                path="/",
+                                secure=str(config.webhook.url).startswith("https://"),
+                                samesite="Strict",
+                            )
+                        except Exception:
+                            pass
+                        raise resp
+                    return web.Response(status=500, text="server error")
 
                 # Notify student fire-and-forget
                 try:
@@ -2584,6 +2515,7 @@ th{{background:#0d1117;color:#c9d1d9;}}
         app.router.add_get("/admin", admin_router)
         app.router.add_post("/admin/act", admin_act_post)
         app.router.add_get("/db/health", db_health)
+        app.router.add_get("/metrics", metrics_endpoint)
         app.router.add_post(config.webhook.path, telegram_webhook)
 
         # skip_webhook computed earlier
@@ -2594,6 +2526,7 @@ th{{background:#0d1117;color:#c9d1d9;}}
         if not skip_webhook:
             await application.initialize()
             await application.start()
+            await resume_broadcasts(application)
 
         if not skip_webhook:
             # Delete any existing webhook first to prevent 409 errors
@@ -2648,6 +2581,8 @@ th{{background:#0d1117;color:#c9d1d9;}}
         bind_port = _env_port or int(config.webhook.port or 0) or 8080
         logger.info(f"✅ Health check at: http://{bind_host}:{bind_port}/")  # nosec B104
 
+        update_dispatcher.start()
+
         # Start web server EARLY so tests can connect immediately
         runner = web.AppRunner(app)
         await runner.setup()
@@ -2661,6 +2596,18 @@ th{{background:#0d1117;color:#c9d1d9;}}
             await multi_rate_limiter.start_cleanup_tasks()
         except Exception as e:
             logger.warning(f"Could not start rate limiter cleanup tasks: {e}")
+        try:
+            await ban_registry.start()
+        except Exception as e:
+            logger.warning(f"Could not start ban registry sync: {e}")
+        try:
+            await stats_snapshot.start()
+        except Exception as e:
+            logger.warning(f"Could not start stats snapshot refresh: {e}")
+        try:
+            await leaderboard.start()
+        except Exception as e:
+            logger.warning(f"Could not start leaderboard refresh: {e}")
 
         # 24/7 watchdog: periodically verify DB and webhook health and auto-heal
         async def _watchdog_task():
@@ -2676,13 +2623,11 @@ th{{background:#0d1117;color:#c9d1d9;}}
                         with ENGINE.connect() as _conn:
                             _conn.execute(_text("SELECT 1"))
                     except Exception as de:
-                        logger.warning(f"Watchdog DB ping failed: {de}. Attempting init_db().")
-                        try:
-                            from database.migrate import init_db
-
-                            init_db()
-                        except Exception as ie:
-                            logger.error(f"Watchdog init_db failed: {ie}")
+                        logger.warning(f"Watchdog DB ping failed: {de}. Re-checking schema.")
+                        invalidate_schema_gate()
+                    if not schema_ready():
+                        if not await run_blocking(ensure_schema_ready):
+                            logger.error("Watchdog schema readiness check failed")
 
                     # Webhook verification (skip in test/dev if configured)
                     if not skip_webhook:
@@ -2730,6 +2675,14 @@ th{{background:#0d1117;color:#c9d1d9;}}
                 except Exception as e:
                     logger.warning(f"Warning: Could not delete webhook during shutdown: {e}")
 
+            # Finish queued updates before the application (and its bot session) stops
+            try:
+                dropped = await update_dispatcher.stop()
+                if dropped:
+                    logger.warning(f"Dropped {dropped} queued update(s) at shutdown")
+            except Exception as e:
+                logger.warning(f"Could not drain update queue: {e}")
+
             if not skip_webhook:
                 await application.stop()
                 await application.shutdown()
@@ -2740,6 +2693,18 @@ th{{background:#0d1117;color:#c9d1d9;}}
                     wd.cancel()
             except Exception:
                 pass
+            try:
+                await ban_registry.stop()
+            except Exception:
+                pass
+            try:
+                await stats_snapshot.stop()
+            except Exception:
+                pass
+            try:
+                await leaderboard.stop()
+            except Exception:
+                pass
             await runner.cleanup()
             logger.info("✅ Webhook mode shutdown complete")
 
@@ -2748,6 +2713,16 @@ th{{background:#0d1117;color:#c9d1d9;}}
         raise
 
 
+async def resume_broadcasts(application: Application) -> None:
+    """Restart broadcasts that were still running when the previous process stopped."""
+    manager = application.bot_data.get("broadcast_manager")
+    if manager is None:
+        return
+    resumed = await manager.resume_pending(application)
+    if resumed:
+        logger.info(f"📤 Resumed {len(resumed)} broadcast job(s): {', '.join(resumed)}")
+
+
 async def run_polling_mode(application: Application) -> None:
     """Run bot in polling mode for development"""
     try:
@@ -2772,31 +2747,35 @@ def main() -> None:
             logger.error(f"❌ Configuration validation failed: {e}")
             return
 
-        # Initialize database schema (idempotent)
-        try:
-            from database.migrate import init_db
-
-            init_db()
-            logger.info("🗄️ Database initialized (create_all)")
-        except Exception as e:
-            logger.warning(f"DB init skipped/failed: {e}")
+        # Check schema version once; runs init_db() only when the schema is missing/outdated
+        if ensure_schema_ready(force=True):
+            logger.info("🗄️ Database schema ready")
+        else:
+            logger.warning("DB schema readiness check failed; will retry on demand")
 
         # Create application with proper configuration
         application = (
             ApplicationBuilder()
             .token(config.bot_token)
             .rate_limiter(AIORateLimiter())
-            .connection_pool_size(8)
-            .connect_timeout(30.0)
-            .read_timeout(30.0)
-            .write_timeout(30.0)
-            .pool_timeout(30.0)
+            .post_init(resume_broadcasts)
+            # bot_data holds live runtime objects (managers, tasks), so it is not persisted
+            .persistence(SQLPersistence(PersistenceInput(bot_data=False, callback_data=False)))
+            .request(
+                TimedHTTPXRequest(
+                    connection_pool_size=8,
+                    connect_timeout=30.0,
+                    read_timeout=30.0,
+                    write_timeout=30.0,
+                    pool_timeout=30.0,
+                )
+            )
             .build()
         )
 
         # No JSON storage; DB is source of truth
         application.bot_data["config"] = config
-        application.bot_data["broadcast_manager"] = BroadcastManager()
+        application.bot_data["broadcast_manager"] = BroadcastManager(store=SQLBroadcastStore())
 
         # Setup handlers and expose rate limiter for status diagnostics
         asyncio.run(setup_handlers(application))
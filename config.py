@@ -56,6 +56,7 @@ class PerformanceConfig:
     max_concurrent_users: int = 1000
     request_timeout_seconds: int = 30
     enable_compression: bool = True
+    user_cache_max_size: int = 10000
 
 
 @dataclass
@@ -197,6 +198,7 @@ class Config:
             max_concurrent_users=int(os.getenv("MAX_CONCURRENT_USERS", "1000")),
             request_timeout_seconds=int(os.getenv("REQUEST_TIMEOUT_SECONDS", "30")),
             enable_compression=os.getenv("ENABLE_COMPRESSION", "true").lower() == "true",
+            user_cache_max_size=int(os.getenv("USER_CACHE_MAX_SIZE", "10000")),
         )
 
         self.security = SecurityConfig(
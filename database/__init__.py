@@ -8,10 +8,27 @@ SQLAlchemy models in `database.models_sql` and service helpers in
 `database.service`.
 """
 
-from .db import Base, ENGINE, SessionLocal, session_scope  # noqa: F401
+from .db import (  # noqa: F401
+    Base,
+    ENGINE,
+    SessionLocal,
+    session_scope,
+    ASYNC_ENGINE,
+    AsyncSessionLocal,
+    async_session_scope,
+)
 from . import models_sql  # noqa: F401
 
-__all__ = ["Base", "ENGINE", "SessionLocal", "session_scope", "models_sql"]
+__all__ = [
+    "Base",
+    "ENGINE",
+    "SessionLocal",
+    "session_scope",
+    "ASYNC_ENGINE",
+    "AsyncSessionLocal",
+    "async_session_scope",
+    "models_sql",
+]
 
 
 # Alembic convenience
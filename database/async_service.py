@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Async counterparts of `database.service` for use from PTB/aiohttp handlers.
+
+Each function opens its own `async_session_scope()` (one transaction per call) and
+runs the sync service function through `session.run_sync`, so the event loop is
+never blocked on a database round-trip. Signatures match `database.service`
+without the leading `session` argument.
+"""
+
+from __future__ import annotations
+
+import functools
+from typing import Any, Callable
+
+from database import service
+from database.db import async_session_scope
+
+
+def _asyncify(name: str) -> Callable[..., Any]:
+    # Resolve the sync function at call time so patches on database.service apply
+    sync_fn = getattr(service, name)
+
+    @functools.wraps(sync_fn)
+    async def wrapper(*args: Any, **kwargs: Any) -> Any:
+        async with async_session_scope() as session:
+            return await session.run_sync(getattr(service, name), *args, **kwargs)
+
+    del wrapper.__wrapped__
+    return wrapper
+
+
+async def run_in_session(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Run an ad-hoc sync `fn(session, *args, **kwargs)` in its own async transaction."""
+    async with async_session_scope() as session:
+        return await session.run_sync(fn, *args, **kwargs)
+
+
+# ---------------------
+# User Management
+# ---------------------
+
+get_user_by_telegram_id = _asyncify("get_user_by_telegram_id")
+get_or_create_user = _asyncify("get_or_create_user")
+audit_profile_change = _asyncify("audit_profile_change")
+
+# ---------------------
+# Purchases & Receipts
+# ---------------------
+
+create_purchase = _asyncify("create_purchase")
+list_user_purchases = _asyncify("list_user_purchases")
+add_receipt = _asyncify("add_receipt")
+approve_or_reject_purchase = _asyncify("approve_or_reject_purchase")
+
+# ---------------------
+# Lists
+# ---------------------
+
+get_approved_book_buyers = _asyncify("get_approved_book_buyers")
+get_pending_purchases = _asyncify("get_pending_purchases")
+get_course_participants_by_slug = _asyncify("get_course_participants_by_slug")
+get_free_course_participants_by_grade = _asyncify("get_free_course_participants_by_grade")
+
+# ---------------------
+# Ban management (SQL)
+# ---------------------
+
+is_user_banned = _asyncify("is_user_banned")
+ban_user = _asyncify("ban_user")
+unban_user = _asyncify("unban_user")
+
+# ---------------------
+# Reporting & Housekeeping
+# ---------------------
+
+get_stats_summary = _asyncify("get_stats_summary")
+list_stale_pending_purchases = _asyncify("list_stale_pending_purchases")
+
+# ---------------------
+# Learning services (Quiz)
+# ---------------------
+
+upsert_user_stats = _asyncify("upsert_user_stats")
+get_daily_question = _asyncify("get_daily_question")
+submit_answer = _asyncify("submit_answer")
+get_user_stats = _asyncify("get_user_stats")
+get_leaderboard_top = _asyncify("get_leaderboard_top")
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Broadcast audience selection.
+
+An `AudienceSegment` describes who receives a broadcast (grade, province/city, field of
+study, participants of a course, approved buyers). `audience_query()` turns it into a
+single `SELECT users.telegram_user_id ...` with `EXISTS` sub-queries for purchases, so
+no ORM rows (and no PII) are loaded and every user appears once.
+
+`iter_audience_batches()` reads the IDs through a server-side cursor (`yield_per`) in
+lists of `AUDIENCE_BATCH_SIZE`; `stream_audience()` drives it off the event loop and is
+what `BroadcastManager.start_broadcast()` consumes.
+"""
+
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from typing import AsyncIterator, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import exists, select
+
+from database.db import iterate_blocking, session_scope
+from database.models_sql import Purchase, User
+
+AUDIENCE_BATCH_SIZE = int(os.getenv("AUDIENCE_BATCH_SIZE", "1000"))
+
+# `key=value` names accepted by `parse_segment_args`, mapped to segment fields
+SEGMENT_KEYS = {
+    "grade": "grade",
+    "province": "province",
+    "city": "city",
+    "field": "field_of_study",
+    "course": "course",
+    "buyers": "buyers",
+}
+BUYER_TYPES = ("any", "book", "course")
+
+
+@dataclass(frozen=True)
+class AudienceSegment:
+    """Filters combined with AND; an empty segment selects every registered user."""
+
+    grade: Optional[str] = None
+    province: Optional[str] = None
+    city: Optional[str] = None
+    field_of_study: Optional[str] = None
+    course: Optional[str] = None  # course slug; approved participants only
+    buyers: Optional[str] = None  # any|book|course: users with an approved purchase
+
+    def describe(self) -> str:
+        return " ".join(
+            f"{key}={getattr(self, name)}"
+            for key, name in SEGMENT_KEYS.items()
+            if getattr(self, name) is not None
+        )
+
+
+def parse_segment_args(args: Sequence[str]) -> Tuple[AudienceSegment, List[str]]:
+    """Split leading `key=value` filters off command args; returns (segment, rest).
+
+    Raises ValueError for an unknown `buyers` type.
+    """
+    values = {}
+    rest = list(args)
+    while rest and "=" in rest[0]:
+        key, _, value = rest[0].partition("=")
+        name = SEGMENT_KEYS.get(key.strip().lower())
+        if name is None or not value:
+            break
+        values[name] = value.replace("_", " ") if name in ("province", "city") else value
+        rest.pop(0)
+    if values.get("buyers") is not None and values["buyers"] not in BUYER_TYPES:
+        raise ValueError(f"buyers must be one of {', '.join(BUYER_TYPES)}")
+    return AudienceSegment(**values), rest
+
+
+def audience_query(segment: AudienceSegment):
+    """`SELECT telegram_user_id` for the users matching `segment`, in primary-key order."""
+    stmt = select(User.telegram_user_id).where(User.telegram_user_id.is_not(None))
+    for name in ("grade", "province", "city", "field_of_study"):
+        value = getattr(segment, name)
+        if value is not None:
+            stmt = stmt.where(getattr(User, name) == value)
+    if segment.course is not None:
+        stmt = stmt.where(
+            exists().where(
+                Purchase.user_id == User.id,
+                Purchase.product_type == "course",
+                Purchase.product_id == segment.course,
+                Purchase.status == "approved",
+            )
+        )
+    if segment.buyers is not None:
+        bought = exists().where(Purchase.user_id == User.id, Purchase.status == "approved")
+        if segment.buyers != "any":
+            bought = bought.where(Purchase.product_type == segment.buyers)
+        stmt = stmt.where(bought)
+    return stmt.order_by(User.id)
+
+
+def iter_audience_batches(
+    segment: AudienceSegment, batch_size: int = AUDIENCE_BATCH_SIZE
+) -> Iterator[List[int]]:
+    """Blocking generator of Telegram ID lists, one per server-side cursor batch."""
+    stmt = audience_query(segment).execution_options(yield_per=batch_size)
+    with session_scope() as session:
+        for batch in session.execute(stmt).scalars().partitions():
+            yield list(batch)
+
+
+def stream_audience(
+    segment: AudienceSegment, batch_size: int = AUDIENCE_BATCH_SIZE
+) -> AsyncIterator[List[int]]:
+    """Async iterator over `iter_audience_batches` run on the default executor."""
+    return iterate_blocking(iter_audience_batches, segment, batch_size)
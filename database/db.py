@@ -7,12 +7,27 @@ Supports PostgreSQL via DATABASE_URL; falls back to SQLite if not provided.
 
 from __future__ import annotations
 
+import asyncio
+import contextvars
+import functools
+import logging
 import os
-from contextlib import contextmanager
-from typing import Generator
+import re
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import TYPE_CHECKING, Any, AsyncIterator, Callable, Dict, Generator, List, Optional
 
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, event, exc, text
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
+from sqlalchemy.pool import QueuePool
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+
+logger = logging.getLogger(__name__)
 
 
 class Base(DeclarativeBase):
@@ -45,12 +60,223 @@ def _is_postgres_url(url: str) -> bool:
 
 
 is_postgres = _is_postgres_url(_db_url)
+
+
+# ---------------------
+# Query telemetry
+# ---------------------
+#
+# Engine and pool events feed `QUERY_TELEMETRY`: statement timing grouped by a
+# normalized SQL fingerprint, a ring buffer of slow statements, and connection pool
+# checkout wait / overflow / timeout / invalidation counters. It is reported by
+# `utils.performance_monitor` (`get_stats()["sql"]`), the Prometheus endpoint and the
+# /metrics command; queries per update and handler come from `utils.instrumentation`.
+
+_FP_PLACEHOLDERS = re.compile(r"%\(\w+\)s|%s|\$\d+")
+_FP_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_FP_LISTS = re.compile(r"\((?:\s*\?\s*,)*\s*\?\s*\)")
+_FP_ROWS = re.compile(r"\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+")
+_FP_SPACE = re.compile(r"\s+")
+_fingerprints: Dict[str, str] = {}
+
+
+def fingerprint(statement: str) -> str:
+    """Statement with literals and placeholders as `?` and value lists folded to `(...)`."""
+    cached = _fingerprints.get(statement)
+    if cached is not None:
+        return cached
+    fp = _FP_PLACEHOLDERS.sub("?", statement)
+    fp = _FP_LITERALS.sub("?", fp)
+    fp = _FP_ROWS.sub("(...)", _FP_LISTS.sub("(...)", fp))
+    fp = _FP_SPACE.sub(" ", fp).strip()[:300]
+    if len(_fingerprints) >= 2000:
+        _fingerprints.clear()
+    _fingerprints[statement] = fp
+    return fp
+
+
+class QueryTelemetry:
+    """Statement timings by fingerprint, recent slow statements and pool checkout counters.
+
+    Events fire on whichever thread runs the statement, so updates take a lock.
+    At most `MAX_FINGERPRINTS` distinct fingerprints are tracked; later ones are
+    counted under `OTHER`.
+    """
+
+    MAX_FINGERPRINTS = 500
+    OTHER = "(other)"
+
+    def __init__(self, slow_ms: Optional[float] = None, slow_log_size: Optional[int] = None):
+        if slow_ms is None:
+            slow_ms = float(os.getenv("DB_SLOW_QUERY_MS", "200"))
+        if slow_log_size is None:
+            slow_log_size = int(os.getenv("DB_SLOW_QUERY_LOG_SIZE", "50"))
+        self.slow_seconds = float(slow_ms) / 1000.0
+        self.slow_log_size = int(slow_log_size)
+        # Returns the name of the handler running in this context (set by instrumentation)
+        self.context_label: Optional[Callable[[], Optional[str]]] = None
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            # fingerprint -> [count, total seconds, max seconds]
+            self.fingerprints: Dict[str, List[float]] = {}
+            self.slow_queries: deque = deque(maxlen=max(1, self.slow_log_size))
+            self.slow_total = 0
+            self.pool = {
+                "checkouts": 0,
+                "overflow": 0,
+                "timeouts": 0,
+                "invalidated": 0,
+                "wait_seconds": 0.0,
+                "max_wait_seconds": 0.0,
+            }
+
+    def record_query(self, statement: str, duration: float) -> None:
+        fp = fingerprint(statement)
+        with self._lock:
+            entry = self.fingerprints.get(fp)
+            if entry is None:
+                if len(self.fingerprints) >= self.MAX_FINGERPRINTS:
+                    fp = self.OTHER
+                entry = self.fingerprints.setdefault(fp, [0, 0.0, 0.0])
+            entry[0] += 1
+            entry[1] += duration
+            if duration > entry[2]:
+                entry[2] = duration
+        if duration >= self.slow_seconds:
+            self._record_slow(fp, duration)
+
+    def _record_slow(self, fp: str, duration: float) -> None:
+        handler = None
+        if self.context_label is not None:
+            try:
+                handler = self.context_label()
+            except Exception:
+                handler = None
+        with self._lock:
+            self.slow_total += 1
+            self.slow_queries.append(
+                {
+                    "at": time.time(),
+                    "duration": round(duration, 4),
+                    "handler": handler,
+                    "fingerprint": fp,
+                }
+            )
+        logger.warning(f"Slow query ({duration * 1000:.0f} ms, {handler or 'no handler'}): {fp}")
+
+    def record_checkout(self, wait: float, overflow: bool = False, timeout: bool = False) -> None:
+        with self._lock:
+            pool = self.pool
+            pool["timeouts" if timeout else "checkouts"] += 1
+            if overflow:
+                pool["overflow"] += 1
+            pool["wait_seconds"] += wait
+            if wait > pool["max_wait_seconds"]:
+                pool["max_wait_seconds"] = wait
+
+    def record_invalidation(self) -> None:
+        with self._lock:
+            self.pool["invalidated"] += 1
+
+    def top(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """Fingerprints with the most total execution time"""
+        with self._lock:
+            items = [(fp, list(entry)) for fp, entry in self.fingerprints.items()]
+        items.sort(key=lambda item: item[1][1], reverse=True)
+        return [
+            {
+                "fingerprint": fp,
+                "count": int(count),
+                "total_seconds": round(total, 4),
+                "avg_seconds": round(total / count, 6) if count else 0.0,
+                "max_seconds": round(peak, 4),
+            }
+            for fp, (count, total, peak) in items[:limit]
+        ]
+
+    def snapshot(self, limit: int = 10) -> Dict[str, Any]:
+        with self._lock:
+            queries = sum(int(e[0]) for e in self.fingerprints.values())
+            seconds = sum(e[1] for e in self.fingerprints.values())
+            pool = dict(self.pool)
+            slow = list(self.slow_queries)
+            slow_total = self.slow_total
+        return {
+            "queries": queries,
+            "query_seconds": round(seconds, 4),
+            "fingerprints": len(self.fingerprints),
+            "slow_threshold_ms": round(self.slow_seconds * 1000, 1),
+            "slow_total": slow_total,
+            "slow_queries": slow,
+            "top": self.top(limit),
+            "pool": pool,
+        }
+
+
+QUERY_TELEMETRY = QueryTelemetry()
+
+_telemetry_engines = set()
+
+
+def install_query_telemetry(engine, telemetry: Optional[QueryTelemetry] = None) -> None:
+    """Feed statement timings and pool invalidations on `engine` to `telemetry` (idempotent)."""
+    telemetry = telemetry or QUERY_TELEMETRY
+    engine = getattr(engine, "sync_engine", engine)
+    if engine is None or (id(engine), id(telemetry)) in _telemetry_engines:
+        return
+    _telemetry_engines.add((id(engine), id(telemetry)))
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._telemetry_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_telemetry_started", None)
+        if started is not None:
+            telemetry.record_query(statement, time.perf_counter() - started)
+
+    @event.listens_for(engine, "invalidate")
+    def _invalidate(dbapi_connection, connection_record, exception):
+        telemetry.record_invalidation()
+
+    @event.listens_for(engine, "soft_invalidate")
+    def _soft_invalidate(dbapi_connection, connection_record, exception):
+        telemetry.record_invalidation()
+
+
+class TimedQueuePool(QueuePool):
+    """`QueuePool` that reports each checkout's wait (free slot, connect, pre-ping).
+
+    A checkout counts as overflow when it had to open a connection beyond
+    `pool_size`; one that gives up after `pool_timeout` counts as a timeout.
+    """
+
+    def connect(self):
+        started = time.perf_counter()
+        before = self.overflow()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            QUERY_TELEMETRY.record_checkout(time.perf_counter() - started, timeout=True)
+            raise
+        QUERY_TELEMETRY.record_checkout(
+            time.perf_counter() - started, overflow=self.overflow() > max(before, 0)
+        )
+        return connection
+
+
 # Engine configuration differs for SQLite to improve concurrency in tests
 if _db_url.startswith("sqlite"):
     ENGINE = create_engine(
         _db_url,
         pool_pre_ping=True,
         future=True,
+        poolclass=TimedQueuePool,
         connect_args={"check_same_thread": False, "timeout": 30},
     )
 else:
@@ -58,72 +284,84 @@ else:
         _db_url,
         pool_pre_ping=True,
         future=True,
+        poolclass=TimedQueuePool,
         pool_size=int(os.getenv("DB_POOL_SIZE", "20")),
         max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "30")),
         pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "300")),
     )
+install_query_telemetry(ENGINE)
 SessionLocal = sessionmaker(bind=ENGINE, autoflush=False, autocommit=False, expire_on_commit=False)
 
-# Lazy, idempotent schema initialization for test and script contexts
-# Avoids circular imports by importing migrate only on demand.
+# One-time schema readiness gate.
+# The first caller checks the `schema_version` marker (a single-row read); only when it
+# is missing or older than `database.migrate.SCHEMA_VERSION` does it run `init_db()`
+# (advisory lock + DDL) and record the new version. Afterwards every session and
+# webhook request short-circuits on an in-process flag. The watchdog re-opens the
+# gate via `invalidate_schema_gate()` when the database looks unhealthy.
 _SCHEMA_INIT_DONE = False
+_SCHEMA_GATE_LOCK = threading.Lock()
+_SCHEMA_GATE_RETRY_AT = 0.0
+_SCHEMA_GATE_RETRY_SECONDS = 30.0
 
 
-def _ensure_schema_initialized() -> None:
+def schema_ready() -> bool:
+    return _SCHEMA_INIT_DONE
+
+
+def invalidate_schema_gate() -> None:
+    """Force the next `ensure_schema_ready()` call to re-check the schema version.
+
+    A pending retry backoff is kept, so repeated invalidations from failing queries
+    cannot turn into a DDL attempt per session while the database is down.
+    """
     global _SCHEMA_INIT_DONE
-    if _SCHEMA_INIT_DONE:
-        return
-    try:
-        # Probe for core tables; if missing, run initializer
-        with ENGINE.connect() as conn:
-            # Apply a conservative statement timeout on Postgres connections (server-side)
-            try:
-                if is_postgres:
-                    conn.execute(text("SET statement_timeout TO 8000"))
-            except Exception:
-                # best-effort; ignore if not supported
-                pass
-            try:
-                # Core tables must exist; if any probe fails we will run init_db()
-                conn.exec_driver_sql("SELECT 1 FROM users LIMIT 1")
-                conn.exec_driver_sql("SELECT 1 FROM purchases LIMIT 1")
-                conn.exec_driver_sql("SELECT 1 FROM receipts LIMIT 1")
-                conn.exec_driver_sql("SELECT 1 FROM purchase_audits LIMIT 1")
-                conn.exec_driver_sql("SELECT 1 FROM profile_changes LIMIT 1")
-                # Optional but critical ops tables
-                conn.exec_driver_sql("SELECT 1 FROM banned_users LIMIT 1")
-                # Probe learning tables (if any missing, trigger init)
-                conn.exec_driver_sql("SELECT 1 FROM quiz_questions LIMIT 1")
-                conn.exec_driver_sql("SELECT 1 FROM quiz_attempts LIMIT 1")
-                conn.exec_driver_sql("SELECT 1 FROM user_stats LIMIT 1")
-                _SCHEMA_INIT_DONE = True
-                return
-            except Exception:
-                # Any missing table -> initialize
-                pass
-        # Run initializer (idempotent and concurrency-safe on Postgres)
-        from database.migrate import init_db  # local import to avoid cycles
+    _SCHEMA_INIT_DONE = False
+
+
+def ensure_schema_ready(force: bool = False) -> bool:
+    global _SCHEMA_INIT_DONE, _SCHEMA_GATE_RETRY_AT
+    if _SCHEMA_INIT_DONE and not force:
+        return True
+    with _SCHEMA_GATE_LOCK:
+        if _SCHEMA_INIT_DONE and not force:
+            return True
+        # After a failed attempt, back off instead of running DDL on every session
+        if not force and time.monotonic() < _SCHEMA_GATE_RETRY_AT:
+            return False
+        from database.migrate import (  # local import to avoid cycles
+            SCHEMA_VERSION,
+            init_db,
+            read_schema_version,
+            record_schema_version,
+        )
 
         try:
-            init_db()
-        except Exception:
-            # Best-effort: leave to caller if initialization fails here
-            pass
-        # Safety net for SQLite in tests: ensure all tables are created
-        try:
-            if ENGINE.dialect.name == "sqlite":
-                Base.metadata.create_all(bind=ENGINE)
-        except Exception:
-            pass
-        _SCHEMA_INIT_DONE = True
-    except Exception:
-        # As a last resort, mark as done to prevent infinite attempts
+            with ENGINE.connect() as conn:
+                version = read_schema_version(conn)
+            if version is None or version < SCHEMA_VERSION:
+                logger.info(f"Schema version {version} < {SCHEMA_VERSION}; running init_db()")
+                init_db()
+                # Safety net for SQLite in tests: ensure all tables are created
+                if ENGINE.dialect.name == "sqlite":
+                    Base.metadata.create_all(bind=ENGINE)
+                with ENGINE.begin() as conn:
+                    record_schema_version(conn, SCHEMA_VERSION)
+        except Exception as e:
+            logger.error(f"Schema readiness check failed: {e}")
+            _SCHEMA_GATE_RETRY_AT = time.monotonic() + _SCHEMA_GATE_RETRY_SECONDS
+            return False
         _SCHEMA_INIT_DONE = True
+        return True
+
+
+def _ensure_schema_initialized() -> None:
+    # Ensure schema exists at first use in tests/CLI contexts
+    if not _SCHEMA_INIT_DONE:
+        ensure_schema_ready()
 
 
 @contextmanager
 def session_scope() -> Generator:
-    # Ensure schema exists at first use in tests/CLI contexts
     _ensure_schema_initialized()
     session = SessionLocal()
     try:
@@ -134,3 +372,188 @@ def session_scope() -> Generator:
         raise
     finally:
         session.close()
+
+
+# ---------------------
+# Async session API
+# ---------------------
+#
+# Handlers run on the PTB/aiohttp event loop, so blocking SQL there stalls every
+# other update. `async_session_scope()` yields a session whose I/O never runs on
+# the loop: a native SQLAlchemy AsyncSession when DB_ASYNC_DRIVER=native and the
+# driver (asyncpg / aiosqlite) is installed, otherwise a sync Session driven from a
+# worker thread. Both expose `await session.run_sync(fn, *args)`, where `fn`
+# receives a regular sync Session, so `database.service` functions work unchanged.
+
+
+def _build_async_db_url(url: str) -> Optional[str]:
+    """Map the sync URL to its async-driver twin, or None if the driver is missing."""
+    try:
+        if url.startswith("sqlite"):
+            import aiosqlite  # noqa: F401
+
+            return url.replace("sqlite://", "sqlite+aiosqlite://", 1)
+        if _is_postgres_url(url):
+            import asyncpg  # noqa: F401
+
+            return "postgresql+asyncpg://" + url.split("://", 1)[1]
+    except ImportError:
+        return None
+    return None
+
+
+def _create_async_engine():
+    if os.getenv("DB_ASYNC_DRIVER", "thread").strip().lower() != "native":
+        return None
+    async_url = _build_async_db_url(_db_url)
+    if not async_url:
+        return None
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    if async_url.startswith("sqlite"):
+        return create_async_engine(async_url, pool_pre_ping=True, connect_args={"timeout": 30})
+    return create_async_engine(
+        async_url,
+        pool_pre_ping=True,
+        pool_size=int(os.getenv("DB_POOL_SIZE", "20")),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", "30")),
+        pool_recycle=int(os.getenv("DB_POOL_RECYCLE", "300")),
+    )
+
+
+ASYNC_ENGINE = _create_async_engine()
+AsyncSessionLocal: Optional[async_sessionmaker[AsyncSession]]
+if ASYNC_ENGINE is not None:
+    install_query_telemetry(ASYNC_ENGINE)
+    from sqlalchemy.ext.asyncio import async_sessionmaker
+
+    AsyncSessionLocal = async_sessionmaker(
+        bind=ASYNC_ENGINE, autoflush=False, expire_on_commit=False
+    )
+else:
+    AsyncSessionLocal = None
+
+
+async def run_blocking(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Run a blocking DB callable on the loop's default executor.
+
+    Concurrency is bounded by the connection pool (pool_size + max_overflow); extra
+    workers simply wait for a connection instead of stalling the event loop. The
+    callable runs in a copy of the caller's context, so context variables (e.g. the
+    per-handler timing in `utils.instrumentation`) are visible to engine events.
+    """
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(None, functools.partial(ctx.run, fn, *args, **kwargs))
+
+
+async def iterate_blocking(
+    gen_fn: Callable[..., Any], *args: Any, max_pending: int = 8, **kwargs: Any
+) -> AsyncIterator:
+    """Drive a blocking generator on the default executor and yield its items.
+
+    At most `max_pending` items are buffered between the worker and the consumer, so a
+    slow reader (e.g. an admin downloading an export) throttles the producer. Closing
+    the async iterator early stops the worker before its next item.
+    """
+    loop = asyncio.get_running_loop()
+    items: asyncio.Queue = asyncio.Queue()
+    slots = threading.Semaphore(max_pending)
+    stop = threading.Event()
+    end = object()
+
+    def _produce() -> None:
+        gen = gen_fn(*args, **kwargs)
+        try:
+            for item in gen:
+                slots.acquire()
+                if stop.is_set():
+                    return
+                loop.call_soon_threadsafe(items.put_nowait, (item, None))
+        except Exception as e:
+            loop.call_soon_threadsafe(items.put_nowait, (end, e))
+            return
+        finally:
+            # Runs the generator's own cleanup (e.g. session_scope exit) in this worker
+            gen.close()
+        loop.call_soon_threadsafe(items.put_nowait, (end, None))
+
+    producer = loop.run_in_executor(None, contextvars.copy_context().run, _produce)
+    try:
+        while True:
+            item, error = await items.get()
+            if item is end:
+                if error is not None:
+                    raise error
+                return
+            slots.release()
+            yield item
+    finally:
+        stop.set()
+        slots.release()
+        try:
+            await producer
+        except Exception:
+            pass
+
+
+class ThreadedAsyncSession:
+    """Awaitable facade over a sync Session; every call is executed off the event loop.
+
+    The wrapped session is only ever used by one coroutine and each call is awaited
+    before the next one starts, so it is never touched by two threads at once.
+    """
+
+    __slots__ = ("sync_session",)
+
+    def __init__(self, sync_session) -> None:
+        self.sync_session = sync_session
+
+    async def run_sync(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        return await run_blocking(fn, self.sync_session, *args, **kwargs)
+
+    async def execute(self, statement, *args: Any, **kwargs: Any):
+        # Buffer rows in the worker so iterating the result never hits the cursor
+        return await run_blocking(
+            lambda: self.sync_session.execute(statement, *args, **kwargs).freeze()()
+        )
+
+    async def scalar(self, statement, *args: Any, **kwargs: Any) -> Any:
+        return await run_blocking(self.sync_session.scalar, statement, *args, **kwargs)
+
+    async def get(self, entity, ident) -> Any:
+        return await run_blocking(self.sync_session.get, entity, ident)
+
+    def add(self, instance) -> None:
+        self.sync_session.add(instance)
+
+    async def flush(self) -> None:
+        await run_blocking(self.sync_session.flush)
+
+    async def commit(self) -> None:
+        await run_blocking(self.sync_session.commit)
+
+    async def rollback(self) -> None:
+        await run_blocking(self.sync_session.rollback)
+
+    async def close(self) -> None:
+        await run_blocking(self.sync_session.close)
+
+
+@asynccontextmanager
+async def async_session_scope() -> AsyncIterator:
+    if not _SCHEMA_INIT_DONE:
+        await run_blocking(_ensure_schema_initialized)
+    session: AsyncSession | ThreadedAsyncSession
+    if AsyncSessionLocal is not None:
+        session = AsyncSessionLocal()
+    else:
+        session = ThreadedAsyncSession(SessionLocal())
+    try:
+        yield session
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        raise
+    finally:
+        await session.close()
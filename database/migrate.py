@@ -6,6 +6,8 @@ For production use Alembic; this provides a quick start.
 """
 
 import logging
+from typing import Optional
+
 from sqlalchemy import text
 
 from database.db import ENGINE, Base
@@ -21,11 +23,17 @@ from database.models_sql import (
     QuizAttempt,
     UserStats,
     BannedUser,
+    RateLimitState,
+    SchemaVersion,
 )
 
 
 logger = logging.getLogger(__name__)
 
+# Bump whenever models or `_upgrade_schema_if_needed` change so the readiness gate
+# in `database.db.ensure_schema_ready` re-runs `init_db()` once on the next deploy.
+SCHEMA_VERSION = 6
+
 
 def init_db():
     """Initialize DB schema robustly (idempotent, concurrency-safe on Postgres).
@@ -104,10 +112,15 @@ def _upgrade_schema_if_needed(conn):
             "purchases",
             "receipts",
             "purchase_audits",
+            "payment_tokens",
+            "broadcast_jobs",
+            "bot_persistence",
             "profile_changes",
             "quiz_questions",
             "quiz_attempts",
             "user_stats",
+            "rate_limit_state",
+            "schema_version",
         ]
         for tname in creation_order:
             table = name_to_table.get(tname)
@@ -174,6 +187,32 @@ def _upgrade_schema_if_needed(conn):
     except Exception as e:
         logger.warning(f"Could not read/upgrade purchases.admin_action_by column type: {e}")
 
+    # payment_tokens.processed was first created as INTEGER 0/1
+    try:
+        dt_row = conn.execute(
+            text(
+                "SELECT data_type FROM information_schema.columns "
+                "WHERE table_name='payment_tokens' AND column_name='processed'"
+            )
+        ).scalar()
+        if dt_row and str(dt_row).lower() in ("integer", "int4"):
+            try:
+                conn.execute(
+                    text(
+                        "ALTER TABLE payment_tokens ALTER COLUMN processed DROP DEFAULT, "
+                        "ALTER COLUMN processed TYPE BOOLEAN USING processed <> 0"
+                    )
+                )
+                logger.info("Upgraded payment_tokens.processed to BOOLEAN")
+            except Exception as e:
+                try:
+                    conn.rollback()
+                except Exception:
+                    pass
+                logger.warning(f"Could not alter payment_tokens.processed to BOOLEAN: {e}")
+    except Exception as e:
+        logger.warning(f"Could not read/upgrade payment_tokens.processed column type: {e}")
+
     # 3) Fallback DDL for critical tables and column additions (Postgres)
     try:
         if str(getattr(ENGINE.dialect, 'name', '')).startswith("postgresql"):
@@ -322,6 +361,42 @@ def _upgrade_schema_if_needed(conn):
             conn.execute(text("CREATE INDEX IF NOT EXISTS ix_users_field ON users(field_of_study)"))
     except Exception as e:
         logger.warning(f"Creating optional indexes failed: {e}")
+    # 4) Shared rate-limit buckets are disposable; skip the WAL for them (Postgres)
+    try:
+        if str(getattr(ENGINE.dialect, 'name', '')).startswith("postgresql"):
+            conn.execute(text("ALTER TABLE rate_limit_state SET UNLOGGED"))
+    except Exception as e:
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        logger.warning(f"Could not make rate_limit_state UNLOGGED: {e}")
+
+
+def read_schema_version(conn) -> Optional[int]:
+    """Return the recorded schema version, or None if the marker is missing."""
+    try:
+        return conn.execute(
+            text("SELECT version FROM schema_version WHERE id = 1")
+        ).scalar_one_or_none()
+    except Exception:
+        return None
+
+
+def record_schema_version(conn, version: int = SCHEMA_VERSION) -> None:
+    """Persist `version` as the applied schema revision.
+
+    A single upsert, so replicas recording concurrently cannot race on the marker row.
+    """
+    conn.execute(
+        text(
+            "INSERT INTO schema_version (id, version, applied_at) "
+            "VALUES (1, :v, CURRENT_TIMESTAMP) "
+            "ON CONFLICT (id) DO UPDATE SET version = excluded.version, "
+            "applied_at = excluded.applied_at"
+        ),
+        {"v": version},
+    )
 
 
 def _create_tables_individually(conn):
@@ -7,9 +7,12 @@ from sqlalchemy import (
     Column,
     Integer,
     BigInteger,
+    Boolean,
     String,
+    Text,
     DateTime,
     Enum,
+    Float,
     ForeignKey,
     UniqueConstraint,
     Index,
@@ -141,6 +144,89 @@ class PurchaseAudit(Base):
     )
 
 
+class PaymentToken(Base):
+    """Correlation token for a submitted payment receipt and the admin messages about it."""
+
+    __tablename__ = "payment_tokens"
+    token: Mapped[str] = mapped_column(String(64), primary_key=True)
+    student_id: Mapped[int] = mapped_column(BigInteger)
+    item_type: Mapped[str] = mapped_column(String(16))  # book|course
+    item_id: Mapped[str] = mapped_column(String(128))
+    item_title: Mapped[str] = mapped_column(String(256), nullable=True)
+    file_unique_id: Mapped[str] = mapped_column(String(128), nullable=True, index=True)
+    messages: Mapped[list] = mapped_column(JSON, default=list)  # [[admin_id, message_id], ...]
+    processed: Mapped[bool] = mapped_column(Boolean, default=False)
+    decision: Mapped[str] = mapped_column(String(16), nullable=True)  # approve|reject
+    decided_by: Mapped[int] = mapped_column(BigInteger, nullable=True)
+    decided_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime, default=lambda: datetime.now(timezone.utc), index=True
+    )
+    expires_at: Mapped[datetime] = mapped_column(DateTime, index=True)
+    __table_args__ = (
+        # Open-token lookup per student and item
+        Index("ix_payment_tokens_open", "student_id", "item_type", "item_id", "processed"),
+        # Pending lists ordered by recency
+        Index("ix_payment_tokens_processed_created", "processed", "created_at"),
+    )
+
+
+class BroadcastCheckpoint(Base):
+    """Progress of a broadcast job, saved periodically so it can resume after a restart."""
+
+    __tablename__ = "broadcast_jobs"
+    job_id: Mapped[str] = mapped_column(String(32), primary_key=True)
+    admin_chat_id: Mapped[int] = mapped_column(BigInteger)
+    text: Mapped[str] = mapped_column(String(4096))
+    user_ids: Mapped[list] = mapped_column(JSON, default=list)  # audience, in send order
+    cursor: Mapped[int] = mapped_column(Integer, default=0)  # next audience index to dispatch
+    pending: Mapped[list] = mapped_column(JSON, default=list)  # dispatched but unsettled indexes
+    sent: Mapped[int] = mapped_column(Integer, default=0)
+    failed: Mapped[int] = mapped_column(Integer, default=0)
+    failed_ids: Mapped[list] = mapped_column(JSON, default=list)
+    message_id: Mapped[int] = mapped_column(BigInteger, nullable=True)
+    status: Mapped[str] = mapped_column(String(16), default="running", index=True)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime, default=lambda: datetime.now(timezone.utc)
+    )
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime,
+        default=lambda: datetime.now(timezone.utc),
+        onupdate=lambda: datetime.now(timezone.utc),
+    )
+
+
+class BotPersistenceRecord(Base):
+    """One PTB persistence entry: a user's/chat's data, bot_data or a conversation state."""
+
+    __tablename__ = "bot_persistence"
+    # user_data | chat_data | bot_data | conversation:<handler name>
+    namespace: Mapped[str] = mapped_column(String(64), primary_key=True)
+    # user/chat id, "" for bot_data, JSON-encoded key tuple for conversations
+    key: Mapped[str] = mapped_column(String(128), primary_key=True)
+    data: Mapped[str] = mapped_column(Text)  # compact JSON
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime,
+        default=lambda: datetime.now(timezone.utc),
+        onupdate=lambda: datetime.now(timezone.utc),
+    )
+
+
+class RateLimitState(Base):
+    """One shared rate-limit bucket (see `utils.rate_limit_store.SQLRateLimitStore`)."""
+
+    __tablename__ = "rate_limit_state"
+    # <namespace>:<user id>
+    bucket: Mapped[str] = mapped_column(String(128), primary_key=True)
+    # GCRA theoretical arrival time (epoch seconds); indexed for purge_expired
+    tat: Mapped[float] = mapped_column(Float, nullable=False, index=True)
+    blocked_until: Mapped[float] = mapped_column(
+        Float, nullable=False, default=0.0, server_default="0"
+    )
+    # Tokens granted by the latest upsert (read back through RETURNING)
+    granted: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
+
+
 # ---------------------
 # Learning: Quiz content and progress
 # ---------------------
@@ -191,3 +277,14 @@ class UserStats(Base):
         default=lambda: datetime.now(timezone.utc),
         onupdate=lambda: datetime.now(timezone.utc),
     )
+
+
+class SchemaVersion(Base):
+    """Single-row marker of the schema revision applied by `database.migrate.init_db`."""
+
+    __tablename__ = "schema_version"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    version: Mapped[int] = mapped_column(Integer, nullable=False)
+    applied_at: Mapped[datetime] = mapped_column(
+        DateTime, default=lambda: datetime.now(timezone.utc)
+    )
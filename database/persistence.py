@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PTB persistence on the application's SQLAlchemy engine.
+
+`SQLPersistence` keeps `user_data`, `chat_data`, `bot_data` and the states of
+persistent `ConversationHandler`s in the `bot_persistence` table, so a redeploy in
+the middle of registration or a book purchase resumes where the user left off.
+
+Nothing touches the database while an update is handled: PTB only marks the user
+and chat as dirty, and every `update_interval` seconds hands the dirty entries to
+the `update_*` methods. Those just serialize the entry into a pending map (a later
+write to the same key replaces an earlier one) and schedule one flush, which writes
+the whole batch in a single transaction off the event loop: one multi-row upsert
+plus one delete for dropped entries. A failed flush keeps the batch and retries it
+with exponential backoff. Data is stored as compact JSON; enum conversation states
+are stored by name and datetimes as ISO strings.
+
+The `refresh_*` hooks are no-ops, so the in-process copy is authoritative while the
+process runs and other replicas see the state after their next start.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import datetime as dt
+import importlib
+import json
+import logging
+import os
+from collections import defaultdict
+from enum import Enum
+from typing import Any, Dict, Optional, Tuple, Union
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+logger = logging.getLogger(__name__)
+
+USER_DATA = "user_data"
+CHAT_DATA = "chat_data"
+BOT_DATA = "bot_data"
+CONVERSATION = "conversation:"
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, dt.datetime):
+        return {"$dt": value.isoformat()}
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _object_hook(obj: Dict[str, Any]) -> Any:
+    if len(obj) == 1 and "$dt" in obj:
+        return dt.datetime.fromisoformat(obj["$dt"])
+    return obj
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=_default)
+
+
+def _loads(data: str) -> Any:
+    return json.loads(data, object_hook=_object_hook)
+
+
+def encode_state(state: Any) -> Any:
+    """JSON form of a conversation state; enum members are stored by class and name."""
+    if isinstance(state, Enum):
+        cls = type(state)
+        return {"enum": f"{cls.__module__}:{cls.__qualname__}", "name": state.name}
+    return state
+
+
+def decode_state(raw: Any) -> Any:
+    if isinstance(raw, dict) and "enum" in raw:
+        module, _, qualname = raw["enum"].partition(":")
+        cls: Any = importlib.import_module(module)
+        for part in qualname.split("."):
+            cls = getattr(cls, part)
+        return cls[raw["name"]]
+    return raw
+
+
+class SQLPersistence(BasePersistence):
+    """`BasePersistence` backed by the `bot_persistence` table with batched write-behind."""
+
+    # Backoff between retries of a failed flush: doubles from the min up to the max
+    retry_min_seconds = 1.0
+    retry_max_seconds = 60.0
+
+    def __init__(
+        self,
+        store_data: Optional[PersistenceInput] = None,
+        update_interval: Optional[float] = None,
+    ):
+        super().__init__(
+            store_data=store_data or PersistenceInput(callback_data=False),
+            update_interval=(
+                update_interval
+                if update_interval is not None
+                else float(os.getenv("PERSISTENCE_UPDATE_SECONDS", "10"))
+            ),
+        )
+        # (namespace, key) -> serialized data, or None to delete the row
+        self._pending: Dict[Tuple[str, str], Optional[str]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        # Set by flush() to cut a retry backoff short; `_flushing` stops further retries
+        self._wake = asyncio.Event()
+        self._flushing = False
+        self.stats = {"batches": 0, "rows": 0, "errors": 0}
+
+    # ---------------------
+    # Reads (once, at Application.initialize)
+    # ---------------------
+
+    async def _load(self, namespace: str) -> Dict[str, str]:
+        from sqlalchemy import select
+        from database import async_service
+        from database.models_sql import BotPersistenceRecord
+
+        def _select(session):
+            rows = session.execute(
+                select(BotPersistenceRecord.key, BotPersistenceRecord.data).where(
+                    BotPersistenceRecord.namespace == namespace
+                )
+            )
+            return {r.key: r.data for r in rows}
+
+        try:
+            return await async_service.run_in_session(_select)
+        except Exception as e:
+            logger.error(f"Could not load persisted {namespace}: {e}")
+            return {}
+
+    async def get_user_data(self) -> Dict[int, Dict[Any, Any]]:
+        rows = await self._load(USER_DATA)
+        return {int(k): _loads(v) for k, v in rows.items()}
+
+    async def get_chat_data(self) -> Dict[int, Dict[Any, Any]]:
+        rows = await self._load(CHAT_DATA)
+        return {int(k): _loads(v) for k, v in rows.items()}
+
+    async def get_bot_data(self) -> Dict[Any, Any]:
+        rows = await self._load(BOT_DATA)
+        return _loads(rows[""]) if "" in rows else {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def get_conversations(self, name: str) -> Dict[Tuple, object]:
+        rows = await self._load(CONVERSATION + name)
+        return {tuple(json.loads(k)): decode_state(_loads(v)) for k, v in rows.items()}
+
+    # ---------------------
+    # Writes (staged, flushed in batches)
+    # ---------------------
+
+    def _stage(self, namespace: str, key: str, value: Any, delete: bool = False) -> None:
+        if delete:
+            self._pending[(namespace, key)] = None
+        else:
+            try:
+                self._pending[(namespace, key)] = _dumps(value)
+            except (TypeError, ValueError) as e:
+                # Keep the in-memory copy; only the unserializable entry is not persisted
+                logger.warning(f"Not persisting {namespace}[{key}]: {e}")
+                return
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_pending())
+
+    async def update_user_data(self, user_id: int, data: Dict[Any, Any]) -> None:
+        self._stage(USER_DATA, str(user_id), data)
+
+    async def update_chat_data(self, chat_id: int, data: Dict[Any, Any]) -> None:
+        self._stage(CHAT_DATA, str(chat_id), data)
+
+    async def update_bot_data(self, data: Dict[Any, Any]) -> None:
+        self._stage(BOT_DATA, "", data)
+
+    async def update_callback_data(self, data: Any) -> None:
+        return None
+
+    async def update_conversation(self, name: str, key: Tuple, new_state: Optional[object]) -> None:
+        self._stage(
+            CONVERSATION + name,
+            _dumps(list(key)),
+            encode_state(new_state),
+            delete=new_state is None,
+        )
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._stage(USER_DATA, str(user_id), None, delete=True)
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self._stage(CHAT_DATA, str(chat_id), None, delete=True)
+
+    async def refresh_user_data(self, user_id: int, user_data: Dict[Any, Any]) -> None:
+        return None
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: Dict[Any, Any]) -> None:
+        return None
+
+    async def refresh_bot_data(self, bot_data: Dict[Any, Any]) -> None:
+        return None
+
+    async def _flush_pending(self) -> None:
+        # Let the rest of this `update_persistence` run stage its entries first
+        await asyncio.sleep(0)
+        delay = self.retry_min_seconds
+        while self._pending:
+            batch, self._pending = self._pending, {}
+            try:
+                await self._write(batch)
+                self.stats["batches"] += 1
+                self.stats["rows"] += len(batch)
+                delay = self.retry_min_seconds
+                continue
+            except Exception as e:
+                self.stats["errors"] += 1
+                # Keep the batch for the retry, unless a newer value was staged meanwhile
+                for item, value in batch.items():
+                    self._pending.setdefault(item, value)
+                if self._flushing:
+                    logger.error(f"Persistence flush of {len(batch)} entries failed: {e}")
+                    return
+                logger.error(
+                    f"Persistence flush of {len(batch)} entries failed, "
+                    f"retrying in {delay:.0f}s: {e}"
+                )
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            delay = min(delay * 2, self.retry_max_seconds)
+
+    async def _write(self, batch: Dict[Tuple[str, str], Optional[str]]) -> None:
+        from database import async_service
+
+        upserts = [
+            {"namespace": ns, "key": key, "data": data}
+            for (ns, key), data in batch.items()
+            if data is not None
+        ]
+        deletes = defaultdict(list)
+        for (ns, key), data in batch.items():
+            if data is None:
+                deletes[ns].append(key)
+        await async_service.run_in_session(_write_batch, upserts, dict(deletes))
+
+    async def flush(self) -> None:
+        """Write everything still pending (called by PTB on shutdown)."""
+        self._flushing = True
+        self._wake.set()
+        try:
+            task = self._flush_task
+            if task is not None and not task.done():
+                # The running flush also picks up whatever is staged while it writes
+                await asyncio.gather(task, return_exceptions=True)
+            elif self._pending:
+                self._flush_task = None
+                await self._flush_pending()
+        finally:
+            self._flushing = False
+
+
+def _write_batch(session, upserts, deletes) -> None:
+    """Upsert `upserts` and delete `deletes` ({namespace: [keys]}) in one transaction."""
+    from sqlalchemy import delete, insert
+    from sqlalchemy.dialects import postgresql, sqlite
+    from database.models_sql import BotPersistenceRecord as Record
+
+    for namespace, keys in deletes.items():
+        session.execute(delete(Record).where(Record.namespace == namespace, Record.key.in_(keys)))
+    if not upserts:
+        return
+    now = dt.datetime.now(dt.timezone.utc)
+    rows = [dict(row, updated_at=now) for row in upserts]
+    dialect = session.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        stmt: Union[postgresql.Insert, sqlite.Insert] = (
+            postgresql.insert(Record) if dialect == "postgresql" else sqlite.insert(Record)
+        )
+        session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[Record.namespace, Record.key],
+                set_={"data": stmt.excluded.data, "updated_at": stmt.excluded.updated_at},
+            ),
+            rows,
+        )
+        return
+    # Other dialects: replace the rows
+    for namespace in {row["namespace"] for row in rows}:
+        keys = [row["key"] for row in rows if row["namespace"] == namespace]
+        session.execute(delete(Record).where(Record.namespace == namespace, Record.key.in_(keys)))
+    session.execute(insert(Record), rows)
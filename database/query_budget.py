@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SQL round-trip budgets for handlers.
+
+`count_queries()` counts what the code inside the block sends to the database:
+statements, connection checkouts (each one a pre-ping on `ENGINE`) and transaction
+ends (COMMIT / ROLLBACK). Work pushed to worker threads through
+`database.db.run_blocking` / `iterate_blocking` runs in a copy of the caller's
+context, so it is counted too, while concurrent unrelated work is not; pass
+`all_contexts=True` to count everything on the engine (e.g. across an HTTP request
+served by another task).
+
+`QUERY_BUDGETS` declares the most each main user path may spend, and
+`query_budget(name)` fails with `QueryBudgetExceeded` (listing the statement
+fingerprints) when a block goes over, so a handler that quietly grows an N+1 or a
+second session is caught by the test suite.
+"""
+
+from __future__ import annotations
+
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Iterator, List, Tuple, Union
+
+from sqlalchemy import event
+
+from database.db import ENGINE, fingerprint
+
+
+@dataclass(frozen=True)
+class QueryBudget:
+    """Most statements and connection checkouts (sessions) one invocation may use"""
+
+    statements: int
+    connections: int = 1
+
+
+# Budgets for the main user paths; each counts a cold cache (first request of a user)
+QUERY_BUDGETS = {
+    # Registration lookup through the user cache
+    "send_main_menu": QueryBudget(statements=1),
+    # Cached registration lookup + profile read
+    "handle_menu_selection": QueryBudget(statements=2, connections=2),
+    # User lookup, purchase + receipt inserts in one transaction, then the payment token
+    # store: periodic purge, duplicate-receipt and open-token checks, create, messages
+    "handle_payment_receipt": QueryBudget(statements=8, connections=7),
+    # Cached user lookup, then one transaction: stats read, attempt insert, stats upsert
+    # and the Telegram ID for the leaderboard (the answer is checked in memory)
+    "handle_quiz_answer": QueryBudget(statements=5, connections=2),
+    # One page of orders: COUNT(*) + the page with its receipt flags
+    "admin_list": QueryBudget(statements=2),
+}
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryCount:
+    """Statements, connection checkouts and transaction ends seen inside a block"""
+
+    def __init__(self) -> None:
+        self.statements: List[str] = []
+        self.connections = 0
+        self.transactions = 0
+
+    @property
+    def round_trips(self) -> int:
+        return len(self.statements) + self.connections + self.transactions
+
+    def by_fingerprint(self) -> List[Tuple[str, int]]:
+        return Counter(fingerprint(s) for s in self.statements).most_common()
+
+    def describe(self) -> str:
+        lines = [
+            f"{len(self.statements)} statement(s), {self.connections} connection(s), "
+            f"{self.transactions} commit/rollback(s)"
+        ]
+        lines.extend(f"  {count}x {fp}" for fp, count in self.by_fingerprint())
+        return "\n".join(lines)
+
+
+_active: ContextVar[Tuple[QueryCount, ...]] = ContextVar("query_counts", default=())
+_global: List[QueryCount] = []
+_installed = set()
+
+
+def _counters() -> Tuple[QueryCount, ...]:
+    active = _active.get()
+    return active + tuple(c for c in _global if c not in active) if _global else active
+
+
+def _install(engine) -> None:
+    engine = getattr(engine, "sync_engine", engine)
+    if id(engine) in _installed:
+        return
+    _installed.add(id(engine))
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _statement(conn, cursor, statement, parameters, context, executemany):
+        for counter in _counters():
+            counter.statements.append(statement)
+
+    @event.listens_for(engine, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        for counter in _counters():
+            counter.connections += 1
+
+    @event.listens_for(engine, "commit")
+    def _commit(conn):
+        for counter in _counters():
+            counter.transactions += 1
+
+    @event.listens_for(engine, "rollback")
+    def _rollback(conn):
+        for counter in _counters():
+            counter.transactions += 1
+
+
+@contextmanager
+def count_queries(engine=None, all_contexts: bool = False) -> Iterator[QueryCount]:
+    """Count the statements, checkouts and transaction ends issued inside the block."""
+    _install(engine if engine is not None else ENGINE)
+    counter = QueryCount()
+    if all_contexts:
+        _global.append(counter)
+        try:
+            yield counter
+        finally:
+            _global.remove(counter)
+        return
+    token = _active.set(_active.get() + (counter,))
+    try:
+        yield counter
+    finally:
+        _active.reset(token)
+
+
+def check_budget(budget: Union[str, QueryBudget], counted: QueryCount) -> None:
+    """Raise `QueryBudgetExceeded` if `counted` is over `budget` (a `QUERY_BUDGETS` key)."""
+    name = budget if isinstance(budget, str) else "block"
+    if isinstance(budget, str):
+        budget = QUERY_BUDGETS[budget]
+    over = []
+    if len(counted.statements) > budget.statements:
+        over.append(f"{len(counted.statements)} statements > {budget.statements}")
+    if counted.connections > budget.connections:
+        over.append(f"{counted.connections} connections > {budget.connections}")
+    if over:
+        raise QueryBudgetExceeded(
+            f"{name} is over its SQL budget ({', '.join(over)}):\n{counted.describe()}"
+        )
+
+
+@contextmanager
+def query_budget(
+    budget: Union[str, QueryBudget], engine=None, all_contexts: bool = False
+) -> Iterator[QueryCount]:
+    """`count_queries()` that checks the result against `budget` when the block exits."""
+    with count_queries(engine, all_contexts=all_contexts) as counted:
+        yield counted
+    check_budget(budget, counted)
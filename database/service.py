@@ -4,13 +4,13 @@ from __future__ import annotations
 
 import os
 import datetime as dt
-from typing import Optional, Tuple, List, Dict
+from typing import Any, Optional, Tuple, List, Dict
 
-from sqlalchemy import select, update, func
+from sqlalchemy import case, select, update, func
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
-from database.db import session_scope
+from database.db import session_scope, invalidate_schema_gate
 from database.models_sql import (
     User,
     ProfileChange,
@@ -23,6 +23,9 @@ from database.models_sql import (
     UserStats,
 )
 from utils.crypto import crypto_manager
+from utils.ban_registry import publish_ban_change, record_ban_change
+from utils.leaderboard import record_points
+from utils.stats_snapshot import record_purchase_change, record_user_created
 
 
 # ---------------------
@@ -35,6 +38,12 @@ def encrypt_text(_: Optional[str]) -> str:
     return ""
 
 
+def get_user_by_telegram_id(session: Session, telegram_user_id: int) -> Optional[User]:
+    return session.execute(
+        select(User).where(User.telegram_user_id == telegram_user_id)
+    ).scalar_one_or_none()
+
+
 def get_or_create_user(
     session: Session,
     telegram_user_id: int,
@@ -62,6 +71,7 @@ def get_or_create_user(
         )
         session.add(user)
         session.flush()
+        record_user_created(session)
         return user
 
     # Update fields if provided
@@ -122,9 +132,9 @@ def audit_profile_change(
             "new": new_value or "",
             "by": int(changed_by),
         }
-        data_dir = Path("data")
-        data_dir.mkdir(exist_ok=True)
-        with (data_dir / "profile_changes.json").open("a", encoding="utf-8") as f:
+        log_path = Path(os.getenv("PROFILE_AUDIT_LOG", "data/profile_changes.json"))
+        log_path.parent.mkdir(parents=True, exist_ok=True)
+        with log_path.open("a", encoding="utf-8") as f:
             f.write(json.dumps(rec, ensure_ascii=False) + "\n")
     except Exception:
         # Never fail main flow due to file I/O
@@ -157,13 +167,17 @@ def create_purchase(
         discount=discount,
         payment_method=payment_method,
         transaction_id=transaction_id,
-        notes_enc=None,
     )
     session.add(purchase)
     session.flush()
+    record_purchase_change(session, None, status)
     return purchase
 
 
+def list_user_purchases(session: Session, user_id: int) -> List[Purchase]:
+    return list(session.execute(select(Purchase).where(Purchase.user_id == user_id)).scalars())
+
+
 def add_receipt(
     session: Session,
     purchase_id: int,
@@ -208,6 +222,7 @@ def approve_or_reject_purchase(
     ).first()
     if not result:
         return None
+    record_purchase_change(session, "pending", result.status)
 
     # Write audit record
     session.add(PurchaseAudit(purchase_id=purchase_id, admin_id=admin_id, action=decision))
@@ -314,30 +329,17 @@ def is_user_banned(session: Session, telegram_user_id: int) -> bool:
             is not None
         )
     except Exception:
-        # Table may be missing on first boot → attempt init once
-        try:
-            from database.migrate import init_db
-
-            init_db()
-        except Exception:
-            pass
-        try:
-            return (
-                session.execute(
-                    select(BannedUser).where(BannedUser.telegram_user_id == telegram_user_id)
-                ).scalar_one_or_none()
-                is not None
-            )
-        except Exception:
-            pass
+        # Table may be missing → fail open and let the readiness gate re-check the schema
+        invalidate_schema_gate()
         return False
 
 
 def ban_user(session: Session, telegram_user_id: int) -> bool:
-    if is_user_banned(session, telegram_user_id):
-        return True
-    session.add(BannedUser(telegram_user_id=telegram_user_id))
-    session.flush()
+    if not is_user_banned(session, telegram_user_id):
+        session.add(BannedUser(telegram_user_id=telegram_user_id))
+        session.flush()
+        publish_ban_change(session, "ban", telegram_user_id)
+    record_ban_change(session, "ban", telegram_user_id)
     return True
 
 
@@ -345,10 +347,11 @@ def unban_user(session: Session, telegram_user_id: int) -> bool:
     row = session.execute(
         select(BannedUser).where(BannedUser.telegram_user_id == telegram_user_id)
     ).scalar_one_or_none()
-    if not row:
-        return True
-    session.delete(row)
-    session.flush()
+    if row:
+        session.delete(row)
+        session.flush()
+        publish_ban_change(session, "unban", telegram_user_id)
+    record_ban_change(session, "unban", telegram_user_id)
     return True
 
 
@@ -358,28 +361,23 @@ def unban_user(session: Session, telegram_user_id: int) -> bool:
 
 
 def get_stats_summary(session: Session) -> Dict:
-    total_users = session.execute(select(func.count(User.id))).scalar() or 0
-    total_purchases = session.execute(select(func.count(Purchase.id))).scalar() or 0
-    pending_purchases = (
-        session.execute(
-            select(func.count(Purchase.id)).where(Purchase.status == "pending")
-        ).scalar()
-        or 0
-    )
-    approved_purchases = (
-        session.execute(
-            select(func.count(Purchase.id)).where(Purchase.status == "approved")
-        ).scalar()
-        or 0
-    )
-    rejected_purchases = (
-        session.execute(
-            select(func.count(Purchase.id)).where(Purchase.status == "rejected")
-        ).scalar()
-        or 0
+    # One pass over purchases with conditional aggregates instead of a COUNT per status
+    def _count_status(status: str):
+        return func.coalesce(func.sum(case((Purchase.status == status, 1), else_=0)), 0)
+
+    totals = session.execute(
+        select(
+            func.count(Purchase.id),
+            _count_status("pending"),
+            _count_status("approved"),
+            _count_status("rejected"),
+        )
+    ).one()
+    total_purchases, pending_purchases, approved_purchases, rejected_purchases = (
+        int(v or 0) for v in totals
     )
 
-    grades = [
+    grades: List[Dict[str, Any]] = [
         {
             "grade": r[0] or "",
             "count": int(r[1] or 0),
@@ -391,6 +389,9 @@ def get_stats_summary(session: Session) -> Dict:
         )
     ]
 
+    # Every user falls in exactly one grade bucket, so the grade breakdown also gives the total
+    total_users = sum(g["count"] for g in grades)
+
     cities_top = [
         {
             "city": r[0] or "",
@@ -464,7 +465,12 @@ def upsert_user_stats(session: Session, user_db_id: int, correct: bool) -> None:
         )
         session.add(stats)
         session.flush()
+        telegram_user_id = session.scalar(
+            select(User.telegram_user_id).where(User.id == user_db_id)
+        )
+        record_points(session, user_db_id, stats.points, stats.points, telegram_user_id)
         return
+    points_before = stats.points or 0
     stats.total_attempts += 1
     if correct:
         stats.total_correct += 1
@@ -473,6 +479,7 @@ def upsert_user_stats(session: Session, user_db_id: int, correct: bool) -> None:
     if stats.last_daily_award_date != today:
         stats.points += 5
         stats.last_daily_award_date = today
+    record_points(session, user_db_id, stats.points, stats.points - points_before)
     # streak
     if stats.last_attempt_date == today:
         pass
@@ -503,24 +510,22 @@ def get_daily_question(session: Session, grade: str) -> QuizQuestion | None:
         )
         return q
     except Exception:
-        try:
-            from database.migrate import init_db
-
-            init_db()
-        except Exception:
-            pass
+        invalidate_schema_gate()
         return None
 
 
 def submit_answer(session: Session, user_db_id: int, question_id: int, selected_index: int) -> bool:
-    question = (
-        session.execute(select(QuizQuestion).where(QuizQuestion.id == question_id))
-        .scalars()
-        .first()
-    )
-    if not question:
-        return False
-    is_correct = int(selected_index == int(question.correct_index))
+    from utils.question_bank import question_bank
+
+    correct_index = question_bank.correct_index(question_id)
+    if correct_index is None:
+        # Not in the bank (not loaded yet, or added since the last reload)
+        correct_index = session.execute(
+            select(QuizQuestion.correct_index).where(QuizQuestion.id == question_id)
+        ).scalar()
+        if correct_index is None:
+            return False
+    is_correct = int(selected_index == int(correct_index))
     attempt = QuizAttempt(
         user_id=user_db_id,
         question_id=question_id,
@@ -541,12 +546,7 @@ def get_user_stats(session: Session, user_db_id: int) -> Dict:
             .first()
         )
     except Exception:
-        try:
-            from database.migrate import init_db
-
-            init_db()
-        except Exception:
-            pass
+        invalidate_schema_gate()
         stats = None
     if not stats:
         return {"total_attempts": 0, "total_correct": 0, "streak_days": 0, "points": 0}
@@ -561,37 +561,15 @@ def get_user_stats(session: Session, user_db_id: int) -> Dict:
 def get_leaderboard_top(session: Session, limit: int = 10) -> List[Dict]:
     try:
         q = session.execute(
-            select(UserStats.user_id, UserStats.points)
-            .order_by(UserStats.points.desc())
-            .limit(max(1, min(50, limit)))
-        )
-        user_ids = [r.user_id for r in q]
-        if not user_ids:
-            return []
-        # Map user_id -> telegram id
-        m = {}
-        rows = session.execute(select(User.id, User.telegram_user_id).where(User.id.in_(user_ids)))
-        for r in rows:
-            m[int(r.id)] = int(r.telegram_user_id)
-        q2 = session.execute(
-            select(UserStats.user_id, UserStats.points)
+            select(User.telegram_user_id, UserStats.points)
+            .join(User, User.id == UserStats.user_id)
             .order_by(UserStats.points.desc())
             .limit(max(1, min(50, limit)))
         )
-        out = []
-        for r in q2:
-            out.append(
-                {
-                    "telegram_user_id": int(m.get(int(r.user_id), 0)),
-                    "points": int(r.points or 0),
-                }
-            )
-        return out
+        return [
+            {"telegram_user_id": int(r.telegram_user_id or 0), "points": int(r.points or 0)}
+            for r in q
+        ]
     except Exception:
-        try:
-            from database.migrate import init_db
-
-            init_db()
-        except Exception:
-            pass
+        invalidate_schema_gate()
         return []
@@ -6,7 +6,9 @@ This provides all the database models and functions that tests need
 to run without the actual database.
 """
 
+import os
 import sys
+import types
 from unittest.mock import MagicMock
 from datetime import datetime, timezone
 
@@ -709,13 +711,32 @@ class IntegrityError(Exception):
 # Add to sys.modules so imports work
 sys.modules['database.models_sql'] = sys.modules[__name__]
 sys.modules['database'] = sys.modules[__name__]
+# Submodules without a stand-in (persistence, broadcast stores, ...) load from the real package
+__path__ = [os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database')]
 setattr(sys.modules['database'], 'db', None)  # temporary, set after class definition
 setattr(sys.modules['database'], 'alembic_metadata', alembic_metadata)
 
 
 # Create a mock database.db module
+# Blocking helpers run inline: the mock store is a plain in-process dict
+async def _run_blocking(fn, *args, **kwargs):
+    return fn(*args, **kwargs)
+
+
+async def _iterate_blocking(gen_fn, *args, max_pending=8, **kwargs):
+    for item in gen_fn(*args, **kwargs):
+        yield item
+
+
 class database_db_module:
     session_scope = session_scope
+    run_blocking = staticmethod(_run_blocking)
+    iterate_blocking = staticmethod(_iterate_blocking)
+    schema_ready = staticmethod(lambda: True)
+    ensure_schema_ready = staticmethod(lambda force=False: True)
+    invalidate_schema_gate = staticmethod(lambda: None)
+    QUERY_TELEMETRY = MagicMock()
+    ASYNC_ENGINE = None
     SessionLocal = Session
     Base = Base
     ENGINE = MagicMock()
@@ -795,6 +816,16 @@ def is_user_banned(session, telegram_user_id):
     return False
 
 
+def get_user_by_telegram_id(session, telegram_user_id):
+    """Mock get_user_by_telegram_id function"""
+    return session.query(User).filter_by(telegram_user_id=telegram_user_id).first()
+
+
+def get_user_stats(session, user_db_id):
+    """Mock get_user_stats function"""
+    return {"total_attempts": 0, "total_correct": 0, "streak_days": 0, "points": 0}
+
+
 def get_or_create_user(session, telegram_user_id, first_name=None, last_name=None, **kwargs):
     """Mock get_or_create_user function"""
     # Try to find existing user
@@ -1072,6 +1103,8 @@ class database_service_module:
     ban_user = ban_user
     unban_user = unban_user
     is_user_banned = is_user_banned
+    get_user_by_telegram_id = get_user_by_telegram_id
+    get_user_stats = get_user_stats
     get_or_create_user = get_or_create_user
     create_purchase = create_purchase
     approve_or_reject_purchase = approve_or_reject_purchase
@@ -1092,6 +1125,34 @@ sys.modules['database.service'] = database_service_module
 setattr(sys.modules['database'], 'service', database_service_module)
 
 
+def _run_in_mock_session(fn, *args, **kwargs):
+    with session_scope() as session:
+        return fn(session, *args, **kwargs)
+
+
+# Create a mock database.async_service module: every service function, awaitable
+database_async_service_module = types.ModuleType('database.async_service')
+
+
+async def _async_run_in_session(fn, *args, **kwargs):
+    return _run_in_mock_session(fn, *args, **kwargs)
+
+
+def _async_service_getattr(name):
+    fn = getattr(database_service_module, name)
+
+    async def wrapper(*args, **kwargs):
+        return _run_in_mock_session(fn, *args, **kwargs)
+
+    return wrapper
+
+
+database_async_service_module.run_in_session = _async_run_in_session
+database_async_service_module.__getattr__ = _async_service_getattr
+sys.modules['database.async_service'] = database_async_service_module
+setattr(sys.modules['database'], 'async_service', database_async_service_module)
+
+
 class sqlalchemy_exc_module:
     IntegrityError = IntegrityError
 
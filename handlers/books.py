@@ -25,6 +25,7 @@ from telegram.constants import ParseMode
 from config import config
 from utils.rate_limiter import rate_limit_handler
 from ui.keyboards import build_main_menu_keyboard
+from ui.render_cache import RenderedScreen, render_cache
 from handlers.payments import handle_payment_receipt as unified_payment_receipt
 from utils.validators import Validator
 
@@ -66,8 +67,12 @@ BOOK_DETAILS = {
 @rate_limit_handler("default")
 async def handle_book_info(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle /book command - Show book information"""
-    # Show book details
-    message_text = (
+    screen = render_cache.get("book_info_command", _render_book_info_command)
+    await update.message.reply_text(screen.text, reply_markup=screen.reply_markup, **screen.options)
+
+
+def _book_summary(purchase_hint: str) -> str:
+    return (
         f"📘 کتاب «{BOOK_DETAILS['title']}»\n"
         f"{BOOK_DETAILS['subtitle']}\n\n"
         f"✍ تألیف: {BOOK_DETAILS['author']}\n"
@@ -80,18 +85,33 @@ async def handle_book_info(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         f"3️⃣ تکنیک این‌همانی در تست‌ها (مطابق کنکور ۱۴۰۴)\n"
         f"4️⃣ تحلیل نمودارها با کاربرد کنکوری\n\n"
         f"✨ این کتاب فقط یک مجموعه تست نیست؛ مرجعی مفهومی برای یادگیری عمیق ریاضی است.\n\n"
-        f"🛒 برای خرید، از منوی اصلی گزینه «کتاب انفجار خلاقیت» را انتخاب کنید."
+        f"{purchase_hint}"
     )
 
-    keyboard = [
-        [InlineKeyboardButton("🔙 بازگشت به منو", callback_data="back_to_menu")],
-    ]
 
-    await update.message.reply_text(
-        message_text,
-        reply_markup=InlineKeyboardMarkup(keyboard),
-        parse_mode=ParseMode.HTML,
-        disable_web_page_preview=True,
+_BOOK_SCREEN_OPTIONS = {"parse_mode": ParseMode.HTML, "disable_web_page_preview": True}
+
+
+def _render_book_info_command() -> RenderedScreen:
+    return RenderedScreen(
+        _book_summary("🛒 برای خرید، از منوی اصلی گزینه «کتاب انفجار خلاقیت» را انتخاب کنید."),
+        InlineKeyboardMarkup(
+            [[InlineKeyboardButton("🔙 بازگشت به منو", callback_data="back_to_menu")]]
+        ),
+        _BOOK_SCREEN_OPTIONS,
+    )
+
+
+def _render_book_info() -> RenderedScreen:
+    return RenderedScreen(
+        _book_summary("🛒 برای خرید، از طریق ربات اقدام کنید."),
+        InlineKeyboardMarkup(
+            [
+                [InlineKeyboardButton("🛍 خرید کتاب", callback_data="start_book_purchase")],
+                [InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_menu")],
+            ]
+        ),
+        _BOOK_SCREEN_OPTIONS,
     )
 
 
@@ -105,33 +125,8 @@ async def show_book_info(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     await query.answer()
 
     # Show book details with purchase button
-    message_text = (
-        f"📘 کتاب «{BOOK_DETAILS['title']}»\n"
-        f"{BOOK_DETAILS['subtitle']}\n\n"
-        f"✍ تألیف: {BOOK_DETAILS['author']}\n"
-        f"📚 ویژه پایه‌های ۱۰، ۱۱ و ۱۲ رشته ریاضی و تجربی\n"
-        f"📄 {BOOK_DETAILS['pages']} صفحه | 💰 قیمت: {BOOK_DETAILS['price']:,} تومان\n"
-        f"📦 ارسال فقط روزهای شنبه با پست\n\n"
-        f"🔍 فصل‌های اصلی:\n"
-        f"1️⃣ حل خلاقانه معادلات و نامعادلات\n"
-        f"2️⃣ اتحادهای مفهومی و کاربردی\n"
-        f"3️⃣ تکنیک این‌همانی در تست‌ها (مطابق کنکور ۱۴۰۴)\n"
-        f"4️⃣ تحلیل نمودارها با کاربرد کنکوری\n\n"
-        f"✨ این کتاب فقط یک مجموعه تست نیست؛ مرجعی مفهومی برای یادگیری عمیق ریاضی است.\n\n"
-        f"🛒 برای خرید، از طریق ربات اقدام کنید."
-    )
-
-    keyboard = [
-        [InlineKeyboardButton("🛍 خرید کتاب", callback_data="start_book_purchase")],
-        [InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_menu")],
-    ]
-
-    await query.edit_message_text(
-        message_text,
-        reply_markup=InlineKeyboardMarkup(keyboard),
-        parse_mode=ParseMode.HTML,
-        disable_web_page_preview=True,
-    )
+    screen = render_cache.get("book_info", _render_book_info)
+    await query.edit_message_text(screen.text, reply_markup=screen.reply_markup, **screen.options)
     return ConversationHandler.END
 
 
@@ -308,8 +303,8 @@ async def cancel_book_purchase(update: Update, context: ContextTypes.DEFAULT_TYP
     return ConversationHandler.END
 
 
-def build_book_purchase_conversation() -> ConversationHandler:
-    """Build the book purchase conversation handler"""
+def build_book_purchase_conversation(persistent: bool = False) -> ConversationHandler:
+    """Build the book purchase conversation handler (`persistent` needs an application persistence)"""
     return ConversationHandler(
         entry_points=[
             CallbackQueryHandler(show_book_info, pattern="^book_info$"),
@@ -335,7 +330,7 @@ def build_book_purchase_conversation() -> ConversationHandler:
             CommandHandler("cancel", cancel_book_purchase),
         ],
         name="book_purchase",
-        persistent=False,
+        persistent=persistent,
         per_chat=True,
     )
 
@@ -14,25 +14,43 @@ import time
 from config import config
 from datetime import datetime, timedelta
 from database.db import session_scope
+from database import async_service
+from utils.user_cache import get_cached_user
+from utils.catalog import course_catalog
+from utils.question_bank import question_bank
+from ui.render_cache import RenderedScreen, render_cache
 from utils.rate_limiter import rate_limit_handler
 from ui.keyboards import build_main_menu_keyboard
 from database.service import get_or_create_user, create_purchase
 from utils.admin_notify import send_paginated_list
 from database.service import get_course_participants_by_slug
-from database.service import get_daily_question, submit_answer
 from sqlalchemy import select
 from database.models_sql import User as DBUser
-from database.service import approve_or_reject_purchase, get_pending_purchases
+from database.service import get_pending_purchases
 
 logger = logging.getLogger(__name__)
 
 
+async def _show(query, name: str, render, *sources) -> None:
+    """Edit the callback message into the cached screen `name`."""
+    screen = render_cache.get(name, render, *sources)
+    await query.edit_message_text(screen.text, reply_markup=screen.reply_markup, **screen.options)
+
+
 @rate_limit_handler("default")
 async def handle_courses_overview(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a concise Farsi overview of all available programs and the book."""
     query = update.callback_query
     if query:
         await query.answer()
+    screen = render_cache.get("courses_overview", _render_courses_overview)
+    if query:
+        await query.edit_message_text(screen.text, reply_markup=screen.reply_markup)
+    else:
+        await update.effective_message.reply_text(screen.text, reply_markup=screen.reply_markup)
+
+
+def _render_courses_overview() -> RenderedScreen:
     text = (
         "معرفی کامل دوره‌ها و کتاب استاد حاتمی:\n\n"
         "🔰 دوره ۱ | مهارت‌های خلاق در حل مسائل ریاضی (رایگان)\n"
@@ -60,10 +78,7 @@ async def handle_courses_overview(update: Update, context: ContextTypes.DEFAULT_
             [InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_menu")],
         ]
     )
-    if query:
-        await query.edit_message_text(text, reply_markup=kb)
-    else:
-        await update.effective_message.reply_text(text, reply_markup=kb)
+    return RenderedScreen(text, kb)
 
 
 @rate_limit_handler("default")
@@ -75,34 +90,20 @@ async def handle_free_courses(update: Update, context: ContextTypes.DEFAULT_TYPE
 
     await query.answer()
 
-    # Load free courses with caching
-    import json, os
-    from utils.cache import cache_manager
+    await _show(query, "courses_free", _render_free_courses, course_catalog)
 
-    c = cache_manager.get_cache("courses")
-    all_courses = c._get_sync("all_courses")
-    if all_courses is None:
-        try:
-            with open("data/courses.json", "r", encoding="utf-8") as f:
-                all_courses = json.load(f)
-        except Exception:
-            all_courses = []
-        c._set_sync("all_courses", all_courses, ttl=600)
-    free_courses = [
-        course
-        for course in all_courses
-        if course.get("course_type") == "free" and course.get("is_active")
-    ]
+
+def _render_free_courses() -> RenderedScreen:
+    free_courses = course_catalog.by_type("free", active_only=True)
 
     if not free_courses:
-        await query.edit_message_text(
+        return RenderedScreen(
             "📚 در حال حاضر دوره رایگانی موجود نیست.\n\n" "🔙 بازگشت به منوی اصلی:",
-            reply_markup=InlineKeyboardMarkup(
+            InlineKeyboardMarkup(
                 [[InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_menu")]]
             ),
-            parse_mode=ParseMode.HTML,
+            {"parse_mode": ParseMode.HTML},
         )
-        return
 
     # Build course list with registration buttons
     keyboard = []
@@ -135,10 +136,8 @@ async def handle_free_courses(update: Update, context: ContextTypes.DEFAULT_TYPE
 
     keyboard.append([InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_menu")])
 
-    await query.edit_message_text(
-        message_text,
-        reply_markup=InlineKeyboardMarkup(keyboard),
-        disable_web_page_preview=True,
+    return RenderedScreen(
+        message_text, InlineKeyboardMarkup(keyboard), {"disable_web_page_preview": True}
     )
 
 
@@ -150,7 +149,10 @@ async def handle_paid_courses(update: Update, context: ContextTypes.DEFAULT_TYPE
         return
 
     await query.answer()
+    await _show(query, "courses_paid", _render_paid_courses)
+
 
+def _render_paid_courses() -> RenderedScreen:
     text = (
         "دوره‌های تخصصی:\n\n"
         "1) کلاس‌های تک‌درس — ۲۰ تا ۲۵ جلسه، هر جلسه ۹۰ دقیقه — جلسه‌ای ۱۵۰ هزار ت (پرداخت کامل قبل از شروع)\n\n"
@@ -169,7 +171,7 @@ async def handle_paid_courses(update: Update, context: ContextTypes.DEFAULT_TYPE
         ]
     )
 
-    await query.edit_message_text(text, reply_markup=kb)
+    return RenderedScreen(text, kb)
 
 
 @rate_limit_handler("default")
@@ -179,6 +181,10 @@ async def handle_paid_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     if not query:
         return
     await query.answer()
+    await _show(query, "paid_menu", _render_paid_menu)
+
+
+def _render_paid_menu() -> RenderedScreen:
     text = (
         "💼 دوره‌های تخصصی:\n\n"
         "1) کلاس‌های آموزشی تک‌درس (تجربی/ریاضی) — مخصوص امتحان نهایی و آزمون‌های آزمایشی\n"
@@ -195,7 +201,7 @@ async def handle_paid_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -
             [InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_menu")],
         ]
     )
-    await query.edit_message_text(text, reply_markup=kb)
+    return RenderedScreen(text, kb)
 
 
 @rate_limit_handler("default")
@@ -204,6 +210,10 @@ async def handle_paid_single(update: Update, context: ContextTypes.DEFAULT_TYPE)
     if not query:
         return
     await query.answer()
+    await _show(query, "paid_single", _render_paid_single)
+
+
+def _render_paid_single() -> RenderedScreen:
     kb = InlineKeyboardMarkup(
         [
             [InlineKeyboardButton("تجربی: ریاضی ۱", callback_data="paid_single_exp_math1")],
@@ -217,9 +227,9 @@ async def handle_paid_single(update: Update, context: ContextTypes.DEFAULT_TYPE)
             [InlineKeyboardButton("🔙 بازگشت", callback_data="paid_menu")],
         ]
     )
-    await query.edit_message_text(
+    return RenderedScreen(
         "کلاس‌های تک‌درس (۲۰–۲۵ جلسه، ۹۰ دقیقه، ۱۵۰هزار/جلسه) — مخصوص امتحان نهایی/آزمون‌های آزمایشی",
-        reply_markup=kb,
+        kb,
     )
 
 
@@ -242,28 +252,15 @@ async def handle_paid_single_select(update: Update, context: ContextTypes.DEFAUL
     }
     key = query.data
     title, slug = slug_map.get(key, ("تک‌درس", "single_unknown"))
-    # Try enrich from data/courses.json if exists
+    # Try enrich from data/courses.json if exists: by course_id, else a paid course whose
+    # id contains the slug (e.g. "exp_math1_1403")
     try:
-        import json
-        from utils.cache import cache_manager
-
-        c = cache_manager.get_cache("courses")
-        all_courses = c._get_sync("all_courses")
-        if all_courses is None:
-            with open("data/courses.json", "r", encoding="utf-8") as f:
-                all_courses = json.load(f)
-            c._set_sync("all_courses", all_courses, ttl=600)
-        # Find any paid course matching our slug key by course_id or title contains
-        course = next(
-            (
-                co
-                for co in all_courses
-                if isinstance(co, dict)
-                and co.get("course_type") == "paid"
-                and (co.get("course_id") == slug or slug in (co.get("course_id") or ""))
-            ),
-            None,
-        )
+        course = course_catalog.get(slug)
+        if not course or course.get("course_type") != "paid":
+            course = next(
+                (c for c in course_catalog.by_type("paid") if slug in (c.get("course_id") or "")),
+                None,
+            )
         if course:
             price = course.get("price", 150000)
             duration = course.get("duration", "۹۰ دقیقه")
@@ -326,6 +323,10 @@ async def handle_paid_private(update: Update, context: ContextTypes.DEFAULT_TYPE
     if not query:
         return
     await query.answer()
+    await _show(query, "paid_private", _render_paid_private)
+
+
+def _render_paid_private() -> RenderedScreen:
     text = (
         "کلاس‌های خصوصی آنلاین ریاضی:\n"
         "هماهنگی مستقیم با استاد:\n"
@@ -333,11 +334,9 @@ async def handle_paid_private(update: Update, context: ContextTypes.DEFAULT_TYPE
         "💬 @ostad_hatami\n\n"
         "هزینه کلاس خصوصی: تماس بگیرید (بر اساس زمان و درس انتخابی)."
     )
-    await query.edit_message_text(
+    return RenderedScreen(
         text,
-        reply_markup=InlineKeyboardMarkup(
-            [[InlineKeyboardButton("🔙 بازگشت", callback_data="paid_menu")]]
-        ),
+        InlineKeyboardMarkup([[InlineKeyboardButton("🔙 بازگشت", callback_data="paid_menu")]]),
     )
 
 
@@ -347,6 +346,10 @@ async def handle_paid_comprehensive(update: Update, context: ContextTypes.DEFAUL
     if not query:
         return
     await query.answer()
+    await _show(query, "paid_comprehensive", _render_paid_comprehensive)
+
+
+def _render_paid_comprehensive() -> RenderedScreen:
     kb = InlineKeyboardMarkup(
         [
             [InlineKeyboardButton("بخش تجربی", callback_data="paid_comp_exp")],
@@ -354,9 +357,9 @@ async def handle_paid_comprehensive(update: Update, context: ContextTypes.DEFAUL
             [InlineKeyboardButton("🔙 بازگشت", callback_data="paid_menu")],
         ]
     )
-    await query.edit_message_text(
+    return RenderedScreen(
         "دوره جامع پایه تا کنکور — ۴۰ جلسه (۹۰ دقیقه)، ۱۵۰هزار/جلسه",
-        reply_markup=kb,
+        kb,
     )
 
 
@@ -377,19 +380,7 @@ async def handle_paid_comp_select(update: Update, context: ContextTypes.DEFAULT_
         slug = "comp_math"
     # Try enrich from data
     try:
-        import json
-        from utils.cache import cache_manager
-
-        c = cache_manager.get_cache("courses")
-        all_courses = c._get_sync("all_courses")
-        if all_courses is None:
-            with open("data/courses.json", "r", encoding="utf-8") as f:
-                all_courses = json.load(f)
-            c._set_sync("all_courses", all_courses, ttl=600)
-        course = next(
-            (co for co in all_courses if isinstance(co, dict) and co.get("course_id") == slug),
-            None,
-        )
+        course = course_catalog.get(slug)
         price = (course.get("price") if course else 150000) or 150000
         duration = (course.get("duration") if course else "۹۰ دقیقه") or "۹۰ دقیقه"
         schedule = (
@@ -441,6 +432,10 @@ async def handle_paid_workshops(update: Update, context: ContextTypes.DEFAULT_TY
     if not query:
         return
     await query.answer()
+    await _show(query, "paid_workshops", _render_paid_workshops, course_catalog)
+
+
+def _render_paid_workshops() -> RenderedScreen:
     # Single source of truth for months
     from utils.workshops import get_workshop_months
 
@@ -452,26 +447,7 @@ async def handle_paid_workshops(update: Update, context: ContextTypes.DEFAULT_TY
     duration_line = ""
     price_line = ""
     try:
-        import json
-        from utils.cache import cache_manager
-
-        c = cache_manager.get_cache("courses")
-        all_courses = c._get_sync("all_courses")
-        if all_courses is None:
-            with open("data/courses.json", "r", encoding="utf-8") as f:
-                all_courses = json.load(f)
-            c._set_sync("all_courses", all_courses, ttl=600)
-
-        # Collect workshop entries
-        workshop_entries = []
-        for m in months:
-            cid = f"workshop_{m}"
-            co = next(
-                (x for x in all_courses if isinstance(x, dict) and x.get("course_id") == cid),
-                None,
-            )
-            if co:
-                workshop_entries.append(co)
+        workshop_entries = list(course_catalog.workshops().values())
 
         # Duration: show if all the same and non-empty
         durations = [str(co.get("duration") or "").strip() for co in workshop_entries]
@@ -502,7 +478,7 @@ async def handle_paid_workshops(update: Update, context: ContextTypes.DEFAULT_TY
         price_line = ""
 
     header_text = "همایش‌های ماهانه — موضوع بعداً اعلام می‌شود" + duration_line + price_line
-    await query.edit_message_text(header_text, reply_markup=InlineKeyboardMarkup(rows))
+    return RenderedScreen(header_text, InlineKeyboardMarkup(rows))
 
 
 @rate_limit_handler("default")
@@ -512,21 +488,18 @@ async def handle_workshop_select(update: Update, context: ContextTypes.DEFAULT_T
         return
     await query.answer()
     month = query.data.split(":", 1)[1]
+    if month in course_catalog.workshops():
+        await _show(query, f"workshop:{month}", lambda: _render_workshop(month), course_catalog)
+    else:
+        screen = _render_workshop(month)
+        await query.edit_message_text(screen.text, reply_markup=screen.reply_markup)
+
+
+def _render_workshop(month: str) -> RenderedScreen:
     slug = f"workshop_{month}"
     # Enrich from data if available
     try:
-        import json
-        from utils.cache import cache_manager
-
-        c = cache_manager.get_cache("courses")
-        all_courses = c._get_sync("all_courses")
-        if all_courses is None:
-            with open("data/courses.json", "r", encoding="utf-8") as f:
-                all_courses = json.load(f)
-            c._set_sync("all_courses", all_courses, ttl=600)
-        course = next(
-            (co for co in all_courses if isinstance(co, dict) and co.get("course_id") == slug), None
-        )
+        course = course_catalog.get(slug)
         # Normalize display title to use parentheses regardless of stored title
         title = (course.get("title") if course else None) or f"همایش ماهانه ({month})"
         # Prefer stored description, but normalize generic phrasing to our agreed style
@@ -572,7 +545,7 @@ async def handle_workshop_select(update: Update, context: ContextTypes.DEFAULT_T
             [InlineKeyboardButton("🔙 بازگشت", callback_data="paid_workshops")],
         ]
     )
-    await query.edit_message_text(text, reply_markup=kb)
+    return RenderedScreen(text, kb)
 
 
 @rate_limit_handler("default")
@@ -585,24 +558,16 @@ async def handle_purchased_courses(update: Update, context: ContextTypes.DEFAULT
     await query.answer()
 
     # Build user's courses from SQL purchases
-    from sqlalchemy import select
-    from database.models_sql import Purchase, User as DBUser
-
-    with session_scope() as session:
-        db_user = session.execute(
-            select(DBUser).where(DBUser.telegram_user_id == query.from_user.id)
-        ).scalar_one_or_none()
-        if not db_user:
-            await query.edit_message_text(
-                "❌ ابتدا ثبت‌نام کنید.",
-                reply_markup=InlineKeyboardMarkup(
-                    [[InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_menu")]]
-                ),
-            )
-            return
-        rows = list(
-            session.execute(select(Purchase).where(Purchase.user_id == db_user.id)).scalars()
+    db_user = await get_cached_user(query.from_user.id)
+    if not db_user:
+        await query.edit_message_text(
+            "❌ ابتدا ثبت‌نام کنید.",
+            reply_markup=InlineKeyboardMarkup(
+                [[InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_menu")]]
+            ),
         )
+        return
+    rows = await async_service.list_user_purchases(db_user.id)
     user_courses = {
         "free_courses": [
             p.product_id for p in rows if p.product_type == "course" and p.status == "approved"
@@ -626,23 +591,6 @@ async def handle_purchased_courses(update: Update, context: ContextTypes.DEFAULT
         )
         return
 
-    # Load course details from cache
-    import json
-    from utils.cache import cache_manager
-
-    c = cache_manager.get_cache("courses")
-    all_courses = c._get_sync("all_courses")
-    if all_courses is None:
-        try:
-            with open("data/courses.json", "r", encoding="utf-8") as f:
-                all_courses = json.load(f)
-        except Exception:
-            all_courses = []
-        c._set_sync("all_courses", all_courses, ttl=600)
-    course_details = {
-        c["course_id"]: c for c in all_courses if isinstance(c, dict) and c.get("course_id")
-    }
-
     # Build courses list
     message_text = "🛒 سبد خرید من:\n\n"
     keyboard = []
@@ -651,8 +599,8 @@ async def handle_purchased_courses(update: Update, context: ContextTypes.DEFAULT
     if user_courses["free_courses"]:
         message_text += "🎓 دوره‌های رایگان:\n"
         for course_id in user_courses["free_courses"]:
-            if course_id in course_details:
-                course = course_details[course_id]
+            course = course_catalog.get(course_id)
+            if course:
                 message_text += f"📚 {course['title']}\n"
                 if course.get("schedule"):
                     message_text += f"📅 {course['schedule']}\n"
@@ -664,8 +612,8 @@ async def handle_purchased_courses(update: Update, context: ContextTypes.DEFAULT
     if user_courses["purchased_courses"]:
         message_text += "💼 دوره‌های تخصصی:\n"
         for course_id in user_courses["purchased_courses"]:
-            if course_id in course_details:
-                course = course_details[course_id]
+            course = course_catalog.get(course_id)
+            if course:
                 message_text += f"📚 {course['title']}\n"
 
                 # Check if course is approved (has link)
@@ -740,23 +688,7 @@ async def handle_course_registration(update: Update, context: ContextTypes.DEFAU
         ):
             return
 
-    # Load course details from cache
-    import json
-    from utils.cache import cache_manager
-
-    c = cache_manager.get_cache("courses")
-    all_courses = c._get_sync("all_courses")
-    if all_courses is None:
-        try:
-            with open("data/courses.json", "r", encoding="utf-8") as f:
-                all_courses = json.load(f)
-        except Exception:
-            all_courses = []
-        c._set_sync("all_courses", all_courses, ttl=600)
-    course = next(
-        (c for c in all_courses if isinstance(c, dict) and c.get("course_id") == course_id),
-        None,
-    )
+    course = course_catalog.get(course_id)
 
     if course_type == "free":
         # Register free course in SQL as PENDING (awaiting admin approval)
@@ -764,15 +696,17 @@ async def handle_course_registration(update: Update, context: ContextTypes.DEFAU
             from utils.admin_notify import notify_admins
             from config import config as app_config
 
-            with session_scope() as session:
+            def _register_free(session):
                 u = get_or_create_user(session, query.from_user.id)
-                p = create_purchase(
+                return create_purchase(
                     session,
                     user_id=u.id,
                     product_type="course",
                     product_id=course_id,
                     status="pending",
                 )
+
+            await async_service.run_in_session(_register_free)
             course_title = course["title"] if course else "دوره رایگان"
             # Inform user
             await query.edit_message_text(
@@ -845,23 +779,7 @@ async def handle_course_registration_confirm(
         return
     course_id = (query.data or "")[len(prefix) :]
 
-    # Load course details from cache
-    import json
-    from utils.cache import cache_manager
-
-    c = cache_manager.get_cache("courses")
-    all_courses = c._get_sync("all_courses")
-    if all_courses is None:
-        try:
-            with open("data/courses.json", "r", encoding="utf-8") as f:
-                all_courses = json.load(f)
-        except Exception:
-            all_courses = []
-        c._set_sync("all_courses", all_courses, ttl=600)
-    course = next(
-        (c for c in all_courses if isinstance(c, dict) and c.get("course_id") == course_id),
-        None,
-    )
+    course = course_catalog.get(course_id)
 
     course_title = course["title"] if course else "دوره تخصصی"
     course_price = course.get("price", 0) if course else 0
@@ -945,8 +863,7 @@ async def admin_list_pending(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
     if update.effective_user.id not in app_config.bot.admin_user_ids:
         return
-    with session_scope() as session:
-        rows = get_pending_purchases(session, limit=200)
+    rows = await async_service.get_pending_purchases(limit=200)
     if not rows:
         await update.effective_message.reply_text("درخواست معلقی وجود ندارد.")
         return
@@ -1163,16 +1080,14 @@ async def admin_approve(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception:
         await update.effective_message.reply_text("شناسه نامعتبر است.")
         return
-    with session_scope() as session:
-        p = approve_or_reject_purchase(session, pid, update.effective_user.id, "approve")
+    p = await async_service.approve_or_reject_purchase(pid, update.effective_user.id, "approve")
     if not p:
         await update.effective_message.reply_text("عدم موفقیت در تأیید (شاید قبلاً رسیدگی شده).")
         return
     # Inform user with Skyroom convention
     try:
         # Fetch user's name for username
-        with session_scope() as session:
-            u = session.execute(select(DBUser).where(DBUser.id == p.user_id)).scalar_one_or_none()
+        u = await async_service.run_in_session(lambda session: session.get(DBUser, p.user_id))
         full_name = (
             " ".join(filter(None, [getattr(u, 'first_name', ''), getattr(u, 'last_name', '')]))
             or "کاربر"
@@ -1204,8 +1119,7 @@ async def admin_reject(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception:
         await update.effective_message.reply_text("شناسه نامعتبر است.")
         return
-    with session_scope() as session:
-        p = approve_or_reject_purchase(session, pid, update.effective_user.id, "reject")
+    p = await async_service.approve_or_reject_purchase(pid, update.effective_user.id, "reject")
     if not p:
         await update.effective_message.reply_text("عدم موفقیت در رد (شاید قبلاً رسیدگی شده).")
         return
@@ -1223,27 +1137,16 @@ async def handle_daily_quiz(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     await query.answer()
     user = query.from_user
-    with session_scope() as session:
-        db_user = session.execute(
-            select(DBUser).where(DBUser.telegram_user_id == user.id)
-        ).scalar_one_or_none()
-        if not db_user:
-            await query.edit_message_text("❌ ابتدا ثبت‌نام کنید.")
-            return
-        q = get_daily_question(session, db_user.grade or "دهم")
+    db_user = await get_cached_user(user.id)
+    if not db_user:
+        await query.edit_message_text("❌ ابتدا ثبت‌نام کنید.")
+        return
+    await question_bank.ensure_loaded()
+    q = question_bank.daily(db_user.grade or "دهم")
     if not q:
         await query.edit_message_text("سوال روز موجود نیست. فردا دوباره تلاش کنید.")
         return
-    choices = (q.options or {}).get("choices", [])
-    rows = [
-        [InlineKeyboardButton(text=c, callback_data=f"quiz:{q.id}:{i}")]
-        for i, c in enumerate(choices[:8])
-    ]
-    rows.append([InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_menu")])
-    await query.edit_message_text(
-        f"سوال روز ({q.grade})\n\n{q.question_text}",
-        reply_markup=InlineKeyboardMarkup(rows),
-    )
+    await query.edit_message_text(q.text, reply_markup=q.reply_markup)
 
 
 async def handle_quiz_answer(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1260,14 +1163,11 @@ async def handle_quiz_answer(update: Update, context: ContextTypes.DEFAULT_TYPE)
         sel = int(sel)
     except ValueError:
         return
-    with session_scope() as session:
-        u = session.execute(
-            select(DBUser).where(DBUser.telegram_user_id == query.from_user.id)
-        ).scalar_one_or_none()
-        if not u:
-            await query.edit_message_text("❌ ابتدا ثبت‌نام کنید.")
-            return
-        correct = submit_answer(session, u.id, qid, sel)
+    u = await get_cached_user(query.from_user.id)
+    if not u:
+        await query.edit_message_text("❌ ابتدا ثبت‌نام کنید.")
+        return
+    correct = await async_service.submit_answer(u.id, qid, sel)
     if correct:
         await query.edit_message_text("✅ پاسخ صحیح! آفرین! 🎉")
     else:
@@ -11,10 +11,10 @@ from telegram.ext import ContextTypes
 from telegram.constants import ParseMode
 
 from config import config
-from database.db import session_scope
 from utils.rate_limiter import rate_limit_handler
 from ui.keyboards import build_main_menu_keyboard, build_register_keyboard
-from database.db import session_scope
+from database import async_service
+from utils.user_cache import get_cached_user
 from database.models_sql import User
 from sqlalchemy import select
 from utils.admin_notify import send_paginated_list
@@ -35,11 +35,8 @@ async def send_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     if not chat or not user:
         return
 
-    # Check if user is registered in SQL DB
-    with session_scope() as session:
-        student = session.execute(
-            select(User).where(User.telegram_user_id == user.id)
-        ).scalar_one_or_none()
+    # Check if user is registered (cached; falls back to SQL on a miss)
+    student = await get_cached_user(user.id)
 
     if not student and user.id not in config.bot.admin_user_ids:
         # User needs to register first
@@ -56,7 +53,7 @@ async def send_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     # Show main menu
     await chat.send_message(
         text="🏠 منوی اصلی",
-        reply_markup=build_main_menu_keyboard(),
+        reply_markup=_MAIN_MENU_KEYBOARD,
         parse_mode=ParseMode.HTML,
     )
 
@@ -75,15 +72,8 @@ async def handle_menu_selection(update: Update, context: ContextTypes.DEFAULT_TY
     if not user:
         return
 
-    # Check registration against SQL DB (single source of truth)
-    from sqlalchemy import select
-    from database.db import session_scope
-    from database.models_sql import User as DBUser
-
-    with session_scope() as session:
-        db_user = session.execute(
-            select(DBUser).where(DBUser.telegram_user_id == user.id)
-        ).scalar_one_or_none()
+    # Check registration (cached; falls back to SQL on a miss)
+    db_user = await get_cached_user(user.id)
 
     if not db_user and user.id not in config.bot.admin_user_ids:
         await query.edit_message_text(
@@ -99,6 +89,8 @@ async def handle_menu_selection(update: Update, context: ContextTypes.DEFAULT_TY
         option = query.data.replace("menu_", "")
 
     if option == "profile":
+        # Profile view needs name/phone, which the cache does not hold
+        db_user = await async_service.get_user_by_telegram_id(user.id) if db_user else None
         if not db_user:
             await query.edit_message_text(
                 "❌ پروفایل شما یافت نشد.",
@@ -161,10 +153,7 @@ def build_menu_handlers():
     async def list_books_cmd(update, context):
         if update.effective_user.id not in config.bot.admin_user_ids:
             return
-        from database.service import get_approved_book_buyers
-
-        with session_scope() as session:
-            buyers = get_approved_book_buyers(session, limit=1000)
+        buyers = await async_service.get_approved_book_buyers(limit=1000)
         lines = [f"{b['user_id']} | {b['product_id']} | {b['created_at'].date()}" for b in buyers]
         if len(lines) > 400:
             import csv, io
@@ -195,10 +184,7 @@ def build_menu_handlers():
             await update.effective_message.reply_text("فرمت: /list_free <پایه>")
             return
         grade = context.args[0]
-        from database.service import get_free_course_participants_by_grade
-
-        with session_scope() as session:
-            uids = get_free_course_participants_by_grade(session, grade)
+        uids = await async_service.get_free_course_participants_by_grade(grade)
         lines = [str(uid) for uid in uids]
         if len(lines) > 400:
             import csv, io
@@ -229,10 +215,7 @@ def build_menu_handlers():
             await update.effective_message.reply_text("فرمت: /list_special <slug>")
             return
         slug = context.args[0]
-        from database.service import get_course_participants_by_slug
-
-        with session_scope() as session:
-            uids = get_course_participants_by_slug(session, slug)
+        uids = await async_service.get_course_participants_by_slug(slug)
         lines = [str(uid) for uid in uids]
         if len(lines) > 400:
             import csv, io
@@ -289,20 +272,24 @@ def build_menu_handlers():
             return
         from database.models_sql import User as DBUser, ProfileChange
 
-        with session_scope() as session:
+        def _load_history(session):
             db_user = session.execute(
                 select(DBUser).where(DBUser.telegram_user_id == target)
             ).scalar_one_or_none()
             if not db_user:
-                await update.effective_message.reply_text("کاربر یافت نشد.")
-                return
-            rows = (
+                return None
+            return (
                 session.query(ProfileChange)
                 .filter(ProfileChange.user_id == db_user.id)
                 .order_by(ProfileChange.timestamp.desc())
                 .limit(50)
                 .all()
             )
+
+        rows = await async_service.run_in_session(_load_history)
+        if rows is None:
+            await update.effective_message.reply_text("کاربر یافت نشد.")
+            return
         lines = [f"{r.timestamp:%Y-%m-%d %H:%M} | {r.field_name}" for r in rows]
         await send_paginated_list(
             context,
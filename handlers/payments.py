@@ -12,17 +12,20 @@ from database.models_sql import User as DBUser
 from utils.rate_limiter import rate_limit_handler
 from ui.keyboards import build_main_menu_keyboard
 from telegram import InlineKeyboardMarkup, InlineKeyboardButton
-import time
 import secrets
 import asyncio
-from database.db import session_scope
+import logging
+from database import async_service
 from database.service import (
-    get_or_create_user,
     create_purchase,
     add_receipt,
     approve_or_reject_purchase,
 )
 from utils.performance_monitor import monitor
+from utils.payment_store import get_payment_store
+from utils.catalog import book_catalog, course_catalog
+
+logger = logging.getLogger(__name__)
 
 
 @rate_limit_handler("default")
@@ -49,12 +52,7 @@ async def handle_payment_receipt(update: Update, context: ContextTypes.DEFAULT_T
         return
 
     # Fetch student from DB (PII decrypted for caption only)
-    with session_scope() as session:
-        db_user = (
-            session.query(DBUser)
-            .filter(DBUser.telegram_user_id == update.effective_user.id)
-            .one_or_none()
-        )
+    db_user = await async_service.get_user_by_telegram_id(update.effective_user.id)
     if not db_user:
         await update.message.reply_text(
             "❌ شما ثبت‌نام نکرده‌اید. لطفاً ابتدا ثبت‌نام کنید.",
@@ -104,26 +102,15 @@ async def handle_payment_receipt(update: Update, context: ContextTypes.DEFAULT_T
     # Course payment
     if context.user_data.get("pending_course"):
         course_id = context.user_data["pending_course"]
+
         # Create DB purchase pending
-        with session_scope() as session:
-            u = get_or_create_user(session, update.effective_user.id)
+        def _save(session):
             # Derive amount for course if available from courses.json
-            _amount = None
-            try:
-                import json as _json
-
-                with open("data/courses.json", "r", encoding="utf-8") as _f:
-                    _all = _json.load(_f)
-                for c in _all or []:
-                    if c.get("course_id") == course_id:
-                        _amount = c.get("price")
-                        break
-            except Exception:
-                _amount = None
+            _amount = course_catalog.price(course_id)
 
             purchase = create_purchase(
                 session,
-                user_id=u.id,
+                user_id=db_user.id,
                 product_type="course",
                 product_id=course_id,
                 status="pending",
@@ -139,6 +126,8 @@ async def handle_payment_receipt(update: Update, context: ContextTypes.DEFAULT_T
                 )
             except Exception:
                 pass
+
+        await async_service.run_in_session(_save)
         # Notify admins of new pending course purchase
         try:
             from utils.admin_notify import notify_admins
@@ -151,16 +140,9 @@ async def handle_payment_receipt(update: Update, context: ContextTypes.DEFAULT_T
         except Exception:
             pass
 
-        # Load course title from JSON
-        import json
-
-        try:
-            with open("data/courses.json", "r", encoding="utf-8") as f:
-                all_courses = json.load(f)
-            course = next((c for c in all_courses if c.get("course_id") == course_id), None)
-            course_title = course.get("title") if course else course_id
-        except Exception:
-            course_title = course_id
+        # Load course title from the catalog
+        course = course_catalog.get(course_id)
+        course_title = (course.get("title") if course else None) or course_id
 
         caption = (
             f"🧾 رسید پرداخت دوره\n\n"
@@ -186,27 +168,16 @@ async def handle_payment_receipt(update: Update, context: ContextTypes.DEFAULT_T
     # Book payment
     elif context.user_data.get("book_purchase"):
         book_data = context.user_data["book_purchase"]
+
         # Create DB purchase pending (book)
-        with session_scope() as session:
-            u = get_or_create_user(session, update.effective_user.id)
+        def _save(session):
             # Book price if available
-            _amount = None
-            try:
-                import json as _json
-
-                with open("data/books.json", "r", encoding="utf-8") as _f:
-                    _all = _json.load(_f)
-                title = book_data.get("title", "book")
-                for b in _all or []:
-                    if (b.get("title") == title) or (b.get("book_id") == title):
-                        _amount = b.get("price")
-                        break
-            except Exception:
-                _amount = None
+            book = book_catalog.find(book_data.get("title", "book"))
+            _amount = book.get("price") if book else None
 
             purchase = create_purchase(
                 session,
-                user_id=u.id,
+                user_id=db_user.id,
                 product_type="book",
                 product_id=book_data.get("title", "book"),
                 status="pending",
@@ -221,6 +192,8 @@ async def handle_payment_receipt(update: Update, context: ContextTypes.DEFAULT_T
                 )
             except Exception:
                 pass
+
+        await async_service.run_in_session(_save)
         # Notify admins of new pending book purchase
         try:
             from utils.admin_notify import notify_admins
@@ -263,19 +236,12 @@ async def handle_payment_receipt(update: Update, context: ContextTypes.DEFAULT_T
         )
         return
 
+    store = get_payment_store(context.bot_data)
+    await store.purge_if_due()
+
     # Prevent duplicate receipts: block re-use of the same Telegram file_unique_id for 7 days
-    receipts_index = context.bot_data.setdefault("receipts_index", {})  # id -> ts
     file_uid = getattr(largest_photo, "file_unique_id", None)
-    now_ts = time.time()
-    retention = 7 * 24 * 3600
-    # Purge old
-    try:
-        to_del = [k for k, ts in receipts_index.items() if now_ts - ts > retention]
-        for k in to_del:
-            del receipts_index[k]
-    except Exception:
-        pass
-    if file_uid and file_uid in receipts_index:
+    if file_uid and await store.receipt_seen(file_uid):
         await update.message.reply_text(
             "⚠️ این رسید قبلاً ارسال شده است و قابل استفاده مجدد نیست.",
             reply_markup=build_main_menu_keyboard(),
@@ -283,48 +249,36 @@ async def handle_payment_receipt(update: Update, context: ContextTypes.DEFAULT_T
         return
 
     # Prevent duplicate receipts: accept only one active token per user+item for 2 minutes
-    notifications = context.bot_data.setdefault("payment_notifications", {})
-    recent_tokens = [
-        t
-        for t, meta in notifications.items()
-        if meta.get("student_id") == update.effective_user.id and not meta.get("processed")
-    ]
-    # If there is a very recent open token for same type+id, reject to prevent spam/dupes
-    for t in recent_tokens:
-        meta = notifications.get(t) or {}
-        if (
-            meta.get("item_type") == payment_meta.get("item_type")
-            and meta.get("item_id") == payment_meta.get("item_id")
-            and time.time() - meta.get("created_at", 0) < 120
-        ):
-            await update.message.reply_text(
-                "⚠️ رسید شما قبلاً دریافت شده و در حال بررسی است.",
-                reply_markup=build_main_menu_keyboard(),
-            )
-            return
+    if await store.find_open(
+        update.effective_user.id,
+        payment_meta.get("item_type"),
+        payment_meta.get("item_id"),
+        within_seconds=120,
+    ):
+        await update.message.reply_text(
+            "⚠️ رسید شما قبلاً دریافت شده و در حال بررسی است.",
+            reply_markup=build_main_menu_keyboard(),
+        )
+        return
 
     # Generate token to correlate notifications across admins
     # Use strong, unpredictable token for approval flow
     token = secrets.token_urlsafe(12)
-
-    # Track admin messages for this token
-    notifications[token] = {
-        "student_id": update.effective_user.id,
-        "item_type": payment_meta.get("item_type"),
-        "item_id": payment_meta.get("item_id"),
-        "item_title": payment_meta.get("item_title"),
-        "messages": [],  # list of (admin_id, message_id)
-        "processed": False,
-        "decision": None,
-        "decided_by": None,
-        "created_at": time.time(),
-        "decided_at": None,
-        "file_unique_id": file_uid,
-    }
+    await store.create(
+        token,
+        {
+            "student_id": update.effective_user.id,
+            "item_type": payment_meta.get("item_type"),
+            "item_id": payment_meta.get("item_id"),
+            "item_title": payment_meta.get("item_title"),
+            "file_unique_id": file_uid,
+        },
+    )
 
     kb = admin_approval_keyboard(token)
 
     # Send to ALL admins: forward photo + details with buttons
+    messages = []  # list of (admin_id, message_id)
     for admin_id in config.bot.admin_user_ids or []:
         try:
             await context.bot.forward_message(
@@ -333,13 +287,11 @@ async def handle_payment_receipt(update: Update, context: ContextTypes.DEFAULT_T
                 message_id=update.message.message_id,
             )
             sent = await context.bot.send_message(chat_id=admin_id, text=caption, reply_markup=kb)
-            notifications[token]["messages"].append((admin_id, sent.message_id))
+            messages.append((admin_id, sent.message_id))
         except Exception:
             continue
-
-    # Clear context markers and record receipt id
-    if file_uid:
-        receipts_index[file_uid] = now_ts
+    if messages:
+        await store.set_messages(token, messages)
 
     # Clear context markers
     if context.user_data.get("pending_course"):
@@ -369,13 +321,12 @@ async def handle_payment_decision(update: Update, context: ContextTypes.DEFAULT_
         await query.edit_message_text("⛔️ مجاز نیست.")
         return
 
-    notifications = context.bot_data.setdefault("payment_notifications", {})
-    meta = notifications.get(token)
+    store = get_payment_store(context.bot_data)
+    meta = await store.get(token)
     if not meta:
         await query.edit_message_text("⛔️ اطلاعات پرداخت یافت نشد یا منقضی شده است.")
         return
 
-    # If already processed, disable this keyboard too
     if meta.get("processed"):
         try:
             await query.edit_message_reply_markup(reply_markup=None)
@@ -383,37 +334,53 @@ async def handle_payment_decision(update: Update, context: ContextTypes.DEFAULT_
             pass
         return
 
-    # Update user data accordingly and notify
-    try:
-        student_id = meta["student_id"]
-        item_type = meta["item_type"]
-        item_id = meta["item_id"]
-        item_title = meta.get("item_title") or item_id
-
-        # Atomic decision in DB
-        from sqlalchemy import select
-        from database.models_sql import User as DBUser, Purchase as DBPurchase
-
-        with session_scope() as session:
-            db_user = session.execute(
-                select(DBUser).where(DBUser.telegram_user_id == student_id)
-            ).scalar_one_or_none()
-            db_purchase = session.execute(
-                select(DBPurchase)
-                .where(
-                    DBPurchase.user_id == (db_user.id if db_user else -1),
-                    DBPurchase.product_type == ("book" if item_type == "book" else "course"),
-                    DBPurchase.product_id == item_id,
-                    DBPurchase.status == "pending",
-                )
-                .order_by(DBPurchase.created_at.desc())
-            ).scalar_one_or_none()
-            if db_purchase:
-                approve_or_reject_purchase(session, db_purchase.id, user_id, decision)
+    student_id = meta["student_id"]
+    item_type = meta["item_type"]
+    item_id = meta["item_id"]
+    item_title = meta.get("item_title") or item_id
+
+    from sqlalchemy import select
+    from database.models_sql import Purchase as DBPurchase
+
+    def _apply_decision(session):
+        db_user = session.execute(
+            select(DBUser).where(DBUser.telegram_user_id == student_id)
+        ).scalar_one_or_none()
+        db_purchase = session.execute(
+            select(DBPurchase)
+            .where(
+                DBPurchase.user_id == (db_user.id if db_user else -1),
+                DBPurchase.product_type == ("book" if item_type == "book" else "course"),
+                DBPurchase.product_id == item_id,
+                DBPurchase.status == "pending",
+            )
+            .order_by(DBPurchase.created_at.desc())
+        ).scalar_one_or_none()
+        if db_purchase:
+            approve_or_reject_purchase(session, db_purchase.id, user_id, decision)
 
-        # JSON reflection removed; SQL is the source of truth
+    # Claim the token and record the decision in one transaction, so two admins (or
+    # replicas) cannot both decide it and a failed decision leaves it open for a retry
+    try:
+        claimed = await store.mark_decided(token, decision, user_id, apply=_apply_decision)
+    except Exception as e:
+        logger.error(f"Payment decision failed for token {token}: {e}")
+        try:
+            await context.bot.send_message(
+                chat_id=user_id, text="❌ ثبت تصمیم پرداخت ناموفق بود. لطفاً دوباره تلاش کنید."
+            )
+        except Exception:
+            pass
+        return
+    if not claimed:
+        try:
+            await query.edit_message_reply_markup(reply_markup=None)
+        except Exception:
+            pass
+        return
 
-        # Notify student
+    # Notify student and admins
+    try:
         await context.bot.send_message(
             chat_id=student_id,
             text=(
@@ -444,10 +411,9 @@ async def handle_payment_decision(update: Update, context: ContextTypes.DEFAULT_
                 f"📊 وضعیت پرداخت {item_type} «{item_title}» برای کاربر {student_id}: {('تایید' if decision=='approve' else 'رد')}",
             )
             if decision == "approve" and item_type == "course":
-                from database.service import get_course_participants_by_slug
-
-                with session_scope() as session:
-                    uids = get_course_participants_by_slug(session, item_id, status="approved")
+                uids = await async_service.get_course_participants_by_slug(
+                    item_id, status="approved"
+                )
                 lines = [str(uid) for uid in uids]
                 from utils.performance_monitor import monitor
 
@@ -464,12 +430,7 @@ async def handle_payment_decision(update: Update, context: ContextTypes.DEFAULT_
         except Exception:
             pass
 
-        # Mark processed and disable buttons for all admin messages
-        meta["processed"] = True
-        meta["decision"] = decision
-        meta["decided_by"] = user_id
-        meta["decided_at"] = time.time()
-
+        # Disable buttons for all admin messages
         for admin_id, msg_id in meta.get("messages", []):
             try:
                 await context.bot.edit_message_reply_markup(
@@ -519,21 +480,22 @@ async def _orders_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception:
         page, type_filter, user_filter = 0, "all", None
 
-    notifications = context.bot_data.get("payment_notifications", {})
-    pending = [(t, m) for t, m in notifications.items() if not m.get("processed")]
-    if type_filter in ("book", "course"):
-        pending = [(t, m) for t, m in pending if m.get("item_type") == type_filter]
-    if user_filter is not None:
-        pending = [(t, m) for t, m in pending if int(m.get("student_id", 0)) == user_filter]
-    if not pending:
-        await query.edit_message_text("مورد در انتظاری وجود ندارد.")
-        return
-
     page_size = 5
-    ordered = list(sorted(pending, key=lambda kv: kv[1].get("created_at", 0), reverse=True))
     start = page * page_size
     end = start + page_size
-    slice_items = ordered[start:end]
+    # One extra row tells whether a next page exists
+    entries = await get_payment_store(context.bot_data).list(
+        status="pending",
+        item_type=type_filter if type_filter in ("book", "course") else None,
+        student_id=user_filter,
+        limit=page_size + 1,
+        offset=start,
+    )
+    if not entries and page == 0:
+        await query.edit_message_text("مورد در انتظاری وجود ندارد.")
+        return
+    has_next = len(entries) > page_size
+    slice_items = entries[:page_size]
 
     from telegram import InlineKeyboardMarkup, InlineKeyboardButton
 
@@ -557,7 +519,7 @@ async def _orders_page(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 callback_data=f"orders_page:{page-1}:{type_filter}:{user_filter if user_filter is not None else '-'}",
             )
         )
-    if end < len(ordered):
+    if has_next:
         nav.append(
             InlineKeyboardButton(
                 "بعدی ➡️",
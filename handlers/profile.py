@@ -8,10 +8,11 @@ from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import CallbackQueryHandler
 
 from config import config
-from database.db import session_scope
+from database import async_service
 from database.models_sql import User as DBUser
 from database.service import get_or_create_user, audit_profile_change
 from utils.validators import Validator
+from utils.user_cache import forget_user, get_cached_user
 
 
 def _kb(rows: List[List[InlineKeyboardButton]]) -> InlineKeyboardMarkup:
@@ -54,7 +55,8 @@ async def set_province(update: Update, context: Any) -> None:
     await query.answer()
     province = query.data.split(":", 1)[1]
     user_id = update.effective_user.id
-    with session_scope() as session:
+
+    def _save(session):
         db_user = session.query(DBUser).filter(DBUser.telegram_user_id == user_id).one_or_none()
         if db_user:
             old_province = getattr(db_user, "province", None)
@@ -83,6 +85,9 @@ async def set_province(update: Update, context: Any) -> None:
         else:
             get_or_create_user(session, user_id, province=province, city="")
             session.flush()
+
+    await async_service.run_in_session(_save)
+    forget_user(user_id)
     # Prompt city next
     cities = config.cities_by_province.get(province, [])
     rows = [[InlineKeyboardButton(c, callback_data=f"set_city:{c}")] for c in cities]
@@ -100,8 +105,7 @@ async def edit_city(update: Update, context: Any) -> None:
     await query.answer()
     # Determine user's province
     user_id = update.effective_user.id
-    with session_scope() as session:
-        db_user = session.query(DBUser).filter(DBUser.telegram_user_id == user_id).one_or_none()
+    db_user = await get_cached_user(user_id)
     province = db_user.province if db_user else None
     if not province:
         await query.edit_message_text(
@@ -124,19 +128,13 @@ async def set_city(update: Update, context: Any) -> None:
     await query.answer()
     city = query.data.split(":", 1)[1]
     user_id = update.effective_user.id
-    with session_scope() as session:
+
+    def _save(session):
         db_user = session.query(DBUser).filter(DBUser.telegram_user_id == user_id).one_or_none()
         province = db_user.province if db_user else None
         valid_cities = config.cities_by_province.get(province or "", [])
         if city not in valid_cities:
-            # Show valid list again
-            rows = [[InlineKeyboardButton(c, callback_data=f"set_city:{c}")] for c in valid_cities]
-            rows.append([InlineKeyboardButton("🔙 بازگشت", callback_data="menu_profile_edit")])
-            await query.edit_message_text(
-                "❌ شهر نامعتبر است برای استان انتخاب‌شده. لطفاً از لیست انتخاب کنید:",
-                reply_markup=_kb(rows),
-            )
-            return
+            return valid_cities
         if db_user:
             old_city = getattr(db_user, "city", None)
             audit_profile_change(
@@ -152,6 +150,18 @@ async def set_city(update: Update, context: Any) -> None:
         else:
             get_or_create_user(session, user_id, city=city)
             session.flush()
+
+    invalid_cities = await async_service.run_in_session(_save)
+    forget_user(user_id)
+    if invalid_cities is not None:
+        # Show valid list again
+        rows = [[InlineKeyboardButton(c, callback_data=f"set_city:{c}")] for c in invalid_cities]
+        rows.append([InlineKeyboardButton("🔙 بازگشت", callback_data="menu_profile_edit")])
+        await query.edit_message_text(
+            "❌ شهر نامعتبر است برای استان انتخاب‌شده. لطفاً از لیست انتخاب کنید:",
+            reply_markup=_kb(rows),
+        )
+        return
     await query.edit_message_text(
         f"🏙 شهر {city} ثبت شد.",
         reply_markup=_kb([[InlineKeyboardButton("🔙 بازگشت", callback_data="menu_profile_edit")]]),
@@ -175,7 +185,8 @@ async def set_grade(update: Update, context: Any) -> None:
     await query.answer()
     grade = query.data.split(":", 1)[1]
     user_id = update.effective_user.id
-    with session_scope() as session:
+
+    def _save(session):
         db_user = session.query(DBUser).filter(DBUser.telegram_user_id == user_id).one_or_none()
         if db_user:
             old_grade = getattr(db_user, "grade", None)
@@ -192,6 +203,9 @@ async def set_grade(update: Update, context: Any) -> None:
         else:
             get_or_create_user(session, user_id, grade=grade)
             session.flush()
+
+    await async_service.run_in_session(_save)
+    forget_user(user_id)
     await query.edit_message_text(
         f"📚 پایه {grade} ثبت شد.",
         reply_markup=_kb([[InlineKeyboardButton("🔙 بازگشت", callback_data="menu_profile_edit")]]),
@@ -215,7 +229,8 @@ async def set_major(update: Update, context: Any) -> None:
     await query.answer()
     major = query.data.split(":", 1)[1]
     user_id = update.effective_user.id
-    with session_scope() as session:
+
+    def _save(session):
         db_user = session.query(DBUser).filter(DBUser.telegram_user_id == user_id).one_or_none()
         if db_user:
             old_major = getattr(db_user, "field_of_study", None)
@@ -232,6 +247,9 @@ async def set_major(update: Update, context: Any) -> None:
         else:
             get_or_create_user(session, user_id, field_of_study=major)
             session.flush()
+
+    await async_service.run_in_session(_save)
+    forget_user(user_id)
     await query.edit_message_text(
         f"🎓 رشته {major} ثبت شد.",
         reply_markup=_kb([[InlineKeyboardButton("🔙 بازگشت", callback_data="menu_profile_edit")]]),
@@ -290,8 +308,9 @@ def build_profile_edit_handlers() -> list:
             if not (ok1 and ok2):
                 await update.message.reply_text((first_name_val if not ok1 else last_name_val))
                 return
+
             # Audit and save
-            with session_scope() as session:
+            def _save(session):
                 db_user = (
                     session.query(DBUser).filter(DBUser.telegram_user_id == user_id).one_or_none()
                 )
@@ -320,6 +339,9 @@ def build_profile_edit_handlers() -> list:
                     first_name=first_name_val,
                     last_name=last_name_val,
                 )
+
+            await async_service.run_in_session(_save)
+            forget_user(user_id)
             await update.message.reply_text("✅ نام و نام‌خانوادگی بروزرسانی شد.")
             context.user_data.pop("profile_edit", None)
             return
@@ -328,7 +350,8 @@ def build_profile_edit_handlers() -> list:
             if not ok:
                 await update.message.reply_text(phone_norm)
                 return
-            with session_scope() as session:
+
+            def _save(session):
                 db_user = (
                     session.query(DBUser).filter(DBUser.telegram_user_id == user_id).one_or_none()
                 )
@@ -343,6 +366,9 @@ def build_profile_edit_handlers() -> list:
                         changed_by=user_id,
                     )
                 get_or_create_user(session, user_id, phone=phone_norm)
+
+            await async_service.run_in_session(_save)
+            forget_user(user_id)
             await update.message.reply_text("✅ شماره تماس بروزرسانی شد.")
             context.user_data.pop("profile_edit", None)
             return
@@ -368,7 +394,8 @@ def build_profile_edit_handlers() -> list:
             if not ok:
                 await update.message.reply_text("؛ ".join(errs))
                 return
-            with session_scope() as session:
+
+            def _save(session):
                 db_user = (
                     session.query(DBUser).filter(DBUser.telegram_user_id == user_id).one_or_none()
                 )
@@ -398,6 +425,9 @@ def build_profile_edit_handlers() -> list:
                     db_user.address = address
                     db_user.postal_code = postal or None
                 session.flush()
+
+            await async_service.run_in_session(_save)
+            forget_user(user_id)
             await update.message.reply_text("✅ آدرس پستی بروزرسانی شد.")
             context.user_data.pop("profile_edit", None)
             return
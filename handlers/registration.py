@@ -25,7 +25,8 @@ TELEGRAM_AVAILABLE = True
 from config import config
 from utils.validators import Validator
 from utils.rate_limiter import rate_limit_handler
-from database.db import session_scope
+from database import async_service
+from utils.user_cache import remember_user
 from database.service import get_or_create_user, audit_profile_change
 from utils.performance_monitor import monitor
 from ui.keyboards import (
@@ -408,7 +409,8 @@ async def confirm(update: Update, context: Any) -> int:
 
     # Save user data
     try:
-        with session_scope() as session:
+
+        def _save(session):
             # If editing existing, write profile audits (no old value exposure)
             from sqlalchemy import select
             from database.models_sql import User as DBUser
@@ -435,7 +437,7 @@ async def confirm(update: Update, context: Any) -> int:
                     except Exception:
                         pass
 
-            get_or_create_user(
+            return get_or_create_user(
                 session,
                 telegram_user_id=update.effective_user.id,
                 first_name=context.user_data.get("first_name", ""),
@@ -446,6 +448,8 @@ async def confirm(update: Update, context: Any) -> int:
                 grade=context.user_data.get("grade", ""),
                 field_of_study=context.user_data.get("field", ""),
             )
+
+        remember_user(await async_service.run_in_session(_save))
         try:
             monitor.increment_counter("registrations")
         except Exception:
@@ -523,8 +527,8 @@ async def cancel_callback(update: Update, context: Any) -> int:
     return ConversationHandler.END
 
 
-def build_registration_conversation() -> ConversationHandler:
-    """Build the registration conversation handler"""
+def build_registration_conversation(persistent: bool = False) -> ConversationHandler:
+    """Build the registration conversation handler (`persistent` needs an application persistence)"""
     return ConversationHandler(
         entry_points=[
             CallbackQueryHandler(start_registration, pattern="^start_registration$"),
@@ -565,6 +569,6 @@ def build_registration_conversation() -> ConversationHandler:
             CallbackQueryHandler(cancel_callback, pattern="^cancel_reg$"),
         ],
         name="registration",
-        persistent=False,
+        persistent=persistent,
         per_chat=True,
     )
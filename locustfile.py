@@ -1,13 +1,18 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import itertools
 import os
+import random
+import time
 
 try:
     from locust import HttpUser, task, between  # type: ignore
 except Exception:  # Fallback when locust isn't installed (used in CI mocks)
 
     class HttpUser:
-        client = type("Client", (), {"get": lambda self, *a, **k: None})()
+        client = type(
+            "Client", (), {"get": lambda self, *a, **k: None, "post": lambda self, *a, **k: None}
+        )()
 
     def task(func=None):
         def _decorator(f):
@@ -19,6 +24,17 @@ except Exception:  # Fallback when locust isn't installed (used in CI mocks)
         return (a, b)
 
 
+from scripts.loadtest_harness import (  # noqa: E402
+    MENU_CALLBACKS,
+    PAID_COURSE,
+    callback_update,
+    message_update,
+    registration_steps,
+)
+
+_update_ids = itertools.count(int(time.time() * 1000) % 10**9)
+
+
 class BotWebhookUser(HttpUser):
     wait_time = between(0.5, 2.0)
 
@@ -26,3 +42,50 @@ class BotWebhookUser(HttpUser):
     def health(self):
         port = os.getenv("PORT", "8080")
         self.client.get("/", name="health")
+
+
+class BotUpdateUser(HttpUser):
+    """Registers, then browses menus, restarts and sends receipts as signed webhook updates.
+
+    Target a staging bot: WEBHOOK_PATH is its `config.webhook.path` and WEBHOOK_SECRET
+    its secret token. For an offline run with latency/DB numbers per scenario use
+    `scripts/loadtest_harness.py` instead.
+    """
+
+    wait_time = between(0.5, 2.0)
+    weight = 3
+
+    def on_start(self):
+        self.user_id = random.randint(6_000_000_000, 6_999_999_999)
+        for kind, value in registration_steps(self.user_id):
+            if kind == "text":
+                self._post(message_update(next(_update_ids), self.user_id, text=value), "register")
+            else:
+                self._post(callback_update(next(_update_ids), self.user_id, value), "register")
+
+    def _post(self, update, name):
+        self.client.post(
+            os.getenv("WEBHOOK_PATH", "/webhook/dev"),
+            json=update,
+            headers={"X-Telegram-Bot-Api-Secret-Token": os.getenv("WEBHOOK_SECRET", "")},
+            name=name,
+        )
+
+    @task(5)
+    def menu(self):
+        data = random.choice(MENU_CALLBACKS)
+        self._post(callback_update(next(_update_ids), self.user_id, data), "menu")
+
+    @task(2)
+    def start(self):
+        self._post(message_update(next(_update_ids), self.user_id, text="/start"), "start")
+
+    @task(1)
+    def receipt(self):
+        for data in (
+            f"register_course_paid_{PAID_COURSE}",
+            f"confirm_register_course_paid_{PAID_COURSE}",
+        ):
+            self._post(callback_update(next(_update_ids), self.user_id, data), "course_select")
+        photo = f"receipt-{self.user_id}-{next(_update_ids)}"
+        self._post(message_update(next(_update_ids), self.user_id, photo=photo), "receipt")
@@ -84,6 +84,10 @@ def seed_quiz_from_json(json_path: str) -> int:
                 inserted += 1
             except Exception:
                 continue
+    if inserted:
+        from utils.question_bank import question_bank
+
+        question_bank.invalidate()
     return inserted
 
 
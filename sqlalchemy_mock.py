@@ -278,6 +278,30 @@ def func(*args, **kwargs):
 func.count = MagicMock()
 
 
+def bindparam(*args, **kwargs):
+    """Mock bindparam function"""
+    return MagicMock()
+
+
+# Mock event registry: listeners are accepted but never fired
+class event:
+    @staticmethod
+    def listen(*args, **kwargs):
+        pass
+
+    @staticmethod
+    def remove(*args, **kwargs):
+        pass
+
+    @staticmethod
+    def contains(*args, **kwargs):
+        return False
+
+    @staticmethod
+    def listens_for(*args, **kwargs):
+        return lambda fn: fn
+
+
 # Mock session_scope context manager
 class session_scope:
     """Mock session_scope context manager"""
@@ -302,6 +326,8 @@ sys.modules['sqlalchemy'] = sys.modules[__name__]
 
 # Provide a minimal orm module with sessionmaker returning our database session
 class orm_module:
+    Session = Session
+
     @staticmethod
     def sessionmaker(bind=None):
         def _factory():
@@ -77,7 +77,41 @@ class ParseMode:
     MARKDOWN_V2 = "MARKDOWN_V2"
 
 
+# Mock telegram.error module
+class TelegramError(Exception):
+    """Mock TelegramError class"""
+
+
+class BadRequest(TelegramError):
+    """Mock BadRequest class"""
+
+
+class NetworkError(TelegramError):
+    """Mock NetworkError class"""
+
+
+class RetryAfter(TelegramError):
+    """Mock RetryAfter class"""
+
+    def __init__(self, retry_after=0, *args):
+        super().__init__(f"Flood control exceeded. Retry in {retry_after} seconds")
+        self.retry_after = retry_after
+
+
+# Mock telegram.request module
+class HTTPXRequest:
+    """Mock HTTPXRequest class"""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    async def do_request(self, *args, **kwargs):
+        return 200, b'{"ok": true, "result": true}'
+
+
 # Add to sys.modules so imports work
 sys.modules['telegram'] = sys.modules[__name__]
 sys.modules['telegram.ext'] = MagicMock()
 sys.modules['telegram.constants'] = sys.modules[__name__]
+sys.modules['telegram.request'] = sys.modules[__name__]
+sys.modules['telegram.error'] = sys.modules[__name__]
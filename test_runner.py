@@ -61,10 +61,6 @@ def setup_global_mocks():
     sys.modules['aiohttp.CookieJar'] = aiohttp_mock.CookieJar
 
 
-# Set up mocks immediately
-setup_global_mocks()
-
-
 def run_test_file(test_file_path):
     """Run all test functions in a test file"""
     print(f"\nRunning tests from: {test_file_path}")
@@ -226,5 +222,8 @@ def run_all_tests():
 
 
 if __name__ == "__main__":
+    # Only when run as a script: under pytest the stand-ins are scoped to the test
+    # modules that need them (see tests/conftest.py)
+    setup_global_mocks()
     success = run_all_tests()
     sys.exit(0 if success else 1)
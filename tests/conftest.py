@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import sys
+from contextlib import contextmanager
+from pathlib import Path
+
+import pytest
+
+# Test modules written against the root-level stand-ins (telegram_mock, sqlalchemy_mock,
+# aiohttp_mock, database_mock, ...) that `test_runner.setup_global_mocks()` puts into
+# sys.modules. They are imported and run in their own module table so the stand-ins
+# never leak into the rest of the suite, which runs against the real libraries.
+STUBBED_TEST_MODULES = {
+    "test_admin_approve_financials.py",
+    "test_admin_filters_i18n_snapshot.py",
+    "test_admin_html_snapshot.py",
+    "test_admin_pagination_and_exports_snapshot.py",
+    "test_admin_pagination_large_dataset_snapshot.py",
+    "test_admin_payment_select_i18n.py",
+    "test_admin_security_edge_cases.py",
+    "test_migrate.py",
+    "test_profile_receipts_and_admin.py",
+}
+
+# Application packages that must be re-imported against the stand-ins
+_APP_PACKAGES = {"bot", "config", "core", "database", "handlers", "scripts", "ui", "utils"}
+
+# sys.modules entries as the stubbed modules see them; kept between tests like the
+# single global install of test_runner, so stand-in state (e.g. database_mock rows)
+# carries over from one stubbed test to the next
+_stubbed_modules: dict = {}
+
+
+@contextmanager
+def _stubbed_module_table():
+    real = dict(sys.modules)
+    for name in list(sys.modules):
+        if name.partition(".")[0] in _APP_PACKAGES:
+            del sys.modules[name]
+    if _stubbed_modules:
+        sys.modules.update(_stubbed_modules)
+    else:
+        from test_runner import setup_global_mocks
+
+        setup_global_mocks()
+    try:
+        yield
+    finally:
+        _stubbed_modules.update(
+            (name, module) for name, module in sys.modules.items() if real.get(name) is not module
+        )
+        for name in list(sys.modules):
+            if name not in real:
+                del sys.modules[name]
+        sys.modules.update(real)
+
+
+def _is_stubbed(path) -> bool:
+    return Path(str(path)).name in STUBBED_TEST_MODULES
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_make_collect_report(collector):
+    # Modules and the test classes inside them
+    if isinstance(collector, (pytest.Module, pytest.Class)) and _is_stubbed(collector.path):
+        with _stubbed_module_table():
+            yield
+    else:
+        yield
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_protocol(item):
+    if _is_stubbed(item.path):
+        with _stubbed_module_table():
+            yield
+    else:
+        yield
+
+
+@pytest.fixture(autouse=True)
+def _profile_audit_log(tmp_path, monkeypatch):
+    # Keep `audit_profile_change` from appending to data/profile_changes.json in the tree
+    monkeypatch.setenv("PROFILE_AUDIT_LOG", str(tmp_path / "profile_changes.json"))
+
+
+@pytest.fixture
+def query_budget():
+    """`database.query_budget.query_budget`: fail when a block exceeds its SQL budget."""
+    from database.db import ensure_schema_ready
+    from database.query_budget import query_budget as _query_budget
+
+    # Schema bootstrap must not be charged to the first handler under test
+    ensure_schema_ready()
+    return _query_budget
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import csv
+import io
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+
+@pytest.fixture
+def export_stmt():
+    from sqlalchemy import select
+    from database.db import session_scope
+    from database.models_sql import User, Purchase
+
+    now = datetime.utcnow()
+    tid = int(time.time() * 1000) % 10_000_000 + 5_000_000
+    with session_scope() as s:
+        u = User(telegram_user_id=tid, first_name="export", city="شیراز", grade="دهم")
+        s.add(u)
+        s.flush()
+        for i in range(23):
+            s.add(
+                Purchase(
+                    user_id=u.id,
+                    product_type="course",
+                    product_id=f"ex{i}",
+                    status="pending",
+                    created_at=now - timedelta(minutes=i),
+                )
+            )
+        uid = u.id
+    return tid, (
+        select(Purchase)
+        .where(Purchase.user_id == uid)
+        .order_by(Purchase.created_at.desc(), Purchase.id.desc())
+    )
+
+
+def test_csv_export_is_chunked_per_batch(monkeypatch, export_stmt):
+    import bot
+
+    tid, stmt = export_stmt
+    monkeypatch.setattr(bot, "EXPORT_BATCH_SIZE", 10)
+    chunks = list(bot._iter_orders_csv(stmt))
+    # 23 rows in batches of 10 -> three chunks, header travels with the first
+    assert len(chunks) == 3
+    rows = list(csv.reader(io.StringIO(b"".join(chunks).decode("utf-8"))))
+    assert rows[0] == bot.ORDERS_CSV_HEADER
+    assert [r[4] for r in rows[1:]] == [f"ex{i}" for i in range(23)]
+    assert {r[2] for r in rows[1:]} == {str(tid)}
+
+
+def test_xlsx_export_write_only_workbook(monkeypatch, export_stmt):
+    import bot
+    from openpyxl import load_workbook
+
+    _, stmt = export_stmt
+    monkeypatch.setattr(bot, "EXPORT_BATCH_SIZE", 10)
+    body = b"".join(bot._iter_orders_xlsx(stmt, chunk_size=1024))
+    assert body[:2] == b"PK"
+    ws = load_workbook(io.BytesIO(body)).active
+    rows = list(ws.iter_rows(values_only=True))
+    assert list(rows[0]) == bot.ORDERS_XLSX_HEADER
+    assert len(rows) == 24
+    assert rows[1][3:5] == ("شیراز", "دهم")
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for broadcast audience segments and streamed ID selection
+"""
+import time
+import uuid
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from database.audience import (
+    AudienceSegment,
+    iter_audience_batches,
+    parse_segment_args,
+    stream_audience,
+)
+
+
+@pytest.fixture()
+def seeded():
+    """Five users in a fresh city; two bought a course, one a book."""
+    from database.db import session_scope
+    from database.models_sql import Purchase, User
+
+    city = f"city-{uuid.uuid4().hex[:8]}"
+    base = int(time.time() * 1000) % 10**9 * 10 + 7_000_000_000_000
+    ids = [base + i for i in range(5)]
+    with session_scope() as session:
+        users = [
+            User(telegram_user_id=tg, city=city, grade="دهم" if i < 3 else "یازدهم")
+            for i, tg in enumerate(ids)
+        ]
+        session.add_all(users)
+        session.flush()
+        session.add_all(
+            [
+                Purchase(
+                    user_id=users[0].id, product_type="course", product_id=city, status="approved"
+                ),
+                Purchase(
+                    user_id=users[3].id, product_type="course", product_id=city, status="approved"
+                ),
+                Purchase(
+                    user_id=users[1].id, product_type="course", product_id=city, status="pending"
+                ),
+                Purchase(
+                    user_id=users[0].id, product_type="book", product_id=city, status="approved"
+                ),
+                Purchase(
+                    user_id=users[4].id, product_type="book", product_id=city, status="approved"
+                ),
+            ]
+        )
+    return city, ids
+
+
+def _ids(segment, batch_size=2):
+    batches = list(iter_audience_batches(segment, batch_size))
+    assert all(len(b) <= batch_size for b in batches)
+    return [uid for batch in batches for uid in batch]
+
+
+def test_segments_select_matching_ids_once(seeded):
+    city, ids = seeded
+    assert _ids(AudienceSegment(city=city)) == ids
+    assert _ids(AudienceSegment(city=city, grade="دهم")) == ids[:3]
+    assert _ids(AudienceSegment(city=city, course=city)) == [ids[0], ids[3]]
+    assert _ids(AudienceSegment(city=city, buyers="book")) == [ids[0], ids[4]]
+    assert _ids(AudienceSegment(city=city, buyers="any")) == [ids[0], ids[3], ids[4]]
+    assert _ids(AudienceSegment(city=city, grade="یازدهم", buyers="book")) == [ids[4]]
+
+
+def test_parse_segment_args():
+    segment, rest = parse_segment_args(["grade=دهم", "city=بندر_عباس", "سلام", "a=b"])
+    assert segment == AudienceSegment(grade="دهم", city="بندر عباس")
+    assert rest == ["سلام", "a=b"]
+    assert segment.describe() == "grade=دهم city=بندر عباس"
+    assert parse_segment_args(["x=1", "hi"]) == (AudienceSegment(), ["x=1", "hi"])
+    with pytest.raises(ValueError):
+        parse_segment_args(["buyers=everyone", "hi"])
+
+
+@pytest.mark.asyncio
+async def test_manager_drains_stream_in_background(seeded):
+    from utils.background import BroadcastManager
+
+    city, ids = seeded
+    app = MagicMock()
+    app.bot = AsyncMock()
+    app.bot.send_message.return_value = MagicMock(message_id=1)
+    manager = BroadcastManager()
+
+    job_id = await manager.start_broadcast(
+        app, 1, stream_audience(AudienceSegment(city=city), batch_size=2), "hi"
+    )
+    job = manager.jobs[job_id]
+    await job._task
+    assert job.user_ids == ids and job.sent == 5 and job.status == "done"
+    sent_to = [c.kwargs["chat_id"] for c in app.bot.send_message.call_args_list]
+    assert sent_to[0] == 1 and sorted(sent_to[1:]) == ids
+
+    app.bot.send_message.reset_mock()
+    job_id = await manager.start_broadcast(
+        app, 1, stream_audience(AudienceSegment(city=city, course="none")), "hi"
+    )
+    await manager.jobs[job_id]._task
+    app.bot.send_message.assert_awaited_once()
+    assert app.bot.send_message.call_args.kwargs["chat_id"] == 1
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import time
+
+import pytest
+
+
+def _uid(offset: int = 0) -> int:
+    return int(time.time() * 1000) % 10_000_000 + 8_000_000 + offset
+
+
+def test_service_ban_unban_updates_registry_in_place():
+    from database.db import session_scope
+    from database.service import ban_user, unban_user
+    from utils.ban_registry import ban_registry
+
+    uid = _uid()
+    with session_scope() as session:
+        ban_user(session, uid)
+    assert ban_registry.is_banned(uid)
+
+    with session_scope() as session:
+        unban_user(session, uid)
+    assert not ban_registry.is_banned(uid)
+
+
+def test_rolled_back_ban_leaves_registry_untouched():
+    from database.db import session_scope
+    from database.service import ban_user
+    from utils.ban_registry import ban_registry
+
+    uid = _uid(2)
+    with pytest.raises(RuntimeError):
+        with session_scope() as session:
+            ban_user(session, uid)
+            assert not ban_registry.is_banned(uid)
+            raise RuntimeError("abort")
+    assert not ban_registry.is_banned(uid)
+
+
+def test_load_reads_banned_users_table():
+    from database.db import session_scope
+    from database.models_sql import BannedUser
+    from utils.ban_registry import BanRegistry
+
+    uid = _uid(1)
+    with session_scope() as session:
+        session.add(BannedUser(telegram_user_id=uid))
+
+    registry = BanRegistry(resync_seconds=60)
+    assert not registry.loaded
+    assert registry.load() >= 1
+    assert registry.loaded
+    assert registry.is_banned(uid)
+    assert not registry.is_banned(uid + 1)
+
+
+def test_apply_notification_payloads():
+    from utils.ban_registry import BanRegistry
+
+    registry = BanRegistry(resync_seconds=60)
+    registry.apply_notification("ban:42")
+    assert registry.is_banned(42)
+    registry.apply_notification("unban:42")
+    assert not registry.is_banned(42)
+    # Malformed payloads are ignored
+    registry.apply_notification("ban:not-a-number")
+    registry.apply_notification("")
+    assert len(registry) == 0
+
+
+@pytest.mark.asyncio
+async def test_start_resyncs_and_stop_cancels():
+    from utils.ban_registry import BanRegistry
+
+    registry = BanRegistry(resync_seconds=60)
+    await registry.start()
+    try:
+        await registry.ensure_loaded()
+        assert registry.loaded
+    finally:
+        await registry.stop()
+    assert registry._refresh_task is None
+
+
+@pytest.mark.asyncio
+async def test_listener_reconnects_with_backoff_and_resyncs(monkeypatch):
+    from utils.ban_registry import BanRegistry
+
+    registry = BanRegistry(resync_seconds=60)
+    registry.listen_retry_min_seconds = 0.001
+    attempts = []
+    refreshed = []
+
+    async def _start_listener():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise ConnectionError("db down")
+
+    async def _refresh():
+        refreshed.append(1)
+        return 0
+
+    monkeypatch.setattr(registry, "_start_listener", _start_listener)
+    monkeypatch.setattr(registry, "refresh", _refresh)
+    registry._schedule_reconnect()
+    await registry._reconnect_task
+    assert len(attempts) == 3
+    assert refreshed == [1]
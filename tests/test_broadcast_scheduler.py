@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for broadcast pacing, retries and checkpoint/resume
+"""
+import asyncio
+import time
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from telegram.error import BadRequest, Forbidden, RetryAfter, TimedOut
+
+import utils.background as background
+from utils.background import BroadcastJob, BroadcastManager, TokenBucket
+from utils.broadcast_store import InMemoryBroadcastStore
+
+
+pytestmark = pytest.mark.asyncio
+
+
+def _app(side_effect=None):
+    app = MagicMock()
+    app.bot = AsyncMock()
+    app.bot.send_message.return_value = MagicMock(message_id=99)
+    if side_effect is not None:
+        app.bot.send_message.side_effect = side_effect
+    return app
+
+
+def _per_chat(outcomes):
+    """send_message side effect replaying a list of outcomes per chat ID."""
+    calls = {}
+
+    async def _send(chat_id=None, text=None):
+        calls.setdefault(chat_id, 0)
+        script = outcomes.get(chat_id, [])
+        i = calls[chat_id]
+        calls[chat_id] += 1
+        if i < len(script) and script[i] is not None:
+            raise script[i]
+        return MagicMock(message_id=1)
+
+    _send.calls = calls
+    return _send
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(background, "RETRY_BASE_DELAY", 0.01)
+
+
+async def test_bucket_paces_sends():
+    bucket = TokenBucket(rate=50, burst=1)
+    started = time.monotonic()
+    for _ in range(6):
+        await bucket.acquire()
+    assert time.monotonic() - started >= 5 / 50 * 0.9
+
+
+async def test_retry_after_pauses_and_halves_rate():
+    send = _per_chat({2: [RetryAfter(0)]})
+    manager = BroadcastManager(bucket=TokenBucket(rate=20))
+    job = BroadcastJob("j", 1, [1, 2, 3], "hi")
+    await manager._run_broadcast(_app(send), job)
+    assert (job.sent, job.failed) == (3, 0)
+    assert send.calls[2] == 2
+    assert manager.bucket.rate < 20
+
+
+async def test_transient_errors_retry_permanent_ones_fail(monkeypatch):
+    monkeypatch.setattr(background, "MAX_SEND_ATTEMPTS", 3)
+    send = _per_chat(
+        {
+            1: [TimedOut()],
+            2: [BadRequest("Chat not found")],
+            3: [Forbidden("bot was blocked by the user")],
+            4: [TimedOut(), TimedOut(), TimedOut()],
+        }
+    )
+    job = BroadcastJob("j", 1, [1, 2, 3, 4, 5], "hi")
+    await BroadcastManager()._run_broadcast(_app(send), job)
+    assert (job.sent, job.failed) == (2, 3)
+    assert sorted(job.failed_ids) == [2, 3, 4]
+    assert send.calls == {1: 2, 2: 1, 3: 1, 4: 3, 5: 1}
+    assert job.status == "done" and not job.unsettled and job.cursor == 5
+
+
+async def test_checkpoints_and_resume_skip_settled_recipients():
+    store = InMemoryBroadcastStore()
+    await store.save(
+        {
+            "job_id": "77",
+            "admin_chat_id": 1,
+            "text": "hi",
+            "user_ids": [10, 11, 12, 13],
+            "cursor": 3,
+            "pending": [1],
+            "sent": 2,
+            "failed": 0,
+            "failed_ids": [],
+            "message_id": 5,
+            "status": "running",
+        }
+    )
+    await store.save({"job_id": "78", "user_ids": [1], "status": "done"})
+    send = _per_chat({})
+    manager = BroadcastManager(store=store)
+
+    assert await manager.resume_pending(_app(send)) == ["77"]
+    await manager.jobs["77"]._task
+    assert send.calls == {11: 1, 13: 1}
+    saved = await store.get("77")
+    assert (saved["sent"], saved["status"], saved["cursor"], saved["pending"]) == (
+        4,
+        "done",
+        4,
+        [],
+    )
+    assert await store.load_unfinished() == []
+
+
+async def test_shutdown_keeps_job_resumable_but_cancel_does_not():
+    store = InMemoryBroadcastStore()
+    manager = BroadcastManager(store=store)
+
+    async def _slow(chat_id=None, text=None):
+        if chat_id != 100:
+            await asyncio.sleep(10)
+        return MagicMock(message_id=1)
+
+    for explicit in (False, True):
+        job_id = await manager.start_broadcast(_app(_slow), 100, [1, 2], "hi")
+        job = manager.jobs[job_id]
+        await asyncio.sleep(0.01)
+        if explicit:
+            job.cancel()
+        else:
+            job._task.cancel()
+        await asyncio.gather(job._task, return_exceptions=True)
+        assert (await store.get(job_id))["status"] == ("cancelled" if explicit else "running")
+        await asyncio.sleep(0.002)  # distinct millisecond job IDs
+
+
+async def test_sql_store_round_trip():
+    from utils.broadcast_store import SQLBroadcastStore
+
+    store = SQLBroadcastStore()
+    job = BroadcastJob(f"t{int(time.time() * 1000)}", 1, [5, 6, 7], "hi")
+    job.cursor, job.unsettled, job.sent = 2, {1}, 1
+    await store.save(job.checkpoint())
+    job.cursor, job.unsettled, job.sent, job.status = 3, set(), 3, "done"
+    job.failed_ids = []
+    await store.save(job.checkpoint())
+    saved = await store.get(job.job_id)
+    assert saved["user_ids"] == [5, 6, 7]
+    assert (saved["cursor"], saved["pending"], saved["sent"], saved["status"]) == (3, [], 3, "done")
+    assert job.job_id not in {s["job_id"] for s in await store.load_unfinished()}
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for the indexed course/book catalogs
+"""
+import json
+import os
+
+import pytest
+
+from utils.catalog import BookCatalog, CourseCatalog, course_catalog
+from utils.workshops import get_workshop_months
+
+
+COURSES = [
+    {
+        "course_id": "free_math_10th",
+        "title": "ریاضی دهم",
+        "course_type": "free",
+        "is_active": True,
+        "target_grades": ["دهم"],
+        "target_majors": ["ریاضی", "تجربی"],
+    },
+    {
+        "course_id": "free_old",
+        "title": "قدیمی",
+        "course_type": "free",
+        "is_active": False,
+        "target_grades": ["دهم"],
+    },
+    {"course_id": "hesaban1", "title": "حسابان ۱", "course_type": "paid", "price": 150000},
+    {"course_id": "workshop_تیر ۱۴۰۵", "course_type": "paid", "price": 100000},
+    {"course_id": "workshop_مهر ۱۴۰۴", "course_type": "paid", "price": 100000},
+    {"course_id": "workshop_اسفند ۱۴۰۴", "course_type": "paid", "price": 100000},
+]
+
+
+def _write(path, data, mtime=None):
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+@pytest.fixture
+def courses_file(tmp_path):
+    path = tmp_path / "courses.json"
+    _write(path, COURSES, mtime=1_000_000)
+    return path
+
+
+def test_course_indexes(courses_file):
+    catalog = CourseCatalog(courses_file)
+    assert catalog.get("hesaban1")["price"] == 150000
+    assert catalog.price("missing") is None
+    assert [c["course_id"] for c in catalog.by_type("free")] == ["free_math_10th", "free_old"]
+    assert [c["course_id"] for c in catalog.by_type("free", active_only=True)] == ["free_math_10th"]
+    assert {c["course_id"] for c in catalog.for_grade("دهم")} == {"free_math_10th", "free_old"}
+    assert [c["course_id"] for c in catalog.for_major("تجربی")] == ["free_math_10th"]
+    assert catalog.workshop_months() == ("مهر ۱۴۰۴", "اسفند ۱۴۰۴", "تیر ۱۴۰۵")
+    assert list(catalog.workshops()) == list(catalog.workshop_months())
+
+
+def test_snapshot_is_read_only(courses_file):
+    catalog = CourseCatalog(courses_file)
+    course = catalog.get("free_math_10th")
+    with pytest.raises(TypeError):
+        course["title"] = "x"
+    assert isinstance(course["target_grades"], tuple)
+
+
+def test_reloads_on_mtime_change(courses_file):
+    catalog = CourseCatalog(courses_file, check_interval=0)
+    before = catalog.all()
+    assert catalog.all() is before  # unchanged file is not re-read
+
+    _write(courses_file, COURSES + [{"course_id": "geometry3", "course_type": "paid"}], 1_000_050)
+    assert catalog.get("geometry3") is not None
+    assert catalog.all() is not before
+
+
+def test_broken_file_keeps_previous_snapshot(courses_file):
+    catalog = CourseCatalog(courses_file, check_interval=0)
+    assert catalog.get("hesaban1") is not None
+    courses_file.write_text("[{", encoding="utf-8")
+    os.utime(courses_file, (1_000_100, 1_000_100))
+    assert catalog.get("hesaban1") is not None
+
+
+def test_check_interval_throttles_stat(courses_file):
+    catalog = CourseCatalog(courses_file, check_interval=3600)
+    assert catalog.get("hesaban1") is not None
+    _write(courses_file, [], 1_000_200)
+    assert catalog.get("hesaban1") is not None
+    assert catalog.reload() is True
+    assert catalog.get("hesaban1") is None
+
+
+def test_missing_file_is_empty(tmp_path):
+    catalog = CourseCatalog(tmp_path / "nope.json")
+    assert not catalog.exists()
+    assert catalog.all() == () and catalog.get("x") is None
+    with pytest.raises(FileNotFoundError):
+        get_workshop_months(tmp_path / "nope.json")
+
+
+def test_book_lookup_by_title_or_id(tmp_path):
+    path = tmp_path / "books.json"
+    _write(path, [{"book_id": "b1", "title": "انفجار خلاقیت", "price": 5, "target_grades": []}])
+    catalog = BookCatalog(path)
+    assert catalog.find("انفجار خلاقیت")["price"] == 5
+    assert catalog.find("b1")["price"] == 5
+    assert catalog.get("b1") is catalog.find("b1")
+    assert catalog.find("other") is None
+
+
+def test_shared_catalog_serves_workshop_months():
+    assert get_workshop_months() == list(course_catalog.workshop_months())
+
+
+def test_paid_single_select_matches_course_id_containing_slug(tmp_path, monkeypatch):
+    import asyncio
+    from types import SimpleNamespace
+
+    import handlers.courses as courses
+
+    path = tmp_path / "courses.json"
+    _write(path, [{"course_id": "exp_math1_1403", "course_type": "paid", "price": 200000}])
+    monkeypatch.setattr(courses, "course_catalog", CourseCatalog(path, check_interval=0))
+    sent = []
+
+    class _Query:
+        data = "paid_single_exp_math1"
+
+        async def answer(self, *a, **k):
+            return None
+
+        async def edit_message_text(self, text, reply_markup=None, **kwargs):
+            sent.append(text)
+
+    update = SimpleNamespace(callback_query=_Query(), effective_user=SimpleNamespace(id=1))
+    asyncio.run(courses.handle_paid_single_select(update, SimpleNamespace(user_data={})))
+    assert "200,000" in sent[0]
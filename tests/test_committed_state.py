@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import pytest
+
+from utils.committed_state import CommittedState, stage_on_commit
+
+
+class _Counter(CommittedState):
+    """Running total of applied ints over a fake table."""
+
+    def __init__(self):
+        super().__init__(refresh_seconds=60)
+        self.rows = [1, 2]
+        self.total = 0
+        self.during_read = None
+
+    def _read(self):
+        data = sum(self.rows)
+        if self.during_read is not None:
+            self.during_read()
+        return data
+
+    def _swap(self, total):
+        self.total = total
+        return total
+
+    def _apply(self, changes):
+        self.total += sum(changes)
+
+
+def test_commit_during_load_is_replayed_after_swap():
+    state = _Counter()
+    assert state.load() == 3
+
+    def _commit():
+        # Committed after the read: the row is missing from what load() read
+        state.rows.append(10)
+        state.apply([10])
+
+    state.during_read = _commit
+    state.load()
+    assert state.total == 13
+    state.during_read = None
+    assert state.load() == 13
+
+
+def test_apply_before_first_load_is_dropped():
+    state = _Counter()
+    state.apply([5])
+    assert not state.loaded and state.total == 0
+
+
+def test_failed_read_keeps_current_state():
+    state = _Counter()
+    state.load()
+
+    def _fail():
+        raise RuntimeError("db down")
+
+    state.during_read = _fail
+    with pytest.raises(RuntimeError):
+        state.load()
+    state.apply([4])
+    assert state.total == 7 and state._replay is None
+
+
+def test_staged_changes_apply_on_commit_only():
+    from database.db import session_scope
+
+    applied = []
+    with session_scope() as session:
+        stage_on_commit(session, "a", applied.append).append(1)
+        stage_on_commit(session, "a", applied.append).append(2)
+        stage_on_commit(session, "b", applied.append, set).add(3)
+    assert applied == [[1, 2], {3}]
+
+    with pytest.raises(RuntimeError):
+        with session_scope() as session:
+            stage_on_commit(session, "a", applied.append).append(4)
+            raise RuntimeError("abort")
+    assert applied == [[1, 2], {3}]
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for automatic handler latency instrumentation
+"""
+import asyncio
+import sys
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+import telegram.ext as telegram_ext
+from sqlalchemy import create_engine, text
+from telegram.ext import (
+    ApplicationBuilder,
+    ApplicationHandlerStop,
+    CallbackQueryHandler,
+    CommandHandler,
+    ConversationHandler,
+)
+
+from utils.instrumentation import (
+    current_timing,
+    install_db_timing,
+    instrument_application,
+    timed_callback,
+)
+from utils.performance_monitor import PerformanceMonitor
+
+
+pytestmark = pytest.mark.asyncio
+
+
+def _update(user_id=7):
+    return SimpleNamespace(effective_user=SimpleNamespace(id=user_id))
+
+
+@pytest.fixture
+def monitor():
+    m = PerformanceMonitor()
+    with patch("utils.instrumentation.monitor", m):
+        yield m
+
+
+async def test_records_duration_user_and_errors(monitor):
+    async def ok_handler(update, context):
+        await asyncio.sleep(0)
+        return "done"
+
+    async def failing_handler(update, context):
+        raise ValueError("boom")
+
+    assert await timed_callback(ok_handler)(_update(), None) == "done"
+    with pytest.raises(ValueError):
+        await timed_callback(failing_handler)(_update(8), None)
+
+    ok = await monitor.get_handler_stats(ok_handler.__qualname__)
+    assert ok["total_requests"] == 1 and ok["error_count"] == 0
+    failed = await monitor.get_handler_stats(failing_handler.__qualname__)
+    assert failed["total_requests"] == 1 and failed["error_count"] == 1
+    assert set(monitor.user_activity) == {7, 8}
+
+
+async def test_handler_stop_is_not_an_error(monitor):
+    async def stopper(update, context):
+        raise ApplicationHandlerStop()
+
+    with pytest.raises(ApplicationHandlerStop):
+        await timed_callback(stopper)(_update(), None)
+    assert (await monitor.get_handler_stats(stopper.__qualname__))["error_count"] == 0
+
+
+async def test_db_time_follows_handler_into_worker_threads(monitor):
+    from database.db import run_blocking
+
+    engine = create_engine("sqlite://")
+    install_db_timing(engine)
+    install_db_timing(engine)  # idempotent
+
+    def _query():
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+            conn.execute(text("SELECT 2"))
+
+    seen = {}
+
+    async def db_handler(update, context):
+        await run_blocking(_query)
+        seen["calls"] = current_timing().db_calls
+
+    await timed_callback(db_handler)(_update(), None)
+    assert seen["calls"] == 2
+    stats = await monitor.get_handler_stats(db_handler.__qualname__)
+    assert stats["avg_db_duration"] >= 0
+    assert monitor.metrics[db_handler.__qualname__].db_duration > 0
+    # Outside a handler nothing is attributed
+    await run_blocking(_query)
+    assert current_timing() is None
+
+
+async def test_failed_statement_is_timed_and_leaves_no_state(monitor):
+    from database.db import run_blocking
+
+    engine = create_engine("sqlite://")
+    install_db_timing(engine)
+
+    def _query():
+        with engine.connect() as conn:
+            with pytest.raises(Exception):
+                conn.execute(text("SELECT * FROM no_such_table"))
+            conn.execute(text("SELECT 1"))
+            return dict(conn.info)
+
+    seen = {}
+
+    async def failing_db_handler(update, context):
+        seen["info"] = await run_blocking(_query)
+        seen["calls"] = current_timing().db_calls
+
+    await timed_callback(failing_db_handler)(_update(), None)
+    assert seen["calls"] == 2
+    assert "handler_timing_started" not in seen["info"]
+
+
+async def test_instrument_application_wraps_nested_handlers(monkeypatch):
+    # ConversationHandler imports from telegram.ext lazily; other tests may stub it
+    monkeypatch.setitem(sys.modules, "telegram.ext", telegram_ext)
+
+    async def start(update, context):
+        return 1
+
+    async def step(update, context):
+        return ConversationHandler.END
+
+    app = ApplicationBuilder().token("123:ABC").build()
+    app.add_handler(CommandHandler("start", start), group=1)
+    app.add_handler(
+        ConversationHandler(
+            entry_points=[CommandHandler("go", start)],
+            states={1: [CallbackQueryHandler(step)]},
+            fallbacks=[],
+        ),
+        group=1,
+    )
+    assert instrument_application(app) == 3
+    # Already wrapped callbacks are left alone
+    assert instrument_application(app) == 0
+    handler = app.handlers[1][0]
+    assert handler.callback.__qualname__ == start.__qualname__
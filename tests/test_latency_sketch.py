@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for the latency sketch and sliding windows behind PerformanceMetrics
+"""
+import random
+import time
+from unittest.mock import patch
+
+import pytest
+
+from utils.performance_monitor import (
+    LatencySketch,
+    PerformanceMetrics,
+    SlidingLatencyWindows,
+)
+
+
+def test_small_sketch_is_exact():
+    sketch = LatencySketch()
+    for value in [5.0, 1.0, 3.0, 2.0, 4.0]:
+        sketch.add(value)
+    assert sketch.mean() == 3.0
+    assert sketch.median() == 3.0
+    assert sketch.percentile(0.95) == 4.0
+    assert sketch.percentile(0.99) == 5.0
+
+
+def test_large_sketch_within_relative_accuracy():
+    rng = random.Random(7)
+    values = [rng.lognormvariate(-3, 1.2) for _ in range(20_000)]
+    sketch = LatencySketch()
+    for value in values:
+        sketch.add(value)
+    ordered = sorted(values)
+    for q in (0.95, 0.99):
+        exact = ordered[int(len(values) * q) - (1 if q < 0.99 else 0)]
+        assert sketch.percentile(q) == pytest.approx(exact, rel=LatencySketch.ACCURACY * 1.01)
+    assert sketch.median() == pytest.approx(
+        ordered[(len(values) - 1) // 2], rel=LatencySketch.ACCURACY * 1.01
+    )
+    # Bucket count stays small regardless of sample count
+    assert len(sketch._positive) < 1000
+
+
+def test_merge_matches_single_sketch():
+    rng = random.Random(3)
+    values = [rng.uniform(0.001, 2.0) for _ in range(5_000)]
+    whole, left, right = LatencySketch(), LatencySketch(), LatencySketch()
+    for i, value in enumerate(values):
+        whole.add(value)
+        (left if i % 2 else right).add(value)
+    left.merge(right)
+    assert left.count == whole.count
+    assert left.percentile(0.95) == whole.percentile(0.95)
+    assert left.percentile(0.99) == whole.percentile(0.99)
+
+
+def test_windows_drop_old_slots():
+    windows = SlidingLatencyWindows()
+    now = 1_000_000.0
+    windows.add(9.0, now - 2 * 3600)
+    windows.add(1.0, now - 1800)
+    windows.add(2.0, now - 120)
+    windows.add(3.0, now - 5)
+    assert windows.snapshot(60, now).count == 1
+    assert windows.snapshot(300, now).count == 2
+    assert windows.snapshot(3600, now).count == 3
+    assert len(windows._slots) == 3
+
+
+def test_add_request_does_not_compute_statistics():
+    metrics = PerformanceMetrics("h")
+    with patch.object(LatencySketch, "percentile") as percentile:
+        for _ in range(1_000):
+            metrics.add_request(0.01)
+        percentile.assert_not_called()
+    assert metrics.p95_duration == pytest.approx(0.01, rel=LatencySketch.ACCURACY)
+
+
+def test_to_dict_reports_sliding_windows():
+    metrics = PerformanceMetrics("h")
+    now = time.time()
+    metrics.add_request(4.0, now - 1200)
+    metrics.add_request(1.0, now)
+    metrics.add_request(2.0, now)
+    result = metrics.to_dict()
+    assert result["windows"]["1m"]["count"] == 2
+    assert result["windows"]["1h"]["count"] == 3
+    assert result["avg_duration"] == 1.5
+    assert result["windows"]["1h"]["p99"] == 4.0
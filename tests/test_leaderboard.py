@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import datetime as dt
+import time
+
+import pytest
+
+
+def _tid(offset: int = 0) -> int:
+    return int(time.time() * 1000) % 10_000_000 + 6_000_000 + offset
+
+
+def test_ranked_board_ranks_ties_and_moves():
+    from utils.leaderboard import RankedBoard
+
+    board = RankedBoard({1: 10, 2: 30, 3: 10, 4: 5})
+    assert board.top(3) == [(1, 2, 30), (2, 1, 10), (2, 3, 10)]
+    assert [board.rank(u) for u in (2, 1, 3, 4)] == [1, 2, 2, 4]
+    board.add(4, 30)
+    board.set(2, 0)
+    assert board.top(2) == [(1, 4, 35), (2, 1, 10)]
+    assert board.rank(2) == 4 and board.rank(99) is None
+    assert len(board) == 4
+
+
+def test_window_starts():
+    from utils.leaderboard import window_start
+
+    friday = dt.date(2026, 10, 16)
+    assert window_start("week", friday) == dt.date(2026, 10, 10)  # Saturday
+    assert window_start("week", dt.date(2026, 10, 17)) == dt.date(2026, 10, 17)
+    assert window_start("month", friday) == dt.date(2026, 10, 1)
+    assert window_start("all", friday) is None
+
+
+def test_answers_update_boards_on_commit_only():
+    from database.db import session_scope
+    from database.models_sql import QuizQuestion
+    from database.service import get_or_create_user, submit_answer
+    from utils.leaderboard import Leaderboard, leaderboard
+
+    tg_a, tg_b = _tid(1), _tid(2)
+    with session_scope() as s:
+        a = get_or_create_user(s, tg_a, first_name="LA")
+        b = get_or_create_user(s, tg_b, first_name="LB")
+        q = QuizQuestion(
+            grade="دهم", question_text="?", options={"choices": ["x", "y"]}, correct_index=0
+        )
+        s.add(q)
+        s.flush()
+        a_id, b_id, qid = a.id, b.id, q.id
+
+    leaderboard.load()
+    with session_scope() as s:
+        submit_answer(s, a_id, qid, 0)  # 5 daily + 5 correct
+        submit_answer(s, a_id, qid, 0)  # +5 correct
+        submit_answer(s, b_id, qid, 1)  # 5 daily
+    with pytest.raises(RuntimeError):
+        with session_scope() as s:
+            submit_answer(s, b_id, qid, 0)
+            raise RuntimeError("rolled back")
+
+    for window in ("all", "week", "month"):
+        mine = leaderboard.rank(a_id, window)
+        theirs = leaderboard.rank(b_id, window)
+        assert mine["points"] == 15 and theirs["points"] == 5
+        assert mine["rank"] < theirs["rank"]
+
+    # A rebuild from user_stats / quiz_attempts agrees with the incremental state
+    fresh = Leaderboard(refresh_seconds=60)
+    fresh.load()
+    for window in ("all", "week", "month"):
+        assert fresh.rank(a_id, window) == leaderboard.rank(a_id, window)
+        assert fresh.rank(b_id, window) == leaderboard.rank(b_id, window)
+    assert fresh.telegram_ids[a_id] == tg_a
+
+
+def test_points_committed_during_load_are_kept(monkeypatch):
+    from utils.leaderboard import Leaderboard
+
+    board = Leaderboard(refresh_seconds=60)
+    board.load()
+    read = board._read
+
+    def _read_then_commit():
+        data = read()
+        board.apply([(-1, 100, 40, 40)])
+        return data
+
+    monkeypatch.setattr(board, "_read", _read_then_commit)
+    board.load()
+    assert board.rank(-1, "all")["points"] == 40
+    assert board.rank(-1, "week")["points"] == 40
+
+
+def test_apply_before_load_is_ignored():
+    from utils.leaderboard import Leaderboard
+
+    board = Leaderboard(refresh_seconds=60)
+    board.apply([(1, 100, 50, 50)])
+    assert not board.loaded and board.top() == [] and board.rank(1) is None
+
+
+def test_windows_reset_when_period_rolls():
+    import utils.leaderboard as lb
+
+    board = lb.Leaderboard(refresh_seconds=60)
+    board._loaded = True
+    board.apply([(1, 100, 20, 20)])
+    assert board.rank(1, "week")["points"] == 20
+    board.starts["week"] = dt.date(2000, 1, 1)
+    assert board.rank(1, "week") is None
+    assert board.rank(1, "all")["points"] == 20
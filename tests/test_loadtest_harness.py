@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for the offline webhook load-test harness (scripts/loadtest_harness.py)
+"""
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import telegram
+
+from scripts.loadtest_harness import callback_update, message_update, registration_steps
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def test_update_builders_parse_as_telegram_updates(monkeypatch):
+    # Other tests may leave a mocked `telegram` behind; parsing re-imports it internally
+    monkeypatch.setitem(sys.modules, "telegram", telegram)
+    Update = telegram.Update
+    command = Update.de_json(message_update(1, 42, text="/start"), None)
+    assert command.message.text == "/start" and command.message.entities[0].type == "bot_command"
+    receipt = Update.de_json(message_update(2, 42, photo="r-1"), None)
+    assert receipt.message.photo[-1].file_size > receipt.message.photo[0].file_size
+    press = Update.de_json(callback_update(3, 42, "menu_profile"), None)
+    assert press.callback_query.data == "menu_profile" and press.effective_chat.id == 42
+    assert registration_steps(42)[-1] == ("cb", "confirm_reg")
+
+
+def test_harness_replays_mix_against_fake_bot_api(tmp_path):
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{tmp_path / 'load.db'}")
+    env.pop("PYTEST_CURRENT_TEST", None)
+    args = ["--users", "4", "--steps", "8", "--latency-ms", "2", "--rate-429", "0.05"]
+    args += ["--no-rate-limiter", "--port", "8096", "--seed", "7", "--json"]
+    proc = subprocess.run(
+        [sys.executable, str(ROOT / "scripts" / "loadtest_harness.py"), *args],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=240,
+    )
+    assert proc.returncode == 0, proc.stderr[-2000:]
+    report = json.loads(proc.stdout[proc.stdout.index("{\n") :])
+
+    total = report["total"]
+    assert total["updates"] >= 4 * 10 and total["rejected"] == 0 and total["unfinished"] == 0
+    assert total["throughput_per_s"] > 0 and total["e2e_p99_ms"] >= total["e2e_p50_ms"] > 0
+    assert {"start", "registration", "menu"} <= set(report["scenarios"])
+    assert report["config"]["database"].startswith("sqlite")
+
+    api = report["bot_api"]
+    assert api["calls"] > total["updates"] and api["throttled_429"] > 0
+    assert api["by_method"]["setWebhook"] >= 1
+    # Registration saves users, so at least one scenario touches the database
+    assert max(row["queries_max"] for row in report["scenarios"].values()) > 0
+    assert report["dispatcher"]["processed"] == total["updates"]
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for the Prometheus /metrics exposition and HTTP endpoint
+"""
+import asyncio
+import sys
+
+import pytest
+import telegram.ext as telegram_ext
+from sqlalchemy import create_engine
+from sqlalchemy.pool import QueuePool
+
+from utils.background import BroadcastJob, BroadcastManager
+from utils.cache import SimpleCache
+from utils.metrics_export import iter_metrics
+from utils.performance_monitor import PerformanceMonitor
+from utils.rate_limiter import MultiLevelRateLimiter
+
+
+pytestmark = pytest.mark.asyncio
+
+
+def _lines(text):
+    return [line for line in text.splitlines() if line and not line.startswith("#")]
+
+
+async def test_exposition_covers_every_source():
+    monitor = PerformanceMonitor()
+    for duration in (0.003, 0.02, 0.02, 3.0):
+        await monitor.log_request_time('say "hi"', duration, db_time=0.001)
+    monitor.increment_counter("registrations", 2)
+    monitor.increment_hourly("participant_pushes")
+
+    limiter = MultiLevelRateLimiter(engines={"default": "window"})
+    await limiter.is_allowed("1")
+
+    cache = SimpleCache(ttl_seconds=60)
+    await cache.set("k", 1)
+    await cache.get("k")
+    await cache.get("missing")
+
+    manager = BroadcastManager()
+    manager.jobs["42"] = BroadcastJob("42", 1, [1, 2, 3], "hello")
+    manager.jobs["42"].sent = 2
+
+    text = "".join(
+        iter_metrics(
+            monitor=monitor,
+            multi_limiter=limiter,
+            caches={"users": cache},
+            engine=create_engine("sqlite://", poolclass=QueuePool),
+            broadcast_manager=manager,
+        )
+    )
+    lines = _lines(text)
+    handler = 'handler="say \\"hi\\""'
+    assert f'bot_handler_duration_seconds_bucket{{{handler},le="0.005"}} 1' in lines
+    assert f'bot_handler_duration_seconds_bucket{{{handler},le="0.025"}} 3' in lines
+    assert f'bot_handler_duration_seconds_bucket{{{handler},le="2.5"}} 3' in lines
+    assert f'bot_handler_duration_seconds_bucket{{{handler},le="+Inf"}} 4' in lines
+    assert f"bot_handler_duration_seconds_count{{{handler}}} 4" in lines
+    assert 'bot_events_total{name="registrations"} 2' in lines
+    assert 'bot_events_current_hour{name="participant_pushes"} 1' in lines
+    assert 'bot_rate_limit_requests_total{level="default",outcome="allowed"} 1' in lines
+    assert 'bot_cache_hit_ratio{cache="users"} 0.5' in lines
+    assert 'bot_broadcast_sent{job="42"} 2' in lines
+    assert 'bot_broadcast_running{job="42"} 0' in lines
+    assert any(line.startswith("bot_db_pool_connections{") for line in lines)
+    assert "# TYPE bot_handler_duration_seconds histogram" in text
+
+
+async def test_render_does_not_take_monitor_lock():
+    monitor = PerformanceMonitor()
+    await monitor.log_request_time("h", 0.1)
+    async with monitor._lock:
+        text = "".join(iter_metrics(monitor=monitor))
+    assert 'bot_handler_duration_seconds_count{handler="h"} 1' in text
+
+
+async def test_metrics_endpoint_served_by_webhook_app(monkeypatch):
+    from aiohttp import ClientSession
+
+    monkeypatch.setitem(sys.modules, "telegram.ext", telegram_ext)
+    from bot import ApplicationBuilder, run_webhook_mode, setup_handlers
+    from config import config
+
+    monkeypatch.setenv("PORT", "8081")
+    monkeypatch.setenv("WEBHOOK_URL", "https://example.org")
+    monkeypatch.setenv("SKIP_WEBHOOK_REG", "true")
+    monkeypatch.setenv("METRICS_TOKEN", "scrape-me")
+
+    app = ApplicationBuilder().token(config.bot_token).build()
+    await setup_handlers(app)
+    task = asyncio.create_task(run_webhook_mode(app))
+    try:
+        await asyncio.sleep(0.8)
+        async with ClientSession() as s:
+            async with s.get("http://127.0.0.1:8081/metrics") as r:
+                assert r.status == 401
+            async with s.get(
+                "http://127.0.0.1:8081/metrics", headers={"Authorization": "Bearer wrong"}
+            ) as r:
+                assert r.status == 401
+            headers = {"Authorization": "Bearer scrape-me"}
+            async with s.get("http://127.0.0.1:8081/metrics", headers=headers) as r:
+                assert r.status == 200
+                assert r.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+                body = await r.text()
+        assert "# TYPE bot_handler_duration_seconds histogram" in body
+        assert "bot_rate_limit_requests_total" in body
+
+        # Without METRICS_TOKEN the endpoint fails closed, whatever the caller sends
+        monkeypatch.delenv("METRICS_TOKEN")
+        async with ClientSession() as s:
+            async with s.get("http://127.0.0.1:8081/metrics") as r:
+                assert r.status == 401
+            async with s.get(
+                "http://127.0.0.1:8081/metrics", headers={"Authorization": "Bearer "}
+            ) as r:
+                assert r.status == 401
+    finally:
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import secrets
+import time
+from datetime import timedelta
+
+import pytest
+
+
+pytestmark = pytest.mark.asyncio
+
+
+def _student(offset: int = 0) -> int:
+    return int(time.time() * 1000) % 10_000_000 + 3_000_000 + offset
+
+
+def _meta(student_id, item_id="c1", file_uid=None):
+    return {
+        "student_id": student_id,
+        "item_type": "course",
+        "item_id": item_id,
+        "item_title": item_id,
+        "file_unique_id": file_uid,
+    }
+
+
+@pytest.fixture(params=["sql", "memory"])
+def store(request):
+    from utils.payment_store import InMemoryPaymentStore, SQLPaymentStore
+
+    return SQLPaymentStore() if request.param == "sql" else InMemoryPaymentStore({})
+
+
+async def test_create_get_and_open_token_lookup(store):
+    sid = _student()
+    token = secrets.token_urlsafe(12)
+    file_uid = f"fu-{token}"
+    await store.create(token, _meta(sid, file_uid=file_uid))
+    await store.set_messages(token, [(111, 5), (222, 6)])
+
+    meta = await store.get(token)
+    assert meta["student_id"] == sid
+    assert meta["processed"] is False
+    assert [tuple(m) for m in meta["messages"]] == [(111, 5), (222, 6)]
+
+    assert await store.find_open(sid, "course", "c1", within_seconds=120) == token
+    assert await store.find_open(sid, "course", "other", within_seconds=120) is None
+    assert await store.receipt_seen(file_uid) is True
+    assert await store.receipt_seen(f"unused-{token}") is False
+
+
+async def test_mark_decided_claims_once(store):
+    sid = _student(1)
+    token = secrets.token_urlsafe(12)
+    await store.create(token, _meta(sid))
+
+    assert await store.mark_decided(token, "approve", 111) is True
+    assert await store.mark_decided(token, "reject", 222) is False
+    meta = await store.get(token)
+    assert meta["processed"] is True
+    assert meta["decision"] == "approve"
+    assert meta["decided_by"] == 111
+    assert await store.find_open(sid, "course", "c1", within_seconds=120) is None
+
+
+async def test_failed_decision_releases_the_claim(store):
+    sid = _student(3)
+    token = secrets.token_urlsafe(12)
+    await store.create(token, _meta(sid))
+
+    def _fail(session):
+        raise RuntimeError("purchase update failed")
+
+    with pytest.raises(RuntimeError):
+        await store.mark_decided(token, "approve", 111, apply=_fail)
+    meta = await store.get(token)
+    assert meta["processed"] is False and meta["decision"] is None
+
+    applied = []
+    assert await store.mark_decided(token, "reject", 222, apply=applied.append) is True
+    assert len(applied) == 1
+    assert (await store.get(token))["decision"] == "reject"
+
+
+async def test_list_filters_and_orders_by_recency(store):
+    sid = _student(2)
+    tokens = []
+    for i in range(3):
+        token = secrets.token_urlsafe(12)
+        await store.create(token, _meta(sid, item_id=f"item{i}"))
+        tokens.append(token)
+        time.sleep(0.01)
+    await store.mark_decided(tokens[0], "reject", 1)
+
+    pending = await store.list(status="pending", student_id=sid)
+    assert [t for t, _ in pending] == [tokens[2], tokens[1]]
+    rejected = await store.list(status="reject", student_id=sid)
+    assert [t for t, _ in rejected] == [tokens[0]]
+    page = await store.list(student_id=sid, limit=1, offset=1)
+    assert [t for t, _ in page] == [tokens[1]]
+
+
+async def test_sql_store_purges_expired_tokens():
+    from sqlalchemy import update
+    from database.db import session_scope
+    from database.models_sql import PaymentToken
+    from utils.payment_store import SQLPaymentStore, _utcnow
+
+    store = SQLPaymentStore()
+    token = secrets.token_urlsafe(12)
+    await store.create(token, _meta(_student(3), file_uid=f"old-{token}"))
+    with session_scope() as s:
+        s.execute(
+            update(PaymentToken)
+            .where(PaymentToken.token == token)
+            .values(expires_at=_utcnow() - timedelta(seconds=1))
+        )
+    # Expired receipts no longer block reuse, and the row is removed on purge
+    assert await store.receipt_seen(f"old-{token}") is False
+    assert await store.purge_expired() >= 1
+    assert await store.get(token) is None
+
+
+async def test_get_payment_store_resolution():
+    from utils.payment_store import InMemoryPaymentStore, get_payment_store, payment_store
+
+    assert get_payment_store({}) is payment_store
+    # A bare notifications dict is not a store; tests inject one explicitly
+    assert get_payment_store({"payment_notifications": {"t": {"student_id": 1}}}) is payment_store
+    custom = InMemoryPaymentStore()
+    assert get_payment_store({"payment_store": custom}) is custom
@@ -60,6 +60,7 @@ class DummyContext:
 @pytest.mark.asyncio
 async def test_handle_payment_decision_approve_course(tmp_path):
     from handlers.payments import handle_payment_decision
+    from utils.payment_store import InMemoryPaymentStore
     from database.db import session_scope
     from database.service import get_or_create_user
 
@@ -85,6 +86,8 @@ async def test_handle_payment_decision_approve_course(tmp_path):
         },
     }
 
+    bot_data["payment_store"] = InMemoryPaymentStore(bot_data["payment_notifications"])
+
     update = DummyUpdate(user_id=111, data=f"pay:{token}:approve")
     context = DummyContext(bot_data=bot_data, bot=bot)
 
@@ -102,6 +105,7 @@ async def test_handle_payment_decision_approve_course(tmp_path):
 @pytest.mark.asyncio
 async def test_handle_payment_decision_approve_book(tmp_path):
     from handlers.payments import handle_payment_decision
+    from utils.payment_store import InMemoryPaymentStore
     from database.db import session_scope
     from database.service import get_or_create_user
 
@@ -126,6 +130,8 @@ async def test_handle_payment_decision_approve_book(tmp_path):
         },
     }
 
+    bot_data["payment_store"] = InMemoryPaymentStore(bot_data["payment_notifications"])
+
     update = DummyUpdate(user_id=111, data=f"pay:{token}:approve")
     context = DummyContext(bot_data=bot_data, bot=bot)
 
@@ -140,6 +146,7 @@ async def test_handle_payment_decision_approve_book(tmp_path):
 @pytest.mark.asyncio
 async def test_handle_payment_decision_reject_book(tmp_path):
     from handlers.payments import handle_payment_decision
+    from utils.payment_store import InMemoryPaymentStore
     from database.db import session_scope
     from database.service import get_or_create_user
 
@@ -164,6 +171,8 @@ async def test_handle_payment_decision_reject_book(tmp_path):
         },
     }
 
+    bot_data["payment_store"] = InMemoryPaymentStore(bot_data["payment_notifications"])
+
     update = DummyUpdate(user_id=111, data=f"pay:{token}:reject")
     context = DummyContext(bot_data=bot_data, bot=bot)
 
@@ -174,3 +183,47 @@ async def test_handle_payment_decision_reject_book(tmp_path):
     assert meta["decision"] == "reject"
     # Rejection message sent
     assert any((m["chat_id"] == user_id and "ناموفق" in m["text"]) for m in bot.sent_messages)
+
+
+@pytest.mark.asyncio
+async def test_handle_payment_decision_failure_keeps_token_open(monkeypatch):
+    import handlers.payments as payments
+    from database.db import session_scope
+    from database.service import create_purchase, get_or_create_user
+    from utils.payment_store import InMemoryPaymentStore
+
+    user_id = 999
+    with session_scope() as session:
+        u = get_or_create_user(session, telegram_user_id=user_id, first_name="Reza", last_name="K")
+        create_purchase(session, u.id, "book", "BookFail")
+
+    def _fail(session, purchase_id, admin_id, decision):
+        raise RuntimeError("db down")
+
+    monkeypatch.setattr(payments, "approve_or_reject_purchase", _fail)
+
+    token = "9988776655443322"
+    bot = DummyBot()
+    notifications = {
+        token: {
+            "student_id": user_id,
+            "item_type": "book",
+            "item_id": "BookFail",
+            "item_title": "BookFail",
+            "messages": [(111, 13)],
+            "processed": False,
+            "created_at": 1,
+        }
+    }
+    bot_data = {
+        "config": types.SimpleNamespace(bot=types.SimpleNamespace(admin_user_ids=[111])),
+        "payment_store": InMemoryPaymentStore(notifications),
+    }
+
+    await payments.handle_payment_decision(
+        DummyUpdate(user_id=111, data=f"pay:{token}:approve"), DummyContext(bot_data, bot)
+    )
+
+    # The claim is released so the admin can retry, and only the admin is told
+    assert notifications[token]["processed"] is False
+    assert [m["chat_id"] for m in bot.sent_messages] == [111]
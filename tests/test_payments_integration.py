@@ -5,6 +5,7 @@ import pytest
 @pytest.mark.asyncio
 async def test_orders_ui_filters():
     from bot import orders_ui_command
+    from utils.payment_store import InMemoryPaymentStore
 
     class DummyMsg:
         async def reply_text(self, text, reply_markup=None):
@@ -36,4 +37,7 @@ async def test_orders_ui_filters():
             },
         }
 
+    DummyContext.bot_data["payment_store"] = InMemoryPaymentStore(
+        DummyContext.bot_data["payment_notifications"]
+    )
     await orders_ui_command(DummyUpdate(), DummyContext())
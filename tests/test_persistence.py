@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for the SQL-backed PTB persistence (batched write-behind, round trips)
+"""
+import asyncio
+import datetime as dt
+import uuid
+
+import pytest
+from sqlalchemy import event
+
+from database.persistence import SQLPersistence
+
+
+def _uid() -> int:
+    return int(uuid.uuid4().int % 10**9) + 7_000_000_000
+
+
+def _count_writes(statements):
+    def _record(conn, cursor, statement, *args):
+        if "bot_persistence" in statement and not statement.lstrip().upper().startswith("SELECT"):
+            statements.append(statement)
+
+    return _record
+
+
+@pytest.mark.asyncio
+async def test_updates_coalesce_into_one_batch():
+    from database.db import ENGINE, ensure_schema_ready
+
+    # Schema bootstrap DDL must not be counted as persistence writes
+    ensure_schema_ready()
+    persistence = SQLPersistence(update_interval=60)
+    users = [_uid() for _ in range(20)]
+    statements = []
+    record = _count_writes(statements)
+    event.listen(ENGINE, "before_cursor_execute", record)
+    try:
+        for n in range(3):
+            for uid in users:
+                await persistence.update_user_data(uid, {"step": n})
+        await persistence.flush()
+    finally:
+        event.remove(ENGINE, "before_cursor_execute", record)
+
+    assert persistence.stats["batches"] == 1 and persistence.stats["rows"] == 20
+    assert len(statements) == 1
+
+    loaded = await SQLPersistence().get_user_data()
+    assert all(loaded[uid] == {"step": 2} for uid in users)
+
+
+@pytest.mark.asyncio
+async def test_round_trip_conversations_and_drops():
+    from handlers.registration import RegistrationStates
+
+    persistence = SQLPersistence(update_interval=60)
+    uid, gone = _uid(), _uid()
+    when = dt.datetime(2026, 10, 16, 8, 30)
+    name = f"registration-{uuid.uuid4().hex[:6]}"
+    await persistence.update_user_data(uid, {"first_name": "علی", "at": when})
+    await persistence.update_user_data(gone, {"x": 1})
+    await persistence.update_chat_data(uid, {"lang": "fa"})
+    await persistence.update_conversation(name, (uid, uid), RegistrationStates.CITY)
+    await persistence.update_conversation(name, (gone, gone), 3)
+    await persistence.flush()
+
+    await persistence.drop_user_data(gone)
+    await persistence.update_conversation(name, (gone, gone), None)
+    await persistence.flush()
+
+    fresh = SQLPersistence()
+    users = await fresh.get_user_data()
+    assert users[uid] == {"first_name": "علی", "at": when} and gone not in users
+    assert (await fresh.get_chat_data())[uid] == {"lang": "fa"}
+    assert await fresh.get_conversations(name) == {(uid, uid): RegistrationStates.CITY}
+
+
+@pytest.mark.asyncio
+async def test_unserializable_entry_is_skipped():
+    persistence = SQLPersistence(update_interval=60)
+    uid = _uid()
+    await persistence.update_user_data(uid, {"lock": object()})
+    await persistence.flush()
+    assert persistence.stats["batches"] == 0
+    assert uid not in await SQLPersistence().get_user_data()
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_is_retried_with_backoff(monkeypatch):
+    persistence = SQLPersistence(update_interval=60)
+    persistence.retry_min_seconds = 0.01
+    real_write = persistence._write
+    attempts = []
+
+    async def _flaky_write(batch):
+        attempts.append(dict(batch))
+        if len(attempts) < 3:
+            raise ConnectionError("db down")
+        await real_write(batch)
+
+    monkeypatch.setattr(persistence, "_write", _flaky_write)
+    uid = _uid()
+    await persistence.update_user_data(uid, {"step": 1})
+    # No further updates: the staged entry must still reach the database
+    await persistence._flush_task
+    assert len(attempts) == 3 and persistence.stats["errors"] == 2
+    assert persistence.stats["batches"] == 1
+    assert (await SQLPersistence().get_user_data())[uid] == {"step": 1}
+
+
+@pytest.mark.asyncio
+async def test_flush_during_backoff_tries_once_and_returns(monkeypatch):
+    persistence = SQLPersistence(update_interval=60)
+    persistence.retry_min_seconds = 60
+
+    async def _down(batch):
+        raise ConnectionError("db down")
+
+    monkeypatch.setattr(persistence, "_write", _down)
+    await persistence.update_user_data(_uid(), {"step": 1})
+    await asyncio.sleep(0.01)
+    await asyncio.wait_for(persistence.flush(), 1)
+    assert persistence.stats["errors"] == 2
+    assert len(persistence._pending) == 1
+
+
+def test_conversations_are_persistent_with_a_persistence(monkeypatch):
+    import handlers.books as books
+    import handlers.registration as registration
+
+    # Other tests may leave a mocked `telegram` behind; only the flag is under test
+    built = []
+    for module in (books, registration):
+        monkeypatch.setattr(module, "ConversationHandler", lambda **kw: built.append(kw) or kw)
+
+    registration.build_registration_conversation()
+    registration.build_registration_conversation(persistent=True)
+    books.build_book_purchase_conversation(persistent=True)
+    assert [kw["persistent"] for kw in built] == [False, True, True]
@@ -52,6 +52,7 @@ async def test_profile_shows_address_and_receipts(monkeypatch):
 @pytest.mark.asyncio
 async def test_admin_approve_reject_with_receipt(monkeypatch):
     from handlers.payments import handle_payment_decision
+    from utils.payment_store import InMemoryPaymentStore
 
     class Q:
         def __init__(self, data, uid):
@@ -99,6 +100,8 @@ async def test_admin_approve_reject_with_receipt(monkeypatch):
         }
     }
 
+    ctx.bot_data["payment_store"] = InMemoryPaymentStore(ctx.bot_data["payment_notifications"])
+
     upd = Upd(f"pay:{token}:approve", 111)
     await handle_payment_decision(upd, ctx)
     assert ctx.bot_data["payment_notifications"][token]["processed"] is True
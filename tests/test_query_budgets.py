@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SQL round-trip budgets for the main user paths (see database.query_budget)
+"""
+import asyncio
+import sys
+import uuid
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+import telegram.ext as telegram_ext
+
+from database.query_budget import (
+    QUERY_BUDGETS,
+    QueryBudget,
+    QueryBudgetExceeded,
+    count_queries,
+)
+
+
+def _tid() -> int:
+    return int(uuid.uuid4().int % 10**9) + 5_000_000_000
+
+
+def _register(tid, grade="دهم"):
+    from database.db import session_scope
+    from database.service import get_or_create_user
+
+    with session_scope() as s:
+        u = get_or_create_user(s, tid, first_name="B", last_name="Q", phone="0912", grade=grade)
+        return u.id
+
+
+def _user(tid):
+    return SimpleNamespace(id=tid, first_name="B")
+
+
+def _callback_update(tid, data):
+    query = SimpleNamespace(
+        data=data,
+        from_user=_user(tid),
+        answer=AsyncMock(),
+        edit_message_text=AsyncMock(),
+    )
+    return SimpleNamespace(
+        effective_user=_user(tid),
+        effective_chat=SimpleNamespace(id=tid, send_message=AsyncMock()),
+        callback_query=query,
+        message=None,
+    )
+
+
+def _context(**user_data):
+    from config import config
+
+    return SimpleNamespace(
+        user_data=dict(user_data),
+        bot_data={"config": config},
+        bot=SimpleNamespace(
+            forward_message=AsyncMock(),
+            send_message=AsyncMock(return_value=SimpleNamespace(message_id=1)),
+            send_photo=AsyncMock(),
+        ),
+        args=[],
+    )
+
+
+@pytest.mark.asyncio
+async def test_send_main_menu(query_budget):
+    from handlers.menu import send_main_menu
+
+    tid = _tid()
+    _register(tid)
+    update = _callback_update(tid, None)
+    with query_budget("send_main_menu"):
+        await send_main_menu(update, _context())
+    update.effective_chat.send_message.assert_awaited()
+
+
+@pytest.mark.asyncio
+async def test_handle_menu_selection_profile(query_budget):
+    from handlers.menu import handle_menu_selection
+
+    tid = _tid()
+    _register(tid)
+    update = _callback_update(tid, "menu_profile")
+    with query_budget("handle_menu_selection"):
+        await handle_menu_selection(update, _context())
+    assert "پروفایل" in update.callback_query.edit_message_text.await_args.args[0]
+
+
+@pytest.mark.asyncio
+async def test_handle_payment_receipt_course(query_budget):
+    from handlers.payments import handle_payment_receipt
+
+    tid = _tid()
+    _register(tid)
+    photo = SimpleNamespace(file_size=1024, file_id=f"f-{tid}", file_unique_id=f"u-{tid}")
+    update = SimpleNamespace(
+        effective_user=_user(tid),
+        effective_chat=SimpleNamespace(id=tid),
+        callback_query=None,
+        message=SimpleNamespace(photo=[photo], message_id=3, reply_text=AsyncMock()),
+    )
+    context = _context(pending_course="course-a")
+    with query_budget("handle_payment_receipt"):
+        await handle_payment_receipt(update, context)
+    assert "pending_course" not in context.user_data
+
+
+@pytest.mark.asyncio
+async def test_handle_quiz_answer(query_budget):
+    from database.db import session_scope
+    from database.models_sql import QuizQuestion
+    from handlers.courses import handle_quiz_answer
+    from utils.question_bank import question_bank
+
+    tid = _tid()
+    _register(tid)
+    with session_scope() as s:
+        q = QuizQuestion(
+            grade="دهم", question_text="?", options={"choices": ["a", "b"]}, correct_index=1
+        )
+        s.add(q)
+        s.flush()
+        qid = q.id
+    question_bank.invalidate()
+    await question_bank.ensure_loaded()
+
+    update = _callback_update(tid, f"quiz:{qid}:1")
+    with query_budget("handle_quiz_answer"):
+        await handle_quiz_answer(update, _context())
+    assert "✅" in update.callback_query.edit_message_text.await_args.args[0]
+
+
+@pytest.mark.asyncio
+async def test_admin_page(monkeypatch, query_budget):
+    from aiohttp import ClientSession
+
+    monkeypatch.setitem(sys.modules, "telegram.ext", telegram_ext)
+    from bot import ApplicationBuilder, run_webhook_mode, setup_handlers
+    from config import config
+
+    monkeypatch.setenv("PORT", "8099")
+    monkeypatch.setenv("WEBHOOK_URL", "https://example.org")
+    monkeypatch.setenv("SKIP_WEBHOOK_REG", "true")
+    monkeypatch.setenv("ADMIN_DASHBOARD_TOKEN", "budget-token")
+    monkeypatch.setattr(config.bot, "admin_dashboard_token", "budget-token")
+
+    app = ApplicationBuilder().token(config.bot_token).build()
+    await setup_handlers(app)
+    task = asyncio.create_task(run_webhook_mode(app))
+    try:
+        await asyncio.sleep(0.8)
+        url = "http://127.0.0.1:8099/admin?token=budget-token&fmt=html"
+        async with ClientSession() as s:
+            # Warm-up loads the header stats snapshot once per process
+            async with s.get(url) as r:
+                assert r.status == 200
+            # The request is served by the server task, so count on the whole engine
+            with query_budget("admin_list", all_contexts=True):
+                async with s.get(url) as r:
+                    assert r.status == 200
+    finally:
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+
+@pytest.mark.asyncio
+async def test_budget_catches_n_plus_one_and_ignores_other_tasks():
+    from sqlalchemy import select
+    from database.db import run_blocking, session_scope
+    from database.models_sql import User
+    from database.query_budget import query_budget
+
+    def _n_plus_one():
+        with session_scope() as s:
+            ids = s.execute(select(User.id).limit(3)).scalars().all()
+            for uid in ids:
+                s.get(User, uid)
+
+    def _one():
+        with session_scope() as s:
+            s.execute(select(User.id).limit(1)).all()
+
+    _register(_tid())
+    with pytest.raises(QueryBudgetExceeded, match="statements > 1"):
+        with query_budget(QueryBudget(statements=1)):
+            await run_blocking(_n_plus_one)
+
+    # Work started outside the block is not charged to it
+    background = asyncio.ensure_future(run_blocking(_n_plus_one))
+    with count_queries() as counted:
+        await run_blocking(_one)
+    await background
+    assert len(counted.statements) == 1 and counted.connections == 1
+    assert counted.round_trips == 3
+
+
+def test_budgets_cover_the_main_paths():
+    assert {
+        "send_main_menu",
+        "handle_menu_selection",
+        "handle_payment_receipt",
+        "handle_quiz_answer",
+        "admin_list",
+    } <= set(QUERY_BUDGETS)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for SQL query telemetry (fingerprints, slow-query log, pool checkout counters)
+"""
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import bindparam, create_engine, exc, text
+
+from database.db import (
+    QUERY_TELEMETRY,
+    QueryTelemetry,
+    TimedQueuePool,
+    fingerprint,
+    install_query_telemetry,
+)
+from utils.metrics_export import iter_metrics
+
+
+def test_fingerprint_folds_literals_and_value_lists():
+    a = fingerprint("SELECT * FROM users WHERE id IN (?, ?, ?) AND name = 'x'  LIMIT 10")
+    b = fingerprint("SELECT * FROM users\nWHERE id IN (?) AND name = 'it''s' LIMIT 5")
+    assert a == b == "SELECT * FROM users WHERE id IN (...) AND name = ? LIMIT ?"
+    assert (
+        fingerprint("INSERT INTO t (a, b) VALUES (%(a_m0)s, %(b_m0)s), (%(a_m1)s, %(b_m1)s)")
+        == "INSERT INTO t (a, b) VALUES (...)"
+    )
+    assert fingerprint("SELECT t1.col2, anon_1.x FROM t1 WHERE v = $1") == (
+        "SELECT t1.col2, anon_1.x FROM t1 WHERE v = ?"
+    )
+
+
+def test_statements_grouped_and_slow_ones_logged():
+    telemetry = QueryTelemetry(slow_ms=0, slow_log_size=2)
+    telemetry.context_label = lambda: "start_command"
+    engine = create_engine("sqlite://")
+    install_query_telemetry(engine, telemetry)
+    install_query_telemetry(engine, telemetry)  # idempotent
+
+    stmt = text("SELECT :x IN :ids").bindparams(bindparam("ids", expanding=True))
+    with engine.connect() as conn:
+        for n in (1, 2, 5):
+            conn.execute(stmt, {"x": 1, "ids": list(range(n))})
+        conn.execute(text("SELECT 1"))
+
+    snapshot = telemetry.snapshot()
+    top = {row["fingerprint"]: row["count"] for row in snapshot["top"]}
+    assert top["SELECT ? IN (...)"] == 3 and top["SELECT ?"] == 1
+    assert snapshot["queries"] == 4 and snapshot["slow_total"] == 4
+    assert len(snapshot["slow_queries"]) == 2
+    latest = snapshot["slow_queries"][-1]
+    assert latest["handler"] == "start_command" and latest["fingerprint"] == "SELECT ?"
+
+    text_out = "".join(iter_metrics(query_telemetry=telemetry))
+    assert 'bot_db_queries_total{fingerprint="SELECT ? IN (...)"} 3' in text_out
+    assert "bot_db_slow_queries_total 4" in text_out
+
+    telemetry.reset()
+    assert telemetry.snapshot()["queries"] == 0
+
+
+def test_fingerprint_table_is_bounded():
+    telemetry = QueryTelemetry(slow_ms=10_000)
+    with patch.object(QueryTelemetry, "MAX_FINGERPRINTS", 2):
+        for table in ("a", "b", "c", "d"):
+            telemetry.record_query(f"SELECT x FROM {table}", 0.001)
+    assert set(telemetry.fingerprints) == {"SELECT x FROM a", "SELECT x FROM b", "(other)"}
+    assert telemetry.fingerprints["(other)"][0] == 2
+
+
+def test_pool_checkout_overflow_timeout_and_invalidation(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        poolclass=TimedQueuePool,
+        pool_size=1,
+        max_overflow=1,
+        pool_timeout=0.05,
+    )
+    install_query_telemetry(engine)
+    before = dict(QUERY_TELEMETRY.pool)
+
+    first = engine.connect()
+    second = engine.connect()  # beyond pool_size
+    with pytest.raises(exc.TimeoutError):
+        engine.connect()
+    second.invalidate()
+    second.close()
+    first.close()
+
+    pool = QUERY_TELEMETRY.pool
+    assert pool["checkouts"] - before["checkouts"] == 2
+    assert pool["overflow"] - before["overflow"] == 1
+    assert pool["timeouts"] - before["timeouts"] == 1
+    assert pool["invalidated"] - before["invalidated"] == 1
+    assert pool["max_wait_seconds"] >= 0.05
+    engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_queries_per_update_recorded_per_handler():
+    from database.db import run_blocking
+    from utils.instrumentation import install_db_timing, timed_callback
+    from utils.performance_monitor import PerformanceMonitor
+
+    monitor = PerformanceMonitor()
+    engine = create_engine("sqlite://")
+    install_db_timing(engine)
+
+    def _queries(n):
+        with engine.connect() as conn:
+            for i in range(n):
+                conn.execute(text("SELECT :i"), {"i": i})
+
+    async def list_courses(update, context):
+        await run_blocking(_queries, context)
+
+    update = SimpleNamespace(effective_user=SimpleNamespace(id=1))
+    with patch("utils.instrumentation.monitor", monitor):
+        await timed_callback(list_courses)(update, 3)
+        await timed_callback(list_courses)(update, 7)
+
+    stats = (await monitor.get_stats())["handlers"][list_courses.__qualname__]
+    assert stats["avg_db_queries"] == 5 and stats["max_db_queries"] == 7
+    assert "sql" in await monitor.get_stats()
+    text_out = "".join(iter_metrics(monitor=monitor))
+    assert f'bot_handler_db_queries_max{{handler="{list_courses.__qualname__}"}} 7' in text_out
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import datetime as dt
+import json
+import uuid
+
+import pytest
+
+
+def _grade() -> str:
+    return f"g-{uuid.uuid4().hex[:8]}"
+
+
+def _seed(grade, specs):
+    from database.db import session_scope
+    from database.models_sql import QuizQuestion
+
+    ids = []
+    with session_scope() as s:
+        for difficulty, correct in specs:
+            q = QuizQuestion(
+                grade=grade,
+                difficulty=difficulty,
+                question_text=f"q{len(ids)}",
+                options={"choices": ["a", "b", "c"]},
+                correct_index=correct,
+            )
+            s.add(q)
+            s.flush()
+            ids.append(q.id)
+    return ids
+
+
+def test_daily_rotation_and_prerendered_keyboard():
+    from utils.question_bank import QuestionBank
+
+    grade = _grade()
+    hard, easy, medium = _seed(grade, [(3, 0), (1, 1), (2, 2)])
+    bank = QuestionBank(refresh_seconds=60)
+    bank.load()
+
+    day = dt.date(2026, 10, 16)
+    order = [bank.daily(grade, day + dt.timedelta(days=i)).id for i in range(3)]
+    assert sorted(order) == sorted([easy, medium, hard])
+    # Difficulty order, starting wherever the day number lands
+    start = order.index(easy)
+    assert order[start:] + order[:start] == [easy, medium, hard]
+    assert bank.daily(grade, day) is bank.daily(grade, day)
+
+    q = bank.daily(grade, day)
+    assert q.text.startswith(f"سوال روز ({grade})")
+    keyboard = q.reply_markup.inline_keyboard
+    assert [row[0].callback_data for row in keyboard[:3]] == [f"quiz:{q.id}:{i}" for i in range(3)]
+    assert keyboard[-1][0].callback_data == "back_to_menu"
+    assert bank.correct_index(easy) == 1 and bank.correct_index(-1) is None
+    assert bank.daily("no-such-grade") is None
+
+
+def test_submit_answer_checks_in_memory(monkeypatch):
+    from sqlalchemy import event
+    from database.db import ENGINE, session_scope
+    from database.service import get_or_create_user, submit_answer
+    import utils.question_bank as qb
+
+    grade = _grade()
+    (qid,) = _seed(grade, [(1, 2)])
+    bank = qb.QuestionBank(refresh_seconds=60)
+    bank.load()
+    monkeypatch.setattr(qb, "question_bank", bank)
+
+    statements = []
+
+    def _record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    with session_scope() as s:
+        u = get_or_create_user(s, int(uuid.uuid4().int % 10**9) + 8_000_000_000, first_name="Q")
+        event.listen(ENGINE, "before_cursor_execute", _record)
+        try:
+            assert submit_answer(s, u.id, qid, 2) is True
+            assert submit_answer(s, u.id, qid, 0) is False
+        finally:
+            event.remove(ENGINE, "before_cursor_execute", _record)
+    assert not any("FROM quiz_questions" in q for q in statements)
+
+    # Unknown to the bank: falls back to the table
+    (late,) = _seed(grade, [(1, 0)])
+    with session_scope() as s:
+        assert submit_answer(s, u.id, late, 0) is True
+        assert submit_answer(s, u.id, -5, 0) is False
+
+
+@pytest.mark.asyncio
+async def test_seeding_invalidates_bank(tmp_path):
+    from scripts.json_to_db import seed_quiz_from_json
+    from utils.question_bank import question_bank
+
+    grade = _grade()
+    await question_bank.ensure_loaded()
+    assert question_bank.daily(grade) is None
+
+    path = tmp_path / "quiz.json"
+    path.write_text(
+        json.dumps(
+            [{"grade": grade, "question_text": "2+2?", "choices": ["3", "4"], "correct_index": 1}]
+        ),
+        encoding="utf-8",
+    )
+    assert seed_quiz_from_json(str(path)) == 1
+    await question_bank.ensure_loaded()
+    q = question_bank.daily(grade)
+    assert q is not None and question_bank.correct_index(q.id) == 1
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for the replica-shared rate limiter and its stores
+"""
+import asyncio
+import time
+import uuid
+from unittest.mock import patch
+
+import pytest
+
+from utils.rate_limit_store import InMemoryRateLimitStore, SQLRateLimitStore
+from utils.rate_limiter import MultiLevelRateLimiter, RateLimitConfig, SharedRateLimiter
+
+
+pytestmark = pytest.mark.asyncio
+
+
+class _Clock:
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    c = _Clock()
+    with patch("utils.rate_limiter.time.time", c):
+        yield c
+
+
+@pytest.fixture(params=["sql", "memory"])
+def store(request):
+    return SQLRateLimitStore() if request.param == "sql" else InMemoryRateLimitStore()
+
+
+def _namespace() -> str:
+    # The SQL table persists between runs; keep buckets of each test apart
+    return f"t-{uuid.uuid4().hex[:12]}"
+
+
+async def test_store_grants_up_to_capacity_then_refills(store):
+    ns, now = _namespace(), time.time()
+    grants = await store.acquire(ns, {"a": 2, "b": 5}, now, 10.0, 3, 0)
+    assert grants["a"][0] == 2
+    assert grants["b"][0] == 3
+    assert (await store.acquire(ns, {"a": 5}, now, 10.0, 3, 0))["a"][0] == 1
+    assert (await store.acquire(ns, {"a": 1}, now, 10.0, 3, 0))["a"][0] == 0
+    # One token back per interval
+    assert (await store.acquire(ns, {"a": 5}, now + 10.0, 10.0, 3, 0))["a"][0] == 1
+
+
+async def test_store_penalty_and_purge(store):
+    ns, now = _namespace(), time.time()
+    assert (await store.acquire(ns, {"u": 1}, now, 10.0, 1, 100))["u"][0] == 1
+    granted, _, blocked_until = (await store.acquire(ns, {"u": 1}, now, 10.0, 1, 100))["u"]
+    assert granted == 0 and blocked_until == pytest.approx(now + 100)
+    assert (await store.acquire(ns, {"u": 1}, now + 50, 10.0, 1, 100))["u"][0] == 0
+    assert (await store.acquire(ns, {"u": 1}, now + 101, 10.0, 1, 100))["u"][0] == 1
+
+    await store.reset(ns, "u")
+    assert (await store.acquire(ns, {"u": 1}, now + 101, 10.0, 1, 100))["u"][0] == 1
+    assert await store.purge_expired(now + 10_000) >= 1
+
+
+async def test_replicas_share_one_budget(store):
+    ns = _namespace()
+    config = RateLimitConfig(max_requests=10, window_seconds=60)
+    replicas = [SharedRateLimiter(config, store=store, namespace=ns) for _ in range(3)]
+    allowed = 0
+    for _ in range(8):
+        for replica in replicas:
+            allowed += await replica.is_allowed("42")
+    assert allowed == 10
+
+
+async def test_concurrent_checks_are_batched_into_one_call():
+    store = InMemoryRateLimitStore()
+    limiter = SharedRateLimiter(
+        RateLimitConfig(max_requests=5, window_seconds=60), store=store, namespace="b"
+    )
+    users = [str(i) for i in range(50)]
+    results = await asyncio.gather(*(limiter.is_allowed(u) for u in users + ["0"] * 9))
+    assert limiter.remote_calls == 1
+    assert sum(results) == 50 + 4
+    assert results[-5:] == [False] * 5
+
+
+async def test_lease_serves_users_under_limit_locally(clock):
+    store = InMemoryRateLimitStore()
+    limiter = SharedRateLimiter(
+        RateLimitConfig(max_requests=60, window_seconds=60),
+        store=store,
+        namespace="lease",
+        lease_size=5,
+    )
+    assert await limiter.is_allowed("u") is True
+    assert await limiter.is_allowed("u") is True  # reserves 5 extra tokens
+    assert limiter.remote_calls == 2
+    for _ in range(5):
+        assert await limiter.is_allowed("u") is True
+    assert limiter.remote_calls == 2
+    # Leased tokens were charged to the shared bucket up front
+    granted, _, _ = (await store.acquire("lease", {"u": 100}, clock.now, 1.0, 60, 0))["u"]
+    assert granted == 60 - 7
+
+
+async def test_refused_user_is_refused_locally_until_refill(clock):
+    store = InMemoryRateLimitStore()
+    limiter = SharedRateLimiter(
+        RateLimitConfig(max_requests=2, window_seconds=60), store=store, namespace="deny"
+    )
+    assert [await limiter.is_allowed("u") for _ in range(3)] == [True, True, False]
+    calls = limiter.remote_calls
+    assert await limiter.is_allowed("u") is False
+    assert limiter.remote_calls == calls
+    clock.now += 30
+    assert await limiter.is_allowed("u") is True
+    assert limiter.remote_calls == calls + 1
+
+
+async def test_store_failure_falls_back_to_local_limits():
+    class _Broken(InMemoryRateLimitStore):
+        async def acquire(self, *args, **kwargs):
+            raise RuntimeError("store down")
+
+    limiter = SharedRateLimiter(
+        RateLimitConfig(max_requests=2, window_seconds=60), store=_Broken(), namespace="x"
+    )
+    assert [await limiter.is_allowed("u") for _ in range(3)] == [True, True, False]
+
+
+async def test_user_missing_from_store_answer_is_refused():
+    class _Lossy(InMemoryRateLimitStore):
+        async def acquire(self, namespace, wants, *args):
+            grants = await super().acquire(namespace, wants, *args)
+            grants.pop("lost", None)
+            return grants
+
+    limiter = SharedRateLimiter(
+        RateLimitConfig(max_requests=5, window_seconds=60), store=_Lossy(), namespace="lossy"
+    )
+    results = await asyncio.gather(limiter.is_allowed("lost"), limiter.is_allowed("kept"))
+    assert results == [False, True]
+
+
+async def test_shared_engine_namespaces_levels(monkeypatch):
+    monkeypatch.setenv("RATE_LIMIT_ENGINE", "shared")
+    limiter = MultiLevelRateLimiter()
+    assert all(isinstance(lim, SharedRateLimiter) for lim in limiter.limiters.values())
+    assert {lvl: lim.namespace for lvl, lim in limiter.limiters.items()} == {
+        "default": "default",
+        "registration": "registration",
+        "admin": "admin",
+    }
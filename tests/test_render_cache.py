@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for the pre-rendered screen cache used by catalog menus
+"""
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from ui.render_cache import RenderCache, RenderedScreen
+from utils.catalog import CourseCatalog
+
+
+def _write(path, data, mtime):
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    os.utime(path, (mtime, mtime))
+
+
+def test_screen_rendered_once_until_catalog_changes(tmp_path):
+    path = tmp_path / "courses.json"
+    _write(path, [{"course_id": "a", "title": "A"}], 1_000_000)
+    catalog = CourseCatalog(path, check_interval=0)
+    cache = RenderCache()
+    calls = []
+
+    def render():
+        calls.append(1)
+        return RenderedScreen(", ".join(c["title"] for c in catalog.all()))
+
+    first = cache.get("titles", render, catalog)
+    assert cache.get("titles", render, catalog) is first
+    assert len(calls) == 1 and cache.stats == {"hits": 1, "misses": 1}
+
+    _write(path, [{"course_id": "a", "title": "A"}, {"course_id": "b", "title": "B"}], 1_000_050)
+    assert cache.get("titles", render, catalog).text == "A, B"
+    assert len(calls) == 2
+
+
+def test_invalidate_rerenders():
+    cache = RenderCache()
+    calls = []
+
+    def render():
+        calls.append(1)
+        return ("text", None, {"parse_mode": "HTML"})
+
+    screen = cache.get("static", render)
+    assert isinstance(screen, RenderedScreen) and screen.options["parse_mode"] == "HTML"
+    with pytest.raises(TypeError):
+        screen.options["parse_mode"] = "x"
+    cache.get("static", render)
+    assert len(calls) == 1
+
+    cache.invalidate("static")
+    cache.get("static", render)
+    cache.invalidate()
+    cache.get("static", render)
+    assert len(calls) == 3
+
+
+@pytest.mark.asyncio
+async def test_free_courses_menu_reuses_markup():
+    from handlers.courses import handle_free_courses
+    from ui.render_cache import render_cache
+
+    sent = []
+
+    class _Query:
+        async def answer(self, *a, **k):
+            return None
+
+        async def edit_message_text(self, text, reply_markup=None, **kwargs):
+            sent.append((text, reply_markup, kwargs))
+
+    update = SimpleNamespace(
+        callback_query=_Query(), effective_user=SimpleNamespace(id=1), effective_chat=None
+    )
+    render_cache.invalidate()
+    await handle_free_courses(update, SimpleNamespace(user_data={}))
+    await handle_free_courses(update, SimpleNamespace(user_data={}))
+    assert sent[0][0] == sent[1][0]
+    assert sent[0][1] is sent[1][1]
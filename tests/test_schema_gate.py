@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+from unittest.mock import patch
+
+import pytest
+
+
+@pytest.fixture
+def reopened_gate(monkeypatch):
+    import database.db as db
+
+    # Make sure the schema exists, then start each test with the gate closed
+    assert db.ensure_schema_ready()
+    monkeypatch.setattr(db, "_SCHEMA_INIT_DONE", False)
+    monkeypatch.setattr(db, "_SCHEMA_GATE_RETRY_AT", 0.0)
+    return db
+
+
+def _set_version(version):
+    from database.db import ENGINE
+    from database.migrate import record_schema_version
+
+    with ENGINE.begin() as conn:
+        record_schema_version(conn, version)
+
+
+def test_gate_records_version_and_short_circuits(reopened_gate):
+    from database.db import ENGINE
+    from database.migrate import SCHEMA_VERSION, read_schema_version
+
+    with patch("database.migrate.init_db") as mock_init:
+        assert reopened_gate.ensure_schema_ready()
+        assert reopened_gate.ensure_schema_ready()
+        assert reopened_gate.schema_ready()
+    # Version marker already current → no DDL at all
+    mock_init.assert_not_called()
+    with ENGINE.connect() as conn:
+        assert read_schema_version(conn) == SCHEMA_VERSION
+
+
+def test_gate_runs_init_once_for_outdated_schema(reopened_gate):
+    from database.db import ENGINE
+    from database.migrate import SCHEMA_VERSION, read_schema_version
+
+    _set_version(SCHEMA_VERSION - 1)
+    with patch("database.migrate.init_db") as mock_init:
+        assert reopened_gate.ensure_schema_ready()
+        assert reopened_gate.ensure_schema_ready()
+        with reopened_gate.session_scope():
+            pass
+    assert mock_init.call_count == 1
+    with ENGINE.connect() as conn:
+        assert read_schema_version(conn) == SCHEMA_VERSION
+
+
+def test_gate_backs_off_after_failure(reopened_gate):
+    from database.migrate import SCHEMA_VERSION
+
+    _set_version(SCHEMA_VERSION - 1)
+    try:
+        with patch("database.migrate.init_db", side_effect=RuntimeError("db down")) as mock_init:
+            assert not reopened_gate.ensure_schema_ready()
+            assert not reopened_gate.ensure_schema_ready()
+        assert mock_init.call_count == 1
+        assert not reopened_gate.schema_ready()
+    finally:
+        _set_version(SCHEMA_VERSION)
+
+
+def test_invalidate_forces_recheck(reopened_gate):
+    assert reopened_gate.ensure_schema_ready()
+    reopened_gate.invalidate_schema_gate()
+    assert not reopened_gate.schema_ready()
+    with patch("database.migrate.read_schema_version", return_value=None) as mock_read:
+        with patch("database.migrate.init_db") as mock_init:
+            assert reopened_gate.ensure_schema_ready()
+    mock_read.assert_called_once()
+    mock_init.assert_called_once()
+
+
+def test_invalidate_keeps_failure_backoff(reopened_gate):
+    from database.migrate import SCHEMA_VERSION
+
+    _set_version(SCHEMA_VERSION - 1)
+    try:
+        with patch("database.migrate.init_db", side_effect=RuntimeError("db down")) as mock_init:
+            assert not reopened_gate.ensure_schema_ready()
+            reopened_gate.invalidate_schema_gate()
+            assert not reopened_gate.ensure_schema_ready()
+        assert mock_init.call_count == 1
+    finally:
+        _set_version(SCHEMA_VERSION)
+
+
+def test_record_schema_version_upserts_one_row(reopened_gate):
+    from sqlalchemy import text
+
+    from database.db import ENGINE
+    from database.migrate import SCHEMA_VERSION, read_schema_version
+
+    _set_version(SCHEMA_VERSION + 1)
+    _set_version(SCHEMA_VERSION)
+    with ENGINE.connect() as conn:
+        assert read_schema_version(conn) == SCHEMA_VERSION
+        assert conn.execute(text("SELECT COUNT(*) FROM schema_version")).scalar() == 1
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import time
+from collections import Counter
+
+import pytest
+
+
+def _tid(offset: int = 0) -> int:
+    return int(time.time() * 1000) % 10_000_000 + 4_000_000 + offset
+
+
+def test_stats_summary_is_a_single_purchase_scan():
+    from sqlalchemy import event
+    from database.db import ENGINE, session_scope
+    from database.service import get_stats_summary
+
+    statements = []
+
+    def _record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    with session_scope() as s:
+        event.listen(ENGINE, "before_cursor_execute", _record)
+        try:
+            stats = get_stats_summary(s)
+        finally:
+            event.remove(ENGINE, "before_cursor_execute", _record)
+    purchase_scans = [q for q in statements if "FROM purchases" in q]
+    assert len(purchase_scans) == 1
+    assert len(statements) == 3
+    p = stats["purchases"]
+    assert p["total"] >= p["pending"] + p["approved"] + p["rejected"]
+    assert stats["users"] == sum(g["count"] for g in stats["grades"])
+
+
+def test_snapshot_tracks_committed_transitions_only():
+    from database.db import session_scope
+    from database.service import (
+        approve_or_reject_purchase,
+        create_purchase,
+        get_or_create_user,
+        get_stats_summary,
+    )
+    from utils.stats_snapshot import stats_snapshot
+
+    stats_snapshot.load()
+    before = stats_snapshot.summary()
+
+    with session_scope() as s:
+        u = get_or_create_user(s, _tid(), first_name="S")
+        p = create_purchase(s, u.id, product_type="course", product_id=f"S{_tid()}")
+        pid = p.id
+    with pytest.raises(RuntimeError):
+        with session_scope() as s:
+            create_purchase(s, u.id, product_type="course", product_id=f"R{_tid()}")
+            raise RuntimeError("rolled back")
+    with session_scope() as s:
+        assert approve_or_reject_purchase(s, pid, admin_id=1, decision="approve") is not None
+
+    after = stats_snapshot.summary()
+    assert after["users"] == before["users"] + 1
+    assert after["purchases"]["total"] == before["purchases"]["total"] + 1
+    assert after["purchases"]["pending"] == before["purchases"]["pending"]
+    assert after["purchases"]["approved"] == before["purchases"]["approved"] + 1
+    # Incremental state agrees with a fresh aggregate
+    with session_scope() as s:
+        fresh = get_stats_summary(s)
+    assert after["purchases"] == fresh["purchases"]
+    assert after["users"] == fresh["users"]
+
+
+def test_user_committed_during_load_is_counted(monkeypatch):
+    import utils.stats_snapshot as ss
+    from database.db import session_scope
+    from database.service import get_or_create_user
+
+    snap = ss.StatsSnapshot(refresh_seconds=60)
+    monkeypatch.setattr(ss, "stats_snapshot", snap)
+    before = snap.load()["users"]
+    read = snap._read
+
+    def _read_then_commit():
+        summary = read()
+        with session_scope() as s:
+            get_or_create_user(s, _tid(7), first_name="L")
+        return summary
+
+    monkeypatch.setattr(snap, "_read", _read_then_commit)
+    snap.load()
+    assert snap.summary()["users"] == before + 1
+
+
+def test_apply_before_load_is_ignored():
+    from utils.stats_snapshot import StatsSnapshot
+
+    snap = StatsSnapshot(refresh_seconds=60)
+    snap.apply(Counter({"users": 3, "purchases.total": 2}))
+    assert not snap.loaded
+    assert snap.summary()["users"] == 0
+
+
+@pytest.mark.asyncio
+async def test_start_refreshes_and_stop_cancels():
+    from utils.stats_snapshot import StatsSnapshot
+
+    snap = StatsSnapshot(refresh_seconds=60)
+    await snap.start()
+    try:
+        await snap.ensure_loaded()
+        assert snap.loaded
+    finally:
+        await snap.stop()
+    assert snap._refresh_task is None
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tests for the webhook ingestion queue (per-chat ordering, backpressure, drain)
+"""
+import asyncio
+import sys
+from types import SimpleNamespace
+
+import pytest
+import telegram.ext as telegram_ext
+
+from utils.metrics_export import iter_metrics
+from utils.update_dispatcher import UpdateDispatcher, chat_key
+
+
+def _update(chat_id, n):
+    return SimpleNamespace(effective_chat=SimpleNamespace(id=chat_id), effective_user=None, n=n)
+
+
+@pytest.mark.asyncio
+async def test_in_order_per_chat_and_concurrent_across_chats():
+    seen = []
+    running = set()
+    overlap = []
+
+    async def process(update):
+        chat = update.effective_chat.id
+        assert chat not in running, "two updates of one chat ran at once"
+        running.add(chat)
+        overlap.append(len(running))
+        await asyncio.sleep(0.01 if update.n % 2 else 0.001)
+        seen.append((chat, update.n))
+        running.discard(chat)
+
+    dispatcher = UpdateDispatcher(process, workers=4, max_depth=100)
+    dispatcher.start()
+    for n in range(6):
+        for chat in (1, 2, 3):
+            assert dispatcher.submit(_update(chat, n))
+    assert await dispatcher.stop(timeout=5) == 0
+
+    for chat in (1, 2, 3):
+        assert [n for c, n in seen if c == chat] == list(range(6))
+    assert max(overlap) > 1
+    assert dispatcher.stats["processed"] == 18 and dispatcher.stats["max_depth"] == 18
+
+
+@pytest.mark.asyncio
+async def test_full_queue_rejects_and_failures_do_not_stall_chat():
+    release = asyncio.Event()
+    done = []
+
+    async def process(update):
+        await release.wait()
+        if update.n == 0:
+            raise RuntimeError("boom")
+        done.append(update.n)
+
+    dispatcher = UpdateDispatcher(process, workers=2, max_depth=3)
+    dispatcher.start()
+    assert all(dispatcher.submit(_update(7, n)) for n in range(3))
+    assert not dispatcher.submit(_update(8, 0))
+    assert dispatcher.stats["rejected"] == 1 and dispatcher.active_chats == 1
+
+    text = "".join(iter_metrics(update_dispatcher=dispatcher))
+    assert 'bot_update_queue_depth{kind="current"} 3' in text
+    assert 'bot_update_queue_updates_total{outcome="rejected"} 1' in text
+
+    release.set()
+    assert await dispatcher.stop(timeout=5) == 0
+    assert done == [1, 2]
+    assert dispatcher.stats["failed"] == 1
+    assert not dispatcher.submit(_update(7, 9))  # stopped
+
+
+@pytest.mark.asyncio
+async def test_drain_timeout_drops_remaining():
+    async def process(update):
+        await asyncio.sleep(10)
+
+    dispatcher = UpdateDispatcher(process, workers=1, max_depth=10)
+    dispatcher.start()
+    dispatcher.submit(_update(1, 0))
+    dispatcher.submit(_update(1, 1))
+    await asyncio.sleep(0)
+    assert await dispatcher.stop(timeout=0.05) == 2
+    assert not dispatcher.running
+
+
+def test_chat_key_falls_back_to_user_then_update():
+    user_only = SimpleNamespace(effective_chat=None, effective_user=SimpleNamespace(id=5))
+    bare = SimpleNamespace()
+    assert chat_key(_update(3, 0)) == ("chat", 3)
+    assert chat_key(user_only) == ("user", 5)
+    assert chat_key(bare) != chat_key(SimpleNamespace())
+
+
+@pytest.mark.asyncio
+async def test_webhook_acks_once_queued(monkeypatch):
+    from aiohttp import ClientSession
+
+    monkeypatch.setitem(sys.modules, "telegram.ext", telegram_ext)
+    import bot
+    from bot import ApplicationBuilder, run_webhook_mode, setup_handlers
+    from config import config
+
+    # Other tests may leave a mocked `telegram` behind; only the queueing is under test
+    parsed = []
+
+    class _Update:
+        @staticmethod
+        def de_json(data, _bot):
+            parsed.append(_update(data["message"]["chat"]["id"], 0))
+            return parsed[-1]
+
+    monkeypatch.setattr(bot, "Update", _Update)
+    monkeypatch.setenv("PORT", "8082")
+    monkeypatch.setenv("WEBHOOK_URL", "https://example.org")
+    monkeypatch.setenv("SKIP_WEBHOOK_REG", "true")
+
+    app = ApplicationBuilder().token(config.bot_token).build()
+    await setup_handlers(app)
+    task = asyncio.create_task(run_webhook_mode(app))
+    try:
+        await asyncio.sleep(0.8)
+        headers = {}
+        if (config.webhook.secret_token or "").strip():
+            headers["X-Telegram-Bot-Api-Secret-Token"] = config.webhook.secret_token.strip()
+        update = {
+            "update_id": 1,
+            "message": {
+                "message_id": 1,
+                "date": 0,
+                "chat": {"id": 99, "type": "private"},
+                "from": {"id": 99, "is_bot": False, "first_name": "T"},
+                "text": "/start",
+            },
+        }
+        async with ClientSession() as s:
+            url = f"http://127.0.0.1:8082{config.webhook.path}"
+            async with s.post(url, json=update, headers=headers) as r:
+                assert r.status == 200
+        dispatcher = app.bot_data["update_dispatcher"]
+        assert dispatcher.stats["enqueued"] == 1 and chat_key(parsed[0]) == ("chat", 99)
+    finally:
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+    assert not dispatcher.running
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+import time
+import types
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+
+pytestmark = pytest.mark.asyncio
+
+
+def _tid(offset: int = 0) -> int:
+    return int(time.time() * 1000) % 10_000_000 + 9_000_000 + offset
+
+
+class DummyQuery:
+    def __init__(self, data):
+        self.data = data
+
+    async def answer(self):
+        return True
+
+    async def edit_message_text(self, *args, **kwargs):
+        return True
+
+
+class DummyUpdate:
+    def __init__(self, user_id, data):
+        self.callback_query = DummyQuery(data)
+        self.effective_user = types.SimpleNamespace(id=user_id)
+
+
+async def test_cached_user_is_compact_record():
+    from utils.user_cache import CachedUser
+
+    rec = CachedUser(id=1, telegram_user_id=2, grade="دهم")
+    assert not hasattr(rec, "__dict__")
+    with pytest.raises(AttributeError):
+        rec.phone = "0912"
+
+
+async def test_get_cached_user_loads_once_then_hits_cache():
+    from database.db import session_scope
+    from database.service import get_or_create_user
+    from utils.user_cache import forget_user, get_cached_user
+
+    tid = _tid()
+    with session_scope() as session:
+        get_or_create_user(session, tid, grade="یازدهم", province="تهران")
+    forget_user(tid)
+
+    from database import async_service
+
+    real = async_service.get_user_by_telegram_id
+    spy = AsyncMock(side_effect=real)
+    with patch.object(async_service, "get_user_by_telegram_id", spy):
+        first = await get_cached_user(tid)
+        second = await get_cached_user(tid)
+    assert spy.await_count == 1
+    assert first is second
+    assert first.grade == "یازدهم"
+    assert first.province == "تهران"
+
+
+async def test_unregistered_users_are_not_cached():
+    from utils.user_cache import get_cached_user, user_cache
+
+    tid = _tid(1)
+    assert await get_cached_user(tid) is None
+    assert str(tid) not in user_cache.cache
+
+
+async def test_profile_setter_invalidates_cache():
+    from database.db import session_scope
+    from database.service import get_or_create_user
+    from handlers.profile import set_grade
+    from utils.user_cache import get_cached_user
+
+    tid = _tid(2)
+    with session_scope() as session:
+        get_or_create_user(session, tid, grade="دهم")
+    assert (await get_cached_user(tid)).grade == "دهم"
+
+    await set_grade(DummyUpdate(tid, "set_grade:دوازدهم"), types.SimpleNamespace(bot_data={}))
+
+    assert (await get_cached_user(tid)).grade == "دوازدهم"
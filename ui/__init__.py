@@ -14,3 +14,4 @@ from .keyboards import (
     build_main_menu_keyboard,
     build_confirmation_keyboard,
 )
+from .render_cache import RenderCache, RenderedScreen, render_cache
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Memoized `(text, reply_markup)` pairs for screens that look the same for every user.
+
+Catalog menus only depend on `data/*.json`, so they are rendered once and reused
+until one of their sources changes. Each entry is keyed by the `version` of the
+catalogs it was rendered from; a hit costs one tuple comparison and returns the
+shared, immutable `InlineKeyboardMarkup`. Screens must not read `config`; anything
+that replaces settings at runtime calls `render_cache.invalidate()`.
+"""
+
+from __future__ import annotations
+
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Mapping, NamedTuple, Optional, Tuple
+
+from telegram import InlineKeyboardMarkup
+
+
+class RenderedScreen(NamedTuple):
+    text: str
+    reply_markup: Optional[InlineKeyboardMarkup] = None
+    options: Mapping[str, Any] = MappingProxyType({})
+
+
+class RenderCache:
+    """Per-screen memo of rendered messages, invalidated when their sources change"""
+
+    def __init__(self):
+        self._screens: Dict[str, Tuple[Tuple, RenderedScreen]] = {}
+        self.stats = {"hits": 0, "misses": 0}
+
+    @staticmethod
+    def _key(sources) -> Tuple:
+        return tuple(src.version for src in sources)
+
+    def get(self, name: str, render: Callable[[], RenderedScreen], *sources: Any) -> RenderedScreen:
+        """Return the cached screen `name`, calling `render()` if any source changed."""
+        key = self._key(sources)
+        entry = self._screens.get(name)
+        if entry is not None and entry[0] == key:
+            self.stats["hits"] += 1
+            return entry[1]
+        self.stats["misses"] += 1
+        screen = render()
+        if not isinstance(screen, RenderedScreen):
+            screen = RenderedScreen(*screen)
+        if not isinstance(screen.options, MappingProxyType):
+            screen = screen._replace(options=MappingProxyType(dict(screen.options)))
+        self._screens[name] = (key, screen)
+        return screen
+
+    def invalidate(self, name: Optional[str] = None) -> None:
+        if name is None:
+            self._screens.clear()
+        else:
+            self._screens.pop(name, None)
+
+
+render_cache = RenderCache()
@@ -2,14 +2,109 @@
 # -*- coding: utf-8 -*-
 """
 Background job utilities (broadcast manager) for long-running tasks.
+
+Broadcast sends are paced by one `TokenBucket` shared by all jobs of a manager, sized
+below Telegram's bot-wide limit (~30 messages/s) so interactive replies still get
+through. A `RetryAfter` (HTTP 429) pauses the bucket for the time Telegram asks for
+and halves its rate; the rate then climbs back in steps while no further 429 arrives.
+Timeouts and other transient network errors are retried with exponential backoff;
+errors that will not go away (bot blocked, chat not found, bad request) count as
+failed and the chat ID is kept in `failed_ids`.
+
+Progress is checkpointed to a broadcast store (`utils.broadcast_store`) every few
+seconds and when the job ends: the dispatch cursor into the audience, the indexes
+dispatched but not yet settled, the counters and the failed IDs.
+`BroadcastManager.resume_pending()` restarts jobs left `running` by a previous
+process; unsettled indexes are sent again first, so after a crash a handful of
+recipients (at most those in flight) may receive the message twice.
 """
 
 import asyncio
+import heapq
 import logging
-from typing import List, Dict, Optional
+import os
+import time
+from typing import List, Dict, Optional, Set, Tuple
+
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+from utils.broadcast_store import InMemoryBroadcastStore
 
 logger = logging.getLogger(__name__)
 
+# Messages per second across all broadcasts (Telegram allows ~30/s per bot)
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))
+# Concurrent in-flight sends per job
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "8"))
+# Attempts per recipient for transient errors (RetryAfter does not count)
+MAX_SEND_ATTEMPTS = 4
+# First retry delay for transient errors; doubles per attempt, capped at 30s
+RETRY_BASE_DELAY = 1.0
+# Seconds between status message edits / checkpoints
+PROGRESS_INTERVAL = 2.0
+
+
+def _retry_after_seconds(error: RetryAfter) -> float:
+    value = error.retry_after
+    return float(value.total_seconds() if hasattr(value, "total_seconds") else value)
+
+
+class TokenBucket:
+    """Async token bucket whose rate halves on 429s and recovers step by step"""
+
+    def __init__(
+        self,
+        rate: float = BROADCAST_RATE,
+        burst: Optional[float] = None,
+        min_rate: float = 1.0,
+        recover_every: float = 2.0,
+    ):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self.recover_every = recover_every
+        self.tokens = self.burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._last_change = float("-inf")
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def backoff(self, retry_after: float) -> None:
+        """Pause all sends for `retry_after` seconds and halve the rate (once per burst of 429s)."""
+        now = time.monotonic()
+        self._paused_until = max(self._paused_until, now + retry_after)
+        self.tokens = 0.0
+        self._updated = max(now, self._paused_until)
+        if now - self._last_change >= self.recover_every:
+            self.rate = max(self.min_rate, self.rate / 2)
+        self._last_change = now
+
+    def on_success(self) -> None:
+        if self.rate >= self.max_rate:
+            return
+        now = time.monotonic()
+        if now >= self._paused_until and now - self._last_change >= self.recover_every:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 10)
+            self._last_change = now
+
 
 class BroadcastJob:
     def __init__(self, job_id: str, admin_chat_id: int, user_ids: List[int], text: str):
@@ -19,6 +114,10 @@ class BroadcastJob:
         self.text = text
         self.sent = 0
         self.failed = 0
+        self.failed_ids: List[int] = []
+        self.cursor = 0  # next audience index to dispatch
+        self.unsettled: Set[int] = set()  # dispatched indexes not yet sent/failed
+        self.status = "running"
         self.message_id: Optional[int] = None
         self._task: Optional[asyncio.Task] = None
         self._cancelled = False
@@ -31,55 +130,207 @@ class BroadcastJob:
         if self._task and not self._task.done():
             self._task.cancel()
 
+    def checkpoint(self) -> Dict:
+        return {
+            "job_id": self.job_id,
+            "admin_chat_id": self.admin_chat_id,
+            "text": self.text,
+            "user_ids": self.user_ids,
+            "cursor": self.cursor,
+            "pending": sorted(self.unsettled),
+            "sent": self.sent,
+            "failed": self.failed,
+            "failed_ids": self.failed_ids,
+            "message_id": self.message_id,
+            "status": self.status,
+        }
+
+    @classmethod
+    def from_checkpoint(cls, state: Dict) -> "BroadcastJob":
+        job = cls(state["job_id"], state["admin_chat_id"], list(state["user_ids"]), state["text"])
+        job.cursor = int(state.get("cursor") or 0)
+        job.unsettled = set(state.get("pending") or [])
+        job.sent = int(state.get("sent") or 0)
+        job.failed = int(state.get("failed") or 0)
+        job.failed_ids = list(state.get("failed_ids") or [])
+        job.message_id = state.get("message_id")
+        job.status = state.get("status") or "running"
+        return job
+
 
 class BroadcastManager:
-    def __init__(self):
+    def __init__(self, store=None, bucket: Optional[TokenBucket] = None):
         self.jobs: Dict[str, BroadcastJob] = {}
+        self.store = store if store is not None else InMemoryBroadcastStore()
+        self.bucket = bucket
+        self.concurrency = BROADCAST_CONCURRENCY
+
+    def _bucket(self) -> TokenBucket:
+        # Created on first use so the lock belongs to the running loop
+        if self.bucket is None:
+            self.bucket = TokenBucket()
+        return self.bucket
+
+    async def _checkpoint(self, job: BroadcastJob) -> None:
+        try:
+            await self.store.save(job.checkpoint())
+        except Exception as e:
+            logger.warning(f"Broadcast {job.job_id} checkpoint failed: {e}")
+
+    async def start_broadcast(self, app, admin_chat_id: int, user_ids, text: str) -> str:
+        """Start a background broadcast and return its job ID.
+
+        `user_ids` is a list or an async iterable of ID batches (see
+        `database.audience.stream_audience`). A stream is drained by the job's own task,
+        so the caller returns before the audience query finishes.
+        """
+        job_id = str(int(time.time() * 1000))
+        if hasattr(user_ids, "__aiter__"):
+            job = BroadcastJob(job_id, admin_chat_id, [], text)
+            self.jobs[job_id] = job
+            job._task = asyncio.create_task(self._load_and_run(app, job, user_ids))
+            return job_id
 
-    async def start_broadcast(self, app, admin_chat_id: int, user_ids: List[int], text: str) -> str:
-        job_id = str(int(asyncio.get_running_loop().time() * 1000))
         job = BroadcastJob(job_id, admin_chat_id, user_ids, text)
         self.jobs[job_id] = job
+        await self._announce(app, job)
 
+        # Launch background task
+        job._task = asyncio.create_task(self._run_broadcast(app, job))
+        return job_id
+
+    async def _announce(self, app, job: BroadcastJob) -> None:
         # Send initial status message
         status = await app.bot.send_message(
-            chat_id=admin_chat_id,
-            text=f"🚀 شروع ارسال برای {len(user_ids)} کاربر... 0%",
+            chat_id=job.admin_chat_id,
+            text=f"🚀 شروع ارسال برای {len(job.user_ids)} کاربر... 0%",
         )
         job.set_status_message(status.message_id)
+        await self._checkpoint(job)
 
-        # Launch background task
-        job._task = asyncio.create_task(self._run_broadcast(app, job))
-        return job_id
+    async def _load_and_run(self, app, job: BroadcastJob, batches) -> None:
+        try:
+            async for batch in batches:
+                job.user_ids.extend(batch)
+        except Exception as e:
+            logger.error(f"Broadcast {job.job_id} audience query failed: {e}")
+            job.status = "failed"
+            await app.bot.send_message(chat_id=job.admin_chat_id, text="❌ خطا در انتخاب مخاطبان.")
+            return
+        if not job.user_ids:
+            job.status = "done"
+            await app.bot.send_message(
+                chat_id=job.admin_chat_id, text="هیچ کاربری برای ارسال وجود ندارد."
+            )
+            return
+        await self._announce(app, job)
+        await self._run_broadcast(app, job)
+
+    async def resume_pending(self, app) -> List[str]:
+        """Restart jobs a previous process left running; returns their IDs."""
+        try:
+            states = await self.store.load_unfinished()
+        except Exception as e:
+            logger.warning(f"Could not load unfinished broadcasts: {e}")
+            return []
+        resumed = []
+        for state in states:
+            if state["job_id"] in self.jobs:
+                continue
+            job = BroadcastJob.from_checkpoint(state)
+            self.jobs[job.job_id] = job
+            job._task = asyncio.create_task(self._run_broadcast(app, job))
+            resumed.append(job.job_id)
+            logger.info(
+                f"Resuming broadcast {job.job_id} at {job.cursor}/{len(job.user_ids)} "
+                f"({len(job.unsettled)} unsettled)"
+            )
+        return resumed
 
     async def _run_broadcast(self, app, job: BroadcastJob):
         total = len(job.user_ids)
-        semaphore = asyncio.Semaphore(8)  # moderate concurrency
+        bucket = self._bucket()
+        # Indexes to (re)send before moving the cursor: leftovers from a checkpoint
+        redo = sorted(i for i in job.unsettled if 0 <= i < total)
+        # (due time, index, attempts) for transient failures waiting to be retried
+        retries: List[Tuple[float, int, int]] = []
+
+        def next_item() -> Tuple[Optional[int], int, float]:
+            """Next (index, attempts) to send, or the seconds to wait for a retry."""
+            now = time.monotonic()
+            if retries and retries[0][0] <= now:
+                _, index, attempts = heapq.heappop(retries)
+                return index, attempts, 0.0
+            if redo:
+                return redo.pop(0), 0, 0.0
+            if job.cursor < total:
+                index = job.cursor
+                job.cursor += 1
+                job.unsettled.add(index)
+                return index, 0, 0.0
+            if retries:
+                return None, 0, retries[0][0] - now
+            return None, 0, -1.0
 
-        async def send_one(uid: int):
-            async with semaphore:
+        def settle(index: int, ok: bool) -> None:
+            job.unsettled.discard(index)
+            if ok:
+                job.sent += 1
+            else:
+                job.failed += 1
+                job.failed_ids.append(job.user_ids[index])
+
+        async def send(uid: int) -> None:
+            try:
+                # Normal call with explicit parameters
+                await app.bot.send_message(chat_id=uid, text=job.text)
+            except TypeError:
+                # Some AsyncMock side_effects in tests are defined without
+                # accepting any parameters. Call without args to support them.
+                await app.bot.send_message()
+
+        async def worker():
+            while True:
+                index, attempts, wait = next_item()
+                if index is None:
+                    if wait < 0:
+                        return
+                    await asyncio.sleep(wait)
+                    continue
+                await bucket.acquire()
                 try:
-                    try:
-                        # Normal call with explicit parameters
-                        await app.bot.send_message(chat_id=uid, text=job.text)
-                    except TypeError:
-                        # Some AsyncMock side_effects in tests are defined without
-                        # accepting any parameters. Call without args to support them.
-                        await app.bot.send_message()
-                    job.sent += 1
+                    await send(job.user_ids[index])
                 except asyncio.CancelledError:
                     raise
+                except RetryAfter as e:
+                    delay = _retry_after_seconds(e)
+                    bucket.backoff(delay)
+                    heapq.heappush(retries, (time.monotonic() + delay, index, attempts))
+                    continue
+                except NetworkError as e:
+                    # BadRequest (chat not found, etc.) will not succeed on retry
+                    if isinstance(e, BadRequest) or attempts + 1 >= MAX_SEND_ATTEMPTS:
+                        settle(index, False)
+                    else:
+                        delay = min(RETRY_BASE_DELAY * 2**attempts, 30.0)
+                        heapq.heappush(retries, (time.monotonic() + delay, index, attempts + 1))
+                    continue
                 except Exception:
-                    job.failed += 1
-                await asyncio.sleep(0.02)
+                    settle(index, False)
+                    continue
+                bucket.on_success()
+                settle(index, True)
 
         # Progress updater
         async def updater():
             try:
                 while job.sent + job.failed < total:
+                    await asyncio.sleep(PROGRESS_INTERVAL)
+                    await self._checkpoint(job)
                     pct = int(((job.sent + job.failed) / max(1, total)) * 100)
                     try:
                         if job.message_id is not None:
+                            await bucket.acquire()
                             await app.bot.edit_message_text(
                                 chat_id=job.admin_chat_id,
                                 message_id=job.message_id,
@@ -88,7 +339,6 @@ class BroadcastManager:
                     except Exception as _e:
                         # Non-fatal; UI updater best-effort
                         pass
-                    await asyncio.sleep(1.0)
             except asyncio.CancelledError:
                 pass
 
@@ -102,21 +352,29 @@ class BroadcastManager:
         except Exception:
             updater_task = None
 
+        workers = [asyncio.ensure_future(worker()) for _ in range(max(1, self.concurrency))]
         try:
-            await asyncio.gather(*(send_one(uid) for uid in job.user_ids))
+            await asyncio.gather(*workers)
+            job.status = "done"
         except asyncio.CancelledError:
+            for w in workers:
+                w.cancel()
+            if job._cancelled:
+                job.status = "cancelled"
+            # Otherwise the process is shutting down: stay "running" so the job resumes
             logger.info("Broadcast job cancelled")
         finally:
             if updater_task is not None:
                 updater_task.cancel()
                 try:
                     await updater_task
-                except Exception as _e:
+                except BaseException as _e:
                     # Ignore cancellation/cleanup errors
                     pass
+            await self._checkpoint(job)
             # Final status
             try:
-                if job.message_id is not None:
+                if job.message_id is not None and job.status != "running":
                     await app.bot.edit_message_text(
                         chat_id=job.admin_chat_id,
                         message_id=job.message_id,
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+In-process registry of banned Telegram user ids.
+
+The group-0 ban gate in `bot.setup_handlers` runs for every update, so the check has
+to be an O(1) set lookup instead of a DB round-trip. The set is loaded once from
+`banned_users`, updated in place once a `database.service.ban_user`/`unban_user`
+transaction commits, and kept consistent across replicas by a periodic re-sync plus
+(on Postgres) a LISTEN/NOTIFY channel that `ban_user`/`unban_user` publish to inside
+their transaction. A broken listener connection is re-established with backoff.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from typing import Iterable, Optional, Set, Tuple
+
+from utils.committed_state import CommittedState, stage_on_commit
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = "ban_changes"
+
+
+class BanRegistry(CommittedState):
+    """Set of banned Telegram ids with periodic re-sync and optional LISTEN/NOTIFY."""
+
+    name = "ban registry"
+    # ban/unban are idempotent, so notifications apply even before the first load
+    apply_before_load = True
+
+    # Listener reconnect backoff: doubles from the min up to the max
+    listen_retry_min_seconds = 1.0
+    listen_retry_max_seconds = 60.0
+
+    def __init__(self, resync_seconds: Optional[float] = None):
+        if resync_seconds is None:
+            resync_seconds = float(os.getenv("BAN_RESYNC_SECONDS", "300"))
+        super().__init__(resync_seconds)
+        self._banned: Set[int] = set()
+        self._reconnect_task: Optional[asyncio.Task] = None
+        self._listen_conn = None
+
+    def __len__(self) -> int:
+        return len(self._banned)
+
+    def is_banned(self, telegram_user_id: int) -> bool:
+        return telegram_user_id in self._banned
+
+    def add(self, telegram_user_id: int) -> None:
+        self._banned.add(int(telegram_user_id))
+
+    def discard(self, telegram_user_id: int) -> None:
+        self._banned.discard(int(telegram_user_id))
+
+    def _read(self) -> Set[int]:
+        from sqlalchemy import select
+        from database.db import session_scope
+        from database.models_sql import BannedUser
+
+        with session_scope() as session:
+            return {int(i) for i in session.execute(select(BannedUser.telegram_user_id)).scalars()}
+
+    def _swap(self, banned: Set[int]) -> int:
+        self._banned = banned
+        return len(banned)
+
+    def _apply(self, changes: Iterable[Tuple[str, int]]) -> None:
+        for op, telegram_user_id in changes:
+            if op == "ban":
+                self.add(telegram_user_id)
+            elif op == "unban":
+                self.discard(telegram_user_id)
+
+    def apply_notification(self, payload: str) -> None:
+        """Apply a `ban:<id>` / `unban:<id>` payload published by another replica."""
+        try:
+            op, _, raw_id = (payload or "").partition(":")
+            uid = int(raw_id)
+        except ValueError:
+            logger.warning(f"Ignoring malformed ban notification: {payload!r}")
+            return
+        self.apply([(op, uid)])
+
+    async def start(self) -> None:
+        """Start the periodic re-sync task and, on Postgres, the NOTIFY listener."""
+        if self._refresh_task and not self._refresh_task.done():
+            return
+        await super().start()
+        try:
+            await self._start_listener()
+        except Exception as e:
+            logger.warning(f"Ban LISTEN/NOTIFY unavailable, relying on re-sync: {e}")
+
+    async def stop(self) -> None:
+        await super().stop()
+        if self._reconnect_task and not self._reconnect_task.done():
+            self._reconnect_task.cancel()
+            try:
+                await self._reconnect_task
+            except asyncio.CancelledError:
+                pass
+        self._reconnect_task = None
+        self._close_listener()
+
+    def _close_listener(self) -> None:
+        conn, self._listen_conn = self._listen_conn, None
+        if conn is None:
+            return
+        try:
+            asyncio.get_running_loop().remove_reader(conn.fileno())
+        except Exception:
+            pass
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _schedule_reconnect(self) -> None:
+        if self._reconnect_task and not self._reconnect_task.done():
+            return
+        self._reconnect_task = asyncio.get_running_loop().create_task(self._reconnect_listener())
+
+    async def _reconnect_listener(self) -> None:
+        delay = self.listen_retry_min_seconds
+        while True:
+            await asyncio.sleep(delay)
+            try:
+                await self._start_listener()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                delay = min(delay * 2, self.listen_retry_max_seconds)
+                logger.warning(f"Ban listener reconnect failed, retrying in {delay:.0f}s: {e}")
+                continue
+            break
+        # Notifications sent while the listener was down are lost; catch up from the table
+        try:
+            await self.refresh()
+        except Exception as e:
+            logger.error(f"Error re-syncing ban registry after reconnect: {e}")
+
+    async def _start_listener(self) -> None:
+        from database.db import ENGINE, is_postgres, run_blocking
+
+        if not is_postgres:
+            return
+
+        def _connect():
+            # Dedicated autocommit connection detached from the pool
+            pooled = ENGINE.raw_connection()
+            pooled.detach()
+            conn = pooled.driver_connection
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f"LISTEN {NOTIFY_CHANNEL}")
+            return conn
+
+        conn = await run_blocking(_connect)
+
+        def _on_readable():
+            try:
+                conn.poll()
+                while conn.notifies:
+                    self.apply_notification(conn.notifies.pop(0).payload)
+            except Exception as e:
+                # The connection is dead; stop polling it and reconnect in the background
+                logger.error(f"Ban notification listener failed: {e}")
+                self._close_listener()
+                self._schedule_reconnect()
+
+        asyncio.get_running_loop().add_reader(conn.fileno(), _on_readable)
+        self._listen_conn = conn
+
+
+def record_ban_change(session, op: str, telegram_user_id: int) -> None:
+    """Stage a `ban`/`unban` for this replica's registry; applied only if `session` commits."""
+    stage_on_commit(session, "ban_registry", ban_registry.apply).append((op, int(telegram_user_id)))
+
+
+def publish_ban_change(session, op: str, telegram_user_id: int) -> None:
+    """Queue a NOTIFY for other replicas; Postgres delivers it only if the tx commits."""
+    from database.db import is_postgres
+
+    if not is_postgres:
+        return
+    from sqlalchemy import text
+
+    session.execute(
+        text("SELECT pg_notify(:channel, :payload)"),
+        {"channel": NOTIFY_CHANNEL, "payload": f"{op}:{int(telegram_user_id)}"},
+    )
+
+
+# Global registry instance
+ban_registry = BanRegistry()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Broadcast job checkpoints.
+
+`BroadcastManager` saves each job's progress here every few seconds and when it
+finishes: the audience, the dispatch cursor, the indexes that were dispatched but
+not yet settled (in flight or waiting for a retry), the sent/failed counters and
+the IDs that failed permanently. After a restart, `load_unfinished()` returns the
+jobs still marked `running` so they can pick up where they stopped.
+
+`SQLBroadcastStore` keeps checkpoints in the `broadcast_jobs` table.
+`InMemoryBroadcastStore` implements the same interface over a dict (single process;
+the default when no store is configured, and used in tests).
+"""
+
+from __future__ import annotations
+
+import copy
+import logging
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Checkpoint fields, as produced by `BroadcastJob.checkpoint()`
+FIELDS = (
+    "job_id",
+    "admin_chat_id",
+    "text",
+    "user_ids",
+    "cursor",
+    "pending",
+    "sent",
+    "failed",
+    "failed_ids",
+    "message_id",
+    "status",
+)
+
+PROGRESS_FIELDS = ("cursor", "pending", "sent", "failed", "failed_ids", "message_id", "status")
+
+
+class InMemoryBroadcastStore:
+    """Checkpoints in a dict keyed by job ID; single process only."""
+
+    def __init__(self):
+        self.jobs: Dict[str, Dict] = {}
+
+    async def save(self, state: Dict) -> None:
+        self.jobs[state["job_id"]] = copy.deepcopy({k: state.get(k) for k in FIELDS})
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        state = self.jobs.get(job_id)
+        return copy.deepcopy(state) if state is not None else None
+
+    async def load_unfinished(self) -> List[Dict]:
+        return [copy.deepcopy(s) for s in self.jobs.values() if s.get("status") == "running"]
+
+
+class SQLBroadcastStore:
+    """Checkpoints in the `broadcast_jobs` table (one row per job, upserted)."""
+
+    @staticmethod
+    def _to_state(row) -> Dict:
+        return {
+            "job_id": row.job_id,
+            "admin_chat_id": row.admin_chat_id,
+            "text": row.text,
+            "user_ids": list(row.user_ids or []),
+            "cursor": row.cursor or 0,
+            "pending": list(row.pending or []),
+            "sent": row.sent or 0,
+            "failed": row.failed or 0,
+            "failed_ids": list(row.failed_ids or []),
+            "message_id": row.message_id,
+            "status": row.status,
+        }
+
+    async def _run(self, fn, *args):
+        from database import async_service
+
+        return await async_service.run_in_session(fn, *args)
+
+    async def save(self, state: Dict) -> None:
+        from sqlalchemy import update
+        from database.models_sql import BroadcastCheckpoint
+
+        values = {k: state.get(k) for k in FIELDS}
+        # The audience never changes after the first save; later saves only move progress
+        progress = {k: values[k] for k in PROGRESS_FIELDS}
+
+        def _save(session):
+            updated = session.execute(
+                update(BroadcastCheckpoint)
+                .where(BroadcastCheckpoint.job_id == values["job_id"])
+                .values(**progress)
+            ).rowcount
+            if not updated:
+                session.add(BroadcastCheckpoint(**values))
+
+        await self._run(_save)
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        from database.models_sql import BroadcastCheckpoint
+
+        def _get(session):
+            row = session.get(BroadcastCheckpoint, job_id)
+            return self._to_state(row) if row is not None else None
+
+        return await self._run(_get)
+
+    async def load_unfinished(self) -> List[Dict]:
+        from sqlalchemy import select
+        from database.models_sql import BroadcastCheckpoint
+
+        def _load(session):
+            rows = session.execute(
+                select(BroadcastCheckpoint)
+                .where(BroadcastCheckpoint.status == "running")
+                .order_by(BroadcastCheckpoint.created_at)
+            ).scalars()
+            return [self._to_state(row) for row in rows]
+
+        return await self._run(_load)
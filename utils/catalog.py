@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Indexed, hot-reloadable views of `data/courses.json` and `data/books.json`.
+
+Handlers used to `json.load` the course list on every menu tap and filter it
+linearly. `course_catalog` and `book_catalog` load each file once into an
+immutable snapshot (read-only mappings and tuples) with the lookups handlers need
+pre-computed: by id, by type, by target grade/major and, for courses, workshop
+entries keyed and ordered by month.
+
+At most once per `check_interval` seconds a query stats the file; when its mtime or
+size changed, a new snapshot is built and swapped in with a single assignment, so
+readers see either the old catalog or the new one, never a mix. A file that fails
+to parse keeps the previous snapshot.
+"""
+
+from __future__ import annotations
+
+import abc
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from utils.workshops import _parse_month_key
+
+logger = logging.getLogger(__name__)
+
+Item = Mapping[str, Any]
+
+WORKSHOP_PREFIX = "workshop_"
+
+
+def _freeze(value: Any) -> Any:
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _group(items: Iterable[Item], keys_of) -> Mapping[str, Tuple[Item, ...]]:
+    groups: Dict[str, List[Item]] = {}
+    for item in items:
+        for key in keys_of(item):
+            groups.setdefault(key, []).append(item)
+    return MappingProxyType({k: tuple(v) for k, v in groups.items()})
+
+
+def _targets(field: str):
+    def _keys(item: Item):
+        values = item.get(field) or ()
+        return [values] if isinstance(values, str) else list(values)
+
+    return _keys
+
+
+class _JsonCatalog(abc.ABC):
+    """Shared load/reload logic; subclasses turn the item list into their indexes."""
+
+    def __init__(self, path: str | Path, check_interval: float = 1.0):
+        self.path = Path(path)
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._signature: Optional[Tuple[int, int]] = None
+        self._checked_at = float("-inf")
+        self._version = 0
+        self._index = self._build(())
+
+    @abc.abstractmethod
+    def _build(self, items: Tuple[Item, ...]) -> Any:
+        """Index `items` into the snapshot that lookups read."""
+
+    def _stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def exists(self) -> bool:
+        return self._stat() is not None
+
+    def reload(self, force: bool = False) -> bool:
+        """Rebuild the snapshot if the file changed (or always with `force`); True if swapped."""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            signature = self._stat()
+            if not force and signature == self._signature:
+                return False
+            if signature is None:
+                items: Tuple[Item, ...] = ()
+            else:
+                try:
+                    data = json.loads(self.path.read_text(encoding="utf-8"))
+                except Exception as e:
+                    logger.warning(f"Keeping previous catalog, failed to load {self.path}: {e}")
+                    return False
+                items = tuple(
+                    _freeze(item)
+                    for item in (data if isinstance(data, list) else [])
+                    if isinstance(item, dict)
+                )
+            self._index = self._build(items)
+            self._signature = signature
+            self._version += 1
+            return True
+
+    def _current(self):
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            self.reload()
+        return self._index
+
+    @property
+    def version(self) -> int:
+        """Bumped on every snapshot swap; key derived data (e.g. rendered menus) on it."""
+        self._current()
+        return self._version
+
+    def all(self) -> Tuple[Item, ...]:
+        return self._current().items
+
+
+class _CourseIndex:
+    __slots__ = (
+        "items",
+        "by_id",
+        "by_type",
+        "active_by_type",
+        "by_grade",
+        "by_major",
+        "workshops",
+        "workshop_months",
+    )
+
+    def __init__(self, items: Tuple[Item, ...]):
+        self.items = items
+        by_id: Dict[str, Item] = {}
+        for item in items:
+            course_id = (item.get("course_id") or "").strip()
+            if course_id and course_id not in by_id:
+                by_id[course_id] = item
+        self.by_id = MappingProxyType(by_id)
+        self.by_type = _group(items, lambda c: [c.get("course_type")])
+        self.active_by_type = _group(
+            (c for c in items if c.get("is_active")), lambda c: [c.get("course_type")]
+        )
+        self.by_grade = _group(items, _targets("target_grades"))
+        self.by_major = _group(items, _targets("target_majors"))
+        workshops = {
+            course_id.split("_", 1)[1]: item
+            for course_id, item in by_id.items()
+            if course_id.startswith(WORKSHOP_PREFIX) and course_id.split("_", 1)[1]
+        }
+        self.workshop_months = tuple(sorted(workshops, key=_parse_month_key))
+        self.workshops = MappingProxyType({m: workshops[m] for m in self.workshop_months})
+
+
+class CourseCatalog(_JsonCatalog):
+    """Course list from `data/courses.json`, indexed for handler lookups."""
+
+    def __init__(self, path: str | Path = "data/courses.json", check_interval: float = 1.0):
+        super().__init__(path, check_interval)
+
+    def _build(self, items: Tuple[Item, ...]) -> _CourseIndex:
+        return _CourseIndex(items)
+
+    def get(self, course_id: Optional[str]) -> Optional[Item]:
+        return self._current().by_id.get(course_id or "")
+
+    def price(self, course_id: Optional[str]) -> Optional[Any]:
+        course = self.get(course_id)
+        return course.get("price") if course else None
+
+    def by_type(self, course_type: str, active_only: bool = False) -> Tuple[Item, ...]:
+        index = self._current()
+        return (index.active_by_type if active_only else index.by_type).get(course_type, ())
+
+    def for_grade(self, grade: str) -> Tuple[Item, ...]:
+        return self._current().by_grade.get(grade, ())
+
+    def for_major(self, major: str) -> Tuple[Item, ...]:
+        return self._current().by_major.get(major, ())
+
+    def workshop_months(self) -> Tuple[str, ...]:
+        """Workshop months sorted by (year, month)."""
+        return self._current().workshop_months
+
+    def workshops(self) -> Mapping[str, Item]:
+        """Workshop course per month, in month order."""
+        return self._current().workshops
+
+
+class _BookIndex:
+    __slots__ = ("items", "by_id", "by_title", "by_grade", "by_major")
+
+    def __init__(self, items: Tuple[Item, ...]):
+        self.items = items
+        by_id: Dict[str, Item] = {}
+        by_title: Dict[str, Item] = {}
+        for item in items:
+            if item.get("book_id"):
+                by_id.setdefault(item["book_id"], item)
+            if item.get("title"):
+                by_title.setdefault(item["title"], item)
+        self.by_id = MappingProxyType(by_id)
+        self.by_title = MappingProxyType(by_title)
+        self.by_grade = _group(items, _targets("target_grades"))
+        self.by_major = _group(items, _targets("target_majors"))
+
+
+class BookCatalog(_JsonCatalog):
+    """Book list from `data/books.json`, indexed by id, title and audience."""
+
+    def __init__(self, path: str | Path = "data/books.json", check_interval: float = 1.0):
+        super().__init__(path, check_interval)
+
+    def _build(self, items: Tuple[Item, ...]) -> _BookIndex:
+        return _BookIndex(items)
+
+    def get(self, book_id: Optional[str]) -> Optional[Item]:
+        return self._current().by_id.get(book_id or "")
+
+    def find(self, key: Optional[str]) -> Optional[Item]:
+        """Look a book up by title, falling back to `book_id`."""
+        index = self._current()
+        return index.by_title.get(key or "") or index.by_id.get(key or "")
+
+    def for_grade(self, grade: str) -> Tuple[Item, ...]:
+        return self._current().by_grade.get(grade, ())
+
+    def for_major(self, major: str) -> Tuple[Item, ...]:
+        return self._current().by_major.get(major, ())
+
+
+course_catalog = CourseCatalog()
+book_catalog = BookCatalog()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+In-process copies of database state, kept current by commit-time changes.
+
+`utils.ban_registry`, `utils.stats_snapshot`, `utils.leaderboard` and
+`utils.question_bank` serve hot reads from memory. `CommittedState` is their common
+base: `load()` rebuilds the state from the database, `start()` repeats that every
+`refresh_seconds` (which also folds in changes made by other replicas), and `apply()`
+folds in changes committed by this process.
+
+Writers stage those changes with `stage_on_commit(session, key, apply_fn)`; a single
+pair of Session listeners calls `apply_fn` once the transaction commits and drops the
+changes on rollback.
+
+A commit that lands while `load()` is reading may be missing from what it read, so
+`apply()` also queues the changes until the rebuilt state is swapped in and replays
+them on top of it.
+"""
+
+from __future__ import annotations
+
+import abc
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# Session.info key for {key: (apply_fn, staged changes)} until commit
+_PENDING_KEY = "committed_state_pending"
+
+
+class CommittedState(abc.ABC):
+    """State rebuilt by `load()`, refreshed periodically and updated by `apply()`."""
+
+    # Label for log messages
+    name = "state"
+    # Changes are dropped before the first load, which reads the committed rows anyway;
+    # states whose changes are idempotent (set/replace) may apply them to the empty state
+    apply_before_load = False
+
+    def __init__(self, refresh_seconds: float):
+        self.refresh_seconds = float(refresh_seconds)
+        self.loaded_at = 0.0
+        self._loaded = False
+        # Commits are applied on DB worker threads while handlers read on the loop
+        self._lock = threading.RLock()
+        # One load at a time; `_replay` collects changes committed while it reads
+        self._load_lock = threading.Lock()
+        self._replay: Optional[List[Any]] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    @abc.abstractmethod
+    def _read(self) -> Any:
+        """Read the full state from the database (blocking, no locks held)."""
+
+    @abc.abstractmethod
+    def _swap(self, data: Any) -> Any:
+        """Install what `_read()` returned; called with `_lock` held. Returned by `load()`."""
+
+    def _apply(self, changes: Any) -> None:
+        """Fold committed `changes` into the current state; called with `_lock` held."""
+
+    def load(self) -> Any:
+        """Rebuild the state from the database (blocking)."""
+        with self._load_lock:
+            with self._lock:
+                self._replay = []
+            try:
+                data = self._read()
+            finally:
+                with self._lock:
+                    replay, self._replay = self._replay, None
+            # Swap under the lock so readers never see a half-built state, then replay
+            # commits that may have landed after the read started
+            with self._lock:
+                result = self._swap(data)
+                self._loaded = True
+                self.loaded_at = time.monotonic()
+                for changes in replay or ():
+                    self._apply(changes)
+        return result
+
+    def apply(self, changes: Any) -> None:
+        """Apply committed `changes` now and, while a load is reading, again after its swap."""
+        with self._lock:
+            if self._replay is not None:
+                self._replay.append(changes)
+            if self._loaded or self.apply_before_load:
+                self._apply(changes)
+
+    async def refresh(self) -> Any:
+        from database.db import run_blocking
+
+        return await run_blocking(self.load)
+
+    async def ensure_loaded(self) -> None:
+        if not self._loaded:
+            await self.refresh()
+
+    async def start(self) -> None:
+        """Start the periodic rebuild task."""
+        if self._refresh_task and not self._refresh_task.done():
+            return
+
+        async def refresh_loop():
+            while True:
+                try:
+                    await self.refresh()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Error refreshing {self.name}: {e}")
+                await asyncio.sleep(self.refresh_seconds)
+
+        self._refresh_task = asyncio.create_task(refresh_loop())
+
+    async def stop(self) -> None:
+        if self._refresh_task and not self._refresh_task.done():
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+        self._refresh_task = None
+
+
+def stage_on_commit(
+    session, key: str, apply_fn: Callable[[Any], None], factory: Callable[[], Any] = list
+) -> Any:
+    """Changes staged under `key` in `session` (created by `factory()` on first use).
+
+    `apply_fn(changes)` runs once the session commits; the changes are dropped if it
+    rolls back.
+    """
+    pending: Dict[str, Tuple[Callable[[Any], None], Any]] = session.info.setdefault(
+        _PENDING_KEY, {}
+    )
+    entry = pending.get(key)
+    if entry is None:
+        entry = pending[key] = (apply_fn, factory())
+    return entry[1]
+
+
+def _apply_committed(session) -> None:
+    for key, (apply_fn, changes) in (session.info.pop(_PENDING_KEY, None) or {}).items():
+        if not changes:
+            continue
+        try:
+            apply_fn(changes)
+        except Exception as e:
+            # The rows are committed; the next periodic rebuild picks them up
+            logger.error(f"Error applying committed {key} changes: {e}")
+
+
+def _discard_rolled_back(session) -> None:
+    session.info.pop(_PENDING_KEY, None)
+
+
+# Listen on the Session class so sync, threaded and native-async sessions are all covered
+if not event.contains(Session, "after_commit", _apply_committed):
+    event.listen(Session, "after_commit", _apply_committed)
+    event.listen(Session, "after_rollback", _discard_rolled_back)
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Per-handler latency instrumentation.
+
+`instrument_application()` wraps the callback of every handler registered on the
+PTB application (including the states of conversation handlers). Each call records
+its duration, outcome, user ID and handler name in `utils.performance_monitor`,
+together with how many SQL statements it ran and how much of its time went to SQL
+and to Telegram Bot API requests:
+
+- SQL time comes from cursor events on the SQLAlchemy engine. `database.db`
+  runs blocking work in a copy of the caller's context, so statements executed in
+  worker threads are still attributed to the handler that issued them.
+- Bot API time comes from `TimedHTTPXRequest`, passed to `ApplicationBuilder.request`.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Optional
+
+from telegram.ext import ApplicationHandlerStop
+from telegram.request import HTTPXRequest
+
+from utils.performance_monitor import monitor
+
+logger = logging.getLogger(__name__)
+
+
+class HandlerTiming:
+    """Time spent in SQL and Bot API calls while one handler callback runs"""
+
+    __slots__ = ("name", "db_time", "db_calls", "api_time", "api_calls")
+
+    def __init__(self, name: Optional[str] = None):
+        self.name = name
+        self.db_time = 0.0
+        self.db_calls = 0
+        self.api_time = 0.0
+        self.api_calls = 0
+
+
+_current_timing: ContextVar[Optional[HandlerTiming]] = ContextVar("handler_timing", default=None)
+
+_instrumented_engines = set()
+
+
+def current_timing() -> Optional[HandlerTiming]:
+    """Timing of the handler running in this context, if any"""
+    return _current_timing.get()
+
+
+def current_handler_name() -> Optional[str]:
+    """Name of the handler running in this context (labels slow queries)"""
+    timing = _current_timing.get()
+    return timing.name if timing is not None else None
+
+
+def install_db_timing(engine) -> None:
+    """Attribute statement execution time on `engine` to the running handler (idempotent)."""
+    from sqlalchemy import event
+
+    engine = getattr(engine, "sync_engine", engine)
+    if engine is None or id(engine) in _instrumented_engines:
+        return
+    _instrumented_engines.add(id(engine))
+
+    def _charge(context) -> None:
+        started = getattr(context, "_handler_timing_started", None)
+        if started is None:
+            return
+        context._handler_timing_started = None
+        timing = _current_timing.get()
+        if timing is not None:
+            timing.db_time += time.perf_counter() - started
+            timing.db_calls += 1
+
+    # The start time lives on the statement's execution context (as in
+    # `database.db.install_query_telemetry`), so a failed statement leaves nothing behind
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._handler_timing_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        _charge(context)
+
+    @event.listens_for(engine, "handle_error")
+    def _on_error(exception_context):
+        _charge(exception_context.execution_context)
+
+
+class TimedHTTPXRequest(HTTPXRequest):
+    """`HTTPXRequest` that adds each Bot API round-trip to the running handler's timing"""
+
+    async def do_request(self, *args: Any, **kwargs: Any):
+        timing = _current_timing.get()
+        if timing is None:
+            return await super().do_request(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return await super().do_request(*args, **kwargs)
+        finally:
+            timing.api_time += time.perf_counter() - started
+            timing.api_calls += 1
+
+
+def _handler_name(callback: Callable) -> str:
+    name = getattr(callback, "__qualname__", None) or getattr(callback, "__name__", None)
+    return str(name or type(callback).__name__)
+
+
+def timed_callback(callback: Callable, name: Optional[str] = None) -> Callable:
+    """Wrap a PTB callback so each call is recorded in the performance monitor."""
+    if getattr(callback, "__instrumented__", False):
+        return callback
+    name = name or _handler_name(callback)
+
+    async def _timed(update, context, *args, **kwargs):
+        timing = HandlerTiming(name)
+        token = _current_timing.set(timing)
+        started = time.perf_counter()
+        error: Optional[BaseException] = None
+        try:
+            return await callback(update, context, *args, **kwargs)
+        except ApplicationHandlerStop:
+            raise
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            _current_timing.reset(token)
+            user = getattr(update, "effective_user", None)
+            user_id = getattr(user, "id", None)
+            try:
+                await monitor.log_request_time(
+                    name,
+                    duration,
+                    user_id,
+                    db_time=timing.db_time,
+                    api_time=timing.api_time,
+                    db_queries=timing.db_calls,
+                )
+                if error is not None:
+                    await monitor.log_error(type(error).__name__, name, user_id)
+            except Exception as e:  # never let metrics break a handler
+                logger.debug(f"Failed to record timing for {name}: {e}")
+
+    _timed.__name__ = getattr(callback, "__name__", name)
+    _timed.__qualname__ = name
+    _timed.__instrumented__ = True  # type: ignore[attr-defined]
+    return _timed
+
+
+def _instrument_handler(handler) -> int:
+    states = getattr(handler, "states", None)
+    if isinstance(states, dict):  # ConversationHandler: wrap its nested handlers
+        count = 0
+        nested = list(handler.entry_points) + list(handler.fallbacks)
+        for state_handlers in states.values():
+            nested.extend(state_handlers)
+        for sub in nested:
+            count += _instrument_handler(sub)
+        return count
+    callback = getattr(handler, "callback", None)
+    if callback is None or getattr(callback, "__instrumented__", False):
+        return 0
+    handler.callback = timed_callback(callback)
+    return 1
+
+
+def instrument_application(application) -> int:
+    """Wrap every registered handler callback; returns how many were wrapped."""
+    try:
+        from database.db import ASYNC_ENGINE, ENGINE, QUERY_TELEMETRY
+
+        QUERY_TELEMETRY.context_label = current_handler_name
+        install_db_timing(ENGINE)
+        if ASYNC_ENGINE is not None:
+            install_db_timing(ASYNC_ENGINE)
+    except Exception as e:
+        logger.warning(f"SQL timing not installed: {e}")
+
+    count = 0
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            count += _instrument_handler(handler)
+    return count
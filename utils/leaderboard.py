@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+In-memory quiz leaderboard with rank queries.
+
+`/leaderboard` reads the top entries and the caller's rank from ordered in-process
+boards instead of sorting `user_stats` on every call. There is one board per window:
+`all` (lifetime `user_stats.points`), `week` (since Saturday, UTC) and `month` (since
+the 1st, UTC). Window points are rebuilt from `quiz_attempts` with the same rule
+`database.service.upsert_user_stats` awards them by: 5 per correct answer plus 5 per
+day with at least one attempt.
+
+Each board is a list of `(-points, user_id)` keys kept sorted with `bisect`, so rank
+lookups are a binary search and top-k reads are a slice. Points gained in
+`upsert_user_stats` are staged on the session and applied only when it commits; a
+periodic rebuild folds in changes made by other replicas (see `utils.committed_state`).
+"""
+
+from __future__ import annotations
+
+import bisect
+import datetime as dt
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+from utils.committed_state import CommittedState, stage_on_commit
+
+logger = logging.getLogger(__name__)
+
+WINDOWS = ("all", "week", "month")
+
+
+def window_start(window: str, today: Optional[dt.date] = None) -> Optional[dt.date]:
+    """First day of the current `week`/`month` window (None for `all`)."""
+    today = today or dt.datetime.utcnow().date()
+    if window == "week":
+        # Weeks start on Saturday
+        return today - dt.timedelta(days=(today.weekday() + 2) % 7)
+    if window == "month":
+        return today.replace(day=1)
+    return None
+
+
+class RankedBoard:
+    """Points per user kept in descending order; ties share a rank."""
+
+    def __init__(self, points: Optional[Dict[int, int]] = None):
+        self._points: Dict[int, int] = dict(points or {})
+        self._keys: List[Tuple[int, int]] = sorted((-p, uid) for uid, p in self._points.items())
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def points(self, user_id: int) -> Optional[int]:
+        return self._points.get(user_id)
+
+    def set(self, user_id: int, points: int) -> None:
+        old = self._points.get(user_id)
+        if old is not None:
+            del self._keys[bisect.bisect_left(self._keys, (-old, user_id))]
+        self._points[user_id] = points
+        bisect.insort(self._keys, (-points, user_id))
+
+    def add(self, user_id: int, delta: int) -> None:
+        self.set(user_id, self._points.get(user_id, 0) + delta)
+
+    def rank(self, user_id: int) -> Optional[int]:
+        """1-based rank of `user_id`, or None if it has no points on this board."""
+        points = self._points.get(user_id)
+        if points is None:
+            return None
+        return bisect.bisect_left(self._keys, (-points,)) + 1
+
+    def top(self, limit: int) -> List[Tuple[int, int, int]]:
+        """`(rank, user_id, points)` for the first `limit` entries."""
+        out = []
+        rank = 0
+        previous = None
+        for i, (neg, uid) in enumerate(self._keys[: max(0, limit)]):
+            if neg != previous:
+                rank, previous = i + 1, neg
+            out.append((rank, uid, -neg))
+        return out
+
+
+class Leaderboard(CommittedState):
+    """Per-window `RankedBoard`s, updated by commit-time deltas and periodic rebuilds."""
+
+    name = "leaderboard"
+
+    def __init__(self, refresh_seconds: Optional[float] = None):
+        if refresh_seconds is None:
+            refresh_seconds = float(os.getenv("LEADERBOARD_REFRESH_SECONDS", "300"))
+        super().__init__(refresh_seconds)
+        self.boards: Dict[str, RankedBoard] = {w: RankedBoard() for w in WINDOWS}
+        self.starts: Dict[str, Optional[dt.date]] = {w: window_start(w) for w in WINDOWS}
+        # users.id -> telegram_user_id for the entries shown in `top()`
+        self.telegram_ids: Dict[int, int] = {}
+
+    def _read(self) -> Tuple:
+        """Every board from `user_stats` and `quiz_attempts`."""
+        from sqlalchemy import distinct, func, select
+        from database.db import session_scope
+        from database.models_sql import QuizAttempt, User, UserStats
+
+        today = dt.datetime.utcnow().date()
+        starts = {w: window_start(w, today) for w in WINDOWS}
+        boards = {}
+        with session_scope() as session:
+            rows = session.execute(
+                select(UserStats.user_id, UserStats.points, User.telegram_user_id).join(
+                    User, User.id == UserStats.user_id
+                )
+            ).all()
+            telegram_ids = {int(r.user_id): int(r.telegram_user_id) for r in rows}
+            boards["all"] = RankedBoard({int(r.user_id): int(r.points or 0) for r in rows})
+            for window in ("week", "month"):
+                start = starts[window]
+                if start is None:  # only "all" has no start
+                    continue
+                since = dt.datetime.combine(start, dt.time.min)
+                window_rows = session.execute(
+                    select(
+                        QuizAttempt.user_id,
+                        func.sum(QuizAttempt.correct),
+                        func.count(distinct(func.date(QuizAttempt.created_at))),
+                    )
+                    .where(QuizAttempt.created_at >= since)
+                    .group_by(QuizAttempt.user_id)
+                ).all()
+                boards[window] = RankedBoard(
+                    {
+                        int(uid): 5 * int(correct or 0) + 5 * int(days)
+                        for uid, correct, days in window_rows
+                    }
+                )
+        return boards, starts, telegram_ids
+
+    def _swap(self, data: Tuple) -> None:
+        self.boards, self.starts, self.telegram_ids = data
+
+    def _roll_windows(self, today: dt.date) -> None:
+        for window in ("week", "month"):
+            start = window_start(window, today)
+            if start != self.starts[window]:
+                self.boards[window] = RankedBoard()
+                self.starts[window] = start
+
+    def _apply(self, updates: List[Tuple[int, Optional[int], int, int]]) -> None:
+        """Apply committed `(user_id, telegram_user_id, total_points, gained)` updates."""
+        self._roll_windows(dt.datetime.utcnow().date())
+        for user_id, telegram_user_id, total, gained in updates:
+            if telegram_user_id is not None:
+                self.telegram_ids[user_id] = telegram_user_id
+            self.boards["all"].set(user_id, total)
+            if gained:
+                self.boards["week"].add(user_id, gained)
+                self.boards["month"].add(user_id, gained)
+
+    def top(self, limit: int = 10, window: str = "all") -> List[Dict]:
+        with self._lock:
+            self._roll_windows(dt.datetime.utcnow().date())
+            entries = self.boards[window].top(limit)
+            return [
+                {
+                    "rank": rank,
+                    "telegram_user_id": self.telegram_ids.get(uid, 0),
+                    "points": points,
+                }
+                for rank, uid, points in entries
+            ]
+
+    def rank(self, user_id: int, window: str = "all") -> Optional[Dict]:
+        """`{"rank", "points", "total"}` for `users.id`, or None if not on the board."""
+        with self._lock:
+            self._roll_windows(dt.datetime.utcnow().date())
+            board = self.boards[window]
+            rank = board.rank(user_id)
+            if rank is None:
+                return None
+            return {"rank": rank, "points": board.points(user_id), "total": len(board)}
+
+
+def record_points(
+    session, user_id: int, total_points: int, gained: int, telegram_user_id: Optional[int] = None
+) -> None:
+    """Stage a user's new point total; it reaches the boards only if `session` commits."""
+    stage_on_commit(session, "leaderboard", leaderboard.apply).append(
+        (user_id, telegram_user_id, total_points, gained)
+    )
+
+
+# Global leaderboard instance
+leaderboard = Leaderboard()
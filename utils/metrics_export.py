@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prometheus text exposition for the `/metrics` HTTP endpoint.
+
+`iter_metrics()` yields the exposition one metric family at a time, so the
+endpoint can write (and yield to the event loop) between families. Each family is
+rendered from a plain read of in-memory counters on the event loop thread; no
+monitor/limiter/cache lock is taken, and the per-handler list is copied up front so
+handlers registered mid-render do not break iteration.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from utils.performance_monitor import LATENCY_BUCKETS
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+Sample = Tuple[str, Dict[str, Any], float]
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+def _family(name: str, kind: str, help_text: str, samples: Iterable[Sample]) -> str:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for sample_name, labels, value in samples:
+        if labels:
+            rendered = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+            lines.append(f"{sample_name}{{{rendered}}} {_format_value(value)}")
+        else:
+            lines.append(f"{sample_name} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def _monitor_families(monitor) -> Iterator[str]:
+    yield _family(
+        "bot_uptime_seconds",
+        "gauge",
+        "Seconds since the performance monitor started.",
+        [("bot_uptime_seconds", {}, max(0.0, time.time() - monitor._start_time))],
+    )
+    yield _family(
+        "bot_events_total",
+        "counter",
+        "Application event counters (PerformanceMonitor.counters).",
+        [("bot_events_total", {"name": k}, v) for k, v in list(monitor.counters.items())],
+    )
+    current_hour = int(time.time() // 3600)
+    yield _family(
+        "bot_events_current_hour",
+        "gauge",
+        "Hourly application counters for the current hour.",
+        [
+            ("bot_events_current_hour", {"name": k}, buckets.get(current_hour, 0))
+            for k, buckets in list(monitor.hourly_counters.items())
+        ],
+    )
+
+    handlers = list(monitor.metrics.items())
+    samples: List[Sample] = []
+    for name, metrics in handlers:
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, metrics.bucket_counts):
+            cumulative += count
+            samples.append(
+                ("bot_handler_duration_seconds_bucket", {"handler": name, "le": bound}, cumulative)
+            )
+        samples.append(
+            (
+                "bot_handler_duration_seconds_bucket",
+                {"handler": name, "le": "+Inf"},
+                metrics.total_requests,
+            )
+        )
+        samples.append(
+            ("bot_handler_duration_seconds_sum", {"handler": name}, metrics.total_duration)
+        )
+        samples.append(
+            ("bot_handler_duration_seconds_count", {"handler": name}, metrics.total_requests)
+        )
+    yield _family(
+        "bot_handler_duration_seconds",
+        "histogram",
+        "Handler callback latency.",
+        samples,
+    )
+    yield _family(
+        "bot_handler_errors_total",
+        "counter",
+        "Handler callbacks that raised.",
+        [("bot_handler_errors_total", {"handler": n}, m.error_count) for n, m in handlers],
+    )
+    yield _family(
+        "bot_handler_db_seconds_total",
+        "counter",
+        "Time handler callbacks spent executing SQL.",
+        [("bot_handler_db_seconds_total", {"handler": n}, m.db_duration) for n, m in handlers],
+    )
+    yield _family(
+        "bot_handler_db_queries_total",
+        "counter",
+        "SQL statements executed by handler callbacks.",
+        [("bot_handler_db_queries_total", {"handler": n}, m.db_queries) for n, m in handlers],
+    )
+    yield _family(
+        "bot_handler_db_queries_max",
+        "gauge",
+        "Most SQL statements a single handler call executed.",
+        [("bot_handler_db_queries_max", {"handler": n}, m.max_db_queries) for n, m in handlers],
+    )
+    yield _family(
+        "bot_handler_api_seconds_total",
+        "counter",
+        "Time handler callbacks spent in Telegram Bot API requests.",
+        [("bot_handler_api_seconds_total", {"handler": n}, m.api_duration) for n, m in handlers],
+    )
+
+
+def _rate_limiter_families(multi_limiter) -> Iterator[str]:
+    levels = list(multi_limiter.limiters.items())
+    samples: List[Sample] = []
+    for level, limiter in levels:
+        for outcome in ("allowed", "blocked"):
+            samples.append(
+                (
+                    "bot_rate_limit_requests_total",
+                    {"level": level, "outcome": outcome},
+                    limiter.stats.get(f"{outcome}_requests", 0),
+                )
+            )
+    yield _family(
+        "bot_rate_limit_requests_total",
+        "counter",
+        "Rate limiter decisions per level.",
+        samples,
+    )
+    yield _family(
+        "bot_rate_limit_tracked_users",
+        "gauge",
+        "Users with rate limit state held in this process.",
+        [("bot_rate_limit_tracked_users", {"level": lvl}, len(lim.limits)) for lvl, lim in levels],
+    )
+
+
+def _cache_families(caches: Dict[str, Any]) -> Iterator[str]:
+    items = list(caches.items())
+    samples: List[Sample] = []
+    for name, cache in items:
+        for key in ("hits", "misses", "evictions", "expired"):
+            samples.append(
+                ("bot_cache_events_total", {"cache": name, "event": key}, cache.stats.get(key, 0))
+            )
+    yield _family("bot_cache_events_total", "counter", "SimpleCache lookups and removals.", samples)
+    ratios: List[Sample] = []
+    for name, cache in items:
+        hits, misses = cache.stats.get("hits", 0), cache.stats.get("misses", 0)
+        ratios.append(
+            (
+                "bot_cache_hit_ratio",
+                {"cache": name},
+                hits / (hits + misses) if hits + misses else 0.0,
+            )
+        )
+    yield _family("bot_cache_hit_ratio", "gauge", "SimpleCache hit ratio.", ratios)
+    yield _family(
+        "bot_cache_entries",
+        "gauge",
+        "Entries held by each SimpleCache.",
+        [("bot_cache_entries", {"cache": name}, len(cache.cache)) for name, cache in items],
+    )
+
+
+def _pool_families(engine) -> Iterator[str]:
+    pool = getattr(engine, "pool", None)
+    samples: List[Sample] = []
+    for state in ("size", "checkedin", "checkedout", "overflow"):
+        method = getattr(pool, state, None)
+        if callable(method):
+            try:
+                samples.append(("bot_db_pool_connections", {"state": state}, method()))
+            except Exception:
+                continue
+    yield _family(
+        "bot_db_pool_connections",
+        "gauge",
+        "SQLAlchemy connection pool status (size, checked in/out, overflow).",
+        samples,
+    )
+
+
+def _query_families(telemetry) -> Iterator[str]:
+    with telemetry._lock:
+        fingerprints = [(fp, tuple(entry)) for fp, entry in telemetry.fingerprints.items()]
+        pool = dict(telemetry.pool)
+        slow_total = telemetry.slow_total
+    yield _family(
+        "bot_db_queries_total",
+        "counter",
+        "SQL statements executed, by normalized statement fingerprint.",
+        [("bot_db_queries_total", {"fingerprint": fp}, int(e[0])) for fp, e in fingerprints],
+    )
+    yield _family(
+        "bot_db_query_seconds_total",
+        "counter",
+        "Time spent executing SQL, by normalized statement fingerprint.",
+        [("bot_db_query_seconds_total", {"fingerprint": fp}, e[1]) for fp, e in fingerprints],
+    )
+    yield _family(
+        "bot_db_slow_queries_total",
+        "counter",
+        "SQL statements slower than DB_SLOW_QUERY_MS.",
+        [("bot_db_slow_queries_total", {}, slow_total)],
+    )
+    yield _family(
+        "bot_db_pool_checkouts_total",
+        "counter",
+        "Connection pool checkouts (overflow = opened beyond pool_size, timeout = gave up).",
+        [
+            ("bot_db_pool_checkouts_total", {"outcome": "ok"}, pool["checkouts"]),
+            ("bot_db_pool_checkouts_total", {"outcome": "overflow"}, pool["overflow"]),
+            ("bot_db_pool_checkouts_total", {"outcome": "timeout"}, pool["timeouts"]),
+        ],
+    )
+    yield _family(
+        "bot_db_pool_checkout_wait_seconds_total",
+        "counter",
+        "Total time callers waited to check out a connection.",
+        [("bot_db_pool_checkout_wait_seconds_total", {}, pool["wait_seconds"])],
+    )
+    yield _family(
+        "bot_db_pool_checkout_wait_seconds_max",
+        "gauge",
+        "Longest connection checkout wait seen.",
+        [("bot_db_pool_checkout_wait_seconds_max", {}, pool["max_wait_seconds"])],
+    )
+    yield _family(
+        "bot_db_pool_invalidations_total",
+        "counter",
+        "Pooled connections invalidated (disconnects, failed pre-pings).",
+        [("bot_db_pool_invalidations_total", {}, pool["invalidated"])],
+    )
+
+
+def _broadcast_families(manager) -> Iterator[str]:
+    jobs = list(getattr(manager, "jobs", {}).items())
+    progress = (
+        (
+            "bot_broadcast_recipients",
+            "Recipients of each broadcast job.",
+            lambda j: len(j.user_ids),
+        ),
+        ("bot_broadcast_sent", "Messages delivered by each broadcast job.", lambda j: j.sent),
+        ("bot_broadcast_failed", "Failed deliveries of each broadcast job.", lambda j: j.failed),
+        (
+            "bot_broadcast_running",
+            "1 while the broadcast job's task is still running.",
+            lambda j: j._task is not None and not j._task.done(),
+        ),
+    )
+    for name, help_text, read in progress:
+        yield _family(
+            name, "gauge", help_text, [(name, {"job": job_id}, read(job)) for job_id, job in jobs]
+        )
+
+
+def _dispatcher_families(dispatcher) -> Iterator[str]:
+    stats = dict(dispatcher.stats)
+    yield _family(
+        "bot_update_queue_updates_total",
+        "counter",
+        "Webhook updates by outcome (rejected = queue full, answered 503).",
+        [
+            ("bot_update_queue_updates_total", {"outcome": key}, stats.get(key, 0))
+            for key in ("enqueued", "processed", "failed", "rejected")
+        ],
+    )
+    yield _family(
+        "bot_update_queue_depth",
+        "gauge",
+        "Updates queued or in flight, the configured cap and the peak seen.",
+        [
+            ("bot_update_queue_depth", {"kind": "current"}, dispatcher.depth),
+            ("bot_update_queue_depth", {"kind": "in_flight"}, dispatcher.in_flight),
+            ("bot_update_queue_depth", {"kind": "limit"}, dispatcher.max_depth),
+            ("bot_update_queue_depth", {"kind": "peak"}, stats.get("max_depth", 0)),
+        ],
+    )
+    yield _family(
+        "bot_update_queue_active_chats",
+        "gauge",
+        "Chats with queued or in-flight updates.",
+        [("bot_update_queue_active_chats", {}, dispatcher.active_chats)],
+    )
+    yield _family(
+        "bot_update_queue_wait_seconds_total",
+        "counter",
+        "Total time updates waited in the queue before a worker picked them up.",
+        [("bot_update_queue_wait_seconds_total", {}, stats.get("wait_seconds", 0.0))],
+    )
+
+
+def iter_metrics(
+    monitor=None,
+    multi_limiter=None,
+    caches: Optional[Dict[str, Any]] = None,
+    engine=None,
+    broadcast_manager=None,
+    update_dispatcher=None,
+    query_telemetry=None,
+) -> Iterator[str]:
+    """Yield the exposition text, one metric family per chunk; missing sources are skipped."""
+    sections = []
+    if monitor is not None:
+        sections.append(_monitor_families(monitor))
+    if multi_limiter is not None:
+        sections.append(_rate_limiter_families(multi_limiter))
+    if caches:
+        sections.append(_cache_families(caches))
+    if engine is not None:
+        sections.append(_pool_families(engine))
+    if query_telemetry is not None:
+        sections.append(_query_families(query_telemetry))
+    if broadcast_manager is not None:
+        sections.append(_broadcast_families(broadcast_manager))
+    if update_dispatcher is not None:
+        sections.append(_dispatcher_families(update_dispatcher))
+    for section in sections:
+        try:
+            yield from section
+        except Exception as e:  # a broken source must not take the endpoint down
+            logger.warning(f"Metrics section failed: {e}")
@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Payment token store.
+
+Every receipt a student submits gets a random token that ties together the admin
+notification messages, the approve/reject callback and the audit commands. Tokens
+live in the `payment_tokens` table so they survive restarts and are shared by all
+replicas; lookups go through its indexes on `(student_id, item_type, item_id,
+processed)`, `file_unique_id` and `(processed, created_at)`. Rows expire after
+`PAYMENT_TOKEN_TTL_SECONDS` (default 7 days), which is also the window in which a
+receipt image (by `file_unique_id`) cannot be reused.
+
+`InMemoryPaymentStore` implements the same interface over a plain dict of token ->
+meta. Inject it as `bot_data["payment_store"]` (tests and single-process setups).
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+TOKEN_TTL_SECONDS = int(os.getenv("PAYMENT_TOKEN_TTL_SECONDS", str(7 * 24 * 3600)))
+
+# Minimum interval between opportunistic purges of expired tokens
+_PURGE_INTERVAL_SECONDS = 3600
+
+Entry = Tuple[str, Dict]
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _to_epoch(value: Optional[datetime]) -> Optional[float]:
+    if value is None:
+        return None
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+def _matches_status(meta: Dict, status: Optional[str]) -> bool:
+    if status is None:
+        return True
+    if status == "pending":
+        return not meta.get("processed")
+    return bool(meta.get("processed")) and meta.get("decision") == status
+
+
+class InMemoryPaymentStore:
+    """Payment tokens kept in a dict (token -> meta); linear scans, single process only."""
+
+    def __init__(self, notifications: Optional[Dict[str, Dict]] = None):
+        self.notifications = notifications if notifications is not None else {}
+
+    async def create(self, token: str, meta: Dict) -> None:
+        entry = dict(meta)
+        entry.setdefault("messages", [])
+        entry.setdefault("processed", False)
+        entry.setdefault("decision", None)
+        entry.setdefault("decided_by", None)
+        entry.setdefault("decided_at", None)
+        entry.setdefault("created_at", time.time())
+        self.notifications[token] = entry
+
+    async def get(self, token: str) -> Optional[Dict]:
+        return self.notifications.get(token)
+
+    async def set_messages(self, token: str, messages: List[Tuple[int, int]]) -> None:
+        meta = self.notifications.get(token)
+        if meta is not None:
+            meta["messages"] = list(messages)
+
+    async def find_open(
+        self, student_id: int, item_type: str, item_id: str, within_seconds: float
+    ) -> Optional[str]:
+        cutoff = time.time() - within_seconds
+        for token, meta in self.notifications.items():
+            if (
+                meta.get("student_id") == student_id
+                and meta.get("item_type") == item_type
+                and meta.get("item_id") == item_id
+                and not meta.get("processed")
+                and meta.get("created_at", 0) >= cutoff
+            ):
+                return token
+        return None
+
+    async def receipt_seen(self, file_unique_id: str) -> bool:
+        cutoff = time.time() - TOKEN_TTL_SECONDS
+        return any(
+            meta.get("file_unique_id") == file_unique_id and meta.get("created_at", 0) >= cutoff
+            for meta in self.notifications.values()
+        )
+
+    async def mark_decided(
+        self,
+        token: str,
+        decision: str,
+        decided_by: int,
+        apply: Optional[Callable[[Any], Any]] = None,
+    ) -> bool:
+        meta = self.notifications.get(token)
+        if meta is None or meta.get("processed"):
+            return False
+        previous = {k: meta.get(k) for k in ("processed", "decision", "decided_by", "decided_at")}
+        meta["processed"] = True
+        meta["decision"] = decision
+        meta["decided_by"] = decided_by
+        meta["decided_at"] = time.time()
+        if apply is not None:
+            from database import async_service
+
+            try:
+                await async_service.run_in_session(apply)
+            except Exception:
+                meta.update(previous)
+                raise
+        return True
+
+    async def list(
+        self,
+        status: Optional[str] = None,
+        item_type: Optional[str] = None,
+        student_id: Optional[int] = None,
+        limit: int = 20,
+        offset: int = 0,
+    ) -> List[Entry]:
+        entries = [
+            (t, m)
+            for t, m in self.notifications.items()
+            if _matches_status(m, status)
+            and (item_type is None or m.get("item_type") == item_type)
+            and (student_id is None or int(m.get("student_id", 0)) == student_id)
+        ]
+        entries.sort(key=lambda kv: kv[1].get("created_at", 0), reverse=True)
+        return entries[offset : offset + limit]
+
+    async def purge_expired(self) -> int:
+        cutoff = time.time() - TOKEN_TTL_SECONDS
+        expired = [t for t, m in self.notifications.items() if m.get("created_at", 0) < cutoff]
+        for t in expired:
+            del self.notifications[t]
+        return len(expired)
+
+    async def purge_if_due(self) -> None:
+        await self.purge_expired()
+
+
+class SQLPaymentStore:
+    """Payment tokens in the `payment_tokens` table; every call runs off the event loop."""
+
+    def __init__(self):
+        self._last_purge = 0.0
+
+    @staticmethod
+    def _to_meta(row) -> Dict:
+        return {
+            "student_id": int(row.student_id),
+            "item_type": row.item_type,
+            "item_id": row.item_id,
+            "item_title": row.item_title,
+            "messages": [tuple(m) for m in (row.messages or [])],
+            "processed": bool(row.processed),
+            "decision": row.decision,
+            "decided_by": row.decided_by,
+            "created_at": _to_epoch(row.created_at),
+            "decided_at": _to_epoch(row.decided_at),
+            "file_unique_id": row.file_unique_id,
+        }
+
+    async def _run(self, fn, *args):
+        from database import async_service
+
+        return await async_service.run_in_session(fn, *args)
+
+    async def create(self, token: str, meta: Dict) -> None:
+        from database.models_sql import PaymentToken
+
+        now = _utcnow()
+
+        def _create(session):
+            session.add(
+                PaymentToken(
+                    token=token,
+                    student_id=meta["student_id"],
+                    item_type=meta.get("item_type") or "",
+                    item_id=meta.get("item_id") or "",
+                    item_title=meta.get("item_title"),
+                    file_unique_id=meta.get("file_unique_id"),
+                    messages=[list(m) for m in meta.get("messages", [])],
+                    processed=False,
+                    created_at=now,
+                    expires_at=now + timedelta(seconds=TOKEN_TTL_SECONDS),
+                )
+            )
+
+        await self._run(_create)
+
+    async def get(self, token: str) -> Optional[Dict]:
+        from database.models_sql import PaymentToken
+
+        def _get(session):
+            row = session.get(PaymentToken, token)
+            return self._to_meta(row) if row is not None else None
+
+        return await self._run(_get)
+
+    async def set_messages(self, token: str, messages: List[Tuple[int, int]]) -> None:
+        from sqlalchemy import update
+        from database.models_sql import PaymentToken
+
+        def _set(session):
+            session.execute(
+                update(PaymentToken)
+                .where(PaymentToken.token == token)
+                .values(messages=[list(m) for m in messages])
+            )
+
+        await self._run(_set)
+
+    async def find_open(
+        self, student_id: int, item_type: str, item_id: str, within_seconds: float
+    ) -> Optional[str]:
+        from sqlalchemy import select, false
+        from database.models_sql import PaymentToken
+
+        cutoff = _utcnow() - timedelta(seconds=within_seconds)
+
+        def _find(session):
+            return session.execute(
+                select(PaymentToken.token)
+                .where(
+                    PaymentToken.student_id == student_id,
+                    PaymentToken.item_type == item_type,
+                    PaymentToken.item_id == item_id,
+                    PaymentToken.processed == false(),
+                    PaymentToken.created_at >= cutoff,
+                )
+                .limit(1)
+            ).scalar()
+
+        return await self._run(_find)
+
+    async def receipt_seen(self, file_unique_id: str) -> bool:
+        from sqlalchemy import select
+        from database.models_sql import PaymentToken
+
+        now = _utcnow()
+
+        def _seen(session):
+            return (
+                session.execute(
+                    select(PaymentToken.token)
+                    .where(
+                        PaymentToken.file_unique_id == file_unique_id,
+                        PaymentToken.expires_at > now,
+                    )
+                    .limit(1)
+                ).scalar()
+                is not None
+            )
+
+        return await self._run(_seen)
+
+    async def mark_decided(
+        self,
+        token: str,
+        decision: str,
+        decided_by: int,
+        apply: Optional[Callable[[Any], Any]] = None,
+    ) -> bool:
+        """Atomically claim an open token; False if it is unknown or already decided.
+
+        `apply(session)` runs in the claiming transaction, so if it raises the claim is
+        rolled back with it and the error propagates.
+        """
+        from sqlalchemy import update, false
+        from database.models_sql import PaymentToken
+
+        def _mark(session):
+            result = session.execute(
+                update(PaymentToken)
+                .where(PaymentToken.token == token, PaymentToken.processed == false())
+                .values(
+                    processed=True,
+                    decision=decision,
+                    decided_by=decided_by,
+                    decided_at=_utcnow(),
+                )
+            )
+            if result.rowcount != 1:
+                return False
+            if apply is not None:
+                apply(session)
+            return True
+
+        return await self._run(_mark)
+
+    async def list(
+        self,
+        status: Optional[str] = None,
+        item_type: Optional[str] = None,
+        student_id: Optional[int] = None,
+        limit: int = 20,
+        offset: int = 0,
+    ) -> List[Entry]:
+        from sqlalchemy import select, false, true
+        from database.models_sql import PaymentToken
+
+        stmt = select(PaymentToken)
+        if status == "pending":
+            stmt = stmt.where(PaymentToken.processed == false())
+        elif status is not None:
+            stmt = stmt.where(PaymentToken.processed == true(), PaymentToken.decision == status)
+        if item_type is not None:
+            stmt = stmt.where(PaymentToken.item_type == item_type)
+        if student_id is not None:
+            stmt = stmt.where(PaymentToken.student_id == student_id)
+        stmt = stmt.order_by(PaymentToken.created_at.desc()).offset(offset).limit(limit)
+
+        def _list(session):
+            return [(row.token, self._to_meta(row)) for row in session.execute(stmt).scalars()]
+
+        return await self._run(_list)
+
+    async def purge_expired(self) -> int:
+        from sqlalchemy import delete
+        from database.models_sql import PaymentToken
+
+        now = _utcnow()
+        self._last_purge = time.time()
+
+        def _purge(session):
+            return session.execute(
+                delete(PaymentToken).where(PaymentToken.expires_at <= now)
+            ).rowcount
+
+        return await self._run(_purge)
+
+    async def purge_if_due(self) -> None:
+        """Run `purge_expired` at most once per `_PURGE_INTERVAL_SECONDS` (indexed DELETE)."""
+        if time.time() - self._last_purge < _PURGE_INTERVAL_SECONDS:
+            return
+        try:
+            removed = await self.purge_expired()
+            if removed:
+                logger.info(f"Purged {removed} expired payment tokens")
+        except Exception as e:
+            logger.warning(f"Payment token purge failed: {e}")
+
+
+# Global SQL-backed store
+payment_store = SQLPaymentStore()
+
+
+def get_payment_store(bot_data):
+    """`bot_data["payment_store"]` when one is injected, else the SQL-backed store."""
+    store = bot_data.get("payment_store") if bot_data is not None else None
+    return store if store is not None else payment_store
@@ -4,6 +4,8 @@
 Enhanced performance monitoring for Ostad Hatami Bot
 """
 
+import bisect
+import math
 import time
 import asyncio
 import logging
@@ -23,12 +25,195 @@ except Exception:
 # Module-level reference used by get_stats and tests
 ENGINE = _DB_ENGINE
 
+try:
+    from database.db import QUERY_TELEMETRY
+except Exception:
+    QUERY_TELEMETRY = None
+
 logger = logging.getLogger(__name__)
 
 
+def _percentile_index(n: int, q: float) -> int:
+    """0-based rank used for p95/p99 (p95 takes the item before floor(n * q))"""
+    index = int(n * q) - 1 if q < 0.99 else int(n * q)
+    return max(0, min(n - 1, index))
+
+
+class LatencySketch:
+    """Mergeable quantile sketch over log-spaced buckets.
+
+    Values are kept exactly until more than `EXACT_LIMIT` have been added; after that
+    each value only bumps the counter of its bucket, whose bounds grow geometrically
+    so any quantile is reported within `ACCURACY` relative error. Recording is O(1);
+    ordering the (at most a few hundred) buckets happens only when a quantile is read.
+    """
+
+    __slots__ = ("count", "total", "_exact", "_positive", "_negative", "_zero")
+
+    ACCURACY = 0.01
+    EXACT_LIMIT = 64
+    _GAMMA = (1 + ACCURACY) / (1 - ACCURACY)
+    _LOG_GAMMA = math.log(_GAMMA)
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self._exact: Optional[List[float]] = []
+        self._positive: Dict[int, int] = {}
+        self._negative: Dict[int, int] = {}
+        self._zero = 0
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        exact = self._exact
+        if exact is not None:
+            exact.append(value)
+            if len(exact) > self.EXACT_LIMIT:
+                self._spill()
+            return
+        self._bucket(value, 1)
+
+    def _bucket(self, value: float, count: int) -> None:
+        if value > 0:
+            key = math.ceil(math.log(value) / self._LOG_GAMMA)
+            self._positive[key] = self._positive.get(key, 0) + count
+        elif value < 0:
+            key = math.ceil(math.log(-value) / self._LOG_GAMMA)
+            self._negative[key] = self._negative.get(key, 0) + count
+        else:
+            self._zero += count
+
+    def _spill(self) -> None:
+        exact, self._exact = self._exact, None
+        for value in exact or ():
+            self._bucket(value, 1)
+
+    def merge(self, other: "LatencySketch") -> None:
+        self.count += other.count
+        self.total += other.total
+        if self._exact is not None and other._exact is not None:
+            self._exact.extend(other._exact)
+            if len(self._exact) > self.EXACT_LIMIT:
+                self._spill()
+            return
+        if self._exact is not None:
+            self._spill()
+        if other._exact is not None:
+            for value in other._exact:
+                self._bucket(value, 1)
+            return
+        for key, count in other._positive.items():
+            self._positive[key] = self._positive.get(key, 0) + count
+        for key, count in other._negative.items():
+            self._negative[key] = self._negative.get(key, 0) + count
+        self._zero += other._zero
+
+    def _value_at(self, index: int) -> float:
+        if self._exact is not None:
+            return sorted(self._exact)[index]
+        # Bucket representative: midpoint of (gamma^(k-1), gamma^k] in relative terms
+        scale = 2.0 / (1.0 + self._GAMMA)
+        seen = 0
+        for key in sorted(self._negative, reverse=True):
+            seen += self._negative[key]
+            if seen > index:
+                return -scale * self._GAMMA**key
+        seen += self._zero
+        if seen > index:
+            return 0.0
+        for key in sorted(self._positive):
+            seen += self._positive[key]
+            if seen > index:
+                return scale * self._GAMMA**key
+        return 0.0
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def median(self) -> float:
+        if not self.count:
+            return 0.0
+        if self._exact is not None:
+            return statistics.median(self._exact)
+        return self._value_at((self.count - 1) // 2)
+
+    def percentile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        return self._value_at(_percentile_index(self.count, q))
+
+
+class SlidingLatencyWindows:
+    """Per-slot latency sketches covering the last hour, read as 1m/5m/1h windows.
+
+    Each `SLOT_SECONDS` slice of time gets its own `LatencySketch`; slots older than
+    the longest window are dropped as new ones are opened. A window is read by merging
+    the slots it covers, so its edge is accurate to one slot.
+    """
+
+    SLOT_SECONDS = 10
+    WINDOWS = {"1m": 60, "5m": 300, "1h": 3600}
+    _HORIZON_SLOTS = 3600 // SLOT_SECONDS
+
+    def __init__(self):
+        self._slots: deque = deque()  # (slot index, LatencySketch), oldest first
+
+    def add(self, value: float, timestamp: float) -> None:
+        index = int(timestamp // self.SLOT_SECONDS)
+        slots = self._slots
+        if slots and slots[-1][0] == index:
+            slots[-1][1].add(value)
+            return
+        if not slots or index > slots[-1][0]:
+            sketch = LatencySketch()
+            sketch.add(value)
+            slots.append((index, sketch))
+            horizon = index - self._HORIZON_SLOTS
+            while slots[0][0] <= horizon:
+                slots.popleft()
+            return
+        # Out-of-order timestamp (rare): record it in its slot if still in range
+        if index <= slots[-1][0] - self._HORIZON_SLOTS:
+            return
+        for position in range(len(slots) - 1, -1, -1):
+            slot_index, sketch = slots[position]
+            if slot_index == index:
+                sketch.add(value)
+                return
+            if slot_index < index:
+                break
+        else:
+            position = -1
+        sketch = LatencySketch()
+        sketch.add(value)
+        slots.insert(position + 1, (index, sketch))
+
+    def snapshot(self, seconds: float, now: Optional[float] = None) -> LatencySketch:
+        """Merged sketch of the slots that overlap the last `seconds` seconds"""
+        if now is None:
+            now = time.time()
+        oldest = int((now - seconds) // self.SLOT_SECONDS)
+        merged = LatencySketch()
+        for slot_index, sketch in reversed(self._slots):
+            if slot_index < oldest:
+                break
+            merged.merge(sketch)
+        return merged
+
+
+# Upper bounds (seconds) of the cumulative latency histogram exported on /metrics
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
 @dataclass
 class PerformanceMetrics:
-    """Performance metrics for a handler or operation"""
+    """Performance metrics for a handler or operation.
+
+    `add_request` is O(1): it updates counters and the sliding latency windows. The
+    average, median and percentiles are computed from the 5-minute window only when
+    read (`avg_duration`, `to_dict`, ...), and cached until the next request.
+    """
 
     handler_name: str
     total_requests: int = 0
@@ -39,18 +224,40 @@ class PerformanceMetrics:
     request_timestamps: deque = field(default_factory=lambda: deque(maxlen=3000))
     error_count: int = 0
     last_request: Optional[float] = None
-    avg_duration: float = 0.0
-    median_duration: float = 0.0
-    p95_duration: float = 0.0
-    p99_duration: float = 0.0
-
-    def add_request(self, duration: float, timestamp: Optional[float] = None):
-        """Add a request with its duration"""
+    db_duration: float = 0.0
+    api_duration: float = 0.0
+    db_queries: int = 0
+    max_db_queries: int = 0
+    windows: SlidingLatencyWindows = field(default_factory=SlidingLatencyWindows, repr=False)
+    # Per-bucket (non-cumulative) counts for LATENCY_BUCKETS plus a final +Inf bucket
+    bucket_counts: List[int] = field(
+        default_factory=lambda: [0] * (len(LATENCY_BUCKETS) + 1), repr=False
+    )
+    _summary: Optional[Dict[str, float]] = field(default=None, init=False, repr=False)
+
+    # Window the headline avg/median/p95/p99 (and the alerts built on them) describe
+    HEADLINE_WINDOW = "5m"
+
+    def add_request(
+        self,
+        duration: float,
+        timestamp: Optional[float] = None,
+        db_time: float = 0.0,
+        api_time: float = 0.0,
+        db_queries: int = 0,
+    ):
+        """Add a request with its duration, the part of it spent in SQL / Bot API calls
+        and the number of SQL statements it ran"""
         if timestamp is None:
             timestamp = time.time()
 
         self.total_requests += 1
         self.total_duration += duration
+        self.db_duration += db_time
+        self.api_duration += api_time
+        self.db_queries += db_queries
+        if db_queries > self.max_db_queries:
+            self.max_db_queries = db_queries
         self.last_request = timestamp
 
         # Update min/max (treat initial state correctly; allow negatives)
@@ -63,49 +270,51 @@ class PerformanceMetrics:
             if duration > self.max_duration:
                 self.max_duration = duration
 
-        # Add to durations list and timestamps
+        # Recent samples and timestamps, plus the windowed sketches
         self.durations.append(duration)
         self.request_timestamps.append(timestamp)
-
-        # Update statistics
-        self._update_statistics()
+        self.windows.add(duration, timestamp)
+        self.bucket_counts[bisect.bisect_left(LATENCY_BUCKETS, duration)] += 1
+        self._summary = None
 
     def add_error(self):
         """Increment error count"""
         self.error_count += 1
 
-    def _update_statistics(self):
-        """Update calculated statistics"""
-        if self.durations:
-            durations_list = list(self.durations)
-            self.avg_duration = statistics.mean(durations_list)
-
-            if len(durations_list) >= 2:
-                self.median_duration = statistics.median(durations_list)
-
-                # Calculate percentiles indices to match tests' expectations
-                sorted_durations = sorted(durations_list)
-                n = len(sorted_durations)
-                # Tests expect for [1..5]: p95=4.0 (index 3) and p99=5.0 (index 4)
-                # Use floor on (n * p) but subtract 1 for p95 to select the previous item when not exact
-                import math as _math
-
-                p95_index = max(
-                    0,
-                    min(
-                        n - 1,
-                        (
-                            int(n * 0.95) - 1
-                            if (n * 0.95).is_integer() is False
-                            else int(n * 0.95) - 1
-                        ),
-                    ),
-                )
-                p95_index = max(0, min(n - 1, p95_index))
-                p99_index = max(0, min(n - 1, int(n * 0.99)))
+    @staticmethod
+    def _describe(sketch: LatencySketch) -> Dict[str, float]:
+        return {
+            "count": sketch.count,
+            "avg": sketch.mean(),
+            "median": sketch.median(),
+            "p95": sketch.percentile(0.95),
+            "p99": sketch.percentile(0.99),
+        }
+
+    def window_stats(self, window: str) -> Dict[str, float]:
+        """Count, average, median, p95 and p99 for one of `SlidingLatencyWindows.WINDOWS`"""
+        return self._describe(self.windows.snapshot(SlidingLatencyWindows.WINDOWS[window]))
 
-                self.p95_duration = sorted_durations[p95_index]
-                self.p99_duration = sorted_durations[p99_index]
+    def _headline(self) -> Dict[str, float]:
+        if self._summary is None:
+            self._summary = self.window_stats(self.HEADLINE_WINDOW)
+        return self._summary
+
+    @property
+    def avg_duration(self) -> float:
+        return self._headline()["avg"]
+
+    @property
+    def median_duration(self) -> float:
+        return self._headline()["median"]
+
+    @property
+    def p95_duration(self) -> float:
+        return self._headline()["p95"]
+
+    @property
+    def p99_duration(self) -> float:
+        return self._headline()["p99"]
 
     def to_dict(self) -> Dict[str, Any]:
         """Convert to dictionary for serialization"""
@@ -123,6 +332,20 @@ class PerformanceMetrics:
             "median_duration": round(self.median_duration, 4),
             "p95_duration": round(self.p95_duration, 4),
             "p99_duration": round(self.p99_duration, 4),
+            "avg_db_duration": (
+                round(self.db_duration / self.total_requests, 4) if self.total_requests else 0
+            ),
+            "avg_api_duration": (
+                round(self.api_duration / self.total_requests, 4) if self.total_requests else 0
+            ),
+            "avg_db_queries": (
+                round(self.db_queries / self.total_requests, 2) if self.total_requests else 0
+            ),
+            "max_db_queries": self.max_db_queries,
+            "windows": {
+                name: {k: round(v, 4) for k, v in self.window_stats(name).items()}
+                for name in SlidingLatencyWindows.WINDOWS
+            },
             "error_count": self.error_count,
             "error_rate": (
                 round((self.error_count / self.total_requests * 100), 2)
@@ -184,14 +407,28 @@ class PerformanceMonitor:
         ]
 
     async def log_request_time(
-        self, handler_name: str, duration: float, user_id: Optional[int] = None
+        self,
+        handler_name: str,
+        duration: float,
+        user_id: Optional[int] = None,
+        db_time: float = 0.0,
+        api_time: float = 0.0,
+        db_queries: int = 0,
     ):
         """Log request time with async locking"""
         async with self._lock:
-            self._log_request_time_sync(handler_name, duration, user_id)
+            self._log_request_time_sync(
+                handler_name, duration, user_id, db_time, api_time, db_queries
+            )
 
     def _log_request_time_sync(
-        self, handler_name: str, duration: float, user_id: Optional[int] = None
+        self,
+        handler_name: str,
+        duration: float,
+        user_id: Optional[int] = None,
+        db_time: float = 0.0,
+        api_time: float = 0.0,
+        db_queries: int = 0,
     ):
         """Synchronous request time logging"""
         # Update handler metrics
@@ -199,7 +436,9 @@ class PerformanceMonitor:
             self.metrics[handler_name] = PerformanceMetrics(handler_name)
 
         # Preserve negative durations (tests expect exact values), do not clamp
-        self.metrics[handler_name].add_request(duration)
+        self.metrics[handler_name].add_request(
+            duration, db_time=db_time, api_time=api_time, db_queries=db_queries
+        )
 
         # Log slow requests
         if duration > 1.0:
@@ -315,6 +554,9 @@ class PerformanceMonitor:
                     stats["db"] = {"ok": False, "error": "ENGINE not available"}
             except Exception as e:
                 stats["db"] = {"ok": False, "error": str(e)}
+            # Statement fingerprints, slow queries and pool checkout counters
+            if QUERY_TELEMETRY is not None:
+                stats["sql"] = QUERY_TELEMETRY.snapshot()
             return stats
 
     async def get_handler_stats(self, handler_name: str) -> Optional[Dict[str, Any]]:
@@ -400,6 +642,8 @@ class PerformanceMonitor:
             self.user_activity.clear()
             self.alerts.clear()
             self._start_time = time.time()
+            if QUERY_TELEMETRY is not None:
+                QUERY_TELEMETRY.reset()
 
     def increment_counter(self, name: str, increment: int = 1):
         self.counters[name] += increment
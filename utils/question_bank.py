@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+In-memory quiz question bank.
+
+`/daily` and the daily-quiz button show one question per grade per day, and every
+answer is checked against that question's `correct_index`. Both are served from
+this bank instead of `quiz_questions`: questions are loaded once per grade, ordered
+by `(difficulty, id)`, with the message text and inline keyboard rendered up front.
+The question of the day is `rotation[day % len(rotation)]` (UTC day number), so each
+grade cycles through its whole bank in difficulty order.
+
+`scripts/json_to_db.seed_quiz_from_json` calls `invalidate()` after inserting
+questions; other processes pick new questions up on the next reload, at most
+`QUIZ_BANK_REFRESH_SECONDS` later.
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import logging
+import os
+import time
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from utils.committed_state import CommittedState
+
+logger = logging.getLogger(__name__)
+
+
+class BankQuestion(NamedTuple):
+    id: int
+    grade: str
+    difficulty: int
+    correct_index: int
+    text: str
+    reply_markup: InlineKeyboardMarkup
+
+
+def _render(row) -> BankQuestion:
+    choices = (row.options or {}).get("choices", [])
+    rows = [
+        [InlineKeyboardButton(text=c, callback_data=f"quiz:{row.id}:{i}")]
+        for i, c in enumerate(choices[:8])
+    ]
+    rows.append([InlineKeyboardButton("🔙 بازگشت", callback_data="back_to_menu")])
+    return BankQuestion(
+        id=int(row.id),
+        grade=row.grade,
+        difficulty=int(row.difficulty or 1),
+        correct_index=int(row.correct_index),
+        text=f"سوال روز ({row.grade})\n\n{row.question_text}",
+        reply_markup=InlineKeyboardMarkup(rows),
+    )
+
+
+class QuestionBank(CommittedState):
+    """Questions per grade in daily-rotation order, plus an id -> correct_index map."""
+
+    name = "question bank"
+
+    def __init__(self, refresh_seconds: Optional[float] = None):
+        if refresh_seconds is None:
+            refresh_seconds = float(os.getenv("QUIZ_BANK_REFRESH_SECONDS", "600"))
+        super().__init__(refresh_seconds)
+        self._rotations: Dict[str, Tuple[BankQuestion, ...]] = {}
+        self._correct: Dict[int, int] = {}
+
+    def _read(self) -> Dict[str, list]:
+        """Questions of `quiz_questions` per grade, in rotation order."""
+        from sqlalchemy import select
+        from database.db import session_scope
+        from database.models_sql import QuizQuestion
+
+        rotations: Dict[str, list] = {}
+        with session_scope() as session:
+            rows = session.execute(
+                select(QuizQuestion).order_by(QuizQuestion.difficulty.asc(), QuizQuestion.id.asc())
+            ).scalars()
+            for row in rows:
+                rotations.setdefault(row.grade, []).append(_render(row))
+        return rotations
+
+    def _swap(self, rotations: Dict[str, list]) -> int:
+        self._rotations = {grade: tuple(qs) for grade, qs in rotations.items()}
+        self._correct = {q.id: q.correct_index for qs in rotations.values() for q in qs}
+        return len(self._correct)
+
+    async def ensure_loaded(self) -> None:
+        """Load on first use and reload once the bank is older than `refresh_seconds`."""
+        if not self._loaded or time.monotonic() - self.loaded_at >= self.refresh_seconds:
+            try:
+                await self.refresh()
+            except Exception as e:
+                if not self._loaded:
+                    raise
+                logger.warning(f"Question bank reload failed, keeping current bank: {e}")
+
+    def invalidate(self) -> None:
+        """Force a reload on the next `ensure_loaded()` (after questions are added)."""
+        self.loaded_at = float("-inf")
+
+    def daily(self, grade: str, day: Optional[dt.date] = None) -> Optional[BankQuestion]:
+        """The question of the day for `grade`, or None if the grade has no questions."""
+        rotation = self._rotations.get(grade)
+        if not rotation:
+            return None
+        day = day or dt.datetime.utcnow().date()
+        return rotation[day.toordinal() % len(rotation)]
+
+    def correct_index(self, question_id: int) -> Optional[int]:
+        """`correct_index` of a loaded question, or None if the bank does not know it."""
+        return self._correct.get(question_id)
+
+
+# Global bank instance
+question_bank = QuestionBank()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Shared rate-limit state.
+
+`SharedRateLimiter` keeps its buckets here so that every bot replica draws from the
+same per-user budget. Buckets use the same GCRA arithmetic as `GCRARateLimiter`: a
+bucket is a theoretical arrival time (`tat`) plus a penalty end (`blocked_until`),
+and a request for `n` tokens is granted as many as the bucket still holds, up to
+`n`. One `acquire()` call settles a whole batch of users.
+
+`SQLRateLimitStore` keeps buckets in the `rate_limit_state` table (UNLOGGED on
+PostgreSQL: the state is disposable and skipping the WAL keeps upserts cheap). A
+batch is a single multi-row `INSERT ... ON CONFLICT DO UPDATE ... RETURNING`, so the
+check-and-charge is atomic across replicas. The table is declared in
+`database.models_sql.RateLimitState` and created by the schema bootstrap.
+
+`InMemoryRateLimitStore` implements the same interface over a dict (single process;
+used as a stand-in in tests).
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (granted tokens, tat, blocked_until) per user ID
+Grant = Tuple[int, float, float]
+
+# Rows per upsert statement; larger batches are split
+_MAX_BATCH_ROWS = 500
+
+# Tolerance for float drift when converting a time budget back into whole tokens
+_EPSILON = 1e-9
+
+
+class InMemoryRateLimitStore:
+    """Buckets in a dict keyed by `namespace:user_id`; single process only."""
+
+    def __init__(self):
+        self.buckets: Dict[str, List[float]] = {}
+
+    async def acquire(
+        self,
+        namespace: str,
+        wants: Dict[str, int],
+        now: float,
+        interval: float,
+        capacity: int,
+        penalty: float,
+    ) -> Dict[str, Grant]:
+        results: Dict[str, Grant] = {}
+        for user_id, want in wants.items():
+            key = f"{namespace}:{user_id}"
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                bucket = self.buckets[key] = [0.0, 0.0]
+            tat, blocked_until = bucket
+            granted = 0
+            if blocked_until <= now:
+                base = tat if tat > now else now
+                available = math.floor((capacity * interval - (base - now)) / interval + _EPSILON)
+                granted = max(0, min(want, available))
+                if granted:
+                    bucket[0] = base + granted * interval
+                elif penalty > 0:
+                    bucket[1] = now + penalty
+            results[user_id] = (granted, bucket[0], bucket[1])
+        return results
+
+    async def reset(self, namespace: str, user_id: str) -> None:
+        self.buckets.pop(f"{namespace}:{user_id}", None)
+
+    async def purge_expired(self, now: float) -> int:
+        expired = [k for k, (tat, blocked) in self.buckets.items() if tat <= now and blocked <= now]
+        for key in expired:
+            del self.buckets[key]
+        return len(expired)
+
+
+class SQLRateLimitStore:
+    """Buckets in the `rate_limit_state` table; every call runs off the event loop."""
+
+    async def _run(self, fn, *args):
+        from database import async_service
+
+        return await async_service.run_in_session(fn, *args)
+
+    @staticmethod
+    def _upsert_sql(dialect: str, rows: int) -> str:
+        if dialect == "postgresql":
+            greatest, least = "GREATEST", "LEAST"
+
+            def floor(expr: str) -> str:
+                return f"CAST(FLOOR({expr}) AS INTEGER)"
+
+        else:
+            # SQLite: multi-argument MAX/MIN are scalar; CAST truncates toward zero,
+            # which only differs from FLOOR for negatives that the outer MAX(0, ..) clamps
+            greatest, least = "MAX", "MIN"
+
+            def floor(expr: str) -> str:
+                return f"CAST({expr} AS INTEGER)"
+
+        base = f"{greatest}(rate_limit_state.tat, :now)"
+        available = floor(f"(:capacity * :interval - ({base} - :now)) / :interval + {_EPSILON}")
+        grant = (
+            "(CASE WHEN rate_limit_state.blocked_until > :now THEN 0 "
+            f"ELSE {greatest}(0, {least}(excluded.granted, {available})) END)"
+        )
+        values = ", ".join(
+            f"(:b{i}, :now + {least}(:w{i}, :capacity) * :interval, 0, {least}(:w{i}, :capacity))"
+            for i in range(rows)
+        )
+        return (
+            "INSERT INTO rate_limit_state (bucket, tat, blocked_until, granted) "
+            f"VALUES {values} "
+            "ON CONFLICT (bucket) DO UPDATE SET "
+            f"tat = CASE WHEN {grant} > 0 THEN {base} + {grant} * :interval "
+            "ELSE rate_limit_state.tat END, "
+            f"blocked_until = CASE WHEN {grant} = 0 AND rate_limit_state.blocked_until <= :now "
+            "AND :penalty > 0 THEN :now + :penalty ELSE rate_limit_state.blocked_until END, "
+            f"granted = {grant} "
+            "RETURNING bucket, granted, tat, blocked_until"
+        )
+
+    async def acquire(
+        self,
+        namespace: str,
+        wants: Dict[str, int],
+        now: float,
+        interval: float,
+        capacity: int,
+        penalty: float,
+    ) -> Dict[str, Grant]:
+        from sqlalchemy import text
+
+        prefix = f"{namespace}:"
+        items = [(prefix + user_id, max(1, int(want))) for user_id, want in wants.items()]
+
+        def _acquire(session):
+            dialect = session.bind.dialect.name
+            results: Dict[str, Grant] = {}
+            for start in range(0, len(items), _MAX_BATCH_ROWS):
+                chunk = items[start : start + _MAX_BATCH_ROWS]
+                params = {
+                    "now": float(now),
+                    "interval": float(interval),
+                    "capacity": int(capacity),
+                    "penalty": float(penalty),
+                }
+                for i, (bucket, want) in enumerate(chunk):
+                    params[f"b{i}"] = bucket
+                    params[f"w{i}"] = want
+                rows = session.execute(text(self._upsert_sql(dialect, len(chunk))), params)
+                for bucket, granted, tat, blocked_until in rows:
+                    results[bucket[len(prefix) :]] = (
+                        int(granted),
+                        float(tat),
+                        float(blocked_until),
+                    )
+            return results
+
+        return await self._run(_acquire)
+
+    async def reset(self, namespace: str, user_id: str) -> None:
+        from sqlalchemy import text
+
+        def _reset(session):
+            session.execute(
+                text("DELETE FROM rate_limit_state WHERE bucket = :bucket"),
+                {"bucket": f"{namespace}:{user_id}"},
+            )
+
+        await self._run(_reset)
+
+    async def purge_expired(self, now: float) -> int:
+        """Delete buckets that are full again and not under penalty (indexed on tat)."""
+        from sqlalchemy import text
+
+        def _purge(session):
+            return session.execute(
+                text("DELETE FROM rate_limit_state WHERE tat <= :now AND blocked_until <= :now"),
+                {"now": float(now)},
+            ).rowcount
+
+        return await self._run(_purge)
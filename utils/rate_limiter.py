@@ -4,11 +4,13 @@
 Enhanced rate limiting system for Ostad Hatami Bot
 """
 
+import os
 import time
 import inspect
+import functools
 import asyncio
 import logging
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple, Type
 from collections import defaultdict, deque
 from dataclasses import dataclass
 from config import config
@@ -25,6 +27,7 @@ def rate_limit_handler(level: str = "default"):
     """
 
     def _decorator(func):
+        @functools.wraps(func)
         async def _wrapped(update, context, *args, **kwargs):
             try:
                 user_id = str(getattr(update.effective_user, "id", "0"))
@@ -144,7 +147,10 @@ class RateLimiter:
     async def is_allowed(self, user_id: str, config: Optional[RateLimitConfig] = None) -> bool:
         """Check if user is allowed to make a request"""
         try:
-            return self._is_allowed_sync(user_id, config)
+            allowed = self._is_allowed_sync(user_id, config)
+            self.stats["total_requests"] += 1
+            self.stats["allowed_requests" if allowed else "blocked_requests"] += 1
+            return allowed
         except Exception as e:
             logger.error(f"Rate limiter error for user {user_id}: {e}")
             # In case of error, allow the request to prevent blocking users
@@ -260,25 +266,421 @@ class RateLimiter:
                 pass
 
 
-class MultiLevelRateLimiter:
-    """Multi-level rate limiter for different types of requests"""
+class GCRAState:
+    """Per-user GCRA state: theoretical arrival time and penalty end (two floats)"""
+
+    __slots__ = ("tat", "blocked_until")
+
+    def __init__(self, tat: float = 0.0, blocked_until: float = 0.0):
+        self.tat = tat
+        self.blocked_until = blocked_until
+
+    def expires_at(self) -> float:
+        """Time after which this state is indistinguishable from a fresh user"""
+        return self.tat if self.tat > self.blocked_until else self.blocked_until
+
+
+class GCRARateLimiter(RateLimiter):
+    """Token-bucket rate limiter using the generic cell rate algorithm (GCRA).
+
+    Instead of a deque of timestamps, each user costs one `GCRAState` (two floats).
+    A request is allowed if the bucket, refilled at `max_requests / window_seconds`,
+    still holds a token; `burst_size` adds extra capacity on top of `max_requests`.
+    Idle states are dropped by an expiry wheel (one bucket of user IDs per
+    `wheel_granularity` seconds), which is swept incrementally as time advances,
+    so cleanup never scans the whole dict.
+    """
+
+    def __init__(
+        self,
+        default_config: Optional[RateLimitConfig] = None,
+        wheel_granularity: float = 1.0,
+    ):
+        super().__init__(default_config)
+        self.limits: Dict[str, GCRAState] = {}  # type: ignore[assignment]
+        self._overrides: Dict[str, RateLimitConfig] = {}
+        self._wheel: Dict[int, List[str]] = {}
+        self._wheel_granularity = float(wheel_granularity)
+        self._wheel_cursor = int(time.time() // self._wheel_granularity)
+        self._next_sweep_at = (self._wheel_cursor + 1) * self._wheel_granularity
+        self._default_params = self._params(self.default_config)
+
+    def _slot(self, timestamp: float) -> int:
+        return int(timestamp // self._wheel_granularity)
+
+    def _schedule(self, user_id: str, old_expiry: float, new_expiry: float) -> None:
+        # Only enqueue when the state moves to another slot; stale slot entries are
+        # skipped on sweep because the state's current expiry no longer matches.
+        new_slot = self._slot(new_expiry)
+        if old_expiry and self._slot(old_expiry) == new_slot:
+            return
+        self._wheel.setdefault(new_slot, []).append(user_id)
+
+    def _sweep(self, now: float) -> int:
+        """Drop states whose expiry slot has passed; returns the number removed."""
+        current = self._slot(now)
+        if current <= self._wheel_cursor:
+            return 0
+        due: Iterable[int]
+        if current - self._wheel_cursor > len(self._wheel):
+            due = sorted(s for s in self._wheel if s < current)
+        else:
+            due = range(self._wheel_cursor, current)
+        self._wheel_cursor = current
+        self._next_sweep_at = (current + 1) * self._wheel_granularity
+        removed = 0
+        for slot in due:
+            for user_id in self._wheel.pop(slot, ()):
+                state = self.limits.get(user_id)
+                if state is not None and state.expires_at() <= now:
+                    # Custom limits from set_user_limit outlive the state
+                    del self.limits[user_id]
+                    removed += 1
+        return removed
+
+    @staticmethod
+    def _params(config: RateLimitConfig) -> Tuple[float, float]:
+        """Return (emission interval, burst tolerance) in seconds"""
+        interval = config.window_seconds / max(1, config.max_requests)
+        capacity = max(1, config.max_requests + config.burst_size)
+        return interval, interval * (capacity - 1)
+
+    def _is_allowed_sync(self, user_id: str, config: Optional[RateLimitConfig] = None) -> bool:
+        if not user_id:
+            return False
+
+        if config is None:
+            config = self._overrides.get(user_id)
+        if config is None or config is self.default_config:
+            config = self.default_config
+            interval, tolerance = self._default_params
+        else:
+            interval, tolerance = self._params(config)
+
+        now = time.time()
+        if now >= self._next_sweep_at:
+            self._sweep(now)
+
+        state = self.limits.get(user_id)
+        if state is None:
+            state = self.limits[user_id] = GCRAState(now + interval)
+            self._schedule(user_id, 0.0, state.tat)
+            return True
+        if now < state.blocked_until:
+            return False
+
+        old_tat = state.tat
+        tat = old_tat if old_tat > now else now
+        if tat - now > tolerance:
+            if config.penalty_seconds > 0:
+                old_expiry = state.expires_at()
+                state.blocked_until = now + config.penalty_seconds
+                self._schedule(user_id, old_expiry, state.expires_at())
+            return False
+
+        state.tat = tat = tat + interval
+        # blocked_until is in the past here, so the expiry is the new TAT; a state whose
+        # slot was already swept would have been dropped, so same slot == still queued
+        granularity = self._wheel_granularity
+        if int(old_tat // granularity) != int(tat // granularity):
+            self._schedule(user_id, 0.0, tat)
+        return True
+
+    async def get_user_stats(self, user_id: str) -> Optional[Dict]:
+        async with self._lock:
+            state = self.limits.get(user_id)
+            if state is None:
+                return None
+            config = self._overrides.get(user_id, self.default_config)
+            interval, _ = self._params(config)
+            now = time.time()
+            backlog = max(0.0, state.tat - now)
+            return {
+                "current_requests": int(-(-backlog // interval)),
+                "max_requests": config.max_requests,
+                "window_seconds": config.window_seconds,
+                "is_blocked": now < state.blocked_until,
+                "blocked_until": state.blocked_until,
+                "time_until_reset": backlog,
+            }
+
+    async def reset_user(self, user_id: str) -> bool:
+        async with self._lock:
+            self._overrides.pop(user_id, None)
+            return self.limits.pop(user_id, None) is not None
+
+    async def cleanup_old_entries(self, max_age_hours: int = 24) -> int:
+        """Sweep due wheel slots; states are dropped as soon as their bucket is full again"""
+        async with self._lock:
+            return self._sweep(time.time())
+
+    async def set_user_limit(self, user_id: str, config: RateLimitConfig) -> None:
+        async with self._lock:
+            self._overrides[user_id] = config
+            self.limits.pop(user_id, None)
+
+
+class SharedBucketView:
+    """What this replica last learned about a user's shared bucket, plus its local lease"""
+
+    __slots__ = ("tat", "blocked_until", "synced_at", "lease", "lease_until")
 
     def __init__(self):
+        self.tat = 0.0
+        self.blocked_until = 0.0
+        self.synced_at = 0.0
+        self.lease = 0  # tokens already charged to the shared bucket, spendable locally
+        self.lease_until = 0.0
+
+
+class SharedRateLimiter(RateLimiter):
+    """GCRA rate limiter whose buckets live in a store shared by all replicas.
+
+    Checks that arrive in the same event-loop turn (or within `batch_window` seconds)
+    are settled with one `store.acquire()` call per batch; batches do not wait for
+    each other, so several can be in flight at once. Two local fast paths avoid the
+    round-trip altogether:
+
+    - A user whose bucket was clearly under the limit at the last sync (at least
+      half of it free) also reserves `lease_size` extra tokens; the next checks spend
+      them locally until `lease_size` emission intervals have passed.
+    - A user who was refused is refused locally until their penalty ends and a token
+      has been refilled; other replicas can only push that moment later.
+
+    Leased tokens are charged when reserved, so replicas together never exceed the
+    configured budget; unspent leases are simply lost. If the store fails, the
+    check falls back to a process-local `GCRARateLimiter`.
+    """
+
+    def __init__(
+        self,
+        default_config: Optional[RateLimitConfig] = None,
+        store=None,
+        namespace: str = "default",
+        lease_size: Optional[int] = None,
+        batch_window: float = 0.0,
+    ):
+        super().__init__(default_config)
+        if store is None:
+            from utils.rate_limit_store import SQLRateLimitStore
+
+            store = SQLRateLimitStore()
+        self.store = store
+        self.namespace = namespace
+        self.lease_size = lease_size
+        self.batch_window = batch_window
+        self.limits: Dict[str, SharedBucketView] = {}  # type: ignore[assignment]
+        self._overrides: Dict[str, RateLimitConfig] = {}
+        self._fallback = GCRARateLimiter(self.default_config)
+        # (interval, capacity, penalty) -> (config, user ID -> waiting checks)
+        self._pending: Dict[Tuple[float, int, float], Tuple[RateLimitConfig, Dict]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self.remote_calls = 0
+
+    def _config_for(self, user_id: str, config: Optional[RateLimitConfig]) -> RateLimitConfig:
+        return config or self._overrides.get(user_id) or self.default_config
+
+    def _lease_for(self, config: RateLimitConfig) -> int:
+        if self.lease_size is not None:
+            return self.lease_size
+        return max(1, (config.max_requests + config.burst_size) // 10)
+
+    def _is_allowed_sync(self, user_id: str, config: Optional[RateLimitConfig] = None) -> bool:
+        """Local-only check (no store round-trip): the process-local fallback engine"""
+        return self._fallback._is_allowed_sync(user_id, self._config_for(user_id, config))
+
+    async def is_allowed(self, user_id: str, config: Optional[RateLimitConfig] = None) -> bool:
+        if not user_id:
+            return False
+        config = self._config_for(user_id, config)
+        self.stats["total_requests"] += 1
+        interval, _ = GCRARateLimiter._params(config)
+        capacity = max(1, config.max_requests + config.burst_size)
+
+        now = time.time()
+        view = self.limits.get(user_id)
+        if view is not None:
+            if view.lease > 0 and now < view.lease_until:
+                view.lease -= 1
+                return self._count(True)
+            if now < view.blocked_until or now < view.tat - (capacity - 1) * interval:
+                return self._count(False)
+
+        future = asyncio.get_running_loop().create_future()
+        key = (interval, capacity, float(config.penalty_seconds))
+        _, waiters = self._pending.setdefault(key, (config, {}))
+        waiters.setdefault(user_id, []).append(future)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_soon())
+        return self._count(await future)
+
+    def _count(self, allowed: bool) -> bool:
+        self.stats["allowed_requests" if allowed else "blocked_requests"] += 1
+        return allowed
+
+    async def _flush_soon(self) -> None:
+        # Yield at least once so checks from concurrently running handlers join the batch
+        await asyncio.sleep(self.batch_window)
+        self._flush_task = None
+        pending, self._pending = self._pending, {}
+        await asyncio.gather(
+            *(self._settle(key, config, waiters) for key, (config, waiters) in pending.items())
+        )
+
+    async def _settle(
+        self,
+        key: Tuple[float, int, float],
+        config: RateLimitConfig,
+        waiters: Dict[str, List[asyncio.Future]],
+    ) -> None:
+        interval, capacity, penalty = key
+        lease = self._lease_for(config)
+        now = time.time()
+        wants: Dict[str, int] = {}
+        for user_id, futures in waiters.items():
+            want = len(futures)
+            view = self.limits.get(user_id)
+            if view is not None and view.synced_at:
+                free = (capacity * interval - max(0.0, view.tat - now)) / interval
+                if free - want >= max(lease, capacity / 2):
+                    want += lease
+            wants[user_id] = want
+
+        try:
+            self.remote_calls += 1
+            grants = await self.store.acquire(
+                self.namespace, wants, now, interval, capacity, penalty
+            )
+        except Exception as e:
+            logger.warning(f"Shared rate limit store failed ({e}); using local limits")
+            for user_id, futures in waiters.items():
+                for future in futures:
+                    if not future.done():
+                        future.set_result(self._fallback._is_allowed_sync(user_id, config))
+            return
+
+        for user_id, futures in waiters.items():
+            grant = grants.get(user_id)
+            if grant is None:
+                # Not charged to the shared bucket, so not granted either
+                logger.warning(f"Shared rate limit store returned no bucket for {user_id}")
+                for future in futures:
+                    if not future.done():
+                        future.set_result(False)
+                continue
+            granted, tat, blocked_until = grant
+            view = self.limits.get(user_id)
+            if view is None:
+                view = self.limits[user_id] = SharedBucketView()
+            view.tat, view.blocked_until, view.synced_at = tat, blocked_until, now
+            spare = granted - len(futures)
+            if spare > 0:
+                view.lease = spare
+                view.lease_until = now + spare * interval
+            for i, future in enumerate(futures):
+                if not future.done():
+                    future.set_result(i < granted)
+
+    async def get_user_stats(self, user_id: str) -> Optional[Dict]:
+        async with self._lock:
+            view = self.limits.get(user_id)
+            if view is None:
+                return None
+            config = self._overrides.get(user_id, self.default_config)
+            now = time.time()
+            return {
+                "max_requests": config.max_requests,
+                "window_seconds": config.window_seconds,
+                "is_blocked": now < view.blocked_until,
+                "blocked_until": view.blocked_until,
+                "time_until_reset": max(0.0, view.tat - now),
+                "leased_tokens": view.lease if now < view.lease_until else 0,
+            }
+
+    async def reset_user(self, user_id: str) -> bool:
+        async with self._lock:
+            self._overrides.pop(user_id, None)
+            await self.store.reset(self.namespace, user_id)
+            return self.limits.pop(user_id, None) is not None
+
+    async def cleanup_old_entries(self, max_age_hours: int = 24) -> int:
+        """Drop local views with nothing left to serve, and purge full buckets from the store"""
+        async with self._lock:
+            now = time.time()
+            stale = [
+                user_id
+                for user_id, view in self.limits.items()
+                if view.tat <= now and view.blocked_until <= now and view.lease_until <= now
+            ]
+            for user_id in stale:
+                del self.limits[user_id]
+            try:
+                await self.store.purge_expired(now)
+            except Exception as e:
+                logger.warning(f"Shared rate limit purge failed: {e}")
+            return len(stale)
+
+    async def set_user_limit(self, user_id: str, config: RateLimitConfig) -> None:
+        async with self._lock:
+            self._overrides[user_id] = config
+            self.limits.pop(user_id, None)
+
+
+RATE_LIMIT_ENGINES: Dict[str, Type[RateLimiter]] = {
+    "window": RateLimiter,
+    "gcra": GCRARateLimiter,
+    "shared": SharedRateLimiter,
+}
+
+
+def _engine_for(level: str, engines: Optional[Dict[str, str]] = None) -> str:
+    """Engine for a level: explicit mapping, RATE_LIMIT_ENGINE_<LEVEL>, RATE_LIMIT_ENGINE"""
+    name = (
+        (engines or {}).get(level)
+        or os.getenv(f"RATE_LIMIT_ENGINE_{level.upper()}")
+        or os.getenv("RATE_LIMIT_ENGINE")
+        or "window"
+    )
+    name = name.strip().lower()
+    if name not in RATE_LIMIT_ENGINES:
+        logger.warning(f"Unknown rate limit engine '{name}' for level {level}; using window")
+        return "window"
+    return name
+
+
+class MultiLevelRateLimiter:
+    """Multi-level rate limiter for different types of requests.
+
+    Each level uses the sliding-window engine (`RateLimiter`) unless `engines` or
+    `RATE_LIMIT_ENGINE[_<LEVEL>]` selects `gcra` (`GCRARateLimiter`) or `shared`
+    (`SharedRateLimiter`, state shared by all replicas through the database).
+    """
+
+    def __init__(self, engines: Optional[Dict[str, str]] = None):
         self.limiters: Dict[str, RateLimiter] = {}
 
+        def _make(level: str, limit_config: Optional[RateLimitConfig] = None) -> RateLimiter:
+            engine = RATE_LIMIT_ENGINES[_engine_for(level, engines)]
+            if issubclass(engine, SharedRateLimiter):
+                # Namespace shared buckets by level so levels never share a budget
+                return engine(limit_config, namespace=level)
+            return engine(limit_config)
+
         # Default limiters
-        self.limiters["default"] = RateLimiter()
+        self.limiters["default"] = _make("default")
         # Registration flow can involve many quick interactions (callbacks/messages).
         # Make this lenient to avoid blocking normal use: 60 actions/min, no penalty.
-        self.limiters["registration"] = RateLimiter(
+        self.limiters["registration"] = _make(
+            "registration",
             RateLimitConfig(
                 max_requests=60,
                 window_seconds=60,
                 penalty_seconds=0,
-            )
+            ),
         )
-        self.limiters["admin"] = RateLimiter(
-            RateLimitConfig(max_requests=100, window_seconds=60)  # 100 admin requests per minute
+        self.limiters["admin"] = _make(
+            "admin",
+            RateLimitConfig(max_requests=100, window_seconds=60),  # 100 admin requests per minute
         )
 
     async def is_allowed(self, user_id: str, level: str = "default") -> bool:
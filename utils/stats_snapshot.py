@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Precomputed dashboard statistics.
+
+The admin dashboard and `/status` read user and purchase counters from an in-process
+snapshot instead of aggregating `users`/`purchases` on every render. The snapshot is
+built by `database.service.get_stats_summary`, kept current by the purchase state
+transitions in `database.service` (deltas are staged on the session and applied only
+when it commits) and rebuilt periodically, which also folds in changes made by other
+replicas and profile edits that move users between grade/city buckets.
+"""
+
+from __future__ import annotations
+
+import copy
+import logging
+import os
+from collections import Counter
+from typing import Dict, Optional
+
+from utils.committed_state import CommittedState, stage_on_commit
+
+logger = logging.getLogger(__name__)
+
+
+class StatsSnapshot(CommittedState):
+    """Stats summary held in memory, updated by commit-time deltas and periodic rebuilds."""
+
+    name = "stats snapshot"
+
+    def __init__(self, refresh_seconds: Optional[float] = None):
+        if refresh_seconds is None:
+            refresh_seconds = float(os.getenv("STATS_REFRESH_SECONDS", "60"))
+        super().__init__(refresh_seconds)
+        self._summary: Optional[Dict] = None
+
+    def summary(self) -> Dict:
+        """Return a copy of the current snapshot (empty counters before the first load)."""
+        if self._summary is None:
+            return {
+                "users": 0,
+                "purchases": {"total": 0, "pending": 0, "approved": 0, "rejected": 0},
+                "grades": [],
+                "cities_top": [],
+            }
+        return copy.deepcopy(self._summary)
+
+    def _read(self) -> Dict:
+        from database.db import session_scope
+        from database.service import get_stats_summary
+
+        with session_scope() as session:
+            return get_stats_summary(session)
+
+    def _swap(self, summary: Dict) -> Dict:
+        self._summary = summary
+        return summary
+
+    def _apply(self, deltas: Counter) -> None:
+        """Apply committed `users` / `purchases.<status>` deltas to the snapshot."""
+        current = self._summary or {}
+        # Copy-on-write: `summary()` copies without taking the lock
+        updated = dict(current)
+        purchases = dict(current.get("purchases") or {})
+        for key, delta in deltas.items():
+            if key == "users":
+                updated["users"] = updated.get("users", 0) + delta
+            elif key.startswith("purchases."):
+                status = key.split(".", 1)[1]
+                purchases[status] = purchases.get(status, 0) + delta
+        updated["purchases"] = purchases
+        self._summary = updated
+
+
+def _pending(session) -> Counter:
+    return stage_on_commit(session, "stats_snapshot", stats_snapshot.apply, Counter)
+
+
+def record_user_created(session) -> None:
+    """Stage `users += 1`; like all deltas it reaches the snapshot only if `session` commits."""
+    _pending(session)["users"] += 1
+
+
+def record_purchase_change(session, old_status: Optional[str], new_status: str) -> None:
+    """Stage a purchase insert (`old_status=None`) or status transition."""
+    pending = _pending(session)
+    if old_status is None:
+        pending["purchases.total"] += 1
+    else:
+        pending[f"purchases.{old_status}"] -= 1
+    pending[f"purchases.{new_status}"] += 1
+
+
+# Global snapshot instance
+stats_snapshot = StatsSnapshot()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Webhook update ingestion queue.
+
+The webhook endpoint only validates and parses the request, hands the update to
+`UpdateDispatcher.submit()` and answers 200; Telegram no longer waits for handler
+SQL and Bot API calls. A fixed pool of workers then runs `application.process_update`
+concurrently across chats but strictly one at a time, in arrival order, within a chat,
+so `ConversationHandler` state and "edit the message I just sent" flows see their
+updates in sequence.
+
+Each chat with queued work has a FIFO of updates; a chat key sits in the ready queue
+at most once and is re-queued by the worker that finished its previous update. The
+total depth (queued + in flight) is capped at `WEBHOOK_QUEUE_DEPTH`: beyond it
+`submit()` refuses the update and the endpoint answers 503, so Telegram redelivers it
+later instead of the process buffering without bound.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+def chat_key(update: Any) -> Hashable:
+    """Ordering key: the chat, else the user, else the update itself (no ordering)."""
+    chat = getattr(update, "effective_chat", None)
+    if chat is not None and getattr(chat, "id", None) is not None:
+        return ("chat", chat.id)
+    user = getattr(update, "effective_user", None)
+    if user is not None and getattr(user, "id", None) is not None:
+        return ("user", user.id)
+    return ("update", id(update))
+
+
+class UpdateDispatcher:
+    """Bounded worker pool running updates in order per chat and concurrently across chats."""
+
+    def __init__(
+        self,
+        process: Callable[[Any], Awaitable[Any]],
+        workers: Optional[int] = None,
+        max_depth: Optional[int] = None,
+    ):
+        self.process = process
+        if workers is None:
+            workers = int(os.getenv("WEBHOOK_WORKERS", "16"))
+        if max_depth is None:
+            max_depth = int(os.getenv("WEBHOOK_QUEUE_DEPTH", "1000"))
+        self.workers = max(1, int(workers))
+        self.max_depth = max(1, int(max_depth))
+        # chat key -> updates not yet finished (the head is the one being processed)
+        self._chains: Dict[Hashable, Deque[Tuple[Any, float]]] = {}
+        # Replaced on every start() so a restarted dispatcher never reuses stale state
+        self._ready: asyncio.Queue = asyncio.Queue()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._tasks: List[asyncio.Task] = []
+        self._accepting = False
+        self.depth = 0
+        self.in_flight = 0
+        self.stats = {
+            "enqueued": 0,
+            "processed": 0,
+            "failed": 0,
+            "rejected": 0,
+            "max_depth": 0,
+            "wait_seconds": 0.0,
+        }
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    @property
+    def active_chats(self) -> int:
+        return len(self._chains)
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._ready = asyncio.Queue()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._accepting = True
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"update-worker-{i}")
+            for i in range(self.workers)
+        ]
+
+    def submit(self, update: Any) -> bool:
+        """Queue `update`; returns False when not running or the queue is full."""
+        if not self._accepting or self.depth >= self.max_depth:
+            self.stats["rejected"] += 1
+            return False
+        key = chat_key(update)
+        chain = self._chains.get(key)
+        if chain is None:
+            chain = self._chains[key] = deque()
+            self._ready.put_nowait(key)
+        chain.append((update, time.monotonic()))
+        self.depth += 1
+        self.stats["enqueued"] += 1
+        if self.depth > self.stats["max_depth"]:
+            self.stats["max_depth"] = self.depth
+        self._idle.clear()
+        return True
+
+    async def _worker(self) -> None:
+        while True:
+            key = await self._ready.get()
+            chain = self._chains[key]
+            update, enqueued_at = chain[0]
+            self.stats["wait_seconds"] += time.monotonic() - enqueued_at
+            self.in_flight += 1
+            try:
+                await self.process(update)
+                self.stats["processed"] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["failed"] += 1
+                logger.error(f"Error processing queued update: {e}")
+            finally:
+                self.in_flight -= 1
+                self.depth -= 1
+                chain.popleft()
+                if chain:
+                    self._ready.put_nowait(key)
+                else:
+                    del self._chains[key]
+                if self.depth == 0:
+                    self._idle.set()
+
+    async def stop(self, timeout: Optional[float] = None) -> int:
+        """Stop accepting, wait up to `timeout` for queued updates, then stop the workers.
+
+        Returns the number of updates dropped because the drain timed out.
+        """
+        if not self._tasks:
+            return 0
+        self._accepting = False
+        if timeout is None:
+            timeout = float(os.getenv("WEBHOOK_DRAIN_SECONDS", "25"))
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Update queue drain timed out with {self.depth} update(s) left")
+        dropped = self.depth
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._chains.clear()
+        self.depth = self.in_flight = 0
+        return dropped
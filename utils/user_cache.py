@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Registered-user lookup cache keyed by Telegram id.
+
+Menu, course and quiz handlers only need to know whether the user is registered and
+a few profile fields (DB id, grade, field, province, city). Those are kept in a
+bounded LRU/TTL cache of compact `__slots__` records so ordinary navigation does
+not query `users`. Registration `confirm` fills the cache; profile edits
+invalidate it. Unregistered users are not cached, so a user created through any
+other path is picked up on the next lookup.
+"""
+
+from __future__ import annotations
+
+from typing import Optional
+
+from config import config
+from utils.cache import SimpleCache, cache_manager
+
+
+class CachedUser:
+    """Compact snapshot of the `users` columns handlers branch on."""
+
+    __slots__ = ("id", "telegram_user_id", "grade", "field_of_study", "province", "city")
+
+    def __init__(
+        self,
+        id: int,
+        telegram_user_id: int,
+        grade: Optional[str] = None,
+        field_of_study: Optional[str] = None,
+        province: Optional[str] = None,
+        city: Optional[str] = None,
+    ):
+        self.id = id
+        self.telegram_user_id = telegram_user_id
+        self.grade = grade
+        self.field_of_study = field_of_study
+        self.province = province
+        self.city = city
+
+    @classmethod
+    def from_model(cls, user) -> "CachedUser":
+        return cls(
+            id=int(user.id),
+            telegram_user_id=int(user.telegram_user_id),
+            grade=user.grade,
+            field_of_study=user.field_of_study,
+            province=user.province,
+            city=user.city,
+        )
+
+    def __repr__(self) -> str:
+        return f"CachedUser(id={self.id}, telegram_user_id={self.telegram_user_id})"
+
+
+# Registered in the global manager so it shows up in cache stats
+user_cache = SimpleCache(
+    ttl_seconds=config.performance.cache_ttl_seconds,
+    max_size=config.performance.user_cache_max_size,
+)
+cache_manager.caches["users"] = user_cache
+
+
+def remember_user(user) -> Optional[CachedUser]:
+    """Store a `User` row (or `CachedUser`) in the cache and return the record."""
+    if user is None:
+        return None
+    record = user if isinstance(user, CachedUser) else CachedUser.from_model(user)
+    user_cache._set_sync(str(record.telegram_user_id), record)
+    return record
+
+
+def forget_user(telegram_user_id: int) -> None:
+    user_cache.cache.pop(str(telegram_user_id), None)
+
+
+async def get_cached_user(telegram_user_id: int) -> Optional[CachedUser]:
+    """Return the cached record, loading it from the DB on a miss."""
+    record = user_cache._get_sync(str(telegram_user_id))
+    if record is not None:
+        return record
+    from database import async_service
+
+    return remember_user(await async_service.get_user_by_telegram_id(telegram_user_id))
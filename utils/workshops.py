@@ -19,7 +19,6 @@ from __future__ import annotations
 
 from pathlib import Path
 from typing import List, Tuple
-import json
 
 
 MONTH_ORDER = {
@@ -55,22 +54,15 @@ def get_workshop_months(courses_json_path: str | Path = "data/courses.json") ->
     """Extract workshop months from courses.json (strict, no fallback), sorted by year+month.
 
     Returns a list like ["مهر ۱۴۰۴", ..., "تیر ۱۴۰۵"]. Raises if JSON missing or empty.
+    The default path is served from the shared `utils.catalog.course_catalog` index.
     """
+    from utils.catalog import CourseCatalog, course_catalog
+
     p = Path(courses_json_path)
-    if not p.exists():
+    catalog = course_catalog if p == course_catalog.path else CourseCatalog(p)
+    if not catalog.exists():
         raise FileNotFoundError(f"courses.json not found at {p}")
-    data = json.loads(p.read_text(encoding="utf-8"))
-    months: List[str] = []
-    for item in data if isinstance(data, list) else []:
-        if not isinstance(item, dict):
-            continue
-        cid = (item.get("course_id") or "").strip()
-        if cid.startswith("workshop_") and len(cid.split("_", 1)) == 2:
-            month = cid.split("_", 1)[1]
-            if month and month not in months:
-                months.append(month)
-    # Sort by (year, month_index)
-    months.sort(key=_parse_month_key)
+    months = list(catalog.workshop_months())
     if not months:
         raise ValueError("No workshop months found in courses.json")
     return months